@@ -0,0 +1,284 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/agnostic_utils/adaptive_concurrency.py
+
+References:
+    https://en.wikipedia.org/wiki/Additive_increase/multiplicative_decrease
+    https://github.com/Netflix/concurrency-limits
+
+Synopsis:
+    按观察到的延迟和 429 自动调整的并发上限 (AIMD) 。
+
+Notes:
+    固定的 max_concurrency 要么过于保守，要么在供应商的容量变化时触发限流。
+
+    AdaptiveConcurrencyLimiter 以 AIMD 调整同时运行的请求数量:
+        - 加性增加: 每完成 limit 个成功的请求 (约一个往返) ，limit + 1 。
+        - 乘性减少: 出现限流 (429, RateLimitError) ，或延迟明显升高时，limit * decrease_factor 。
+            延迟: 最近的 p50 或 p95 超过基线的 latency_tolerance 倍。基线为观察到的最小的 p50 和 p95 ，即没有排队时的延迟。
+            每个往返最多减少一次，同一批并发请求的多个 429 只算一次。
+        - 其他异常不影响 limit 。
+
+    同一个供应商的全部调用应共用同一个实例，见 get_shared 。
+    limit 、延迟分位数和调整的历史可以通过 get_snapshot 和 history 查看。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.agnostic_utils.retry_policy import RetryPolicy
+
+import asyncio
+import statistics
+import threading
+import time
+from collections import Counter, deque
+
+from typing import TYPE_CHECKING, Awaitable, Callable, NamedTuple, TypeVar
+# if TYPE_CHECKING:
+
+T = TypeVar('T')
+
+# 计算分位数前需要的最少样本数量。
+_MIN_LATENCY_SAMPLES = 10
+
+
+class ConcurrencyChange(NamedTuple):
+    """
+    一次 limit 的调整。
+
+    Attributes:
+        timestamp (float): time.time() 。
+        limit (int): 调整后的 limit 。
+        reason (str): 'increase', 'rate-limit', 'latency' 。
+    """
+
+    timestamp: float
+    limit: int
+    reason: str
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    以 AIMD 自动调整的并发上限。
+
+    主要方法:
+        - run: 在并发上限内运行一个协程，并记录结果。
+        - get_shared: 按 key (例如供应商) 获取共享的实例。
+        - get_snapshot: 当前的 limit 、并发数量、延迟分位数。
+
+    状态:
+        - history (deque[ConcurrencyChange]): limit 的调整的历史。
+        - stats (Counter): 'successes', 'errors', 'rate_limited', 'increases', 'decreases' 。
+    """
+
+    _shared: dict[str, AdaptiveConcurrencyLimiter] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        window_size: int = 100,
+        history_size: int = 1000,
+    ):
+        """
+        Args:
+            initial_limit (int): 初始的并发上限。
+            min_limit (int): 并发上限的下限。
+            max_limit (int): 并发上限的上限。
+            decrease_factor (float): 乘性减少的系数。
+            latency_tolerance (float): 延迟超过基线的倍数时减少。
+            window_size (int): 计算延迟分位数的最近的请求数量。
+            history_size (int): 保留的调整历史的数量。
+        """
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError("需要 1 <= min_limit <= initial_limit <= max_limit 。")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.history: deque[ConcurrencyChange] = deque(maxlen=history_size)
+        self.stats: Counter[str] = Counter()
+        self._limit = initial_limit
+        self._in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._latencies: deque[float] = deque(maxlen=window_size)
+        self._baseline_p50: float | None = None
+        self._baseline_p95: float | None = None
+        self._successes_since_change = 0
+        # 上次减少后完成的请求数量。少于当时的并发数量时，不再减少。
+        self._completions_since_decrease = 0
+        self._in_flight_at_decrease = 0
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    # ==== 主要方法。 ====
+    async def run(
+        self,
+        func: Callable[[], Awaitable[T]],
+    ) -> T:
+        """
+        在并发上限内运行 func ，记录延迟和限流。
+
+        Args:
+            func (Callable[[], Awaitable[T]]): 构建请求的协程。
+
+        Returns:
+            T: func 的结果。异常会重新抛出。
+        """
+        await self._acquire()
+        start = time.monotonic()
+        try:
+            result = await func()
+        except Exception as e:
+            self._on_error(e)
+            raise
+        else:
+            self._on_success(time.monotonic() - start)
+            return result
+        finally:
+            self._release()
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def get_shared(
+        key: str,
+        **kwargs,
+    ) -> AdaptiveConcurrencyLimiter:
+        """按 key 获取共享的实例。不存在时以 kwargs 创建。"""
+        with AdaptiveConcurrencyLimiter._shared_lock:
+            limiter = AdaptiveConcurrencyLimiter._shared.get(key)
+            if limiter is None:
+                limiter = AdaptiveConcurrencyLimiter(**kwargs)
+                AdaptiveConcurrencyLimiter._shared[key] = limiter
+            return limiter
+
+    # ==== 主要方法。 ====
+    def get_snapshot(self) -> dict:
+        """当前的状态。"""
+        p50, p95 = self.get_latency_percentiles()
+        return {
+            'limit': self._limit,
+            'in_flight': self._in_flight,
+            'waiting': len(self._waiters),
+            'p50': p50,
+            'p95': p95,
+            'baseline_p50': self._baseline_p50,
+            'baseline_p95': self._baseline_p95,
+            **self.stats,
+        }
+
+    # ==== 工具方法。 ====
+    def get_latency_percentiles(self) -> tuple[float | None, float | None]:
+        """最近的请求的延迟的 p50 和 p95 (秒) 。样本不足时为 None 。"""
+        if len(self._latencies) < _MIN_LATENCY_SAMPLES:
+            return None, None
+        quantiles = statistics.quantiles(self._latencies, n=20, method='inclusive')
+        return quantiles[9], quantiles[18]
+
+    # ==== 内部方法。 ====
+    async def _acquire(self) -> None:
+        if self._in_flight < self._limit and not self._waiters:
+            self._in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 已经分配了位置，但在运行前被取消。
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._in_flight < self._limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    def _on_success(
+        self,
+        latency: float,
+    ) -> None:
+        self.stats['successes'] += 1
+        self._completions_since_decrease += 1
+        self._successes_since_change += 1
+        self._latencies.append(latency)
+        p50, p95 = self.get_latency_percentiles()
+        if p50 is not None:
+            self._baseline_p50 = p50 if self._baseline_p50 is None else min(self._baseline_p50, p50)
+            self._baseline_p95 = p95 if self._baseline_p95 is None else min(self._baseline_p95, p95)
+            if (
+                p50 > self.latency_tolerance * self._baseline_p50
+                or p95 > self.latency_tolerance * self._baseline_p95
+            ):
+                self._decrease(reason='latency')
+                return
+        if self._successes_since_change >= self._limit and self._limit < self.max_limit:
+            self._change_limit(self._limit + 1, reason='increase')
+            self.stats['increases'] += 1
+
+    def _on_error(
+        self,
+        error: Exception,
+    ) -> None:
+        self.stats['errors'] += 1
+        self._completions_since_decrease += 1
+        if AdaptiveConcurrencyLimiter.is_rate_limit_error(error):
+            self.stats['rate_limited'] += 1
+            self._decrease(reason='rate-limit')
+
+    def _decrease(
+        self,
+        reason: str,
+    ) -> None:
+        if self._completions_since_decrease < self._in_flight_at_decrease:
+            return
+        new_limit = max(self.min_limit, int(self._limit * self.decrease_factor))
+        self._completions_since_decrease = 0
+        self._in_flight_at_decrease = self._in_flight
+        if reason == 'latency':
+            # 重新测量减少后的延迟。
+            self._latencies.clear()
+        if new_limit != self._limit:
+            logger.warning(f"Decreasing concurrency limit to {new_limit}: {reason}.")
+            self._change_limit(new_limit, reason=reason)
+            self.stats['decreases'] += 1
+
+    def _change_limit(
+        self,
+        new_limit: int,
+        reason: str,
+    ) -> None:
+        self._limit = new_limit
+        self._successes_since_change = 0
+        self.history.append(ConcurrencyChange(timestamp=time.time(), limit=new_limit, reason=reason))
+        self._wake_waiters()
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def is_rate_limit_error(
+        error: BaseException,
+    ) -> bool:
+        """429 或 SDK 的 RateLimitError 。"""
+        if RetryPolicy.get_status_code(error) == 429:
+            return True
+        return any(cls.__name__ == 'RateLimitError' for cls in type(error).__mro__)
@@ -11,40 +11,280 @@ Synopsis:
 Notes:
     主要用于 LLM development 。
     这只是一些改造工具，仅做参考，原始项目是可以一开始就写成异步的。
+
+    map_concurrent:
+        大量的输入 (例如 10 万条) 不应一次性创建全部的协程再 gather :
+            - 全部的 task 同时存在，没有并发上限。
+            - 一个失败，全部的结果丢失。
+            - 全部完成前没有任何结果。
+        map_concurrent 按窗口从 (异步) 可迭代对象中取出输入，完成一个补充一个，按完成顺序 (或原本的顺序) 逐个产出结果。
+        同时存在的 task 和等待产出的结果的数量不超过 max_concurrency ，内存与输入的数量无关。
 """
 
 from __future__ import annotations
+from loguru import logger
+
+from src.agnostic_utils.offload import OffloadPool
+
 import asyncio
 
-from typing import Callable, Tuple, Any, Coroutine
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    NamedTuple,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar('T')
+
+
+class MapResult(NamedTuple):
+    """
+    map_concurrent 的一个结果。
+
+    Attributes:
+        index (int): 输入的序号。
+        item (Any): 输入。
+        result (Any): async_func 的结果。失败时为 None 。
+        error (BaseException, optional): async_func 抛出的异常。成功时为 None 。
+    """
+
+    index: int
+    item: Any
+    result: Any = None
+    error: BaseException | None = None
 
 
-async def async_wrap(sync_func: Callable, *args, **kwargs) -> Coroutine[Any, Any, Any]:
+async def async_wrap(sync_func: Callable, *args, **kwargs) -> Any:
     """
-    将同步程序包装为异步程序。
+    在线程池中运行同步程序，异步等待结果。
+
+    使用 OffloadPool 的 'default' 线程池。需要指定池时，使用 OffloadPool.get(name).run 或 offload 装饰器。
 
     Args:
         sync_func (Callable): 原本的同步程序。
 
     Returns:
-        可以使用使用异步编程的协程。
+        Any: sync_func 的结果。
     """
-    return asyncio.to_thread(sync_func, *args, **kwargs)
+    return await OffloadPool.get('default').run(sync_func, *args, **kwargs)
 
 
-async def run_parallel(async_func: Callable, arg_list: list[Tuple]) -> Tuple[Any]:
+async def run_parallel(
+    async_func: Callable,
+    arg_list: list[Tuple],
+    max_concurrency: int | None = None,
+) -> list[Any]:
     """
     并行运行大量协程。
 
     如果是自构建的本身就是异步的函数，则不需要专门使用这个函数，而是在实现的时候就写为异步并发。
+    大量的输入，或需要逐个处理结果、保留部分失败的结果时，使用 map_concurrent 。
 
     Args:
         async_func (Callable): 目标要运行的异步程序。
         arg_list (list[Tuple(args, kwargs)]): 需要传输给目标异步函数的参数，包括 args 和 kwargs 。
+        max_concurrency (int, optional): 最大并发数量。默认不限制。
+
+    Returns:
+        list[result1, result2, ...]: 以原本调用顺序的结果。有一个失败时，取消其余的协程并抛出异常。
+    """
+    results = []
+    async for map_result in map_concurrent(
+        lambda args_and_kwargs: async_func(*args_and_kwargs[0], **args_and_kwargs[1]),
+        arg_list,
+        max_concurrency=max_concurrency or max(1, len(arg_list)),
+        ordered=True,
+        return_exceptions=False,
+    ):
+        results.append(map_result.result)
+    return results
+
+
+async def map_concurrent(
+    async_func: Callable[[Any], Awaitable[T]],
+    items: Iterable | AsyncIterable,
+    max_concurrency: int = 16,
+    ordered: bool = False,
+    return_exceptions: bool = True,
+    on_progress: Callable[[int, int], None] | None = None,
+    semaphore: asyncio.Semaphore | None = None,
+) -> AsyncIterator[MapResult]:
+    """
+    以有限的并发对 items 逐个运行 async_func ，逐个产出结果。
+
+    示例:
+        async for map_result in map_concurrent(process, read_lines(path), max_concurrency=32):
+            if map_result.error is None:
+                save(map_result.result)
+
+    提前退出 (break) 或外部取消时，取消全部未完成的 task ，并等待取消完成。
+
+    Args:
+        async_func (Callable[[Any], Awaitable[T]]): 处理一个输入的异步函数。
+        items (Union[Iterable, AsyncIterable]): 输入。按需读取，可以是生成器或异步生成器。
+        max_concurrency (int): 窗口的大小，即同时运行的 task 和等待产出的结果的总数的上限。
+        ordered (bool): 是否按输入的顺序产出。默认按完成的顺序。
+            按顺序时，一个慢的输入会阻塞窗口，之后的结果在窗口中等待。
+        return_exceptions (bool): 是否将异常作为 MapResult.error 产出。
+            否则在第一个异常时取消其余的 task ，并抛出该异常。
+        on_progress (Callable[[int, int], None], optional): 每完成一个输入时调用，参数为 (已完成的数量, 其中失败的数量) 。
+        semaphore (asyncio.Semaphore, optional): 额外的 semaphore 。多个调用共用同一个 semaphore 时，可以限制总的并发数量。
+
+    Yields:
+        MapResult: 每个输入的结果。
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency 需要至少为 1 。")
+
+    async def run_item(item: Any) -> T:
+        if semaphore is None:
+            return await async_func(item)
+        async with semaphore:
+            return await async_func(item)
+
+    if isinstance(items, AsyncIterable):
+        async_iterator = items.__aiter__()
+        sync_iterator = None
+    else:
+        async_iterator = None
+        sync_iterator = iter(items)
+
+    async def next_item() -> tuple[bool, Any]:
+        try:
+            if async_iterator is not None:
+                return True, await async_iterator.__anext__()
+            return True, next(sync_iterator)
+        except (StopIteration, StopAsyncIteration):
+            return False, None
+
+    # task -> (index, item)
+    pending: dict[asyncio.Task, tuple[int, Any]] = {}
+    # ordered 时，已完成但还不能产出的结果。index -> MapResult
+    buffered: dict[int, MapResult] = {}
+    next_index = 0
+    next_yield_index = 0
+    num_completed = 0
+    num_failed = 0
+    is_exhausted = False
+    try:
+        while True:
+            # 补充窗口。
+            while not is_exhausted and len(pending) + len(buffered) < max_concurrency:
+                has_item, item = await next_item()
+                if not has_item:
+                    is_exhausted = True
+                    break
+                pending[asyncio.create_task(run_item(item))] = (next_index, item)
+                next_index += 1
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            completed = []
+            for task in done:
+                index, item = pending.pop(task)
+                error = task.exception()
+                num_completed += 1
+                if error is not None:
+                    num_failed += 1
+                    if not return_exceptions:
+                        raise error
+                    completed.append(MapResult(index=index, item=item, error=error))
+                else:
+                    completed.append(MapResult(index=index, item=item, result=task.result()))
+                if on_progress is not None:
+                    on_progress(num_completed, num_failed)
+            if not ordered:
+                for map_result in sorted(completed, key=lambda r: r.index):
+                    yield map_result
+                continue
+            for map_result in completed:
+                buffered[map_result.index] = map_result
+            while next_yield_index in buffered:
+                yield buffered.pop(next_yield_index)
+                next_yield_index += 1
+    finally:
+        # 取消未完成的 task ，并等待取消完成，避免遗留未完成的请求。
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def run_first_valid(
+    candidate_factory: Callable[[], Awaitable[T]],
+    is_valid: Callable[[T], bool],
+    num_candidates: int,
+    budget: int,
+    semaphore: asyncio.Semaphore | None = None,
+    is_fatal: Callable[[BaseException], bool] | None = None,
+) -> T | None:
+    """
+    并发运行多个候选协程，返回第一个有效的结果，取消其余的协程。
+
+    用于延迟敏感的结构化输出: 顺序重试会使一次慢或错误的生成成倍增加尾延迟。
+
+    实现:
+        - 同时运行 num_candidates 个候选。一个候选完成但结果无效时，补充一个新的候选。
+        - 全部启动的候选数量不超过 budget 。
+        - 每个候选在运行时占用 semaphore 。多个调用共用同一个 semaphore 时，可以限制总的并发数量。
+        - 候选抛出的异常视为无效的结果。is_fatal 判断为致命的异常 (例如认证失败、context 过长) 除外:
+            重新生成没有意义，取消其余的候选，原样抛出。
+
+    Args:
+        candidate_factory (Callable[[], Awaitable[T]]): 构建一个候选协程。
+        is_valid (Callable[[T], bool]): 判断候选的结果是否有效。
+        num_candidates (int): 同时运行的候选数量。
+        budget (int): 最多启动的候选数量。
+        semaphore (asyncio.Semaphore, optional): 限制并发的 semaphore 。默认为 num_candidates 。
+        is_fatal (Callable[[BaseException], bool], optional): 判断候选的异常是否致命。默认全部视为无效的结果。
 
     Returns:
-        Tuple[result1, result2, ...]: 以原本调用顺序的结果。
+        Union[T, None]: 第一个有效的结果。全部候选均无效时为 None 。
+
+    Raises:
+        Exception: is_fatal 判断为致命的候选的异常。
     """
-    tasks = [async_func(*args, **kwargs) for args, kwargs in arg_list]
-    return await asyncio.gather(*tasks)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(num_candidates)
+
+    async def run_candidate() -> T:
+        async with semaphore:
+            return await candidate_factory()
+
+    pending: set[asyncio.Task] = set()
+    launched = 0
+
+    def launch_candidate() -> None:
+        nonlocal launched
+        launched += 1
+        pending.add(asyncio.create_task(run_candidate()))
 
+    for _ in range(min(num_candidates, budget)):
+        launch_candidate()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                error = task.exception()
+                if error is not None:
+                    if is_fatal is not None and is_fatal(error):
+                        raise error
+                    logger.error(f"Candidate failed: {type(error).__name__}.")
+                elif is_valid(task.result()):
+                    return task.result()
+                if launched < budget:
+                    launch_candidate()
+        return None
+    finally:
+        # 取消其余的候选，并等待取消完成，避免遗留未完成的请求。
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,241 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/agnostic_utils/http_client_registry.py
+
+References:
+    https://www.python-httpx.org/advanced/resource-limits/
+    https://www.python-httpx.org/http2/
+
+Synopsis:
+    进程内共享的 httpx client 。
+
+Notes:
+    每个 ChatOpenAI 和 OpenAI client 默认都会构建自己的 httpx client 和连接池。
+    在 MAS 中，会有几十个连接池，并且重复进行 TLS 握手。
+
+    HttpClientRegistry 以 (base_url, api_key 的 hash) 为 key ，共享同步和异步的 httpx client 。
+        - 连接池: 按 configure 中的 max_connections, max_keepalive_connections, keepalive_expiry 设置。
+            默认值与 OpenAI SDK 和 langchain_openai 的默认 client 相同 (1000, 100, 5 秒) ，不降低吞吐量。
+        - TCP keepalive: 与 langchain_openai 相同，默认开启，尽早发现无响应的连接。
+            环境变量中配置了代理 (HTTP_PROXY 等) 时不设置，保留 httpx 对环境变量中的代理的支持。
+        - HTTP/2: 需要可选依赖 h2 。没有安装时使用 HTTP/1.1 。
+            ```shell
+            pip install -U "httpx[http2]"
+            ```
+        - 关闭: 进程退出时关闭同步的 client 。异步的 client 需要在事件循环中调用 aclose_all 。
+
+    注意:
+        - 使用 openai_proxy (model_configs 中指定，或环境变量 OPENAI_PROXY) 时，ChatOpenAI 不接受 http_client 。
+            此时 get_openai_client_kwargs 不返回共享的 client ，由 ChatOpenAI 自行构建带代理的 client 。
+        - 异步的 client 的连接属于创建连接的事件循环。应在同一个长期运行的事件循环中使用。
+            多次使用 asyncio.run 时，在每次结束前调用 aclose_all 。
+        - 不记录 api_key ，key 中仅使用 hash 。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+import atexit
+import hashlib
+import os
+import socket
+import sys
+import threading
+import urllib.request
+
+import httpx
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+from typing import TYPE_CHECKING
+# if TYPE_CHECKING:
+
+
+class HttpClientRegistry:
+    """
+    工具类，进程内共享的 httpx client 。
+
+    主要方法:
+        - get_client: 获取共享的同步 client 。
+        - get_async_client: 获取共享的异步 client 。
+        - configure: 设置之后创建的 client 的连接池和协议。
+        - get_openai_client_kwargs: OpenAI SDK 和 ChatOpenAI 构建时使用的参数。
+        - close_all / aclose_all: 关闭全部的 client 。
+    """
+
+    max_connections: int | None = 1000
+    max_keepalive_connections: int | None = 100
+    keepalive_expiry: float | None = 5.0
+    timeout: float | None = 600.0
+    http2: bool = False
+    is_tcp_keepalive: bool = True
+
+    _clients: dict[tuple[str, str], httpx.Client] = {}
+    _async_clients: dict[tuple[str, str], httpx.AsyncClient] = {}
+    _lock = threading.Lock()
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def configure(
+        max_connections: int | None = 1000,
+        max_keepalive_connections: int | None = 100,
+        keepalive_expiry: float | None = 5.0,
+        timeout: float | None = 600.0,
+        http2: bool = False,
+        is_tcp_keepalive: bool = True,
+    ) -> None:
+        """
+        设置之后创建的 client 。已经创建的 client 不受影响。
+
+        Args:
+            max_connections (int, optional): 每个 client 的最大连接数。None 为不限制。
+            max_keepalive_connections (int, optional): 每个 client 保持的空闲连接数。
+            keepalive_expiry (float, optional): 空闲连接的保持时间 (秒) 。
+            timeout (float, optional): 默认的请求超时 (秒) 。OpenAI SDK 会按自己的设置覆盖。
+            http2 (bool): 是否使用 HTTP/2 。需要安装 h2 。
+            is_tcp_keepalive (bool): 是否设置 TCP keepalive 。环境变量中配置了代理时不设置。
+        """
+        if http2 and h2 is None:
+            logger.warning("h2 is not installed, falling back to HTTP/1.1.")
+            http2 = False
+        HttpClientRegistry.max_connections = max_connections
+        HttpClientRegistry.max_keepalive_connections = max_keepalive_connections
+        HttpClientRegistry.keepalive_expiry = keepalive_expiry
+        HttpClientRegistry.timeout = timeout
+        HttpClientRegistry.http2 = http2
+        HttpClientRegistry.is_tcp_keepalive = is_tcp_keepalive
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def get_client(
+        base_url: str | None = None,
+        api_key: str | None = None,
+    ) -> httpx.Client:
+        """获取 (base_url, api_key) 对应的共享的同步 client 。不存在时创建。"""
+        key = HttpClientRegistry.make_key(base_url=base_url, api_key=api_key)
+        with HttpClientRegistry._lock:
+            client = HttpClientRegistry._clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.Client(**HttpClientRegistry._get_client_kwargs(is_async=False))
+                HttpClientRegistry._clients[key] = client
+                logger.debug(f"Created shared http client for {key[0]}.")
+            return client
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def get_async_client(
+        base_url: str | None = None,
+        api_key: str | None = None,
+    ) -> httpx.AsyncClient:
+        """获取 (base_url, api_key) 对应的共享的异步 client 。不存在时创建。"""
+        key = HttpClientRegistry.make_key(base_url=base_url, api_key=api_key)
+        with HttpClientRegistry._lock:
+            client = HttpClientRegistry._async_clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(**HttpClientRegistry._get_client_kwargs(is_async=True))
+                HttpClientRegistry._async_clients[key] = client
+                logger.debug(f"Created shared async http client for {key[0]}.")
+            return client
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def get_openai_client_kwargs(
+        base_url: str | None = None,
+        api_key: str | None = None,
+        model_configs: dict | None = None,
+    ) -> dict[str, httpx.Client | httpx.AsyncClient]:
+        """
+        ChatOpenAI 构建时使用的 http_client 和 http_async_client 。
+
+        使用 openai_proxy 时为空，ChatOpenAI 不接受同时指定 openai_proxy 和 http_client 。
+
+        Args:
+            base_url (str, optional): 服务的地址。
+            api_key (str, optional): 密钥。仅以 hash 区分 client 。
+            model_configs (dict, optional): ChatOpenAI 的其他参数。用于判断是否指定了 openai_proxy 。
+        """
+        if (model_configs or {}).get('openai_proxy') or os.environ.get('OPENAI_PROXY'):
+            logger.debug("openai_proxy is set, not sharing http clients.")
+            return {}
+        return {
+            'http_client': HttpClientRegistry.get_client(base_url=base_url, api_key=api_key),
+            'http_async_client': HttpClientRegistry.get_async_client(base_url=base_url, api_key=api_key),
+        }
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def close_all() -> None:
+        """关闭全部的同步 client 。进程退出时自动调用。"""
+        with HttpClientRegistry._lock:
+            clients = list(HttpClientRegistry._clients.values())
+            HttpClientRegistry._clients.clear()
+        for client in clients:
+            client.close()
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    async def aclose_all() -> None:
+        """关闭全部的异步 client 。需要在使用这些 client 的事件循环中调用。"""
+        with HttpClientRegistry._lock:
+            clients = list(HttpClientRegistry._async_clients.values())
+            HttpClientRegistry._async_clients.clear()
+        for client in clients:
+            await client.aclose()
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def make_key(
+        base_url: str | None = None,
+        api_key: str | None = None,
+    ) -> tuple[str, str]:
+        """(base_url, api_key 的 hash) 。"""
+        api_key_hash = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+        return base_url or 'default', api_key_hash
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def get_socket_options() -> list[tuple[int, int, int]]:
+        """TCP keepalive 的 socket 选项。与 langchain_openai 的默认值相同: 空闲 60 秒后探测，间隔 10 秒，3 次，最长 120 秒无响应。"""
+        socket_options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        if sys.platform in ('linux', 'darwin'):
+            for option_name, value in (
+                ('TCP_KEEPIDLE', 60),
+                ('TCP_KEEPINTVL', 10),
+                ('TCP_KEEPCNT', 3),
+                ('TCP_USER_TIMEOUT', 120_000),
+            ):
+                if hasattr(socket, option_name):
+                    socket_options.append((socket.IPPROTO_TCP, getattr(socket, option_name), value))
+        return socket_options
+
+    # ==== 内部方法。 ====
+    @staticmethod
+    def _get_client_kwargs(
+        is_async: bool,
+    ) -> dict:
+        limits = httpx.Limits(
+            max_connections=HttpClientRegistry.max_connections,
+            max_keepalive_connections=HttpClientRegistry.max_keepalive_connections,
+            keepalive_expiry=HttpClientRegistry.keepalive_expiry,
+        )
+        client_kwargs = dict(
+            timeout=HttpClientRegistry.timeout,
+            follow_redirects=True,
+        )
+        # 指定 transport 时 httpx 不读取环境变量中的代理。
+        if HttpClientRegistry.is_tcp_keepalive and not urllib.request.getproxies():
+            transport_class = httpx.AsyncHTTPTransport if is_async else httpx.HTTPTransport
+            client_kwargs['transport'] = transport_class(
+                limits=limits,
+                http2=HttpClientRegistry.http2,
+                socket_options=HttpClientRegistry.get_socket_options(),
+            )
+        else:
+            client_kwargs.update(limits=limits, http2=HttpClientRegistry.http2)
+        return client_kwargs
+
+
+atexit.register(HttpClientRegistry.close_all)
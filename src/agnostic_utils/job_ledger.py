@@ -0,0 +1,219 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/agnostic_utils/job_ledger.py
+
+References:
+    https://www.sqlite.org/wal.html
+
+Synopsis:
+    ProcessManager 的任务的持久记录。监管进程重启后跳过已经完成的任务。
+
+Notes:
+    run_process_with_restart 不保存任何状态。监管进程崩溃或被中断后，500 个任务的实验需要全部重新运行。
+
+    JobLedger:
+        - 以 SQLite 文件 (WAL 模式) 记录每个任务的状态、运行次数、退出码、时间和日志文件的位置。
+            - jobs: 每个任务一行。status 为 'pending', 'running', 'succeeded', 'failed' 。
+            - attempts: 每次运行一行。
+        - 任务以 args 、cwd 、env 的内容的 hash 为 key ，输入中重复的任务只运行一次。
+        - ProcessManager.arun_jobs(..., job_ledger=...) :
+            - 已经 'succeeded' 的任务不再运行，产出 'skipped' 事件。
+            - 其余的任务 (包括上次中断时 'running' 的和 'failed' 的) 重新运行。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from typing import TYPE_CHECKING, NamedTuple
+if TYPE_CHECKING:
+    from src.agnostic_utils.process_manager import ProcessEvent, ProcessJob
+
+
+class JobRecord(NamedTuple):
+    """
+    一个任务的记录。
+
+    Attributes:
+        job_key (str): 任务的内容的 hash 。
+        name (str): 任务的名字。
+        status (str): 'pending', 'running', 'succeeded', 'failed' 。
+        attempts (int): 全部的运行次数，包括之前的监管进程。
+        returncode (int, optional): 最后一次运行的退出码。
+        reason (str, optional): 最后一次运行失败的原因。
+        total_duration (float): 全部运行的时间的和 (秒) 。
+        log_path (str, optional): 日志文件的位置。
+        updated_at (float): time.time() 。
+    """
+
+    job_key: str
+    name: str
+    status: str
+    attempts: int
+    returncode: int | None
+    reason: str | None
+    total_duration: float
+    log_path: str | None
+    updated_at: float
+
+
+class JobLedger:
+    """
+    以 SQLite 文件持久记录任务的状态。
+
+    主要方法:
+        - register: 添加任务。已经存在的任务保留原本的状态。
+        - record_event: 按 ProcessEvent 更新状态。
+        - get_record / get_records: 查询。
+        - make_job_key: 任务的内容的 hash 。
+    """
+
+    def __init__(
+        self,
+        db_path: str | Path,
+    ):
+        """
+        Args:
+            db_path (Union[str, Path]): SQLite 文件的路径。重启的监管进程使用同一个路径。
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'job_key TEXT PRIMARY KEY, name TEXT NOT NULL, args TEXT NOT NULL, status TEXT NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, returncode INTEGER, reason TEXT, '
+            'total_duration REAL NOT NULL DEFAULT 0, log_path TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS attempts ('
+            'job_key TEXT NOT NULL, attempt INTEGER NOT NULL, pid INTEGER, returncode INTEGER, reason TEXT, '
+            'duration REAL, started_at REAL NOT NULL, exited_at REAL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS attempts_job_key ON attempts (job_key)')
+
+    # ==== 主要方法。 ====
+    def register(
+        self,
+        job: ProcessJob,
+    ) -> JobRecord:
+        """添加任务。已经存在时不改变原本的状态。"""
+        job_key = JobLedger.make_job_key(job)
+        now = time.time()
+        self._connection.execute(
+            'INSERT OR IGNORE INTO jobs (job_key, name, args, status, log_path, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_key, job.display_name, json.dumps(job.args, ensure_ascii=False, default=str), 'pending', job.log_path, now, now),
+        )
+        return self.get_record(job_key)
+
+    # ==== 主要方法。 ====
+    def record_event(
+        self,
+        event: ProcessEvent,
+    ) -> None:
+        """按 arun_jobs 的事件更新任务和运行的记录。"""
+        job_key = JobLedger.make_job_key(event.job)
+        now = time.time()
+        # 同一个事件的多个更新在一个事务中完成。
+        self._connection.execute('BEGIN')
+        try:
+            if event.kind == 'started':
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE job_key = ?",
+                    (now, job_key),
+                )
+                self._connection.execute(
+                    'INSERT INTO attempts (job_key, attempt, pid, started_at) VALUES (?, ?, ?, ?)',
+                    (job_key, event.attempt, event.pid, now),
+                )
+            elif event.kind == 'exited':
+                if event.pid is None:
+                    # 无法启动，没有 'started' 事件。
+                    self._connection.execute(
+                        'UPDATE jobs SET attempts = attempts + 1 WHERE job_key = ?', (job_key,),
+                    )
+                    self._connection.execute(
+                        'INSERT INTO attempts (job_key, attempt, started_at) VALUES (?, ?, ?)',
+                        (job_key, event.attempt, now),
+                    )
+                self._connection.execute(
+                    'UPDATE jobs SET returncode = ?, reason = ?, total_duration = total_duration + ?, updated_at = ? '
+                    'WHERE job_key = ?',
+                    (event.returncode, event.reason, event.duration, now, job_key),
+                )
+                self._connection.execute(
+                    'UPDATE attempts SET returncode = ?, reason = ?, duration = ?, exited_at = ? '
+                    'WHERE rowid = (SELECT MAX(rowid) FROM attempts WHERE job_key = ?)',
+                    (event.returncode, event.reason, event.duration, now, job_key),
+                )
+            elif event.kind in ('succeeded', 'failed'):
+                self._connection.execute(
+                    'UPDATE jobs SET status = ?, updated_at = ? WHERE job_key = ?',
+                    (event.kind, now, job_key),
+                )
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._connection.execute('COMMIT')
+
+    # ==== 主要方法。 ====
+    def get_record(
+        self,
+        job_key: str,
+    ) -> JobRecord | None:
+        row = self._connection.execute(
+            f'SELECT {", ".join(JobRecord._fields)} FROM jobs WHERE job_key = ?', (job_key,)
+        ).fetchone()
+        return JobRecord(*row) if row is not None else None
+
+    # ==== 主要方法。 ====
+    def get_records(
+        self,
+        status: str | None = None,
+    ) -> list[JobRecord]:
+        """全部的记录，或指定 status 的记录。按添加的顺序。"""
+        query = f'SELECT {", ".join(JobRecord._fields)} FROM jobs'
+        if status is None:
+            rows = self._connection.execute(query + ' ORDER BY created_at, rowid').fetchall()
+        else:
+            rows = self._connection.execute(query + ' WHERE status = ? ORDER BY created_at, rowid', (status,)).fetchall()
+        return [JobRecord(*row) for row in rows]
+
+    # ==== 主要方法。 ====
+    def get_attempts(
+        self,
+        job_key: str,
+    ) -> list[tuple]:
+        """任务的每次运行: (attempt, pid, returncode, reason, duration, started_at, exited_at) 。"""
+        return self._connection.execute(
+            'SELECT attempt, pid, returncode, reason, duration, started_at, exited_at FROM attempts '
+            'WHERE job_key = ? ORDER BY rowid',
+            (job_key,),
+        ).fetchall()
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def make_job_key(
+        job: ProcessJob,
+    ) -> str:
+        """
+        args 、cwd 、env 的 sha256 。名字、超时和资源的设置不影响 key 。
+
+        与 subprocess 一致，args 和 cwd 可以是 pathlib.Path ，以 str 计算，与相同路径的 str 的 key 相同。
+        """
+        content = json.dumps(
+            [job.args, job.cwd, sorted((job.env or {}).items())],
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def close(self) -> None:
+        self._connection.close()
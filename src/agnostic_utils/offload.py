@@ -0,0 +1,300 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/agnostic_utils/offload.py
+
+References:
+    https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.loop.run_in_executor
+    https://docs.python.org/3/library/concurrent.futures.html
+
+Synopsis:
+    将同步的计算放到命名的、有上限的线程池或进程池中运行，不阻塞事件循环。
+
+Notes:
+    agent 在事件循环中运行。json_repair 、pydantic 检验、图片的 base64 编码等同步的计算会阻塞事件循环，
+    期间全部的请求都无法处理响应。
+
+    OffloadPool:
+        - 命名的池: 按用途隔离，大量的解析不会占满其他用途的池。默认的池:
+            - 'default': 线程池。一般的同步调用，例如文件读写。
+            - 'parsing': 线程池。json 的解析和修复、pydantic 检验。
+            - 'cpu': 进程池。不受 GIL 限制的 CPU 密集计算。函数、参数和结果需要可以 pickle 。
+        - 有上限: max_workers 限制同时运行的数量，max_pending 限制每个事件循环中已提交但未完成的数量。
+            超过 max_pending 时，提交者异步等待，而不是在池的队列中无限堆积。
+        - 指标: get_metrics 返回等待的数量 (queued) 、未完成的数量 (pending) 等。
+
+    offload 装饰器:
+        将同步函数转换为在指定的池中运行的异步函数。原本的同步函数保留为 __wrapped__ 。
+        进程池按名字 pickle 函数，被装饰的名字指向的是异步函数。进程池应直接使用 OffloadPool.get('cpu').run(func) 。
+
+    注意:
+        - 线程池中的纯 python 计算仍然受 GIL 限制，但事件循环可以在计算期间切换，处理其他请求的响应。
+        - 进程退出时关闭全部的池。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+import asyncio
+import atexit
+import functools
+import os
+import threading
+import time
+import weakref
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Literal, TypeVar
+# if TYPE_CHECKING:
+
+T = TypeVar('T')
+
+_CPU_COUNT = os.cpu_count() or 1
+
+
+class OffloadPool:
+    """
+    命名的、有上限的线程池或进程池。
+
+    主要方法:
+        - run: 在池中运行同步函数，异步等待结果。
+        - get: 按名字获取共享的池。
+        - configure: 添加或替换命名的池。
+        - get_metrics: 池的指标。
+
+    状态:
+        - stats (Counter): 'submitted', 'completed', 'failed', 'run_seconds', 'throttled' 。
+    """
+
+    # 默认的池: name -> (kind, max_workers, max_pending)
+    DEFAULT_POOL_CONFIGS: dict[str, tuple[Literal['thread', 'process'], int, int | None]] = {
+        'default': ('thread', min(32, _CPU_COUNT + 4), None),
+        'parsing': ('thread', _CPU_COUNT, _CPU_COUNT * 16),
+        'cpu': ('process', _CPU_COUNT, _CPU_COUNT * 16),
+    }
+
+    _pools: dict[str, OffloadPool] = {}
+    _lock = threading.Lock()
+
+    def __init__(
+        self,
+        name: str,
+        kind: Literal['thread', 'process'] = 'thread',
+        max_workers: int = 4,
+        max_pending: int | None = None,
+    ):
+        """
+        Args:
+            name (str): 池的名字。也用于线程的名字前缀。
+            kind (Literal['thread', 'process']): 线程池或进程池。
+            max_workers (int): 同时运行的数量。
+            max_pending (int, optional): 每个事件循环中已提交但未完成的数量的上限。None 为不限制。
+        """
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"未知的池的类型: {kind} 。")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.stats: Counter[str] = Counter()
+        self._pending = 0
+        self._peak_pending = 0
+        self._stats_lock = threading.Lock()
+        # 进程池在第一次使用时创建，避免导入时启动进程。
+        self._executor: Executor | None = None
+        self._executor_lock = threading.Lock()
+        # 限制 max_pending 的 semaphore 。每个事件循环一个。
+        self._semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+
+    # ==== 主要方法。 ====
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args,
+        **kwargs,
+    ) -> T:
+        """
+        在池中运行 func(*args, **kwargs) ，异步等待结果。
+
+        Returns:
+            T: func 的结果。异常会重新抛出。
+        """
+        semaphore = self._get_semaphore()
+        if semaphore is None:
+            return await self._submit(func, *args, **kwargs)
+        if semaphore.locked():
+            self.stats['throttled'] += 1
+        async with semaphore:
+            return await self._submit(func, *args, **kwargs)
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def get(
+        name: str = 'default',
+    ) -> OffloadPool:
+        """按名字获取共享的池。默认的池在第一次使用时按 DEFAULT_POOL_CONFIGS 创建。"""
+        with OffloadPool._lock:
+            pool = OffloadPool._pools.get(name)
+            if pool is None:
+                if name not in OffloadPool.DEFAULT_POOL_CONFIGS:
+                    raise KeyError(f"未知的池: {name} 。需要先调用 OffloadPool.configure 。")
+                kind, max_workers, max_pending = OffloadPool.DEFAULT_POOL_CONFIGS[name]
+                pool = OffloadPool(name=name, kind=kind, max_workers=max_workers, max_pending=max_pending)
+                OffloadPool._pools[name] = pool
+            return pool
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def configure(
+        name: str,
+        kind: Literal['thread', 'process'] = 'thread',
+        max_workers: int = 4,
+        max_pending: int | None = None,
+    ) -> OffloadPool:
+        """添加或替换命名的池。被替换的池在已提交的任务完成后关闭。"""
+        pool = OffloadPool(name=name, kind=kind, max_workers=max_workers, max_pending=max_pending)
+        with OffloadPool._lock:
+            old_pool = OffloadPool._pools.get(name)
+            OffloadPool._pools[name] = pool
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+        return pool
+
+    # ==== 主要方法。 ====
+    def get_metrics(self) -> dict:
+        """
+        池的指标。
+
+        Returns:
+            dict:
+                - pending: 已提交但未完成的数量。
+                - queued: 其中等待 worker 的数量，即队列的深度。
+                - peak_pending: pending 的最大值。
+                - 以及 stats 。
+        """
+        with self._stats_lock:
+            pending = self._pending
+            peak_pending = self._peak_pending
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'max_workers': self.max_workers,
+            'pending': pending,
+            'queued': max(0, pending - self.max_workers),
+            'peak_pending': peak_pending,
+            **self.stats,
+        }
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def get_all_metrics() -> dict[str, dict]:
+        """全部已经创建的池的指标。"""
+        with OffloadPool._lock:
+            pools = list(OffloadPool._pools.values())
+        return {pool.name: pool.get_metrics() for pool in pools}
+
+    # ==== 工具方法。 ====
+    def shutdown(
+        self,
+        wait: bool = True,
+    ) -> None:
+        """关闭池。"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def shutdown_all(
+        wait: bool = True,
+    ) -> None:
+        """关闭全部的池。进程退出时自动调用。"""
+        with OffloadPool._lock:
+            pools = list(OffloadPool._pools.values())
+            OffloadPool._pools.clear()
+        for pool in pools:
+            pool.shutdown(wait=wait)
+
+    # ==== 内部方法。 ====
+    async def _submit(
+        self,
+        func: Callable[..., T],
+        *args,
+        **kwargs,
+    ) -> T:
+        loop = asyncio.get_running_loop()
+        self._change_pending(1)
+        start = time.monotonic()
+        try:
+            result = await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self.stats['failed'] += 1
+            raise
+        else:
+            self.stats['completed'] += 1
+            return result
+        finally:
+            self.stats['run_seconds'] += time.monotonic() - start
+            self._change_pending(-1)
+
+    def _change_pending(
+        self,
+        delta: int,
+    ) -> None:
+        with self._stats_lock:
+            if delta > 0:
+                self.stats['submitted'] += delta
+            self._pending += delta
+            self._peak_pending = max(self._peak_pending, self._pending)
+
+    def _get_executor(self) -> Executor:
+        with self._executor_lock:
+            if self._executor is None:
+                if self.kind == 'thread':
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"offload-{self.name}")
+                else:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                logger.debug(f"Created {self.kind} pool {self.name} with {self.max_workers} workers.")
+            return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore | None:
+        if self.max_pending is None:
+            return None
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_pending)
+        return semaphore
+
+
+def offload(
+    pool_name: str = 'default',
+) -> Callable[[Callable[..., T]], Callable[..., Awaitable[T]]]:
+    """
+    装饰器，将同步函数转换为在指定的池中运行的异步函数。
+
+    示例:
+        @offload('parsing')
+        def parse(raw_str: str) -> dict:
+            return json_repair.loads(raw_str)
+
+        structured_data = await parse(raw_str)
+
+    Args:
+        pool_name (str): 池的名字，见 OffloadPool 。
+
+    Returns:
+        Callable: 装饰器。被装饰的函数的同步版本为 __wrapped__ 。
+    """
+    def decorator(sync_func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(sync_func)
+        async def wrapper(*args, **kwargs) -> T:
+            return await OffloadPool.get(pool_name).run(sync_func, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+atexit.register(OffloadPool.shutdown_all, wait=False)
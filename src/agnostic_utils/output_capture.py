@@ -0,0 +1,299 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/agnostic_utils/output_capture.py
+
+References:
+    https://docs.python.org/3/library/asyncio-stream.html#streamreader
+
+Synopsis:
+    子进程输出的流式捕获: 有上限的环形缓冲，可选的写入文件和轮转，实时的回调。
+
+Notes:
+    subprocess.run(capture_output=True) 在子进程退出前把全部的输出保存在内存中，并且在退出前看不到任何输出。
+    长时间运行的实验的输出可能有几个 GB 。
+
+    ProcessOutputCapture:
+        - 按行读取 stdout 和 stderr 。没有换行的超长输出按 max_line_chars 切分，内存与输出的长度无关。
+            与 subprocess.run(text=True) 一致，'\r\n' 和 '\r' 视为换行。
+            缓冲记录每一段是否以换行结束，get_text 还原原本的文本，切分的位置不插入换行。
+        - 环形缓冲: 每个流保留最后的 max_lines 行，以及最多 max_chars 个字符。都为 None 时保留全部的输出。
+            丢弃的行数见 OutputRingBuffer.dropped_lines 。
+        - 写入文件: 指定 log_path 时，全部的行写入文件，超过 max_log_bytes 时轮转，保留 backup_count 个旧文件。
+            与 logging.handlers.RotatingFileHandler 的命名相同: log.txt, log.txt.1, log.txt.2, ...
+        - 回调: on_line(stream_name, line) ，用于实时转发日志。回调的异常会被记录，不影响捕获。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+import codecs
+import io
+import os
+from collections import deque
+from pathlib import Path
+
+from typing import TYPE_CHECKING, Callable
+if TYPE_CHECKING:
+    import asyncio
+
+# 读取子进程输出的块大小。
+_READ_CHUNK_SIZE = 65536
+
+
+class OutputRingBuffer:
+    """
+    保留最后若干行的缓冲。同时限制行数和字符数。
+
+    状态:
+        - total_lines (int): 写入过的全部行数。
+        - dropped_lines (int): 因为超过上限而丢弃的行数。
+    """
+
+    def __init__(
+        self,
+        max_lines: int | None = 1000,
+        max_chars: int | None = 1_000_000,
+    ):
+        """
+        Args:
+            max_lines (int, optional): 最多保留的行数。None 为不限制行数。
+            max_chars (int, optional): 最多保留的字符数。None 为不限制字符数。
+        """
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.total_lines = 0
+        self.dropped_lines = 0
+        self._lines: deque[str] = deque()
+        # 每一段是否以换行结束。超长的行被切分的部分和最后没有换行的输出为 False 。
+        self._is_line_ends: deque[bool] = deque()
+        self._num_chars = 0
+
+    def append(
+        self,
+        line: str,
+        is_line_end: bool = True,
+    ) -> None:
+        """
+        Args:
+            line (str): 一行，不包含换行。
+            is_line_end (bool): 原本的输出中，这一段之后是否有换行。
+        """
+        self.total_lines += 1
+        self._lines.append(line)
+        self._is_line_ends.append(is_line_end)
+        self._num_chars += len(line)
+        while self._lines and (
+            (self.max_lines is not None and len(self._lines) > self.max_lines)
+            or (self.max_chars is not None and self._num_chars > self.max_chars)
+        ):
+            self._num_chars -= len(self._lines.popleft())
+            self._is_line_ends.popleft()
+            self.dropped_lines += 1
+
+    def get_lines(
+        self,
+        last_n: int | None = None,
+    ) -> list[str]:
+        """最后 last_n 行。默认为全部保留的行。"""
+        if last_n is None or last_n >= len(self._lines):
+            return list(self._lines)
+        return list(self._lines)[-last_n:] if last_n > 0 else []
+
+    def get_text(self) -> str:
+        """保留的输出的原本的文本。没有丢弃时与 subprocess.run(text=True) 的输出相同。"""
+        return ''.join(
+            line + '\n' if is_line_end else line
+            for line, is_line_end in zip(self._lines, self._is_line_ends)
+        )
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+
+class RotatingLogFile:
+    """
+    按大小轮转的日志文件。
+
+    文件在第一次写入时打开。需要调用 close 。
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_bytes: int = 100 * 1024 * 1024,
+        backup_count: int = 3,
+    ):
+        """
+        Args:
+            path (Union[str, Path]): 日志文件的路径。已经存在时追加。
+            max_bytes (int): 单个文件的最大字节数。
+            backup_count (int): 保留的旧文件的数量。0 为超过时清空。
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file = None
+        self._num_bytes = 0
+
+    def write_line(
+        self,
+        line: str,
+    ) -> None:
+        data = (line + '\n').encode('utf-8', errors='replace')
+        if self._file is None:
+            self._open()
+        if self._num_bytes and self._num_bytes + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._num_bytes += len(data)
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ==== 内部方法。 ====
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'ab')
+        self._num_bytes = self._file.tell()
+
+    def _rotate(self) -> None:
+        self.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                source = self.path.with_name(f"{self.path.name}.{i}")
+                if source.exists():
+                    os.replace(source, self.path.with_name(f"{self.path.name}.{i + 1}"))
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink(missing_ok=True)
+        self._open()
+
+
+class ProcessOutputCapture:
+    """
+    一个子进程的 stdout 和 stderr 的捕获。
+
+    主要方法:
+        - afeed: 读取一个流直至结束。
+        - feed_line: 写入一行。
+        - get_tail: stdout 和 stderr 按到达顺序的最后若干行。
+        - close: 关闭日志文件。
+
+    状态:
+        - buffers (dict[str, OutputRingBuffer]): 'stdout', 'stderr' 的缓冲。
+        - log_path (Path, optional): 日志文件的路径。
+    """
+
+    def __init__(
+        self,
+        max_lines: int | None = 1000,
+        max_chars: int | None = 1_000_000,
+        max_line_chars: int = 65536,
+        tail_lines: int = 20,
+        log_path: str | Path | None = None,
+        max_log_bytes: int = 100 * 1024 * 1024,
+        backup_count: int = 3,
+        on_line: Callable[[str, str], None] | None = None,
+    ):
+        """
+        Args:
+            max_lines (int, optional): 每个流的缓冲最多保留的行数。None 为不限制。
+            max_chars (int, optional): 每个流的缓冲最多保留的字符数。None 为不限制。
+            max_line_chars (int): 单行的最大字符数。没有换行的输出按这个长度切分。
+            tail_lines (int): get_tail 保留的 stdout 和 stderr 合并的行数。
+            log_path (Union[str, Path], optional): 日志文件的路径。stdout 和 stderr 写入同一个文件，stderr 的行以 '[stderr] ' 开头。
+            max_log_bytes (int): 日志文件轮转的大小。
+            backup_count (int): 保留的旧日志文件的数量。
+            on_line (Callable[[str, str], None], optional): 每一行的回调，参数为 (stream_name, line) 。
+        """
+        self.buffers: dict[str, OutputRingBuffer] = {
+            'stdout': OutputRingBuffer(max_lines=max_lines, max_chars=max_chars),
+            'stderr': OutputRingBuffer(max_lines=max_lines, max_chars=max_chars),
+        }
+        self.max_line_chars = max_line_chars
+        self.log_path = Path(log_path) if log_path is not None else None
+        self.on_line = on_line
+        self._tail: deque[str] = deque(maxlen=tail_lines)
+        self._log_file = None
+        if self.log_path is not None:
+            self._log_file = RotatingLogFile(path=self.log_path, max_bytes=max_log_bytes, backup_count=backup_count)
+
+    @property
+    def stdout(self) -> OutputRingBuffer:
+        return self.buffers['stdout']
+
+    @property
+    def stderr(self) -> OutputRingBuffer:
+        return self.buffers['stderr']
+
+    # ==== 主要方法。 ====
+    async def afeed(
+        self,
+        stream_name: str,
+        stream: asyncio.StreamReader,
+        on_activity: Callable[[], None] | None = None,
+    ) -> None:
+        """
+        按块读取 stream 直至结束，按行写入。
+
+        Args:
+            stream_name (str): 'stdout' 或 'stderr' 。
+            stream (asyncio.StreamReader): 子进程的输出。
+            on_activity (Callable[[], None], optional): 每次读取到输出时调用。用于 idle_timeout 。
+        """
+        partial = ''
+        # 增量解码，避免多字节的字符和 '\r\n' 被块的边界截断。换行的转换与 subprocess.run(text=True) 一致。
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(errors='replace'), translate=True)
+        while True:
+            chunk = await stream.read(_READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            if on_activity is not None:
+                on_activity()
+            *lines, partial = (partial + decoder.decode(chunk)).split('\n')
+            for line in lines:
+                self.feed_line(stream_name=stream_name, line=line)
+            while len(partial) > self.max_line_chars:
+                self.feed_line(stream_name=stream_name, line=partial[:self.max_line_chars], is_line_end=False)
+                partial = partial[self.max_line_chars:]
+        *lines, partial = (partial + decoder.decode(b'', final=True)).split('\n')
+        for line in lines:
+            self.feed_line(stream_name=stream_name, line=line)
+        if partial:
+            self.feed_line(stream_name=stream_name, line=partial, is_line_end=False)
+        if self._log_file is not None:
+            self._log_file.flush()
+
+    # ==== 主要方法。 ====
+    def feed_line(
+        self,
+        stream_name: str,
+        line: str,
+        is_line_end: bool = True,
+    ) -> None:
+        """写入一行: 缓冲、日志文件、回调。is_line_end 见 OutputRingBuffer.append 。"""
+        self.buffers[stream_name].append(line, is_line_end=is_line_end)
+        self._tail.append(line)
+        if self._log_file is not None:
+            self._log_file.write_line(line if stream_name == 'stdout' else f"[{stream_name}] {line}")
+        if self.on_line is not None:
+            try:
+                self.on_line(stream_name, line)
+            except Exception as e:
+                logger.error(f"Output callback failed: {type(e).__name__}: {e}")
+
+    # ==== 主要方法。 ====
+    def get_tail(self) -> tuple[str, ...]:
+        """stdout 和 stderr 按到达顺序的最后 tail_lines 行。"""
+        return tuple(self._tail)
+
+    # ==== 主要方法。 ====
+    def close(self) -> None:
+        if self._log_file is not None:
+            self._log_file.close()
@@ -12,19 +12,134 @@ Notes:
     预期场景:
         - 定时运行任务。
         - 运行可能会中断的实验，需要重启。
+        - 大量的实验脚本 (例如上百个超参数组合) 并行运行。
+
+    arun_jobs:
+        以 asyncio 的子进程实现的非阻塞的监管:
+            - 并行: 同时运行最多 max_workers 个任务。
+            - 重启: 失败的任务按指数退避 (RetryPolicy.compute_delay) 重新排队，最多重启 max_retries 次。
+                退避期间不占用 worker ，其他任务继续运行。
+            - 超时: timeout 为每次运行的总时间，idle_timeout 为没有任何输出的最长时间。超时时先 terminate ，再 kill 。
+                POSIX 下子进程在新的 session 中运行，超时时结束整个进程组。
+            - 结果: 以 ProcessEvent 的流逐个产出，不需要等待全部任务完成。
+        同步的 run_processes_with_restart 、batch_run_process 、run_process_with_time_control 基于 arun_jobs 实现。
+
+    输出:
+        stdout 和 stderr 按行流式读取到 ProcessOutputCapture 的环形缓冲中，内存与子进程的输出的长度无关。
+        可选: ProcessJob.log_path 写入按大小轮转的日志文件，on_output 回调实时转发每一行。
+
+    资源:
+        指定 resource_scheduler 时，按 ProcessJob 的 cpus 和 memory_mb 预留资源后才启动，
+        并在子进程中设置 CPU 亲和性和 rlimit ，监控进程组的内存。见 ResourceScheduler 。
+
+    恢复:
+        指定 job_ledger 时，任务的状态持久记录在 SQLite 文件中。重启的监管进程跳过已经完成的任务，
+        输入中重复的任务只运行一次。见 JobLedger 。
 """
 
 from __future__ import annotations
 from loguru import logger
 
+from src.agnostic_utils.job_ledger import JobLedger
+from src.agnostic_utils.output_capture import ProcessOutputCapture
+from src.agnostic_utils.resource_scheduler import ResourceScheduler
+from src.agnostic_utils.retry_policy import RetryPolicy
+
+import asyncio
+import concurrent.futures
+import os
+import signal
 import subprocess
 import time
 import sys
 import datetime
+import functools
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterable, Literal, NamedTuple
 if TYPE_CHECKING:
     from subprocess import CompletedProcess
+    from src.agnostic_utils.resource_scheduler import ResourceReservation
+
+# 超时后，terminate 到 kill 之间等待的时间 (秒) 。
+_TERMINATE_GRACE_SECONDS = 5.0
+
+
+class ProcessJob(NamedTuple):
+    """
+    一个需要运行的任务。
+
+    Attributes:
+        args (list[str]): 命令行参数，例如 [sys.executable, 'experiment.py', '--seed', '1'] 。
+        name (str, optional): 日志中使用的名字。默认为 args 。
+        cwd (str, optional): 工作目录。
+        env (dict[str, str], optional): 环境变量。默认继承当前进程。
+        timeout (float, optional): 每次运行的最长时间 (秒) 。
+        idle_timeout (float, optional): 没有任何输出的最长时间 (秒) 。用于发现卡住的进程。
+        log_path (str, optional): 全部输出写入的日志文件。重启时追加。
+        cpus (int): 需要的 CPU 数量。仅在使用 ResourceScheduler 时生效。
+        memory_mb (int, optional): 需要的内存 (MB) 。仅在使用 ResourceScheduler 时生效。
+        cpu_seconds (int, optional): 每次运行的 CPU 时间的上限 (秒) ，即 RLIMIT_CPU 。仅在使用 ResourceScheduler 时生效。
+    """
+
+    args: list[str]
+    name: str | None = None
+    cwd: str | None = None
+    env: dict[str, str] | None = None
+    timeout: float | None = None
+    idle_timeout: float | None = None
+    log_path: str | None = None
+    cpus: int = 1
+    memory_mb: int | None = None
+    cpu_seconds: int | None = None
+
+    @property
+    def display_name(self) -> str:
+        return self.name or ' '.join(map(str, self.args))
+
+
+class ProcessEvent(NamedTuple):
+    """
+    arun_jobs 产出的事件。
+
+    Attributes:
+        kind (str):
+            - 'started': 一次运行开始。
+            - 'exited': 一次运行结束。
+            - 'retrying': 将在 retry_delay 秒后重启。
+            - 'succeeded' / 'failed': 任务的最终结果，每个任务恰好一个。
+            - 'skipped': 使用 job_ledger 时，没有运行的任务的最终结果。reason 为 'completed' (之前已经完成) 或 'duplicate' 。
+        job_index (int): 任务在输入中的序号。
+        job (ProcessJob): 任务。
+        attempt (int): 第几次运行，从 0 开始。
+        pid (int, optional): 子进程的 pid 。
+        returncode (int, optional): 退出码。没有启动或被结束时可能为 None 。
+        reason (str, optional): 失败的原因: 'exit-code', 'timeout', 'idle-timeout', 'spawn-error' ，
+            以及使用 ResourceScheduler 时的 'memory-limit', 'cpu-limit' 。
+        duration (float): 这次运行的时间 (秒) 。
+        retry_delay (float, optional): 'retrying' 的等待时间 (秒) 。
+        output_tail (tuple[str, ...]): stdout 和 stderr 的最后若干行。
+        output (ProcessOutputCapture, optional): 这次运行的输出的缓冲。'exited' 及之后的事件有。
+        peak_rss_mb (float, optional): 进程组的 RSS 的峰值 (MB) 。仅在使用 ResourceScheduler 并支持 /proc 时有。
+        cpu_seconds (float, optional): 进程组最后一次采样的 CPU 时间 (秒) 。同上。
+    """
+
+    kind: Literal['started', 'exited', 'retrying', 'succeeded', 'failed', 'skipped']
+    job_index: int
+    job: ProcessJob
+    attempt: int
+    pid: int | None = None
+    returncode: int | None = None
+    reason: str | None = None
+    duration: float = 0.0
+    retry_delay: float | None = None
+    output_tail: tuple[str, ...] = ()
+    output: ProcessOutputCapture | None = None
+    peak_rss_mb: float | None = None
+    cpu_seconds: float | None = None
+
+    @property
+    def is_final(self) -> bool:
+        return self.kind in ('succeeded', 'failed', 'skipped')
 
 
 class ProcessManager:
@@ -32,8 +147,8 @@ class ProcessManager:
     进程运行管理工具。
 
     实现:
-        - 暂时使用 subprocess.run ，为阻塞执行。
-        - 后续使用 subprocess.Popen ，非阻塞执行并有更具体控制。
+        - run_process: 阻塞执行一个进程，基于 arun_jobs 。
+        - arun_jobs: asyncio 的子进程，非阻塞的并行执行，有重启和超时的控制。
     """
 
     # ====基础方法。====
@@ -41,22 +156,48 @@ class ProcessManager:
     def run_process(
         args: list[str],
         timeout: float | None = None,
+        max_output_lines: int | None = None,
+        max_output_chars: int | None = None,
+        log_path: str | None = None,
+        on_output: Callable[[ProcessJob, str, str], None] | None = None,
     ) -> CompletedProcess[str] | None:
-        try:
-            result = subprocess.run(
-                args=args,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                check=False,
-                timeout=timeout,
-            )
-            return result
-        except FileNotFoundError:
-            print("error: file not found")
-        except Exception as e:
-            print(e)
-        return None
+        """
+        阻塞运行一个进程。
+
+        输出按行流式读取。默认与 subprocess.run 一致，保留完整的 stdout 和 stderr 。
+        输出很长时指定 max_output_lines 或 max_output_chars 仅保留最后的部分，丢弃时记录 warning ，完整的输出可以写入 log_path 。
+        可以在事件循环中调用 (例如 Jupyter) ，此时在新的线程中运行，仍然阻塞直至完成。事件循环中应使用 arun_jobs 。
+
+        Args:
+            max_output_lines (int, optional): stdout 和 stderr 各自保留的最后的行数。默认不限制。
+            max_output_chars (int, optional): stdout 和 stderr 各自保留的最后的字符数。默认不限制。
+
+        Returns:
+            Union[CompletedProcess[str], None]: 运行结果。无法启动或超时时为 None 。
+        """
+        final_event = ProcessManager._run_jobs(
+            jobs=[ProcessJob(args=args, timeout=timeout, log_path=log_path)],
+            max_workers=1,
+            max_retries=0,
+            max_output_lines=max_output_lines,
+            max_output_chars=max_output_chars,
+            on_output=on_output,
+        )[0]
+        if final_event.reason in ('spawn-error', 'timeout'):
+            logger.error(f"{final_event.job.display_name}: {final_event.reason}. {' '.join(final_event.output_tail)}")
+            return None
+        for stream_name, buffer in final_event.output.buffers.items():
+            if buffer.dropped_lines:
+                logger.warning(
+                    f"{final_event.job.display_name}: dropped {buffer.dropped_lines} of {buffer.total_lines} {stream_name} lines."
+                    + (f" Full output in {log_path}." if log_path is not None else '')
+                )
+        return subprocess.CompletedProcess(
+            args=args,
+            returncode=final_event.returncode,
+            stdout=final_event.output.stdout.get_text(),
+            stderr=final_event.output.stderr.get_text(),
+        )
 
     # ====主要方法。====
     @staticmethod
@@ -86,27 +227,439 @@ class ProcessManager:
         timeout: float | None = None,
         max_retries: int = 10,
         retry_interval: int = 3,
-    ):
-        for args in args_list:
-            result = ProcessManager.run_process_with_restart(
-                args=args,
-                timeout=timeout,
-                max_retries=max_retries,
+        max_workers: int | None = None,
+        idle_timeout: float | None = None,
+        ledger_path: str | None = None,
+    ) -> list[ProcessEvent]:
+        """
+        并行运行多个任务，失败时重启。arun_jobs 的同步版本。
+
+        Args:
+            args_list (list[list[str]]): 每个任务的命令行参数。
+            timeout (float, optional): 每次运行的最长时间 (秒) 。
+            max_retries (int): 每个任务最多运行的次数。与 run_process_with_restart 一致。
+            retry_interval (int): 退避的基础时间 (秒) 。
+            max_workers (int, optional): 同时运行的任务数量。默认为 CPU 的数量。
+            idle_timeout (float, optional): 没有任何输出的最长时间 (秒) 。
+            ledger_path (str, optional): JobLedger 的 SQLite 文件。中断后以同样的参数重新运行时，跳过已经完成的任务。
+
+        Returns:
+            list[ProcessEvent]: 与输入顺序一致的每个任务的最终事件。
+        """
+        job_ledger = JobLedger(db_path=ledger_path) if ledger_path is not None else None
+        try:
+            return ProcessManager._run_jobs(
+                jobs=[ProcessJob(args=args, timeout=timeout, idle_timeout=idle_timeout) for args in args_list],
+                max_workers=max_workers,
+                max_retries=max(0, max_retries - 1),
                 retry_interval=retry_interval,
+                job_ledger=job_ledger,
             )
+        finally:
+            if job_ledger is not None:
+                job_ledger.close()
 
+    # ====主要方法。====
     @staticmethod
     def run_process_with_time_control(
+        args: list[str],
+        timeout: float | None = None,
+        idle_timeout: float | None = None,
+    ) -> ProcessEvent:
+        """
+        运行一个任务，超过 timeout 或 idle_timeout 时结束。不重启。
 
-    ):
-        ...
+        Returns:
+            ProcessEvent: 最终事件。超时时 reason 为 'timeout' 或 'idle-timeout' 。
+        """
+        return ProcessManager._run_jobs(
+            jobs=[ProcessJob(args=args, timeout=timeout, idle_timeout=idle_timeout)],
+            max_workers=1,
+            max_retries=0,
+        )[0]
 
+    # ====主要方法。====
     @staticmethod
     def batch_run_process(
+        args_list: list[list[str]],
+        max_workers: int | None = None,
+        timeout: float | None = None,
+        idle_timeout: float | None = None,
+    ) -> list[ProcessEvent]:
+        """
+        并行运行多个任务，不重启。
 
-    ):
-        ...
+        Returns:
+            list[ProcessEvent]: 与输入顺序一致的每个任务的最终事件。
+        """
+        return ProcessManager._run_jobs(
+            jobs=[ProcessJob(args=args, timeout=timeout, idle_timeout=idle_timeout) for args in args_list],
+            max_workers=max_workers,
+            max_retries=0,
+        )
+
+    # ====主要方法。====
+    @staticmethod
+    async def arun_jobs(
+        jobs: Iterable[ProcessJob | list[str]],
+        max_workers: int | None = None,
+        max_retries: int = 3,
+        retry_interval: float = 3.0,
+        output_tail_lines: int = 20,
+        max_output_lines: int | None = 1000,
+        max_output_chars: int | None = 1_000_000,
+        max_log_bytes: int = 100 * 1024 * 1024,
+        log_backup_count: int = 3,
+        on_output: Callable[[ProcessJob, str, str], None] | None = None,
+        resource_scheduler: ResourceScheduler | None = None,
+        job_ledger: JobLedger | None = None,
+    ) -> AsyncIterator[ProcessEvent]:
+        """
+        并行运行多个任务，以事件的流逐个产出结果。
+
+        示例:
+            async for event in ProcessManager.arun_jobs(jobs, max_workers=8):
+                if event.is_final:
+                    logger.info(f"{event.job.display_name}: {event.kind}")
+
+        提前退出 (break) 或外部取消时，结束全部运行中的子进程。
+
+        Args:
+            jobs (Iterable[Union[ProcessJob, list[str]]]): 任务。list[str] 视为 ProcessJob(args=...) 。
+            max_workers (int, optional): 同时运行的任务数量。默认为 CPU 的数量。
+                使用 resource_scheduler 时，默认不限制，由资源决定同时运行的数量。
+            max_retries (int): 每个任务失败后最多重启的次数。
+            retry_interval (float): 退避的基础时间 (秒) 。第 n 次重启前最多等待 retry_interval * 2 ** n 秒。
+            output_tail_lines (int): 事件中保留的输出的最后行数。
+            max_output_lines (int, optional): 每次运行的 stdout 和 stderr 的缓冲各自保留的行数。None 为不限制。
+            max_output_chars (int, optional): 每次运行的 stdout 和 stderr 的缓冲各自保留的字符数。None 为不限制。
+                丢弃的行数见 ProcessEvent.output 的 dropped_lines 。
+            max_log_bytes (int): ProcessJob.log_path 的日志文件轮转的大小。
+            log_backup_count (int): 保留的旧日志文件的数量。
+            on_output (Callable[[ProcessJob, str, str], None], optional): 每一行输出的回调，参数为 (job, stream_name, line) 。
+            resource_scheduler (ResourceScheduler, optional): 按 CPU 和内存调度，并限制子进程的资源。默认不限制。
+            job_ledger (JobLedger, optional): 持久记录任务的状态。已经完成的和重复的任务不运行，产出 'skipped' 。
+
+        Yields:
+            ProcessEvent: 事件。每个任务以一个 'succeeded' 、'failed' 或 'skipped' 结束。
+                运行中未预期的异常 (例如 args 中有不是 str 的值) 产出 reason 为 'spawn-error' 的 'failed' 。
+
+        Raises:
+            Exception: 无法产出事件时 (例如 job_ledger 无法写入) ，抛出该异常并结束全部子进程。
+        """
+        jobs = [job if isinstance(job, ProcessJob) else ProcessJob(args=list(job)) for job in jobs]
+        if not jobs:
+            return
+        if max_workers is None:
+            max_workers = len(jobs) if resource_scheduler is not None else (os.cpu_count() or 1)
+        retry_policy = RetryPolicy(
+            max_attempts=max_retries + 1,
+            base_delay=retry_interval,
+            max_delay=max(60.0, retry_interval),
+        )
+        ready: asyncio.Queue[tuple[int, ProcessJob, int]] = asyncio.Queue()
+        events: asyncio.Queue[ProcessEvent] = asyncio.Queue()
+
+        def emit(event: ProcessEvent) -> None:
+            # 在产生时记录，而不是在产出时，避免消费者较慢时中断丢失状态。
+            if job_ledger is not None:
+                job_ledger.record_event(event)
+            events.put_nowait(event)
+
+        job_keys = set()
+        for job_index, job in enumerate(jobs):
+            if job_ledger is not None:
+                job_key = JobLedger.make_job_key(job)
+                if job_key in job_keys:
+                    emit(ProcessEvent(kind='skipped', job_index=job_index, job=job, attempt=0, reason='duplicate'))
+                    continue
+                job_keys.add(job_key)
+                record = job_ledger.register(job)
+                if record.status == 'succeeded':
+                    emit(ProcessEvent(
+                        kind='skipped',
+                        job_index=job_index,
+                        job=job,
+                        attempt=max(0, record.attempts - 1),
+                        returncode=record.returncode,
+                        reason='completed',
+                        duration=record.total_duration,
+                    ))
+                    continue
+            ready.put_nowait((job_index, job, 0))
+        if job_ledger is not None and job_keys:
+            logger.info(f"Resuming {ready.qsize()} of {len(jobs)} jobs from {job_ledger.db_path}.")
+        retry_tasks: set[asyncio.Task] = set()
+
+        async def requeue(item: tuple[int, ProcessJob, int], delay: float) -> None:
+            await asyncio.sleep(delay)
+            ready.put_nowait(item)
+
+        async def run_attempt(job_index: int, job: ProcessJob, attempt: int) -> None:
+            output = ProcessOutputCapture(
+                max_lines=max_output_lines,
+                max_chars=max_output_chars,
+                tail_lines=output_tail_lines,
+                log_path=job.log_path,
+                max_log_bytes=max_log_bytes,
+                backup_count=log_backup_count,
+                on_line=functools.partial(on_output, job) if on_output is not None else None,
+            )
+            reservation = None
+            try:
+                if resource_scheduler is not None:
+                    reservation = await resource_scheduler.acquire(job)
+                exited = await ProcessManager._arun_attempt(
+                    job_index=job_index,
+                    job=job,
+                    attempt=attempt,
+                    emit=emit,
+                    output=output,
+                    resource_scheduler=resource_scheduler,
+                    reservation=reservation,
+                )
+            finally:
+                output.close()
+                if reservation is not None:
+                    await resource_scheduler.release(reservation)
+            emit(exited)
+            if exited.reason is None:
+                emit(exited._replace(kind='succeeded'))
+            elif attempt < max_retries:
+                delay = retry_policy.compute_delay(attempt=attempt)
+                logger.warning(f"{job.display_name} failed ({exited.reason}), restarting in {delay:.1f}s.")
+                emit(exited._replace(kind='retrying', retry_delay=delay))
+                task = asyncio.create_task(requeue((job_index, job, attempt + 1), delay))
+                retry_tasks.add(task)
+                task.add_done_callback(retry_tasks.discard)
+            else:
+                logger.error(f"{job.display_name} failed ({exited.reason}) after {attempt + 1} attempts.")
+                emit(exited._replace(kind='failed'))
+
+        async def worker() -> None:
+            while True:
+                job_index, job, attempt = await ready.get()
+                try:
+                    await run_attempt(job_index=job_index, job=job, attempt=attempt)
+                except Exception as e:
+                    # 未预期的异常 (例如 args 中有不是 str 的值) : 任务失败，不重启，worker 继续运行。
+                    # emit 本身的异常 (例如 job_ledger 无法写入) 在这里再次抛出，由 next_event 传给消费者。
+                    logger.exception(f"Failed to run {job.display_name}: {e!r}")
+                    emit(ProcessEvent(
+                        kind='failed',
+                        job_index=job_index,
+                        job=job,
+                        attempt=attempt,
+                        reason='spawn-error',
+                        output_tail=(repr(e),),
+                    ))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(max_workers, ready.qsize()))]
+
+        async def next_event() -> ProcessEvent:
+            # 同时等待 worker ，worker 异常结束时抛出它的异常，而不是一直等待不会到来的事件。
+            if not events.empty():
+                return events.get_nowait()
+            get_task = asyncio.ensure_future(events.get())
+            try:
+                await asyncio.wait({get_task, *workers}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not get_task.done():
+                    get_task.cancel()
+            if get_task.done() and not get_task.cancelled():
+                return get_task.result()
+            for task in workers:
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+            raise RuntimeError('All workers of arun_jobs exited before all jobs finished.')
 
+        num_final = 0
+        try:
+            while num_final < len(jobs):
+                event = await next_event()
+                if event.is_final:
+                    num_final += 1
+                yield event
+        finally:
+            # 结束运行中的子进程和等待中的重启。
+            pending = workers + list(retry_tasks)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    # ====内部方法。====
+    @staticmethod
+    def _run_jobs(
+        jobs: list[ProcessJob],
+        max_workers: int | None,
+        max_retries: int,
+        **kwargs,
+    ) -> list[ProcessEvent]:
+        """
+        同步运行 arun_jobs ，返回与输入顺序一致的最终事件。kwargs 为 arun_jobs 的其他参数。
+
+        asyncio.run 不能在运行中的事件循环中调用 (例如 Jupyter) ，此时在新的线程中以新的事件循环运行，调用者阻塞直至完成。
+        """
+        async def collect() -> list[ProcessEvent]:
+            final_events: list[ProcessEvent | None] = [None] * len(jobs)
+            async for event in ProcessManager.arun_jobs(
+                jobs=jobs,
+                max_workers=max_workers,
+                max_retries=max_retries,
+                **kwargs,
+            ):
+                if event.is_final:
+                    final_events[event.job_index] = event
+            return final_events
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(collect())
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, collect()).result()
+
+    # ====内部方法。====
+    @staticmethod
+    async def _arun_attempt(
+        job_index: int,
+        job: ProcessJob,
+        attempt: int,
+        emit,
+        output: ProcessOutputCapture,
+        resource_scheduler: ResourceScheduler | None = None,
+        reservation: ResourceReservation | None = None,
+    ) -> ProcessEvent:
+        """运行一次任务，直至退出或超时。返回 'exited' 事件，reason 为 None 表示成功。"""
+        exited = ProcessEvent(kind='exited', job_index=job_index, job=job, attempt=attempt)
+        start = time.monotonic()
+        spawn_task = asyncio.ensure_future(asyncio.create_subprocess_exec(
+            *job.args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=job.cwd,
+            env=job.env,
+            start_new_session=(os.name == 'posix'),
+            preexec_fn=resource_scheduler.make_preexec_fn(job, reservation) if resource_scheduler is not None else None,
+        ))
+        try:
+            process = await asyncio.shield(spawn_task)
+        except asyncio.CancelledError:
+            # 启动中被取消: 等待启动完成后立即结束，避免遗留子进程。
+            process = await asyncio.gather(spawn_task, return_exceptions=True)
+            process = process[0]
+            if isinstance(process, asyncio.subprocess.Process):
+                ProcessManager._send_signal(process=process, sig=signal.SIGKILL if os.name == 'posix' else None)
+                await process.wait()
+            raise
+        except OSError as e:
+            logger.error(f"Failed to start {job.display_name}: {e}")
+            return exited._replace(reason='spawn-error', output_tail=(str(e),), output=output)
+        last_output_at = start
+
+        def on_activity() -> None:
+            nonlocal last_output_at
+            last_output_at = time.monotonic()
+
+        readers = [
+            asyncio.create_task(output.afeed(stream_name='stdout', stream=process.stdout, on_activity=on_activity)),
+            asyncio.create_task(output.afeed(stream_name='stderr', stream=process.stderr, on_activity=on_activity)),
+        ]
+        wait_task = asyncio.create_task(process.wait())
+        reason = None
+        # 监控进程组的资源。POSIX 下进程组的 id 为子进程的 pid 。
+        is_monitoring = resource_scheduler is not None and os.name == 'posix'
+        # 第一次采样在启动 sample_interval 之后，之前开始的共享的读取中没有这个进程组。
+        next_sample_at = start + resource_scheduler.sample_interval if is_monitoring else start
+        peak_rss_mb = None
+        cpu_seconds = None
+        try:
+            # emit 抛出异常时，同样在 finally 中结束子进程。
+            emit(exited._replace(kind='started', pid=process.pid))
+            while True:
+                deadlines = []
+                if job.timeout is not None:
+                    deadlines.append(start + job.timeout)
+                if job.idle_timeout is not None:
+                    deadlines.append(last_output_at + job.idle_timeout)
+                if is_monitoring:
+                    deadlines.append(next_sample_at)
+                wait_seconds = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                done, _ = await asyncio.wait({wait_task}, timeout=wait_seconds)
+                if done:
+                    break
+                now = time.monotonic()
+                if is_monitoring and now >= next_sample_at:
+                    next_sample_at = now + resource_scheduler.sample_interval
+                    usage, reason = await resource_scheduler.acheck_usage(job=job, pgid=process.pid)
+                    if usage is None:
+                        # 不支持 /proc 。
+                        is_monitoring = False
+                    else:
+                        peak_rss_mb = max(peak_rss_mb or 0.0, usage.rss_mb)
+                        cpu_seconds = usage.cpu_seconds
+                    if reason is not None:
+                        break
+                if job.timeout is not None and now - start >= job.timeout:
+                    reason = 'timeout'
+                    break
+                if job.idle_timeout is not None and now - last_output_at >= job.idle_timeout:
+                    reason = 'idle-timeout'
+                    break
+            if reason is not None:
+                logger.warning(f"{job.display_name} reached {reason}, terminating.")
+                await ProcessManager._aterminate(process=process, wait_task=wait_task)
+        finally:
+            if process.returncode is None:
+                # 被取消: 立即结束。
+                ProcessManager._send_signal(process=process, sig=signal.SIGKILL if os.name == 'posix' else None)
+                # wait_task 可能已经被同时取消，直接等待子进程退出。
+                await process.wait()
+            await asyncio.gather(wait_task, *readers, return_exceptions=True)
+        if reason is None and process.returncode != 0:
+            # 超过 RLIMIT_CPU 时，子进程被 SIGXCPU 或 SIGKILL 结束。
+            is_cpu_limited = job.cpu_seconds is not None and resource_scheduler is not None and process.returncode in (
+                -getattr(signal, 'SIGXCPU', 0), -getattr(signal, 'SIGKILL', 0),
+            )
+            reason = 'cpu-limit' if is_cpu_limited else 'exit-code'
+        return exited._replace(
+            pid=process.pid,
+            returncode=process.returncode,
+            reason=reason,
+            duration=time.monotonic() - start,
+            output_tail=output.get_tail(),
+            output=output,
+            peak_rss_mb=peak_rss_mb,
+            cpu_seconds=cpu_seconds,
+        )
+
+    # ====内部方法。====
+    @staticmethod
+    async def _aterminate(
+        process: asyncio.subprocess.Process,
+        wait_task: asyncio.Task,
+    ) -> None:
+        """先 terminate ，超过 _TERMINATE_GRACE_SECONDS 后 kill 。"""
+        ProcessManager._send_signal(process=process, sig=signal.SIGTERM if os.name == 'posix' else None)
+        done, _ = await asyncio.wait({wait_task}, timeout=_TERMINATE_GRACE_SECONDS)
+        if not done:
+            ProcessManager._send_signal(process=process, sig=signal.SIGKILL if os.name == 'posix' else None)
+            await asyncio.wait({wait_task})
+
+    # ====内部方法。====
+    @staticmethod
+    def _send_signal(
+        process: asyncio.subprocess.Process,
+        sig: int | None,
+    ) -> None:
+        """POSIX 下向整个进程组发送 sig 。其他平台 sig 为 None ，直接 kill 。"""
+        try:
+            if sig is None:
+                process.kill()
+            else:
+                os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
 
 if __name__ == '__main__':
     # 默认情况，这个文件可以直接作为根文件启动。
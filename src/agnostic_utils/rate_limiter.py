@@ -0,0 +1,364 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/agnostic_utils/rate_limiter.py
+
+References:
+    https://platform.openai.com/docs/guides/rate-limits
+
+Synopsis:
+    同时限制每分钟请求数 (RPM) 和每分钟 token 数 (TPM) 的令牌桶。
+
+Notes:
+    供应商同时以 RPM 和 TPM 限速。只限制 RPM 时，长 context 的请求仍然会触发 429 。
+
+    DualTokenBucketLimiter:
+        - 2 个令牌桶: 每次请求消耗 1 个请求令牌，以及预估的 token 数量。
+        - 预估和修正: 请求前按预估的 token 数量获取，请求后按实际的用量修正 (多退少补) 。
+            预估超过桶的容量时，只要求桶是满的，之后允许桶为负数，由之后的请求等待偿还。
+        - 公平: 异步等待按 FIFO 顺序，先等待的请求先获取。不会因为小请求持续插队而让大请求饿死。
+        - 共享: 同一个 key 的全部 limiter 共享同一个桶的状态。桶的状态保存在 backend 中。
+
+    backend:
+        - InMemoryRateLimitBackend: 进程内。默认。
+        - SQLiteRateLimitBackend: 同一台机器上的多个进程共享。
+            以 WAL 模式的 SQLite 文件保存桶的状态，每次获取在 BEGIN IMMEDIATE 的事务中完成读取、计算和写入，
+            即持有写锁的原子操作。多个 worker 使用相同的 API key 时，避免组织级别的 429 。
+            其他进程持有写锁时，获取最多等待 busy_timeout_seconds 。aacquire 在 OffloadPool 的 'default' 线程池中访问，
+            不阻塞事件循环，仍然在 asyncio.Lock 中按 FIFO 顺序。
+        - 其他 backend 实现 RateLimitBackend 的 2 个方法即可。会阻塞 (例如网络或文件锁) 的 backend 设置 is_blocking = True 。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.agnostic_utils.offload import OffloadPool
+
+import asyncio
+import sqlite3
+import threading
+import time
+import weakref
+from collections import Counter
+from pathlib import Path
+
+from typing import TYPE_CHECKING, NamedTuple
+# if TYPE_CHECKING:
+
+
+class RateLimitSpec(NamedTuple):
+    """
+    令牌桶的配置。
+
+    Attributes:
+        requests_per_minute (float): 每分钟请求数。
+        tokens_per_minute (float, optional): 每分钟 token 数。None 为不限制。
+        burst_seconds (float): 桶的容量，以多少秒的额度表示。越大越允许突发。
+    """
+
+    requests_per_minute: float
+    tokens_per_minute: float | None = None
+    burst_seconds: float = 10.0
+
+    @property
+    def request_capacity(self) -> float:
+        return max(1.0, self.requests_per_minute * self.burst_seconds / 60)
+
+    @property
+    def token_capacity(self) -> float:
+        return max(1.0, (self.tokens_per_minute or 0.0) * self.burst_seconds / 60)
+
+
+class RateLimitBackend:
+    """
+    令牌桶状态的存储。派生类实现 try_acquire 和 adjust_tokens ，两者均需要是原子的。
+
+    is_blocking 为 True 时，异步的调用在线程池中运行这 2 个方法。
+    """
+
+    is_blocking: bool = False
+
+    def try_acquire(
+        self,
+        key: str,
+        spec: RateLimitSpec,
+        tokens: float,
+    ) -> float:
+        """
+        尝试获取 1 个请求和 tokens 个 token 。
+
+        Returns:
+            float: 0 为获取成功。否则为预计需要等待的时间 (秒) ，此时不消耗令牌。
+        """
+        raise NotImplementedError
+
+    def adjust_tokens(
+        self,
+        key: str,
+        spec: RateLimitSpec,
+        token_delta: float,
+    ) -> None:
+        """修正 token 桶。正数为退还，负数为补扣。"""
+        raise NotImplementedError
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def refill_and_acquire(
+        spec: RateLimitSpec,
+        request_level: float,
+        token_level: float,
+        updated_at: float,
+        now: float,
+        tokens: float,
+    ) -> tuple[float, float, float]:
+        """
+        令牌桶的计算。各个 backend 共用。
+
+        Returns:
+            tuple[float, float, float]: (新的请求桶, 新的 token 桶, 需要等待的时间) 。等待时间为 0 时已经扣除。
+        """
+        elapsed = max(0.0, now - updated_at)
+        request_level = min(spec.request_capacity, request_level + elapsed * spec.requests_per_minute / 60)
+        wait = max(0.0, (1.0 - request_level) * 60 / spec.requests_per_minute)
+        if spec.tokens_per_minute:
+            token_level = min(spec.token_capacity, token_level + elapsed * spec.tokens_per_minute / 60)
+            required_tokens = min(tokens, spec.token_capacity)
+            wait = max(wait, (required_tokens - token_level) * 60 / spec.tokens_per_minute)
+        if wait > 0:
+            return request_level, token_level, wait
+        request_level -= 1.0
+        if spec.tokens_per_minute:
+            token_level -= tokens
+        return request_level, token_level, 0.0
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """进程内的令牌桶状态。"""
+
+    def __init__(self):
+        # key -> [请求桶, token 桶, 更新时间]
+        self._buckets: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(
+        self,
+        key: str,
+        spec: RateLimitSpec,
+        tokens: float,
+    ) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(key, [spec.request_capacity, spec.token_capacity, now])
+            request_level, token_level, wait = RateLimitBackend.refill_and_acquire(
+                spec, bucket[0], bucket[1], bucket[2], now, tokens,
+            )
+            self._buckets[key] = [request_level, token_level, now]
+        return wait
+
+    def adjust_tokens(
+        self,
+        key: str,
+        spec: RateLimitSpec,
+        token_delta: float,
+    ) -> None:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket[1] = min(spec.token_capacity, bucket[1] + token_delta)
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """
+    以 SQLite 文件在多个进程之间共享的令牌桶状态。
+
+    时间使用 time.time() ，各个进程一致。每个线程使用独立的连接。
+    等待其他进程的写锁时会阻塞，is_blocking 为 True 。
+    """
+
+    is_blocking = True
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        busy_timeout_seconds: float = 30.0,
+    ):
+        """
+        Args:
+            db_path (Union[str, Path]): SQLite 文件的路径。同一台机器上的进程使用同一个路径。
+            busy_timeout_seconds (float): 等待其他进程的写锁的最长时间 (秒) 。
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._busy_timeout_seconds = busy_timeout_seconds
+        self._local = threading.local()
+        connection = self._get_connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_buckets ('
+            'key TEXT PRIMARY KEY, request_level REAL NOT NULL, token_level REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+
+    def try_acquire(
+        self,
+        key: str,
+        spec: RateLimitSpec,
+        tokens: float,
+    ) -> float:
+        connection = self._get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = connection.execute(
+                'SELECT request_level, token_level, updated_at FROM rate_limit_buckets WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                row = (spec.request_capacity, spec.token_capacity, now)
+            request_level, token_level, wait = RateLimitBackend.refill_and_acquire(spec, *row, now, tokens)
+            connection.execute(
+                'INSERT OR REPLACE INTO rate_limit_buckets (key, request_level, token_level, updated_at) VALUES (?, ?, ?, ?)',
+                (key, request_level, token_level, now),
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return wait
+
+    def adjust_tokens(
+        self,
+        key: str,
+        spec: RateLimitSpec,
+        token_delta: float,
+    ) -> None:
+        self._get_connection().execute(
+            'UPDATE rate_limit_buckets SET token_level = MIN(?, token_level + ?) WHERE key = ?',
+            (spec.token_capacity, token_delta, key),
+        )
+
+    # ==== 内部方法。 ====
+    def _get_connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=self._busy_timeout_seconds, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+
+class DualTokenBucketLimiter:
+    """
+    RPM 和 TPM 的令牌桶。
+
+    主要方法:
+        - aacquire: 异步等待，FIFO 。
+        - acquire: 同步等待。
+        - record_usage / arecord_usage: 按实际的 token 用量修正。
+
+    状态:
+        - stats (Counter): 'acquired', 'waits', 'wait_seconds', 'corrected_tokens' 。
+    """
+
+    def __init__(
+        self,
+        key: str,
+        spec: RateLimitSpec,
+        backend: RateLimitBackend | None = None,
+    ):
+        """
+        Args:
+            key (str): 桶的标识。相同 key 的 limiter 共享额度，例如 'openai/gpt-4o' 。
+            spec (RateLimitSpec): 令牌桶的配置。
+            backend (RateLimitBackend, optional): 桶的状态的存储。默认为进程内。
+        """
+        self.key = key
+        self.spec = spec
+        self.backend = backend or InMemoryRateLimitBackend()
+        self.stats: Counter[str] = Counter()
+        # asyncio.Lock 按 FIFO 唤醒等待者。每个事件循环一个。
+        self._async_locks: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock] = weakref.WeakKeyDictionary()
+        self._sync_lock = threading.Lock()
+
+    # ==== 主要方法。 ====
+    async def aacquire(
+        self,
+        estimated_tokens: int = 0,
+    ) -> None:
+        """
+        异步等待，直至获取 1 个请求和 estimated_tokens 个 token 。
+
+        等待中的请求按到达顺序排队，排在队首的请求等待桶的补充，其余的请求等待队首。
+        """
+        loop = asyncio.get_running_loop()
+        lock = self._async_locks.get(loop)
+        if lock is None:
+            lock = self._async_locks[loop] = asyncio.Lock()
+        async with lock:
+            while True:
+                if self.backend.is_blocking:
+                    # 在 lock 中等待线程池的结果，仍然按 FIFO 顺序获取。
+                    wait = await OffloadPool.get('default').run(
+                        self.backend.try_acquire, key=self.key, spec=self.spec, tokens=estimated_tokens,
+                    )
+                else:
+                    wait = self.backend.try_acquire(key=self.key, spec=self.spec, tokens=estimated_tokens)
+                if wait <= 0:
+                    break
+                self._record_wait(wait)
+                await asyncio.sleep(wait)
+        self.stats['acquired'] += 1
+
+    # ==== 主要方法。 ====
+    def acquire(
+        self,
+        estimated_tokens: int = 0,
+    ) -> None:
+        """aacquire 的同步版本。"""
+        with self._sync_lock:
+            while True:
+                wait = self.backend.try_acquire(key=self.key, spec=self.spec, tokens=estimated_tokens)
+                if wait <= 0:
+                    break
+                self._record_wait(wait)
+                time.sleep(wait)
+        self.stats['acquired'] += 1
+
+    # ==== 主要方法。 ====
+    def record_usage(
+        self,
+        estimated_tokens: int,
+        actual_tokens: int | None,
+    ) -> None:
+        """按实际的 token 用量修正 token 桶。actual_tokens 为 None (没有用量信息) 时不修正。"""
+        if actual_tokens is None or not self.spec.tokens_per_minute:
+            return
+        token_delta = estimated_tokens - actual_tokens
+        if token_delta:
+            self.backend.adjust_tokens(key=self.key, spec=self.spec, token_delta=token_delta)
+            self.stats['corrected_tokens'] += abs(token_delta)
+
+    # ==== 主要方法。 ====
+    async def arecord_usage(
+        self,
+        estimated_tokens: int,
+        actual_tokens: int | None,
+    ) -> None:
+        """record_usage 的异步版本。backend 会阻塞时在线程池中修正。"""
+        if not self.backend.is_blocking:
+            self.record_usage(estimated_tokens=estimated_tokens, actual_tokens=actual_tokens)
+            return
+        if actual_tokens is None or not self.spec.tokens_per_minute:
+            return
+        token_delta = estimated_tokens - actual_tokens
+        if token_delta:
+            await OffloadPool.get('default').run(
+                self.backend.adjust_tokens, key=self.key, spec=self.spec, token_delta=token_delta,
+            )
+            self.stats['corrected_tokens'] += abs(token_delta)
+
+    # ==== 内部方法。 ====
+    def _record_wait(
+        self,
+        wait: float,
+    ) -> None:
+        if self.stats['waits'] == 0:
+            logger.debug(f"Rate limited on {self.key}, waiting {wait:.2f}s.")
+        self.stats['waits'] += 1
+        self.stats['wait_seconds'] += wait
@@ -0,0 +1,373 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/agnostic_utils/resource_scheduler.py
+
+References:
+    https://man7.org/linux/man-pages/man2/setrlimit.2.html
+    https://man7.org/linux/man-pages/man5/proc.5.html
+    https://man7.org/linux/man-pages/man2/sched_setaffinity.2.html
+
+Synopsis:
+    按 CPU 和内存的需求调度子进程，并限制和监控子进程的资源。
+
+Notes:
+    同时启动大量的实验进程时，CPU 和内存会被超额使用: 频繁的上下文切换，或者内存不足导致 swap 和 OOM 。
+
+    ResourceScheduler:
+        - 预留: 每个任务声明 cpus 和 memory_mb (见 ProcessJob) 。只有剩余的 CPU 和内存足够时才启动，结束时归还。
+            剩余的资源不足时，等待中的任务不阻塞其他更小的任务 (回填) ，以便紧密地利用资源。
+            为了避免大的任务一直被回填的小任务饿死，最早的等待者等待超过 max_backfill_wait 秒后不再回填，
+            之后归还的资源都留给它，直至它启动。
+            需求超过全部容量的任务按全部容量预留，即单独运行。
+        - 限制 (POSIX) : 在子进程中 exec 前设置。
+            - CPU 亲和性: 绑定到预留的 cpus 个 CPU 核。子进程的子进程继承。
+            - RLIMIT_AS: memory_mb * address_space_factor 。虚拟内存通常大于 RSS ，预留虚拟地址的程序 (例如 CUDA) 需要设置为 None 。
+            - RLIMIT_CPU: ProcessJob.cpu_seconds 。超过时子进程收到 SIGXCPU 。
+        - 监控 (Linux) : 每 sample_interval 秒从 /proc 读取整个进程组的 RSS 和 CPU 时间。
+            读取 /proc 需要遍历全部进程，在 OffloadPool 的 'default' 线程池中运行，不阻塞事件循环。
+            同一个 sample_interval 内全部运行中的任务共享一次读取的结果 (acheck_usage) 。
+            RSS 超过 memory_mb * memory_kill_factor 时结束进程组 (reason 为 'memory-limit') ，之后按重启的规则重新排队。
+
+    没有 /proc 或 resource 的平台 (例如 Windows) 上，仅按预留调度，不限制和监控。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.agnostic_utils.offload import OffloadPool
+
+import asyncio
+import itertools
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from typing import TYPE_CHECKING, Callable, NamedTuple
+if TYPE_CHECKING:
+    from src.agnostic_utils.process_manager import ProcessJob
+
+_PROC_PATH = Path('/proc')
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class ResourceReservation(NamedTuple):
+    """
+    一个任务预留的资源。
+
+    Attributes:
+        cpus (int): 预留的 CPU 数量。
+        memory_mb (float): 预留的内存 (MB) 。
+        cores (tuple[int, ...]): 绑定的 CPU 核。不支持亲和性时为空。
+    """
+
+    cpus: int
+    memory_mb: float
+    cores: tuple[int, ...] = ()
+
+
+class ResourceUsage(NamedTuple):
+    """
+    进程组的资源用量。
+
+    Attributes:
+        rss_mb (float): 常驻内存 (MB) 。
+        cpu_seconds (float): 用户态和内核态的 CPU 时间 (秒) 。
+        num_processes (int): 进程的数量。
+    """
+
+    rss_mb: float
+    cpu_seconds: float
+    num_processes: int
+
+
+class ResourceScheduler:
+    """
+    按 CPU 和内存的预留调度任务。同一个事件循环中使用。
+
+    主要方法:
+        - acquire / release: 预留和归还资源。
+        - make_preexec_fn: 子进程的资源限制。
+        - acheck_usage: 检查运行中的进程组是否超过限制。不阻塞事件循环，同一个采样间隔内共享 /proc 的读取。
+        - check_usage: acheck_usage 的同步版本，每次读取 /proc 。
+        - read_process_groups_usage: 遍历一次 /proc ，读取全部进程组的用量。
+
+    状态:
+        - reserved_cpus (int), reserved_memory_mb (float): 已经预留的资源。
+    """
+
+    def __init__(
+        self,
+        total_cpus: int | None = None,
+        total_memory_mb: float | None = None,
+        memory_headroom_mb: float = 1024.0,
+        is_pinning_cpus: bool = True,
+        address_space_factor: float | None = 2.0,
+        memory_kill_factor: float | None = 1.5,
+        sample_interval: float = 1.0,
+        max_backfill_wait: float | None = 60.0,
+    ):
+        """
+        Args:
+            total_cpus (int, optional): 可以使用的 CPU 数量。默认为当前进程可以使用的 CPU 核的数量。
+            total_memory_mb (float, optional): 可以使用的内存 (MB) 。默认为创建时 /proc/meminfo 的 MemAvailable 减去 memory_headroom_mb 。
+                无法读取时不限制内存。
+            memory_headroom_mb (float): 为系统和监管进程保留的内存 (MB) 。
+            is_pinning_cpus (bool): 是否将子进程绑定到预留的 CPU 核。
+            address_space_factor (float, optional): RLIMIT_AS 为 memory_mb 的倍数。None 为不限制。
+            memory_kill_factor (float, optional): RSS 超过 memory_mb 的倍数时结束进程组。None 为不结束。
+            sample_interval (float): 监控的采样间隔 (秒) 。
+            max_backfill_wait (float, optional): 最早的等待者等待超过这个时间 (秒) 后，其他任务不再回填。
+                0 为严格按顺序启动，None 为总是回填。
+        """
+        self.available_cores = ResourceScheduler.get_available_cores()
+        self.total_cpus = total_cpus or len(self.available_cores)
+        if total_memory_mb is None:
+            available_memory_mb = ResourceScheduler.read_available_memory_mb()
+            if available_memory_mb is not None:
+                total_memory_mb = max(0.0, available_memory_mb - memory_headroom_mb)
+        self.total_memory_mb = total_memory_mb
+        self.is_pinning_cpus = is_pinning_cpus and hasattr(os, 'sched_setaffinity')
+        self.address_space_factor = address_space_factor
+        self.memory_kill_factor = memory_kill_factor
+        self.sample_interval = sample_interval
+        self.max_backfill_wait = max_backfill_wait
+        self.reserved_cpus = 0
+        self.reserved_memory_mb = 0.0
+        self._free_cores: list[int] = list(self.available_cores)
+        self._condition: asyncio.Condition | None = None
+        # 等待中的 acquire: ticket -> 开始等待的时间。按到达的顺序。
+        self._waiting: dict[int, float] = {}
+        self._tickets = itertools.count()
+        # 最近一次 /proc 的读取: (开始的时间, 结果) 。
+        self._usage_scan: tuple[float, asyncio.Future] | None = None
+
+    # ==== 主要方法。 ====
+    async def acquire(
+        self,
+        job: ProcessJob,
+    ) -> ResourceReservation:
+        """等待，直至剩余的资源满足 job 的需求，并且没有等待超过 max_backfill_wait 的更早的任务，然后预留。"""
+        cpus, memory_mb = self._get_request(job)
+        condition = self._get_condition()
+        async with condition:
+            ticket = next(self._tickets)
+            self._waiting[ticket] = time.monotonic()
+            try:
+                if not self._is_fitting(cpus, memory_mb):
+                    logger.debug(f"Waiting for {cpus} cpus and {memory_mb:.0f}MB for {job.display_name}.")
+                await condition.wait_for(lambda: self._is_fitting(cpus, memory_mb) and self._is_turn(ticket))
+            finally:
+                # 最早的等待者离开后，被它阻塞的任务可能可以启动。
+                del self._waiting[ticket]
+                condition.notify_all()
+            self.reserved_cpus += cpus
+            self.reserved_memory_mb += memory_mb
+            cores = ()
+            if self.is_pinning_cpus and len(self._free_cores) >= cpus:
+                cores = tuple(self._free_cores[:cpus])
+                del self._free_cores[:cpus]
+            return ResourceReservation(cpus=cpus, memory_mb=memory_mb, cores=cores)
+
+    # ==== 主要方法。 ====
+    async def release(
+        self,
+        reservation: ResourceReservation,
+    ) -> None:
+        """归还预留的资源，唤醒等待的任务。"""
+        condition = self._get_condition()
+        async with condition:
+            self.reserved_cpus -= reservation.cpus
+            self.reserved_memory_mb -= reservation.memory_mb
+            self._free_cores.extend(reservation.cores)
+            self._free_cores.sort()
+            condition.notify_all()
+
+    # ==== 主要方法。 ====
+    def make_preexec_fn(
+        self,
+        job: ProcessJob,
+        reservation: ResourceReservation,
+    ) -> Callable[[], None] | None:
+        """在子进程中 exec 前设置 CPU 亲和性和 rlimit 。没有需要设置的限制时为 None 。"""
+        cores = reservation.cores
+        address_space_bytes = None
+        if resource is not None and job.memory_mb is not None and self.address_space_factor is not None:
+            address_space_bytes = int(job.memory_mb * self.address_space_factor * 1024 * 1024)
+        cpu_seconds = job.cpu_seconds if resource is not None else None
+        if not cores and address_space_bytes is None and cpu_seconds is None:
+            return None
+
+        def preexec_fn() -> None:
+            # 在 fork 之后的子进程中运行。只使用系统调用。
+            if cores:
+                os.sched_setaffinity(0, cores)
+            if address_space_bytes is not None:
+                resource.setrlimit(resource.RLIMIT_AS, (address_space_bytes, address_space_bytes))
+            if cpu_seconds is not None:
+                resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_seconds), int(cpu_seconds) + 5))
+
+        return preexec_fn
+
+    # ==== 主要方法。 ====
+    async def acheck_usage(
+        self,
+        job: ProcessJob,
+        pgid: int,
+    ) -> tuple[ResourceUsage | None, str | None]:
+        """
+        读取进程组的用量，检查是否超过限制。
+
+        /proc 的读取在线程池中运行。开始于 sample_interval / 2 之内的读取 (包括进行中的) 被全部任务共享，
+        因此每个采样间隔最多遍历一次 /proc ，与运行中的任务的数量无关。
+        进程组需要在共享的读取开始前启动，第一次采样应在启动 sample_interval 之后。
+
+        Returns:
+            tuple[Union[ResourceUsage, None], Union[str, None]]: (用量, 需要结束时的原因) 。无法读取时用量为 None 。
+        """
+        now = time.monotonic()
+        if (
+            self._usage_scan is None
+            or now - self._usage_scan[0] >= self.sample_interval / 2
+            or self._usage_scan[1].get_loop() is not asyncio.get_running_loop()
+        ):
+            self._usage_scan = (now, asyncio.ensure_future(
+                OffloadPool.get('default').run(ResourceScheduler.read_process_groups_usage)
+            ))
+        # 一个任务被取消时不取消共享的读取。
+        usages = await asyncio.shield(self._usage_scan[1])
+        return self._check_limits(job=job, usage=usages.get(pgid) if usages is not None else None)
+
+    # ==== 主要方法。 ====
+    def check_usage(
+        self,
+        job: ProcessJob,
+        pgid: int,
+    ) -> tuple[ResourceUsage | None, str | None]:
+        """acheck_usage 的同步版本。每次调用都遍历 /proc 。"""
+        return self._check_limits(job=job, usage=ResourceScheduler.read_process_group_usage(pgid=pgid))
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def read_process_group_usage(
+        pgid: int,
+    ) -> ResourceUsage | None:
+        """从 /proc 读取进程组中全部进程的 RSS 和 CPU 时间的和。不支持 /proc 或进程组不存在时为 None 。"""
+        usages = ResourceScheduler.read_process_groups_usage()
+        return usages.get(pgid) if usages is not None else None
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def read_process_groups_usage() -> dict[int, ResourceUsage] | None:
+        """遍历一次 /proc ，按进程组汇总全部进程的 RSS 和 CPU 时间。不支持 /proc 时为 None 。"""
+        if not _PROC_PATH.is_dir():
+            return None
+        rss_pages: defaultdict[int, int] = defaultdict(int)
+        cpu_ticks: defaultdict[int, int] = defaultdict(int)
+        num_processes: defaultdict[int, int] = defaultdict(int)
+        for stat_path in _PROC_PATH.glob('[0-9]*/stat'):
+            try:
+                stat = stat_path.read_text()
+            except OSError:
+                # 进程已经退出。
+                continue
+            # comm 可能包含空格和括号，从最后的 ')' 之后开始分割。fields[0] 为 state 。
+            fields = stat[stat.rfind(')') + 2:].split()
+            pgid = int(fields[2])
+            num_processes[pgid] += 1
+            cpu_ticks[pgid] += int(fields[11]) + int(fields[12])
+            rss_pages[pgid] += int(fields[21])
+        return {
+            pgid: ResourceUsage(
+                rss_mb=rss_pages[pgid] * _PAGE_SIZE / 1024 / 1024,
+                cpu_seconds=cpu_ticks[pgid] / _CLOCK_TICKS,
+                num_processes=count,
+            )
+            for pgid, count in num_processes.items()
+        }
+
+    # ==== 内部方法。 ====
+    def _check_limits(
+        self,
+        job: ProcessJob,
+        usage: ResourceUsage | None,
+    ) -> tuple[ResourceUsage | None, str | None]:
+        if usage is None:
+            return None, None
+        if (
+            job.memory_mb is not None
+            and self.memory_kill_factor is not None
+            and usage.rss_mb > job.memory_mb * self.memory_kill_factor
+        ):
+            logger.warning(f"{job.display_name} uses {usage.rss_mb:.0f}MB, over {job.memory_mb}MB.")
+            return usage, 'memory-limit'
+        return usage, None
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def read_available_memory_mb() -> float | None:
+        """/proc/meminfo 的 MemAvailable (MB) 。不支持时为 None 。"""
+        try:
+            with open(_PROC_PATH / 'meminfo') as meminfo:
+                for line in meminfo:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def get_available_cores() -> list[int]:
+        """当前进程可以使用的 CPU 核。"""
+        if hasattr(os, 'sched_getaffinity'):
+            return sorted(os.sched_getaffinity(0))
+        return list(range(os.cpu_count() or 1))
+
+    # ==== 内部方法。 ====
+    def _get_request(
+        self,
+        job: ProcessJob,
+    ) -> tuple[int, float]:
+        cpus = max(1, job.cpus)
+        memory_mb = float(job.memory_mb or 0)
+        if cpus > self.total_cpus:
+            logger.warning(f"{job.display_name} requests {cpus} cpus, more than {self.total_cpus}, running alone.")
+            cpus = self.total_cpus
+        if self.total_memory_mb is not None and memory_mb > self.total_memory_mb:
+            logger.warning(f"{job.display_name} requests {memory_mb:.0f}MB, more than {self.total_memory_mb:.0f}MB, running alone.")
+            memory_mb = self.total_memory_mb
+        return cpus, memory_mb
+
+    def _is_fitting(
+        self,
+        cpus: int,
+        memory_mb: float,
+    ) -> bool:
+        if self.reserved_cpus + cpus > self.total_cpus:
+            return False
+        if self.total_memory_mb is not None and self.reserved_memory_mb + memory_mb > self.total_memory_mb:
+            return False
+        return True
+
+    def _is_turn(
+        self,
+        ticket: int,
+    ) -> bool:
+        """最早的等待者，或者最早的等待者还没有等待超过 max_backfill_wait 时可以回填。"""
+        head_ticket, head_waiting_since = next(iter(self._waiting.items()))
+        if ticket == head_ticket or self.max_backfill_wait is None:
+            return True
+        return time.monotonic() - head_waiting_since < self.max_backfill_wait
+
+    def _get_condition(self) -> asyncio.Condition:
+        # 在事件循环中创建。
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
@@ -0,0 +1,424 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/agnostic_utils/response_cache.py
+
+References:
+    None
+
+Synopsis:
+    以内容寻址的响应缓存。key 为输入内容的 hash ，value 为序列化后的字符串。
+
+Notes:
+    确定性的 LLM 调用 (例如 formatter 的结构化提取) 在重新运行 pipeline 时会重复请求相同的内容。
+    原本在 _old_or_discarded/model_factory/cached_llm_factory.py 中计划过，但没有实现。
+
+    后端:
+        - MemoryResponseCache: 进程内的 LRU 。
+        - SQLiteResponseCache: SQLite 文件，多个进程和多次运行共用。
+        - MmapResponseCache: 只追加的数据文件，以 mmap 读取。索引在打开时重建，读取不需要反序列化整个文件。
+
+    共同的功能:
+        - TTL: 超过 ttl_seconds 的条目视为不存在。
+        - 容量: 超过 max_entries 时按 LRU 淘汰。
+        - single-flight: aget_or_compute 中，相同 key 的并发请求只计算一次，其余等待同一个结果。
+        - 统计: stats 中记录 'hits', 'misses', 'deduplicated', 'evictions' 。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+import asyncio
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+from typing import TYPE_CHECKING, Awaitable, Callable
+# if TYPE_CHECKING:
+
+
+class ResponseCache:
+    """
+    响应缓存的基类。派生类实现 _get, _set, __len__ 。
+
+    主要方法:
+        - get / set: 读取和写入。
+        - aget_or_compute: 读取，不存在时计算并写入。相同 key 的并发请求只计算一次。
+        - make_key: 以输入内容的 hash 构建 key 。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float | None = None,
+        max_entries: int | None = None,
+    ):
+        """
+        Args:
+            ttl_seconds (float, optional): 条目的有效时间 (秒) 。默认不过期。
+            max_entries (int, optional): 最大条目数量。超过时按 LRU 淘汰。默认不限制。
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    # ==== 主要方法。 ====
+    def get(
+        self,
+        key: str,
+    ) -> str | None:
+        """读取。不存在或已过期时为 None 。"""
+        with self._lock:
+            value = self._get(key)
+        self.stats['hits' if value is not None else 'misses'] += 1
+        return value
+
+    # ==== 主要方法。 ====
+    def set(
+        self,
+        key: str,
+        value: str,
+    ) -> None:
+        """写入。"""
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds is not None else 0.0
+        with self._lock:
+            self._set(key, value, expires_at)
+
+    # ==== 主要方法。 ====
+    async def aget_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[str | None]],
+    ) -> str | None:
+        """
+        读取，不存在时计算并写入。
+
+        相同 key 的并发请求只计算一次，其余等待同一个结果。
+        计算失败时，等待的请求得到相同的异常。计算失败或结果为 None 时不写入缓存。
+
+        Args:
+            key (str): 缓存的 key 。
+            compute (Callable[[], Awaitable[Union[str, None]]]): 计算 value 的协程。
+
+        Returns:
+            Union[str, None]: 缓存的或新计算的 value 。
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.stats['deduplicated'] += 1
+            return await asyncio.shield(in_flight)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待的请求时，避免 "exception was never retrieved" 。
+            future.exception()
+            raise
+        else:
+            if value is not None:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def make_key(
+        *parts: str,
+    ) -> str:
+        """以全部输入内容的 sha256 构建 key 。各部分之间有长度前缀，避免拼接产生的碰撞。"""
+        hasher = hashlib.sha256()
+        for part in parts:
+            encoded = part.encode('utf-8')
+            hasher.update(struct.pack('<Q', len(encoded)))
+            hasher.update(encoded)
+        return hasher.hexdigest()
+
+    # ==== 派生类实现。 ====
+    def _get(self, key: str) -> str | None:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: str, expires_at: float) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @staticmethod
+    def _is_expired(expires_at: float) -> bool:
+        return expires_at != 0.0 and expires_at <= time.time()
+
+
+class MemoryResponseCache(ResponseCache):
+    """进程内的 LRU 缓存。"""
+
+    def __init__(
+        self,
+        ttl_seconds: float | None = None,
+        max_entries: int | None = 10_000,
+    ):
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def _get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if self._is_expired(expires_at):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key: str, value: str, expires_at: float) -> None:
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    SQLite 文件缓存。多个进程和多次运行可以共用同一个文件。
+
+    以 WAL 模式打开，读取不阻塞写入。LRU 以最后访问时间实现，超过 max_entries 时删除最久未访问的条目。
+    """
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        ttl_seconds: float | None = None,
+        max_entries: int | None = None,
+    ):
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS response_cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS response_cache_accessed_at ON response_cache (accessed_at)'
+        )
+
+    def _get(self, key: str) -> str | None:
+        row = self._connection.execute(
+            'SELECT value, expires_at FROM response_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if self._is_expired(expires_at):
+            self._connection.execute('DELETE FROM response_cache WHERE key = ?', (key,))
+            return None
+        self._connection.execute('UPDATE response_cache SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return value
+
+    def _set(self, key: str, value: str, expires_at: float) -> None:
+        self._connection.execute(
+            'INSERT OR REPLACE INTO response_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, value, expires_at, time.time()),
+        )
+        if self.max_entries is not None:
+            evictions = len(self) - self.max_entries
+            if evictions > 0:
+                self._connection.execute(
+                    'DELETE FROM response_cache WHERE key IN '
+                    '(SELECT key FROM response_cache ORDER BY accessed_at LIMIT ?)',
+                    (evictions,),
+                )
+                self.stats['evictions'] += evictions
+
+    def __len__(self) -> int:
+        return self._connection.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+# 每条记录的头部: key 的长度，value 的长度，过期时间。
+_RECORD_HEADER = struct.Struct('<IId')
+# 删除记录的过期时间。任何时候都视为已过期。
+_TOMBSTONE_EXPIRES_AT = -1.0
+
+
+class MmapResponseCache(ResponseCache):
+    """
+    只追加的数据文件缓存，以 mmap 读取。
+
+    实现:
+        - 写入: 追加 [header, key, value] 。相同 key 的新记录覆盖旧记录。
+        - 读取: 内存中的索引记录 value 的位置，通过 mmap 切片读取，不需要读取整个文件。
+        - 打开: 顺序扫描一次文件重建索引。末尾不完整的记录 (写入时中断) 被截断。
+        - 淘汰: 超过 max_entries 时从索引中移除最久未访问的条目，并追加该 key 的删除记录 (过期时间为负数的空记录) ，
+            重新打开时不会恢复已经淘汰的条目。过期的记录本身带有过期时间，重新打开时跳过，不需要删除记录。
+            打开时条目超过 max_entries 的，按写入的顺序淘汰。
+            失效的数据超过一半时，重写文件 (compact) 。
+    """
+
+    def __init__(
+        self,
+        data_path: str | Path,
+        ttl_seconds: float | None = None,
+        max_entries: int | None = None,
+    ):
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self._data_path = Path(data_path)
+        self._data_path.parent.mkdir(parents=True, exist_ok=True)
+        self._data_path.touch(exist_ok=True)
+        self._file = open(self._data_path, 'r+b')
+        self._mmap: mmap.mmap | None = None
+        self._mapped_size = 0
+        # key -> (value 的位置, value 的长度, 过期时间, 记录的长度)
+        self._index: OrderedDict[str, tuple[int, int, float, int]] = OrderedDict()
+        self._live_bytes = 0
+        self._load_index()
+
+    def _get(self, key: str) -> str | None:
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        value_offset, value_length, expires_at, _ = entry
+        if self._is_expired(expires_at):
+            self._remove_from_index(key)
+            return None
+        self._index.move_to_end(key)
+        return self._read(value_offset, value_length).decode('utf-8')
+
+    def _set(self, key: str, value: str, expires_at: float) -> None:
+        encoded_value = value.encode('utf-8')
+        value_offset, record_length = self._append_record(key, encoded_value, expires_at)
+        self._remove_from_index(key)
+        self._index[key] = (value_offset, len(encoded_value), expires_at, record_length)
+        self._live_bytes += record_length
+        self._evict()
+        self._file.flush()
+        file_size = value_offset + len(encoded_value)
+        if file_size > 1 << 20 and self._live_bytes * 2 < file_size:
+            self._compact()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    # ==== 内部方法。 ====
+    def _read(
+        self,
+        offset: int,
+        length: int,
+    ) -> bytes:
+        """通过 mmap 读取。文件增长后重新映射。"""
+        end = offset + length
+        if self._mmap is None or end > self._mapped_size:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mapped_size = os.fstat(self._file.fileno()).st_size
+            self._mmap = mmap.mmap(self._file.fileno(), self._mapped_size, access=mmap.ACCESS_READ)
+        return self._mmap[offset:end]
+
+    def _append_record(
+        self,
+        key: str,
+        encoded_value: bytes,
+        expires_at: float,
+    ) -> tuple[int, int]:
+        """追加一条记录。返回 (value 的位置, 记录的长度) 。"""
+        encoded_key = key.encode('utf-8')
+        record_offset = self._file.seek(0, os.SEEK_END)
+        self._file.write(_RECORD_HEADER.pack(len(encoded_key), len(encoded_value), expires_at))
+        self._file.write(encoded_key)
+        self._file.write(encoded_value)
+        return record_offset + _RECORD_HEADER.size + len(encoded_key), _RECORD_HEADER.size + len(encoded_key) + len(encoded_value)
+
+    def _evict(self) -> None:
+        """超过 max_entries 时淘汰最久未访问的条目，并追加删除记录。"""
+        if self.max_entries is None:
+            return
+        while len(self._index) > self.max_entries:
+            key = next(iter(self._index))
+            self._remove_from_index(key)
+            self._append_record(key, b'', _TOMBSTONE_EXPIRES_AT)
+            self.stats['evictions'] += 1
+
+    def _remove_from_index(
+        self,
+        key: str,
+    ) -> None:
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._live_bytes -= entry[3]
+
+    def _load_index(self) -> None:
+        """顺序扫描文件重建索引。"""
+        file_size = os.fstat(self._file.fileno()).st_size
+        offset = 0
+        while offset + _RECORD_HEADER.size <= file_size:
+            header = self._read(offset, _RECORD_HEADER.size)
+            key_length, value_length, expires_at = _RECORD_HEADER.unpack(header)
+            record_length = _RECORD_HEADER.size + key_length + value_length
+            if offset + record_length > file_size:
+                break
+            key = self._read(offset + _RECORD_HEADER.size, key_length).decode('utf-8')
+            # 新记录覆盖旧记录。删除记录和过期的记录都已经过期，只移除旧记录。
+            self._remove_from_index(key)
+            if not self._is_expired(expires_at):
+                self._index[key] = (offset + _RECORD_HEADER.size + key_length, value_length, expires_at, record_length)
+                self._live_bytes += record_length
+            offset += record_length
+        if offset < file_size:
+            logger.warning(f"Truncating incomplete record at {offset} in {self._data_path}.")
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._file.truncate(offset)
+        self._evict()
+        self._file.flush()
+
+    def _compact(self) -> None:
+        """只保留有效的条目，重写数据文件。"""
+        compact_path = self._data_path.with_suffix(self._data_path.suffix + '.compact')
+        new_index: OrderedDict[str, tuple[int, int, float, int]] = OrderedDict()
+        with open(compact_path, 'wb') as f:
+            offset = 0
+            for key, (value_offset, value_length, expires_at, record_length) in self._index.items():
+                encoded_key = key.encode('utf-8')
+                f.write(_RECORD_HEADER.pack(len(encoded_key), value_length, expires_at))
+                f.write(encoded_key)
+                f.write(self._read(value_offset, value_length))
+                new_index[key] = (offset + _RECORD_HEADER.size + len(encoded_key), value_length, expires_at, record_length)
+                offset += record_length
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+        os.replace(compact_path, self._data_path)
+        self._file = open(self._data_path, 'r+b')
+        self._index = new_index
+        self._live_bytes = offset
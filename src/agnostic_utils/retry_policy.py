@@ -0,0 +1,253 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/agnostic_utils/retry_policy.py
+
+References:
+    https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+
+Synopsis:
+    请求 LLM 的重试策略。BaseAgent (V1, V2) 和 StructuredOutputHelper 共用。
+
+Notes:
+    原本的重试是捕获全部异常后立即重试。在 provider 出现大量 429/5xx 时，这会加重过载并消耗配额。
+
+    这个重试策略:
+        - 区分异常: 可重试 (超时、连接错误、408/409/425/429/5xx) 和不可重试 (认证、参数错误等其他 4xx ，以及程序错误)。
+        - 指数退避和 full jitter: 等待时间为 [0, min(max_delay, base_delay * 2 ** n)] 中的随机值。
+        - Retry-After: 异常的响应中有 Retry-After 时，至少等待该时间。
+        - 超时: 每次尝试的超时 (仅异步) ，以及全部尝试的截止时间。
+        - 统计: stats 中记录尝试、等待、等待的总时间和放弃的次数。
+
+    不依赖具体的 SDK ，通过异常的类名和 status_code 判断。支持 openai 和 httpx 的异常。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+import asyncio
+import random
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, TypeVar
+# if TYPE_CHECKING:
+
+T = TypeVar('T')
+
+_RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429})
+_RETRYABLE_ERROR_NAMES = frozenset({
+    'APIConnectionError', 'APITimeoutError', 'RateLimitError', 'InternalServerError',
+    'ServiceUnavailableError', 'TransportError', 'TimeoutException',
+})
+_FATAL_ERROR_NAMES = frozenset({
+    'AuthenticationError', 'PermissionDeniedError', 'BadRequestError', 'NotFoundError',
+    'UnprocessableEntityError',
+})
+# 程序错误，重试没有意义。
+_FATAL_ERROR_TYPES = (TypeError, AttributeError, KeyError, NameError, NotImplementedError)
+
+
+class RetryPolicy:
+    """
+    重试策略。实例持有配置和统计，可以在多个调用之间共用。
+
+    主要方法:
+        - arun: 异步运行，按策略重试。
+        - run: 同步运行，按策略重试。不支持每次尝试的超时。
+        - is_retryable: 按配置的分类判断异常是否可以重试。
+        - is_retryable_error: 默认的异常分类。
+
+    状态:
+        - stats (Counter): 'attempts', 'waits', 'wait_seconds', 'give_ups' 。
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        attempt_timeout: float | None = None,
+        deadline: float | None = None,
+        is_retryable: Callable[[BaseException], bool] | None = None,
+    ):
+        """
+        Args:
+            max_attempts (int): 最大尝试次数，包括第一次。
+            base_delay (float): 指数退避的基础等待时间 (秒) 。
+            max_delay (float): 单次等待时间的上限 (秒) 。
+            attempt_timeout (float, optional): 每次尝试的超时 (秒) 。仅异步时生效。
+            deadline (float, optional): 全部尝试 (包括等待) 的截止时间 (秒) 。
+            is_retryable (Callable[[BaseException], bool], optional): 自定义的异常分类。默认为 RetryPolicy.is_retryable_error 。
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts 至少为 1 。")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self._is_retryable = is_retryable or RetryPolicy.is_retryable_error
+        self.stats: Counter[str] = Counter()
+
+    # ==== 主要方法。 ====
+    async def arun(
+        self,
+        func: Callable[[], Awaitable[T]],
+    ) -> T:
+        """
+        异步运行 func ，按策略重试。
+
+        Args:
+            func (Callable[[], Awaitable[T]]): 构建一次尝试的协程。每次尝试都会重新调用。
+
+        Returns:
+            T: func 的结果。
+
+        Raises:
+            Exception: 不可重试的异常，或达到最大尝试次数、截止时间时的最后一个异常。
+        """
+        start = time.monotonic()
+        for attempt in range(self.max_attempts):
+            self.stats['attempts'] += 1
+            timeout = self._get_attempt_timeout(start)
+            try:
+                return await asyncio.wait_for(func(), timeout=timeout)
+            except Exception as e:
+                delay = self._on_error(e, attempt=attempt, start=start)
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    # ==== 主要方法。 ====
+    def run(
+        self,
+        func: Callable[[], T],
+    ) -> T:
+        """arun 的同步版本。同步调用无法中断，attempt_timeout 不生效，deadline 仅在等待前检查。"""
+        start = time.monotonic()
+        for attempt in range(self.max_attempts):
+            self.stats['attempts'] += 1
+            try:
+                return func()
+            except Exception as e:
+                delay = self._on_error(e, attempt=attempt, start=start)
+            time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    # ==== 主要方法。 ====
+    def is_retryable(
+        self,
+        error: BaseException,
+    ) -> bool:
+        """按配置的分类判断异常是否可以重试。"""
+        return self._is_retryable(error)
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def is_retryable_error(
+        error: BaseException,
+    ) -> bool:
+        """
+        默认的异常分类。
+
+        判断顺序:
+            - 超时和连接错误: 可以重试。
+            - 有 HTTP 状态码: 408/409/425/429 和 5xx 可以重试，其他不可以。
+            - 已知的 SDK 异常类名。
+            - 程序错误: 不可以重试。
+            - 其他异常 (例如 formatter 输出解析失败): 可以重试。
+        """
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+            return True
+        status_code = RetryPolicy.get_status_code(error)
+        if status_code is not None:
+            return status_code in _RETRYABLE_STATUS_CODES or status_code >= 500
+        error_names = {cls.__name__ for cls in type(error).__mro__}
+        if error_names & _FATAL_ERROR_NAMES:
+            return False
+        if error_names & _RETRYABLE_ERROR_NAMES:
+            return True
+        return not isinstance(error, _FATAL_ERROR_TYPES)
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def get_status_code(
+        error: BaseException,
+    ) -> int | None:
+        """获取异常中的 HTTP 状态码。openai 的异常有 status_code ，httpx 的异常有 response.status_code 。"""
+        status_code = getattr(error, 'status_code', None)
+        if status_code is None:
+            status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+        return status_code if isinstance(status_code, int) else None
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def get_retry_after(
+        error: BaseException,
+    ) -> float | None:
+        """获取异常的响应中 Retry-After 的等待时间 (秒) 。支持秒数和 HTTP-date 2 种格式。"""
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+        if not headers:
+            return None
+        retry_after = headers.get('retry-after') or headers.get('Retry-After')
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    # ==== 工具方法。 ====
+    def compute_delay(
+        self,
+        attempt: int,
+        error: BaseException | None = None,
+    ) -> float:
+        """第 attempt 次 (从 0 开始) 失败后的等待时间。full jitter ，且不少于 Retry-After 。"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = RetryPolicy.get_retry_after(error) if error is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    # ==== 内部方法。 ====
+    def _on_error(
+        self,
+        error: Exception,
+        attempt: int,
+        start: float,
+    ) -> float:
+        """处理一次失败。需要放弃时重新抛出异常，否则返回等待时间。"""
+        if not self.is_retryable(error):
+            logger.error(f"Fatal error, not retrying: {type(error).__name__}.")
+            self.stats['give_ups'] += 1
+            raise error
+        if attempt + 1 >= self.max_attempts:
+            logger.error(f"Giving up after {self.max_attempts} attempts: {type(error).__name__}.")
+            self.stats['give_ups'] += 1
+            raise error
+        delay = self.compute_delay(attempt=attempt, error=error)
+        if self.deadline is not None and time.monotonic() - start + delay >= self.deadline:
+            logger.error(f"Giving up, deadline exceeded: {type(error).__name__}.")
+            self.stats['give_ups'] += 1
+            raise error
+        logger.warning(f"Retrying in {delay:.2f}s after {type(error).__name__} (attempt {attempt + 1}).")
+        self.stats['waits'] += 1
+        self.stats['wait_seconds'] += delay
+        return delay
+
+    def _get_attempt_timeout(
+        self,
+        start: float,
+    ) -> float | None:
+        """每次尝试的超时，不超过剩余的截止时间。"""
+        if self.deadline is None:
+            return self.attempt_timeout
+        remaining = max(0.0, self.deadline - (time.monotonic() - start))
+        if self.attempt_timeout is None:
+            return remaining
+        return min(self.attempt_timeout, remaining)
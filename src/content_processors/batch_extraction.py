@@ -0,0 +1,137 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/content_processors/batch_extraction.py
+
+References:
+    None
+
+Synopsis:
+    批量提取结构化数据。JsonOutputExtractor 和 StructuredDataExtractor 的 extract_many 方法共用。
+
+Notes:
+    使用场景是离线评估: 重新解析大量缓存的输出 (数十万条字符串) 。
+
+    实现:
+        - 分块: 输入按 chunk_size 分块，每块作为一个任务提交到 ProcessPoolExecutor ，减少进程间通信的次数。
+        - 有序: 按提交顺序收集结果，输出与输入顺序一致。
+        - 有界: 同时提交的任务数量有限，输入可以是惰性的迭代器，不需要一次性加载全部数据。
+        - 缓存: 每个工作进程有独立的 SchemaValidatorCache ，同一 schema 只在每个进程中构建一次。
+        - JSONL: 以 mmap 逐行读取，不需要一次性加载整个文件。
+
+    注意:
+        - schema_pydantic_base_model 需要可以被 pickle ，即定义在模块的顶层。
+        - max_workers 为 0 时在当前进程中运行，便于调试。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.content_processors.extraction_result import ExtractionOutcome
+
+import json
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from typing import TYPE_CHECKING, Any, Callable
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+
+class BatchExtraction:
+    """
+    工具类，批量运行单条提取的方法。
+
+    主要方法:
+        - run: 分块并行运行，按输入顺序返回结果。
+        - iter_jsonl_contents: 以 mmap 逐行读取 JSONL 文件。
+    """
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def run(
+        extract_with_outcome: Callable[..., tuple[ExtractionOutcome, Any]],
+        raw_strs: Iterable[str],
+        extract_kwargs: dict,
+        max_workers: int | None = None,
+        chunk_size: int = 256,
+    ) -> list[tuple[ExtractionOutcome, Any]]:
+        """
+        分块并行运行单条提取的方法。
+
+        Args:
+            extract_with_outcome (Callable): 单条提取的方法。需要可以被 pickle ，即模块顶层的函数或类的静态方法。
+            raw_strs (Iterable[str]): 全部的原始字符串。可以是惰性的迭代器。
+            extract_kwargs (dict): 除 raw_str 以外的参数。
+            max_workers (int, optional): 进程数量。默认为 CPU 数量。为 0 时在当前进程中运行。
+            chunk_size (int): 每个任务处理的字符串数量。
+
+        Returns:
+            list[tuple[ExtractionOutcome, Any]]: 与输入顺序一致的结果代码和提取结果。
+        """
+        chunks = BatchExtraction.iter_chunks(raw_strs, chunk_size=chunk_size)
+        results = []
+        if max_workers == 0:
+            for chunk in chunks:
+                results.extend(_extract_chunk(extract_with_outcome, chunk, extract_kwargs))
+            return results
+        max_workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # 限制同时提交的任务数量，避免惰性输入被一次性展开。
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_extract_chunk, extract_with_outcome, chunk, extract_kwargs))
+                if len(pending) >= max_workers * 2:
+                    results.extend(pending.popleft().result())
+            while pending:
+                results.extend(pending.popleft().result())
+        logger.info(f"Extracted {len(results)} items.")
+        return results
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def iter_jsonl_contents(
+        jsonl_path: str | Path,
+        content_key: str = 'content',
+    ) -> Iterator[str]:
+        """
+        以 mmap 逐行读取 JSONL 文件中的字符串。
+
+        Args:
+            jsonl_path (Union[str, Path]): JSONL 文件的路径。
+            content_key (str): 每行为 dict 时，原始字符串所在的 key 。每行为 str 时不使用。
+
+        Yields:
+            str: 每行中的原始字符串。
+        """
+        jsonl_path = Path(jsonl_path)
+        if jsonl_path.stat().st_size == 0:
+            return
+        with open(jsonl_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                yield record if isinstance(record, str) else record[content_key]
+
+    # ==== 基础方法。 ====
+    @staticmethod
+    def iter_chunks(
+        iterable: Iterable[str],
+        chunk_size: int,
+    ) -> Iterator[list[str]]:
+        iterator = iter(iterable)
+        while chunk := list(islice(iterator, chunk_size)):
+            yield chunk
+
+
+# ==== 工作进程中运行的方法。需要在模块顶层定义，才可以被 pickle 。 ====
+def _extract_chunk(
+    extract_with_outcome: Callable[..., tuple[ExtractionOutcome, Any]],
+    raw_strs: list[str],
+    extract_kwargs: dict,
+) -> list[tuple[ExtractionOutcome, Any]]:
+    return [extract_with_outcome(raw_str=raw_str, **extract_kwargs) for raw_str in raw_strs]
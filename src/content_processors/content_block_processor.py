@@ -11,12 +11,15 @@ Synopsis:
 Notes:
     主要场景为:
         - VLM 的 HumanMessage.content 的处理方法。
+    图片的读取和 base64 编码是同步的，在事件循环中使用 a_get_image_content_block_from_uri 。
+    图片文件的读取、类型识别、缩小和缓存见 ImageEncoder 。
 """
 
 from __future__ import annotations
 from loguru import logger
 
-import base64
+from src.agnostic_utils.offload import OffloadPool
+from src.content_processors.image_encoder import ImageEncoder
 
 from typing import TYPE_CHECKING, Literal
 # if TYPE_CHECKING:
@@ -34,14 +37,15 @@ class ContentBlockProcessor:
     @staticmethod
     def get_image_content_block_from_base64(
         base64_str: str,
-        image_type: Literal['png'] = 'png',
+        image_type: Literal['png', 'jpeg', 'gif', 'webp'] | str = 'png',
     ) -> dict:
         """
         将原始 base64 编码过的图片转换为可与 VLM 交互的 dict 格式。
 
         Args:
             base64_str (str): 已经经过 base64 编码的图片。
-            image_type (Literal['png']): 图片的类型。需要 VLM 支持，默认为 png 。
+            image_type (Union[Literal['png', 'jpeg', 'gif', 'webp'], str]): 图片的类型。需要 VLM 支持，默认为 png 。
+                也可以是完整的 MIME 类型，例如 'image/jpeg' 。
 
         Returns:
             dict: 添加了必要字段的 dict 。当前 content 中图片模态的内容。
@@ -49,7 +53,7 @@ class ContentBlockProcessor:
         image_content_dict = {
             'type': 'image',
             'source_type': 'base64',
-            'mime_type': f'image/{image_type}',
+            'mime_type': image_type if '/' in image_type else f'image/{image_type}',
             'data': base64_str,
         }
         return image_content_dict
@@ -58,27 +62,56 @@ class ContentBlockProcessor:
     @staticmethod
     def get_image_content_block_from_uri(
         uri: str,
-        image_type: Literal['png'] = 'png',
+        image_type: Literal['png', 'jpeg', 'gif', 'webp'] | None = None,
+        max_pixels: int | None = None,
+        max_bytes: int | None = None,
+        is_using_cache: bool = True,
     ) -> dict:
         """
         使用图片路径加载并转换图片为可与 VLM 交互的 dict 格式。
 
         Args:
             uri (str): 图片的路径。可以使用本地路径。
-            image_type (Literal['png']): 图片的类型。需要 VLM 支持，默认为 png 。
-                这里可以使用 pathlib 自动解析避免该字段传入，但是:
-                    - uri 可能不含有图片类型的扩展名。
-                    - 需要额外检测 VLM 是否支持图片类型。
-                    - 如果需要自动识别，可在该工具类外额外写一个很简洁的方法。
+            image_type (Literal['png', 'jpeg', 'gif', 'webp'], optional): 图片的类型。需要 VLM 支持。
+                默认按文件头自动识别。图片被重新压缩时，使用压缩后的类型。
+            max_pixels (int, optional): 最大像素数。超过时按比例缩小。需要 Pillow 。
+            max_bytes (int, optional): 编码前的最大字节数。超过时重新压缩。需要 Pillow 。
+            is_using_cache (bool): 是否按文件内容缓存编码的结果。
 
         Returns:
             dict: 添加了必要字段的 dict 。当前 content 中图片模态的内容。
         """
-        with open(uri, 'rb') as image_file:
-            base64_str = base64.b64encode(image_file.read()).decode('utf-8')
+        encoded_image = ImageEncoder.encode_file(
+            path=uri,
+            max_pixels=max_pixels,
+            max_bytes=max_bytes,
+            is_using_cache=is_using_cache,
+        )
+        mime_type = encoded_image.mime_type
+        if image_type is not None and not encoded_image.is_transformed:
+            mime_type = f'image/{image_type}'
         return ContentBlockProcessor.get_image_content_block_from_base64(
-            base64_str=base64_str,
+            base64_str=encoded_image.base64_str,
+            image_type=mime_type,
+        )
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    async def a_get_image_content_block_from_uri(
+        uri: str,
+        image_type: Literal['png', 'jpeg', 'gif', 'webp'] | None = None,
+        max_pixels: int | None = None,
+        max_bytes: int | None = None,
+        is_using_cache: bool = True,
+    ) -> dict:
+        """get_image_content_block_from_uri 的异步版本。读取和编码在 OffloadPool 的 'default' 线程池中运行。"""
+        return await OffloadPool.get('default').run(
+            ContentBlockProcessor.get_image_content_block_from_uri,
+            uri=uri,
             image_type=image_type,
+            max_pixels=max_pixels,
+            max_bytes=max_bytes,
+            is_using_cache=is_using_cache,
         )
 
     # ==== 主要方法。 ====
@@ -0,0 +1,110 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/content_processors/extraction_result.py
+
+References:
+    None
+
+Synopsis:
+    结构化数据提取的结果。区分失败的阶段，代替单一的 None 。
+
+Notes:
+    JsonOutputExtractor 和 StructuredDataExtractor 的主要方法在任何失败时都返回 None 。
+    调用方无法区分失败的原因，只能全部重新生成。
+
+    ExtractionResult 是可选的返回形式，包含:
+        - outcome: 失败的阶段。
+        - error_type: 异常的类名。
+        - offset: 出错位置在原始字符串中的偏移。
+        - snippet: 出错位置附近截断的片段。不保留完整的数据。
+
+    根据失败的阶段，选择代价最小的恢复方法:
+        - LOAD_FAILURE: 有 json 但格式错误。先在本地修复，不需要请求 LLM 。
+        - SCHEMA_FAILURE, NO_FENCE: 没有可用的 json 。有 formatter 时仅重新请求 formatter ，否则重新生成。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from enum import IntEnum
+
+from typing import TYPE_CHECKING, Any, Literal, NamedTuple
+# if TYPE_CHECKING:
+
+
+_SNIPPET_LENGTH = 80
+
+
+class ExtractionOutcome(IntEnum):
+    """
+    单条提取的结果代码。代替 None ，区分失败的原因。
+    """
+
+    OK = 0
+    NO_FENCE = 1  # 没有 json 的 markdown-code-cell 。
+    LOAD_FAILURE = 2  # structured-data 格式错误。
+    SCHEMA_FAILURE = 3  # 未通过 schema 检测。
+
+
+class ExtractionResult(NamedTuple):
+    """
+    单条提取的结果。
+
+    Attributes:
+        outcome (ExtractionOutcome): 结果代码，即失败的阶段。
+        structured_data (Any): 提取结果。仅 outcome 为 OK 时不为 None 。
+        error_type (str, optional): 异常的类名。
+        offset (int, optional): 出错位置在原始字符串中的偏移。
+        snippet (str, optional): 出错位置附近截断的片段。
+    """
+
+    outcome: ExtractionOutcome
+    structured_data: Any = None
+    error_type: str | None = None
+    offset: int | None = None
+    snippet: str | None = None
+
+    @property
+    def is_ok(self) -> bool:
+        return self.outcome == ExtractionOutcome.OK
+
+    # ==== 主要方法。 ====
+    def get_recovery_action(
+        self,
+        is_formatter_available: bool = False,
+    ) -> Literal['repair', 'formatter', 'regenerate']:
+        """
+        根据失败的阶段选择恢复方法。
+
+        Args:
+            is_formatter_available (bool): 是否有 formatter 可以从原始输出中提取结构化数据。
+
+        Returns:
+            Literal['repair', 'formatter', 'regenerate']:
+                - repair: 仅在本地修复。
+                - formatter: 仅重新请求 formatter 。
+                - regenerate: 重新生成。
+        """
+        if self.outcome == ExtractionOutcome.LOAD_FAILURE:
+            return 'repair'
+        return 'formatter' if is_formatter_available else 'regenerate'
+
+    # ==== 构建方法。 ====
+    @staticmethod
+    def from_failure(
+        outcome: ExtractionOutcome,
+        raw_str: str,
+        offset: int | None = None,
+        error: Exception | None = None,
+    ) -> ExtractionResult:
+        """构建失败的结果。仅截取 offset 附近的片段。"""
+        snippet = None
+        if offset is not None:
+            start = max(0, offset - _SNIPPET_LENGTH // 2)
+            snippet = raw_str[start:start + _SNIPPET_LENGTH]
+        return ExtractionResult(
+            outcome=outcome,
+            error_type=type(error).__name__ if error is not None else None,
+            offset=offset,
+            snippet=snippet,
+        )
@@ -0,0 +1,338 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/content_processors/image_encoder.py
+
+References:
+    https://docs.python.org/3/library/mmap.html
+    https://docs.python.org/3/library/binascii.html#binascii.b2a_base64
+    https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.thumbnail
+
+Synopsis:
+    图片文件到 base64 的编码: mmap 和分块编码，按文件头识别 MIME 类型，可选的缩小和重新压缩，按内容缓存。
+
+Notes:
+    原本的方法:
+        ```python
+        base64.b64encode(image_file.read()).decode('utf-8')
+        ```
+    每张图片在内存中有 3 份完整的拷贝 (文件内容、base64 的 bytes 、str) ，并且只支持 png 。
+
+    ImageEncoder:
+        - 读取: 以 mmap 映射文件，hash 和编码直接读取映射的内存。
+        - 编码: 按 3 字节的整数倍分块编码，写入预先分配的缓冲，最后解码为 str 。同时存在的只有缓冲和 str 。
+        - MIME 类型: 按文件头 (magic bytes) 识别 png, jpeg, gif, webp, bmp, tiff 。无法识别时按扩展名。
+        - 预算 (需要 Pillow) : 超过 max_pixels 的图片按比例缩小，超过 max_bytes 的图片重新压缩。
+            过大的图片浪费上传的带宽和 VLM 的 token ，并且可能超过 API 的限制。
+            没有安装 Pillow 时记录警告，使用原图。
+        - 缓存: 编码的结果按 (文件内容的 sha256, 预算) 缓存，总字符数超过上限时按 LRU 淘汰。
+            (路径, 大小, mtime) 到 sha256 的索引避免重复计算未修改的文件的 hash 。内容相同的不同文件共用缓存。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+import binascii
+import hashlib
+import io
+import math
+import mimetypes
+import mmap
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from typing import TYPE_CHECKING, NamedTuple
+# if TYPE_CHECKING:
+
+# 编码的块大小。需要是 3 的整数倍，使各块的编码可以直接拼接。
+_ENCODE_CHUNK_SIZE = 3 * 256 * 1024
+# 识别 MIME 类型需要的文件头的长度。
+_HEADER_SIZE = 16
+# 重新压缩时依次尝试的 JPEG 质量。
+_JPEG_QUALITIES = (85, 75, 60, 45)
+# (路径, 大小, mtime) 的索引的最大条目数量。超过时清空。
+_MAX_DIGESTS = 100_000
+
+
+class EncodedImage(NamedTuple):
+    """
+    编码后的图片。
+
+    Attributes:
+        base64_str (str): base64 编码。
+        mime_type (str): 例如 'image/png' 。
+        num_bytes (int): 编码前的字节数。
+        is_transformed (bool): 是否经过缩小或重新压缩。
+    """
+
+    base64_str: str
+    mime_type: str
+    num_bytes: int
+    is_transformed: bool = False
+
+
+class ImageEncoder:
+    """
+    工具类，图片文件到 base64 的编码。可以在多个线程中使用。
+
+    主要方法:
+        - encode_file: 读取、识别类型、按预算处理、编码，使用缓存。
+        - encode_base64: 分块编码 bytes-like 。
+        - detect_mime_type: 按文件头识别 MIME 类型。
+        - fit_to_budget: 缩小和重新压缩。
+
+    状态:
+        - stats (Counter): 'hits', 'misses', 'evictions', 'transformed' 。
+    """
+
+    max_cache_chars: int = 256 * 1024 * 1024
+    stats: Counter[str] = Counter()
+    _cache: OrderedDict[tuple, EncodedImage] = OrderedDict()
+    _cache_chars: int = 0
+    # (路径, 大小, mtime_ns) -> sha256 。
+    _digests: dict[tuple, str] = {}
+    _lock = threading.Lock()
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def encode_file(
+        path: str | Path,
+        max_pixels: int | None = None,
+        max_bytes: int | None = None,
+        is_using_cache: bool = True,
+    ) -> EncodedImage:
+        """
+        读取图片文件并编码为 base64 。
+
+        Args:
+            path (Union[str, Path]): 图片文件的路径。
+            max_pixels (int, optional): 最大像素数 (宽 * 高) 。超过时按比例缩小。需要 Pillow 。
+            max_bytes (int, optional): 编码前的最大字节数。超过时重新压缩。需要 Pillow 。
+                base64 的长度约为字节数的 4/3 。
+            is_using_cache (bool): 是否使用缓存。
+
+        Returns:
+            EncodedImage: 编码后的图片。
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        stat_key = (str(path), stat.st_size, stat.st_mtime_ns)
+        digest = ImageEncoder._digests.get(stat_key) if is_using_cache else None
+        if digest is not None:
+            # 未修改的文件不重新计算 hash 。
+            encoded_image = ImageEncoder._get_cached((digest, max_pixels, max_bytes))
+            if encoded_image is not None:
+                return encoded_image
+
+        with open(path, 'rb') as image_file:
+            # 空文件不能 mmap 。
+            buffer = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+            try:
+                with memoryview(buffer) as view:
+                    if is_using_cache and digest is None:
+                        digest = hashlib.sha256(view).hexdigest()
+                        with ImageEncoder._lock:
+                            if len(ImageEncoder._digests) >= _MAX_DIGESTS:
+                                ImageEncoder._digests.clear()
+                            ImageEncoder._digests[stat_key] = digest
+                        encoded_image = ImageEncoder._get_cached((digest, max_pixels, max_bytes))
+                        if encoded_image is not None:
+                            return encoded_image
+                    encoded_image = ImageEncoder._encode_view(
+                        view=view,
+                        path=path,
+                        max_pixels=max_pixels,
+                        max_bytes=max_bytes,
+                    )
+            finally:
+                if isinstance(buffer, mmap.mmap):
+                    buffer.close()
+
+        if is_using_cache:
+            ImageEncoder._set_cached((digest, max_pixels, max_bytes), encoded_image)
+        return encoded_image
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def encode_base64(
+        data: bytes | bytearray | memoryview | mmap.mmap,
+    ) -> str:
+        """分块编码为 base64 。与 base64.b64encode(data).decode() 的结果相同，但不产生完整的中间 bytes 。"""
+        with memoryview(data) as view:
+            output = bytearray(4 * ((len(view) + 2) // 3))
+            for start in range(0, len(view), _ENCODE_CHUNK_SIZE):
+                encoded_chunk = binascii.b2a_base64(view[start:start + _ENCODE_CHUNK_SIZE], newline=False)
+                output_start = start // 3 * 4
+                output[output_start:output_start + len(encoded_chunk)] = encoded_chunk
+        return output.decode('ascii')
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def detect_mime_type(
+        header: bytes | memoryview,
+    ) -> str | None:
+        """按文件头识别 MIME 类型。无法识别时为 None 。"""
+        header = bytes(header[:_HEADER_SIZE])
+        if header.startswith(b'\x89PNG\r\n\x1a\n'):
+            return 'image/png'
+        if header.startswith(b'\xff\xd8\xff'):
+            return 'image/jpeg'
+        if header.startswith((b'GIF87a', b'GIF89a')):
+            return 'image/gif'
+        if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+            return 'image/webp'
+        if header.startswith(b'BM'):
+            return 'image/bmp'
+        if header.startswith((b'II*\x00', b'MM\x00*')):
+            return 'image/tiff'
+        return None
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def fit_to_budget(
+        data: bytes | memoryview,
+        max_pixels: int | None = None,
+        max_bytes: int | None = None,
+    ) -> tuple[bytes, str] | None:
+        """
+        按预算缩小和重新压缩。
+
+        - 超过 max_pixels 时按比例缩小，保持原本的格式 (png, jpeg, webp 以外的格式保存为 png) 。
+        - 结果超过 max_bytes 时以 JPEG 重新压缩，依次降低质量，仍然超过时继续缩小。透明通道会被去除。
+
+        Returns:
+            Union[tuple[bytes, str], None]: (处理后的图片, MIME 类型) 。不需要处理时为 None 。
+        """
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+        is_over_pixels = max_pixels is not None and width * height > max_pixels
+        is_over_bytes = max_bytes is not None and len(data) > max_bytes
+        if not is_over_pixels and not is_over_bytes:
+            return None
+
+        image_format = image.format if image.format in ('PNG', 'JPEG', 'WEBP') else 'PNG'
+        if is_over_pixels:
+            scale = math.sqrt(max_pixels / (width * height))
+            # thumbnail 对 JPEG 使用 draft ，解码时即缩小。
+            image.thumbnail((max(1, int(width * scale)), max(1, int(height * scale))))
+        else:
+            image.load()
+        result = ImageEncoder._save(image, image_format)
+        if max_bytes is None or len(result) <= max_bytes:
+            return result, f'image/{image_format.lower()}'
+
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        while True:
+            for quality in _JPEG_QUALITIES:
+                result = ImageEncoder._save(image, 'JPEG', quality=quality)
+                if len(result) <= max_bytes:
+                    return result, 'image/jpeg'
+            if image.width <= 16 or image.height <= 16:
+                logger.warning(f"Cannot fit image into {max_bytes} bytes, using {len(result)} bytes.")
+                return result, 'image/jpeg'
+            image = image.resize((image.width // 2, image.height // 2))
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def configure_cache(
+        max_cache_chars: int,
+    ) -> None:
+        """设置缓存的总字符数的上限。0 为不缓存。"""
+        with ImageEncoder._lock:
+            ImageEncoder.max_cache_chars = max_cache_chars
+            ImageEncoder._evict()
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def clear_cache() -> None:
+        with ImageEncoder._lock:
+            ImageEncoder._cache.clear()
+            ImageEncoder._digests.clear()
+            ImageEncoder._cache_chars = 0
+
+    # ==== 内部方法。 ====
+    @staticmethod
+    def _encode_view(
+        view: memoryview,
+        path: Path,
+        max_pixels: int | None,
+        max_bytes: int | None,
+    ) -> EncodedImage:
+        mime_type = ImageEncoder.detect_mime_type(view)
+        if mime_type is None:
+            mime_type = mimetypes.guess_type(path.name)[0] or 'image/png'
+            logger.warning(f"Unknown image header in {path.name}, using {mime_type}.")
+        is_over_bytes = max_bytes is not None and len(view) > max_bytes
+        if max_pixels is not None or is_over_bytes:
+            if Image is None:
+                logger.warning("Pillow is not installed, sending the original image.")
+            else:
+                try:
+                    fitted = ImageEncoder.fit_to_budget(view, max_pixels=max_pixels, max_bytes=max_bytes)
+                except Exception as e:
+                    logger.warning(f"Cannot resize {path.name}, sending the original image: {type(e).__name__}: {e}")
+                    fitted = None
+                if fitted is not None:
+                    data, mime_type = fitted
+                    ImageEncoder.stats['transformed'] += 1
+                    return EncodedImage(
+                        base64_str=ImageEncoder.encode_base64(data),
+                        mime_type=mime_type,
+                        num_bytes=len(data),
+                        is_transformed=True,
+                    )
+        return EncodedImage(
+            base64_str=ImageEncoder.encode_base64(view),
+            mime_type=mime_type,
+            num_bytes=len(view),
+        )
+
+    @staticmethod
+    def _save(
+        image: Image.Image,
+        image_format: str,
+        **kwargs,
+    ) -> bytes:
+        output = io.BytesIO()
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(output, format=image_format, optimize=True, **kwargs)
+        return output.getvalue()
+
+    @staticmethod
+    def _get_cached(
+        cache_key: tuple,
+    ) -> EncodedImage | None:
+        with ImageEncoder._lock:
+            encoded_image = ImageEncoder._cache.get(cache_key)
+            if encoded_image is not None:
+                ImageEncoder._cache.move_to_end(cache_key)
+        ImageEncoder.stats['hits' if encoded_image is not None else 'misses'] += 1
+        return encoded_image
+
+    @staticmethod
+    def _set_cached(
+        cache_key: tuple,
+        encoded_image: EncodedImage,
+    ) -> None:
+        with ImageEncoder._lock:
+            previous = ImageEncoder._cache.pop(cache_key, None)
+            if previous is not None:
+                ImageEncoder._cache_chars -= len(previous.base64_str)
+            ImageEncoder._cache[cache_key] = encoded_image
+            ImageEncoder._cache_chars += len(encoded_image.base64_str)
+            ImageEncoder._evict()
+
+    @staticmethod
+    def _evict() -> None:
+        # 在 _lock 中调用。
+        while ImageEncoder._cache and ImageEncoder._cache_chars > ImageEncoder.max_cache_chars:
+            _, encoded_image = ImageEncoder._cache.popitem(last=False)
+            ImageEncoder._cache_chars -= len(encoded_image.base64_str)
+            ImageEncoder.stats['evictions'] += 1
@@ -0,0 +1,262 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/content_processors/incremental_json_extractor.py
+
+References:
+    None
+
+Synopsis:
+    从流式输出的增量中提取 markdown-code-cell 包裹的 json 数据。
+
+Notes:
+    JsonOutputExtractor 只能在 merge_chunks_into_message 合并全部 chunks 后进行解析。
+    这个工具类持有可恢复的 fence/bracket 状态机，每收到一个增量只处理新增的部分:
+        - fence: 与 JsonFenceScanner 的正向查找一致，依次两两配对。fence 可以跨越多个增量。
+        - bracket: 在 json 的 code-cell 中跟踪括号嵌套，忽略字符串中的括号。括号不匹配即判定为格式错误。
+    结束 fence 到达时，立即加载和检验这个 code-cell ，不需要等待流式输出结束。
+
+    使用场景:
+        - BaseAgent(V1) 的流式提前检验。json 的 code-cell 格式错误或检验失败时，立即取消生成并重试，节省输出 token 和延迟。
+
+    注意:
+        - 括号检查不做修复。即使 json_loader_name 为 'json-repair' ，括号不匹配也会被判定为格式错误。
+        - 这个工具类有状态，每次生成需要新的实例。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.content_processors.json_fence_scanner import (
+    JsonFenceScanner,
+    _FENCE,
+    _FENCE_LENGTH,
+    _LANGUAGE_TAG_CHARS,
+)
+from src.content_processors.json_output_extractor import JsonOutputExtractor
+
+from typing import TYPE_CHECKING, Literal
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessageChunk
+    from pydantic import BaseModel
+
+
+_BRACKET_PAIRS = {'}': '{', ']': '['}
+_QUOTES = frozenset({'"', "'"})
+
+
+class IncrementalJsonExtractor:
+    """
+    有状态的工具类，从流式输出的增量中提取 json 数据。
+
+    流程为:
+        delta (str) --fence/bracket--> raw_json_str (str) --json.loads--> raw_structured_data (JSONReturnType)
+        --schema--> structured_data (BaseModel)
+
+    主要方法:
+        - feed: 输入字符串增量。
+        - feed_chunk: 输入 AIMessageChunk 。
+        - get_structured_output: 获取最后一个已闭合的 code-cell 的提取结果。
+
+    状态:
+        - is_malformed (bool): 当前或最后一个 json 的 code-cell 格式错误，或未通过检验。
+        - structured_data_list (list): 每个已闭合的 json 的 code-cell 的提取结果。提取失败为 None 。
+    """
+
+    def __init__(
+        self,
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
+        schema_pydantic_base_model: type[BaseModel] = None,
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ):
+        """
+        加载和检验的参数，与 JsonOutputExtractor.extract_json_from_str 相同。
+
+        Args:
+            json_loader_name (Literal['json', 'json5', 'json-repair', 'fast-then-repair']): 加载 json 数据的方法。
+            schema_pydantic_base_model (type[BaseModel], optional): pydantic 定义的数据类。当有这个参数，会进行 schema 检测。
+            schema_check_type (Literal['dict', 'list']): 检验 schema 的方法。2 种方式为 dict 或 list 。
+        """
+        self._json_loader_name = json_loader_name
+        self._schema_pydantic_base_model = schema_pydantic_base_model
+        self._schema_check_type = schema_check_type
+        # 已收到的全部文本，以及下一次查找的位置。
+        self._text = ''
+        self._position = 0
+        # fence 状态。
+        self._state: Literal['outside', 'language_tag', 'block'] = 'outside'
+        self._fence_start = 0
+        self._content_start = 0
+        self._is_json_block = False
+        # bracket 状态。仅在 json 的 code-cell 中使用。
+        self._bracket_position = 0
+        self._bracket_stack: list[str] = []
+        self._quote: str | None = None
+        self._is_escaped = False
+        # 结果。
+        self.is_malformed = False
+        self.structured_data_list: list[dict | list | None] = []
+
+    # ==== 主要方法。 ====
+    def feed(
+        self,
+        delta: str,
+    ) -> dict | list | None:
+        """
+        输入一个字符串增量，推进状态机。
+
+        Args:
+            delta (str): 流式输出的增量文本。
+
+        Returns:
+            Union[Union[dict, list], None]:
+                - Union[dict, list]: 这个增量中闭合了 json 的 code-cell ，并且提取成功。多个时为最后一个。
+                - None: 没有闭合 json 的 code-cell ，或者提取失败。提取失败需要查看 is_malformed 。
+        """
+        self._text += delta
+        structured_data = None
+        while True:
+            if self._state == 'outside':
+                fence_start = self._text.find(_FENCE, self._position)
+                if fence_start == -1:
+                    # fence 可能跨越增量，保留末尾不足一个 fence 的部分。
+                    self._position = max(self._position, len(self._text) - _FENCE_LENGTH + 1)
+                    return structured_data
+                self._fence_start = fence_start
+                self._position = fence_start + _FENCE_LENGTH
+                self._state = 'language_tag'
+            if self._state == 'language_tag':
+                if not self._read_language_tag():
+                    return structured_data  # 语言标记可能还未结束。
+            if self._state == 'block':
+                content_end = self._text.find(_FENCE, self._position)
+                if content_end == -1:
+                    self._position = max(self._position, len(self._text) - _FENCE_LENGTH + 1)
+                    if self._is_json_block:
+                        self._scan_brackets(scan_end=self._position)
+                    return structured_data
+                if self._is_json_block:
+                    self._scan_brackets(scan_end=content_end)
+                self._position = content_end + _FENCE_LENGTH
+                self._state = 'outside'
+                if self._is_json_block:
+                    structured_data = self._close_json_block(content_end=content_end)
+
+    # ==== 主要方法。 ====
+    def feed_chunk(
+        self,
+        chunk: BaseMessageChunk,
+    ) -> dict | list | None:
+        """
+        输入一个 AIMessageChunk 。仅处理 str 类型的 content ，与 JsonOutputExtractor 的使用方式一致。
+
+        Args:
+            chunk (BaseMessageChunk): 流式输出的 chunk ，一般为 AIMessageChunk 。
+
+        Returns:
+            Union[Union[dict, list], None]: 同 feed 方法。
+        """
+        if not isinstance(chunk.content, str):
+            return None
+        return self.feed(delta=chunk.content)
+
+    # ==== 主要方法。 ====
+    def get_structured_output(self) -> dict | list | None:
+        """
+        获取最后一个已闭合的 json 的 code-cell 的提取结果。
+
+        Returns:
+            Union[Union[dict, list], None]:
+                - Union[dict, list]: 提取成功。
+                - None: 没有已闭合的 json 的 code-cell ，或者最后一个提取失败。
+        """
+        if not self.structured_data_list:
+            return None
+        return self.structured_data_list[-1]
+
+    # ==== 内部方法。fence 。 ====
+    def _read_language_tag(self) -> bool:
+        """读取开始 fence 之后的语言标记。返回语言标记是否已经结束。"""
+        position = self._position
+        length = len(self._text)
+        while position < length and self._text[position] in _LANGUAGE_TAG_CHARS:
+            position += 1
+        if position == length:
+            return False
+        language_tag = self._text[self._fence_start + _FENCE_LENGTH:position]
+        self._is_json_block = JsonFenceScanner.is_json_language_tag(language_tag)
+        self._content_start = position
+        self._position = position
+        self._state = 'block'
+        # 新的 code-cell ，重置 bracket 状态。
+        self._bracket_position = position
+        self._bracket_stack = []
+        self._quote = None
+        self._is_escaped = False
+        if self._is_json_block:
+            self.is_malformed = False
+        return True
+
+    def _close_json_block(
+        self,
+        content_end: int,
+    ) -> dict | list | None:
+        """json 的 code-cell 闭合，加载和检验其中的内容。"""
+        structured_data = None
+        if not self.is_malformed:
+            structured_data = self._load_and_check(raw_json_str=self._text[self._content_start:content_end])
+            self.is_malformed = structured_data is None
+        self.structured_data_list.append(structured_data)
+        return structured_data
+
+    def _load_and_check(
+        self,
+        raw_json_str: str,
+    ) -> dict | list | None:
+        """与 JsonOutputExtractor.extract_json_from_str 中 fence 之后的步骤一致。"""
+        raw_structured_data = JsonOutputExtractor.load_structured_data_from_raw_json_str(
+            raw_json_str=raw_json_str,
+            json_loader_name=self._json_loader_name,
+        )
+        if not raw_structured_data:
+            return None
+        if self._schema_pydantic_base_model:
+            if self._schema_check_type == 'dict' and not JsonOutputExtractor.check_dict_schema(
+                raw_dict_structured_data=raw_structured_data,
+                schema_pydantic_base_model=self._schema_pydantic_base_model,
+            ):
+                return None
+            elif self._schema_check_type == 'list' and not JsonOutputExtractor.check_list_schema(
+                raw_list_structured_data=raw_structured_data,
+                schema_pydantic_base_model=self._schema_pydantic_base_model,
+            ):
+                return None
+        return raw_structured_data
+
+    # ==== 内部方法。bracket 。 ====
+    def _scan_brackets(
+        self,
+        scan_end: int,
+    ) -> None:
+        """扫描 json 的 code-cell 中新增的内容，跟踪括号嵌套。末尾可能是 fence 的部分留到下一次。"""
+        if self.is_malformed or scan_end <= self._bracket_position:
+            return
+        text = self._text
+        for position in range(self._bracket_position, scan_end):
+            char = text[position]
+            if self._quote is not None:
+                if self._is_escaped:
+                    self._is_escaped = False
+                elif char == '\\':
+                    self._is_escaped = True
+                elif char == self._quote:
+                    self._quote = None
+            elif char in _QUOTES:
+                self._quote = char
+            elif char == '{' or char == '[':
+                self._bracket_stack.append(char)
+            elif char in _BRACKET_PAIRS:
+                if not self._bracket_stack or self._bracket_stack.pop() != _BRACKET_PAIRS[char]:
+                    logger.warning("Mismatched bracket in streaming JSON output.")
+                    self.is_malformed = True
+                    return
+        self._bracket_position = scan_end
@@ -0,0 +1,267 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/content_processors/json_fence_scanner.py
+
+References:
+    None
+
+Synopsis:
+    查找 markdown-code-cell 中 json 数据的扫描器。
+
+Notes:
+    JsonOutputExtractor 和 StructuredDataExtractor 共用的底层实现，替代原本的正则:
+        ```python
+        re.findall(r'```json(.*?)```', raw_str, re.DOTALL)[index_to_choose]
+        ```
+
+    替代的原因:
+        - 正则会构建全部匹配的 list ，但默认只需要最后一个。reasoning-model 的输出常有 30k-60k 字符，这是解析的热点。
+        - 正则只识别小写的 `json` 。LLM 也会输出 `JSON` 和 `jsonc` 。
+        - 正则无法处理未闭合的最后一个 code-cell (例如达到 max_tokens 被截断)。
+
+    实现:
+        - 仅使用 str.find / str.rfind ，均为 C 实现，不构建匹配列表。
+        - fence 按 markdown 规则依次两两配对: 第 1 和第 2 个 ``` 为一个 code-cell ，以此类推。
+            奇数个 fence 时，最后一个为未闭合的 code-cell ，延伸至字符串末尾。
+        - 负索引从末尾反向查找，正索引从开头正向查找。
+            反向查找以语言标记区分开始和结束 fence ，默认的 -1 只需查看末尾附近。
+            配对出现矛盾时，回退为正向的严格配对。对于 fence 正常配对的输出，正负索引的结果一致。
+        - 语言标记不区分大小写，仅识别 json 和 jsonc 。
+
+    性能对比: tests/benchmarks/json_fence_scanner_benchmark.py 。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+import string
+
+from typing import TYPE_CHECKING, NamedTuple
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+
+_FENCE = '```'
+_FENCE_LENGTH = len(_FENCE)
+_JSON_LANGUAGE_TAGS = frozenset({'json', 'jsonc'})
+_LANGUAGE_TAG_CHARS = frozenset(string.ascii_letters + string.digits + '_-+.')
+_LANGUAGE_TAG_FIRST_CHARS = frozenset(string.ascii_letters)
+
+
+class JsonFenceBlock(NamedTuple):
+    """
+    一个 markdown-code-cell 在原始字符串中的位置。
+
+    Attributes:
+        start (int): 开始 fence 的位置。
+        content_start (int): 内容开始的位置，即语言标记之后。
+        content_end (int): 内容结束的位置。未闭合时为字符串长度。
+        end (int): 结束 fence 之后的位置。未闭合时为字符串长度。
+        is_terminated (bool): 是否有结束 fence 。
+    """
+
+    start: int
+    content_start: int
+    content_end: int
+    end: int
+    is_terminated: bool
+
+
+class JsonFenceScanner:
+    """
+    工具类，在字符串中查找 json 的 markdown-code-cell 。
+
+    主要方法:
+        - find_json_block: 获取指定索引的 code-cell 中的内容。
+        - find_json_block_span: 获取指定索引的 code-cell 的位置。
+        - iter_json_block_spans: 按顺序或逆序遍历全部 json 的 code-cell 。
+    """
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def find_json_block(
+        raw_str: str,
+        index_to_choose: int = -1,
+        is_allow_unterminated: bool = True,
+    ) -> str | None:
+        """
+        获取指定索引的 json 的 markdown-code-cell 中的内容。
+
+        返回的内容与原本的正则一致，不做 strip ，由 json 相关库处理空白字符。
+
+        Args:
+            raw_str (str): 完全未处理的字符串结果。
+            index_to_choose (int): 选择提取的索引。支持正负索引，默认提取最后一个。
+            is_allow_unterminated (bool): 是否接受未闭合的最后一个 code-cell 。
+
+        Returns:
+            Union[str, None]:
+                - str: code-cell 中的内容。
+                - None: 没有对应索引的 code-cell 。
+        """
+        block = JsonFenceScanner.find_json_block_span(
+            raw_str=raw_str,
+            index_to_choose=index_to_choose,
+            is_allow_unterminated=is_allow_unterminated,
+        )
+        if block is None:
+            return None
+        return raw_str[block.content_start:block.content_end]
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def find_json_block_span(
+        raw_str: str,
+        index_to_choose: int = -1,
+        is_allow_unterminated: bool = True,
+    ) -> JsonFenceBlock | None:
+        """
+        获取指定索引的 json 的 markdown-code-cell 的位置。
+
+        Args:
+            raw_str (str): 完全未处理的字符串结果。
+            index_to_choose (int): 选择提取的索引。支持正负索引，默认提取最后一个。
+            is_allow_unterminated (bool): 是否接受未闭合的最后一个 code-cell 。
+
+        Returns:
+            Union[JsonFenceBlock, None]:
+                - JsonFenceBlock: code-cell 的位置。
+                - None: 没有对应索引的 code-cell 。
+        """
+        # 负索引反向查找，-1 即反向的第 0 个。
+        is_reverse = index_to_choose < 0
+        target = -index_to_choose - 1 if is_reverse else index_to_choose
+        blocks = JsonFenceScanner.iter_json_block_spans(
+            raw_str=raw_str,
+            is_reverse=is_reverse,
+            is_allow_unterminated=is_allow_unterminated,
+        )
+        for i, block in enumerate(blocks):
+            if i == target:
+                return block
+        return None
+
+    # ==== 基础方法。 ====
+    @staticmethod
+    def iter_json_block_spans(
+        raw_str: str,
+        is_reverse: bool = False,
+        is_allow_unterminated: bool = True,
+    ) -> Iterator[JsonFenceBlock]:
+        """
+        遍历全部 json 的 markdown-code-cell 的位置。惰性计算，找到需要的结果即可停止。
+
+        Args:
+            raw_str (str): 完全未处理的字符串结果。
+            is_reverse (bool): 是否从末尾反向遍历。
+            is_allow_unterminated (bool): 是否包含未闭合的最后一个 code-cell 。
+
+        Yields:
+            JsonFenceBlock: 语言标记为 json 的 code-cell 的位置。
+        """
+        all_blocks = (
+            JsonFenceScanner._iter_block_spans_backward(raw_str)
+            if is_reverse
+            else JsonFenceScanner._iter_block_spans_forward(raw_str)
+        )
+        for block in all_blocks:
+            if not block.is_terminated and not is_allow_unterminated:
+                continue
+            if JsonFenceScanner._is_json_language_tag(raw_str, block):
+                yield block
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def is_json_language_tag(
+        language_tag: str,
+    ) -> bool:
+        """语言标记是否为 json 。不区分大小写。"""
+        return language_tag.lower() in _JSON_LANGUAGE_TAGS
+
+    # ==== 内部方法。正向查找。 ====
+    @staticmethod
+    def _iter_block_spans_forward(
+        raw_str: str,
+    ) -> Iterator[JsonFenceBlock]:
+        length = len(raw_str)
+        position = 0
+        while True:
+            start = raw_str.find(_FENCE, position)
+            if start == -1:
+                return
+            content_start = JsonFenceScanner._skip_language_tag(raw_str, start + _FENCE_LENGTH)
+            content_end = raw_str.find(_FENCE, content_start)
+            if content_end == -1:
+                # 未闭合。一定是最后一个。
+                yield JsonFenceBlock(start, content_start, length, length, False)
+                return
+            end = content_end + _FENCE_LENGTH
+            yield JsonFenceBlock(start, content_start, content_end, end, True)
+            position = end
+
+    # ==== 内部方法。反向查找。 ====
+    @staticmethod
+    def _iter_block_spans_backward(
+        raw_str: str,
+    ) -> Iterator[JsonFenceBlock]:
+        length = len(raw_str)
+        position = length
+        last_fence = raw_str.rfind(_FENCE)
+        if last_fence == -1:
+            return
+        # 按 markdown 规则，结束 fence 之后没有语言标记。最后一个 fence 有语言标记时，即为未闭合的开始 fence 。
+        # 不使用 str.count 判断奇偶，避免扫描整个字符串。
+        if JsonFenceScanner._has_language_tag(raw_str, last_fence):
+            previous_fence = raw_str.rfind(_FENCE, 0, last_fence)
+            if previous_fence != -1 and JsonFenceScanner._has_language_tag(raw_str, previous_fence):
+                # 前一个 fence 应为结束 fence ，却有语言标记。无法判断，回退为从头严格配对。
+                yield from reversed(list(JsonFenceScanner._iter_block_spans_forward(raw_str)))
+                return
+            content_start = JsonFenceScanner._skip_language_tag(raw_str, last_fence + _FENCE_LENGTH)
+            yield JsonFenceBlock(last_fence, content_start, length, length, False)
+            position = last_fence
+        while True:
+            content_end = raw_str.rfind(_FENCE, 0, position)
+            if content_end == -1:
+                return
+            if JsonFenceScanner._has_language_tag(raw_str, content_end):
+                # 作为结束 fence 却有语言标记，说明配对有误 (例如结束 fence 后紧跟文本) 。剩余部分回退为从头严格配对。
+                for block in reversed(list(JsonFenceScanner._iter_block_spans_forward(raw_str))):
+                    if block.start < position:
+                        yield block
+                return
+            start = raw_str.rfind(_FENCE, 0, content_end)
+            if start == -1:
+                return
+            content_start = JsonFenceScanner._skip_language_tag(raw_str, start + _FENCE_LENGTH)
+            yield JsonFenceBlock(start, content_start, content_end, content_end + _FENCE_LENGTH, True)
+            position = start
+
+    # ==== 内部方法。语言标记。 ====
+    @staticmethod
+    def _skip_language_tag(
+        raw_str: str,
+        position: int,
+    ) -> int:
+        """跳过紧跟在开始 fence 之后的语言标记，返回内容开始的位置。"""
+        length = len(raw_str)
+        while position < length and raw_str[position] in _LANGUAGE_TAG_CHARS:
+            position += 1
+        return position
+
+    @staticmethod
+    def _has_language_tag(
+        raw_str: str,
+        fence_position: int,
+    ) -> bool:
+        """语言标记以字母开头。结束 fence 后紧跟的标点等不视为语言标记。"""
+        position = fence_position + _FENCE_LENGTH
+        return position < len(raw_str) and raw_str[position] in _LANGUAGE_TAG_FIRST_CHARS
+
+    @staticmethod
+    def _is_json_language_tag(
+        raw_str: str,
+        block: JsonFenceBlock,
+    ) -> bool:
+        return JsonFenceScanner.is_json_language_tag(raw_str[block.start + _FENCE_LENGTH:block.content_start])
+
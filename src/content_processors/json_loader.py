@@ -0,0 +1,197 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/content_processors/json_loader.py
+
+References:
+    None
+
+Synopsis:
+    加载 json 字符串的方法。JsonOutputExtractor 和 StructuredDataExtractor 共用。
+
+Notes:
+    json-repair 是纯 python 实现的修复解析器，远慢于 C 实现的严格解析器。
+    而 LLM 的输出绝大多数 (约 95%) 是格式正确的 json ，不需要修复。
+
+    'fast-then-repair' 模式按层级依次尝试，只有失败时才使用更慢的层级:
+        1. fast: orjson ，其次 msgspec 。都没有安装时使用标准库 json 。
+        2. json5: 符合 js 定义的输出，例如尾随逗号、单引号。
+        3. json-repair: 大概有 json 数据的结构，尝试自动修复。
+
+    orjson 和 msgspec 是可选依赖:
+        ```shell
+        pip install -U orjson
+        ```
+
+    每次成功加载的层级会记录在 JsonLoader.tier_counter 中，用于观察实际的修复比例。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.content_processors.payload_logger import PayloadLogger
+
+import json
+import json5
+import json_repair
+from collections import Counter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+from typing import TYPE_CHECKING, Literal
+# if TYPE_CHECKING:
+
+
+class JsonLoader:
+    """
+    工具类，加载 json 字符串。
+
+    主要方法:
+        - loads: 按 json_loader_name 加载。失败时抛出异常，由调用方处理。
+        - loads_or_error: 按 json_loader_name 加载。不抛出异常，返回异常。
+        - loads_fast_then_repair: 按层级依次尝试，返回结果和成功的层级。
+
+    状态:
+        - tier_counter (Counter): 'fast-then-repair' 模式下，各层级成功加载的次数。
+    """
+
+    tier_counter: Counter[str] = Counter()
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def loads(
+        raw_json_str: str,
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
+    ) -> dict | list | None:
+        """
+        按 json_loader_name 加载 json 字符串。
+
+        Args:
+            raw_json_str (str): str 形式的 structured-data 。
+            json_loader_name (Literal['json', 'json5', 'json-repair', 'fast-then-repair']): 加载 json 数据的方法。
+
+        Returns:
+            Union[Union[dict, list], None]: 加载的结果。json-repair 无法修复时可能为空字符串。
+
+        Raises:
+            Exception: 对应加载方法的异常。
+        """
+        if json_loader_name == 'json':
+            return json.loads(raw_json_str)
+        elif json_loader_name == 'json5':
+            return json5.loads(raw_json_str)
+        elif json_loader_name == 'json-repair':
+            return json_repair.loads(raw_json_str)
+        elif json_loader_name == 'fast-then-repair':
+            structured_data, _ = JsonLoader.loads_fast_then_repair(raw_json_str=raw_json_str)
+            return structured_data
+        raise ValueError(f"Unknown json_loader_name: {json_loader_name}")
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def loads_or_error(
+        raw_json_str: str,
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
+    ) -> tuple[dict | list | None, Exception | None]:
+        """
+        按 json_loader_name 加载 json 字符串，不抛出异常。
+
+        失败时仅记录异常的类名，原始字符串由 PayloadLogger 限速和采样地记录。
+
+        Args:
+            raw_json_str (str): str 形式的 structured-data 。
+            json_loader_name (Literal['json', 'json5', 'json-repair', 'fast-then-repair']): 加载 json 数据的方法。
+
+        Returns:
+            tuple[Union[Union[dict, list], None], Union[Exception, None]]:
+                - 加载成功: (加载的结果, None) 。
+                - 加载失败: (None, 异常) 。json-repair 无法修复时没有异常，为 (空的结果, None) 。
+        """
+        try:
+            return JsonLoader.loads(raw_json_str=raw_json_str, json_loader_name=json_loader_name), None
+        except Exception as e:
+            logger.error(f"Fail to load structured data from raw_json_str: {type(e).__name__}.")
+            PayloadLogger.log("Fail to load structured data from raw_json_str.", raw_json_str)
+            return None, e
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def locate_error(
+        raw_json_str: str,
+        error: Exception | None = None,
+    ) -> int | None:
+        """
+        获取加载失败的位置。仅在失败时使用。
+
+        优先使用异常中的位置 (json 和 orjson 的 JSONDecodeError) 。否则以标准库 json 重新加载一次来定位。
+        """
+        position = getattr(error, 'pos', None)
+        if isinstance(position, int):
+            return position
+        try:
+            json.loads(raw_json_str)
+        except json.JSONDecodeError as e:
+            return e.pos
+        except Exception:
+            return None
+        return None
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def loads_fast_then_repair(
+        raw_json_str: str,
+    ) -> tuple[dict | list | None, str]:
+        """
+        按层级依次尝试加载: fast -> json5 -> json-repair 。
+
+        Args:
+            raw_json_str (str): str 形式的 structured-data 。
+
+        Returns:
+            tuple[Union[Union[dict, list], None], str]: 加载的结果，以及成功的层级。
+                层级为 'orjson', 'msgspec', 'json', 'json5', 'json-repair' 之一。
+
+        Raises:
+            Exception: json-repair 的异常。前 2 个层级的异常不会抛出。
+        """
+        for tier, loads in (
+            (JsonLoader.get_fast_loader_name(), JsonLoader.fast_loads),
+            ('json5', json5.loads),
+        ):
+            try:
+                structured_data = loads(raw_json_str)
+            except Exception:
+                continue
+            JsonLoader.tier_counter[tier] += 1
+            return structured_data, tier
+        structured_data = json_repair.loads(raw_json_str)
+        logger.debug("Loaded structured data with json-repair.")
+        JsonLoader.tier_counter['json-repair'] += 1
+        return structured_data, 'json-repair'
+
+    # ==== 基础方法。 ====
+    @staticmethod
+    def fast_loads(
+        raw_json_str: str,
+    ) -> dict | list:
+        """使用已安装的最快的严格解析器加载。"""
+        if orjson is not None:
+            return orjson.loads(raw_json_str)
+        if msgspec is not None:
+            return msgspec.json.decode(raw_json_str)
+        return json.loads(raw_json_str)
+
+    @staticmethod
+    def get_fast_loader_name() -> Literal['orjson', 'msgspec', 'json']:
+        """fast 层级实际使用的解析器。"""
+        if orjson is not None:
+            return 'orjson'
+        if msgspec is not None:
+            return 'msgspec'
+        return 'json'
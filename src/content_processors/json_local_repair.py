@@ -0,0 +1,295 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/content_processors/json_local_repair.py
+
+References:
+    None
+
+Synopsis:
+    在本地分阶段修复结构化输出，仅在全部失败时重新生成。
+
+Notes:
+    BaseAgent (V1) 的重试每次都会重新发送完整的 chat-history 。
+    而大多数的失败是解析失败，在本地即可修复，不需要请求 LLM 。
+
+    依次尝试:
+        1. json-repair: 从最后一个 code-cell 内容的起点修复，见 JsonOutputExtractor.repair_json_block 。
+        2. coerce: 最后一个 code-cell 的数据结构接近 schema ，进行简单的转换。例如 dict 被包裹在单元素的 list 中。
+        3. other-fence: 最后一个 code-cell 中没有 json ，但之前的 json 的 code-cell 可用。
+        4. unfenced: 没有 code-cell 包裹的顶层 json 。
+    最后一个 code-cell 中有 json 时，它就是最终的回答，只修复它，不使用其他的 json 。
+    之前的 code-cell 和正文中的 json 通常是 prompt 的示例或放弃的草稿，不能作为回答。
+    修复成功时，原始字符串中的 json 被替换为修复后的 code-cell ，之后的提取可以直接使用默认的最后一个 code-cell 。
+
+    每个阶段成功的次数记录在 JsonLocalRepair.stage_counter 中，'unrepaired' 为需要重新生成的次数。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.content_processors.json_fence_scanner import JsonFenceScanner
+from src.content_processors.json_input_processor import JsonInputProcessor
+from src.content_processors.json_loader import JsonLoader
+from src.content_processors.json_output_extractor import JsonOutputExtractor
+
+import json
+from collections import Counter
+
+from typing import TYPE_CHECKING, Literal, NamedTuple
+if TYPE_CHECKING:
+    from pydantic import BaseModel
+
+
+# 查找顶层 json 时，最多尝试的起点数量。避免在很长的输出中逐个字符尝试。
+_MAX_UNFENCED_CANDIDATES = 64
+
+_REPAIR_STAGES = ('json-repair', 'coerce', 'other-fence', 'unfenced')
+
+
+class LocalRepairResult(NamedTuple):
+    """
+    本地修复的结果。
+
+    Attributes:
+        stage (str): 成功的阶段。
+        repaired_str (str): 替换为修复结果的字符串。
+        structured_data (Union[dict, list]): 修复后的结构化数据。
+    """
+
+    stage: str
+    repaired_str: str
+    structured_data: dict | list
+
+
+class JsonLocalRepair:
+    """
+    工具类，在本地分阶段修复结构化输出。
+
+    主要方法:
+        - repair: 依次尝试各个阶段，返回第一个成功的结果。
+        - get_stage_hit_rates: 各个阶段的命中率。
+
+    状态:
+        - stage_counter (Counter): 各个阶段成功的次数，以及 'unrepaired' 的次数。
+    """
+
+    stage_counter: Counter[str] = Counter()
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def repair(
+        raw_str: str,
+        schema_pydantic_base_model: type[BaseModel] = None,
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> LocalRepairResult | None:
+        """
+        依次尝试各个阶段，在本地修复结构化输出。
+
+        Args:
+            raw_str (str): 提取失败的 LLM 输出。
+            schema_pydantic_base_model (type[BaseModel], optional): pydantic 定义的数据类。不指定时仅要求是 dict 或 list 。
+            schema_check_type (Literal['dict', 'list']): 检验 schema 的方法。
+
+        Returns:
+            Union[LocalRepairResult, None]:
+                - LocalRepairResult: 修复的结果。
+                - None: 全部阶段均失败，需要重新生成。
+        """
+        repair_stages = [
+            ('json-repair', JsonLocalRepair.repair_with_json_repair),
+            ('coerce', JsonLocalRepair.repair_with_coercion),
+        ]
+        if not JsonLocalRepair.has_final_block(raw_str=raw_str):
+            repair_stages.extend([
+                ('other-fence', JsonLocalRepair.repair_with_other_fence),
+                ('unfenced', JsonLocalRepair.repair_with_unfenced_json),
+            ])
+        for stage, repair_stage in repair_stages:
+            repaired = repair_stage(
+                raw_str=raw_str,
+                schema_pydantic_base_model=schema_pydantic_base_model,
+                schema_check_type=schema_check_type,
+            )
+            if repaired is not None:
+                JsonLocalRepair.stage_counter[stage] += 1
+                logger.info(f"Repaired structured output locally: {stage}.")
+                repaired_str, structured_data = repaired
+                return LocalRepairResult(stage=stage, repaired_str=repaired_str, structured_data=structured_data)
+        JsonLocalRepair.stage_counter['unrepaired'] += 1
+        return None
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def get_stage_hit_rates() -> dict[str, float]:
+        """各个阶段成功的次数占全部修复次数的比例。包括 'unrepaired' 。"""
+        total = JsonLocalRepair.stage_counter.total()
+        if total == 0:
+            return {}
+        return {
+            stage: JsonLocalRepair.stage_counter[stage] / total
+            for stage in (*_REPAIR_STAGES, 'unrepaired')
+        }
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def has_final_block(
+        raw_str: str,
+    ) -> bool:
+        """最后一个 json 的 code-cell 中是否有 json 。有时只修复这个 code-cell 。"""
+        block = JsonFenceScanner.find_json_block_span(raw_str=raw_str, index_to_choose=-1)
+        if block is None:
+            return False
+        return JsonLocalRepair._find_json_start(raw_str[block.content_start:block.content_end], 0) >= 0
+
+    # ==== 修复阶段。 ====
+    @staticmethod
+    def repair_with_other_fence(
+        raw_str: str,
+        schema_pydantic_base_model: type[BaseModel] = None,
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> tuple[str, dict | list] | None:
+        """最后一个 code-cell 中没有 json 时，从末尾向前查找其他可用的 json 的 code-cell 。"""
+        blocks = JsonFenceScanner.iter_json_block_spans(raw_str=raw_str, is_reverse=True)
+        last_block = next(blocks, None)
+        if last_block is None:
+            return None
+        for block in blocks:
+            raw_structured_data = JsonLocalRepair._try_loads(raw_str[block.content_start:block.content_end])
+            if JsonLocalRepair._is_valid(raw_structured_data, schema_pydantic_base_model, schema_check_type):
+                return JsonLocalRepair._replace(raw_str, last_block.start, last_block.end, raw_structured_data)
+        return None
+
+    # ==== 修复阶段。 ====
+    @staticmethod
+    def repair_with_unfenced_json(
+        raw_str: str,
+        schema_pydantic_base_model: type[BaseModel] = None,
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> tuple[str, dict | list] | None:
+        """
+        查找没有 code-cell 包裹的顶层 json 。选择最后一个可用的。仅在没有包含 json 的最后一个 code-cell 时使用。
+
+        仅使用严格的 json 解析，从每个 `{` 或 `[` 尝试 raw_decode ，成功后跳过已解析的部分。
+        """
+        decoder = json.JSONDecoder()
+        result = None
+        position = 0
+        for _ in range(_MAX_UNFENCED_CANDIDATES):
+            position = JsonLocalRepair._find_json_start(raw_str, position)
+            if position < 0:
+                break
+            try:
+                raw_structured_data, end = decoder.raw_decode(raw_str, position)
+            except json.JSONDecodeError:
+                position += 1
+                continue
+            if JsonLocalRepair._is_valid(raw_structured_data, schema_pydantic_base_model, schema_check_type):
+                result = (position, end, raw_structured_data)
+            position = end
+        if result is None:
+            return None
+        return JsonLocalRepair._replace(raw_str, *result)
+
+    # ==== 修复阶段。 ====
+    @staticmethod
+    def repair_with_json_repair(
+        raw_str: str,
+        schema_pydantic_base_model: type[BaseModel] = None,
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> tuple[str, dict | list] | None:
+        """使用 json-repair 修复最后一个 code-cell 。"""
+        return JsonOutputExtractor.repair_json_block(
+            raw_str=raw_str,
+            index_to_choose=-1,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+            schema_check_type=schema_check_type,
+        )
+
+    # ==== 修复阶段。 ====
+    @staticmethod
+    def repair_with_coercion(
+        raw_str: str,
+        schema_pydantic_base_model: type[BaseModel] = None,
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> tuple[str, dict | list] | None:
+        """
+        最后一个 code-cell 可以加载但结构不符合 schema 时，进行简单的转换:
+            - dict: 单元素的 list 中的 dict ，或仅有一个 key 的 dict 中包裹的 dict 。
+            - list: dict 中唯一的 list ，或单独的 dict 作为 list 的唯一元素。
+        """
+        if schema_pydantic_base_model is None:
+            return None
+        block = JsonFenceScanner.find_json_block_span(raw_str=raw_str, index_to_choose=-1)
+        if block is None:
+            return None
+        raw_structured_data = JsonLocalRepair._try_loads(raw_str[block.content_start:block.content_end])
+        for candidate in JsonLocalRepair._iter_coercions(raw_structured_data, schema_check_type):
+            if JsonLocalRepair._is_valid(candidate, schema_pydantic_base_model, schema_check_type):
+                return JsonLocalRepair._replace(raw_str, block.start, block.end, candidate)
+        return None
+
+    # ==== 内部方法。 ====
+    @staticmethod
+    def _iter_coercions(
+        raw_structured_data: dict | list | None,
+        schema_check_type: Literal['dict', 'list'],
+    ):
+        if schema_check_type == 'dict':
+            if isinstance(raw_structured_data, list) and len(raw_structured_data) == 1:
+                yield raw_structured_data[0]
+            if isinstance(raw_structured_data, dict) and len(raw_structured_data) == 1:
+                yield next(iter(raw_structured_data.values()))
+        elif schema_check_type == 'list' and isinstance(raw_structured_data, dict):
+            list_values = [value for value in raw_structured_data.values() if isinstance(value, list)]
+            if len(list_values) == 1:
+                yield list_values[0]
+            yield [raw_structured_data]
+
+    @staticmethod
+    def _is_valid(
+        raw_structured_data,
+        schema_pydantic_base_model: type[BaseModel] | None,
+        schema_check_type: Literal['dict', 'list'],
+    ) -> bool:
+        if not isinstance(raw_structured_data, (dict, list)) or not raw_structured_data:
+            return False
+        if schema_pydantic_base_model is None:
+            return True
+        return JsonOutputExtractor.find_schema_error(
+            raw_structured_data=raw_structured_data,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+            schema_check_type=schema_check_type,
+        ) is None
+
+    @staticmethod
+    def _try_loads(
+        raw_json_str: str,
+    ) -> dict | list | None:
+        """静默加载。修复过程中的失败是预期的，不记录日志。"""
+        try:
+            structured_data, _ = JsonLoader.loads_fast_then_repair(raw_json_str=raw_json_str)
+        except Exception:
+            return None
+        return structured_data
+
+    @staticmethod
+    def _find_json_start(
+        raw_str: str,
+        start: int,
+    ) -> int:
+        brace_position = raw_str.find('{', start)
+        bracket_position = raw_str.find('[', start)
+        if brace_position < 0 or bracket_position < 0:
+            return max(brace_position, bracket_position)
+        return min(brace_position, bracket_position)
+
+    @staticmethod
+    def _replace(
+        raw_str: str,
+        start: int,
+        end: int,
+        structured_data: dict | list,
+    ) -> tuple[str, dict | list]:
+        """将 [start, end) 替换为结构化数据的 code-cell 。"""
+        repaired_str = raw_str[:start] + JsonInputProcessor.put_in_markdown(structured_data) + raw_str[end:]
+        return repaired_str, structured_data
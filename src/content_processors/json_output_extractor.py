@@ -27,13 +27,19 @@ Notes:
 from __future__ import annotations
 from loguru import logger
 
-import json
-import json5
+from src.content_processors.batch_extraction import BatchExtraction
+from src.content_processors.extraction_result import ExtractionOutcome, ExtractionResult
+from src.content_processors.json_fence_scanner import JsonFenceScanner
+from src.content_processors.json_input_processor import JsonInputProcessor
+from src.content_processors.json_loader import JsonLoader
+from src.content_processors.schema_validator_cache import SchemaValidatorCache
+
 import json_repair
-import re
 
 from typing import TYPE_CHECKING, Literal
 if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
     from pydantic import BaseModel
 
 
@@ -44,11 +50,14 @@ class JsonOutputExtractor:
     所有方法均返回 JSONReturnType 或者 None。None 无论是什么原因，都需要重新生成。
 
     流程为:
-        raw_str (str) --re--> raw_json_str (str) --json.loads--> raw_structured_data (JSONReturnType)
+        raw_str (str) --scanner--> raw_json_str (str) --json.loads--> raw_structured_data (JSONReturnType)
         --schema--> structured_data (BaseModel)
 
     主要方法:
         - extract_json_from_str: 封装所有操作的方法，需要指定相关参数。
+        - extract_json_with_outcome: 同时返回结果代码，区分失败的原因。
+        - extract_json_result: 返回 ExtractionResult ，包含失败的阶段和出错位置。
+        - extract_many: 批量提取，多进程分块运行。
     """
 
     # ==== 暴露方法。主要方法。 ====
@@ -56,7 +65,7 @@ class JsonOutputExtractor:
     def extract_json_from_str(
         raw_str: str,
         index_to_choose: int = -1,
-        json_loader_name: Literal['json', 'json5', 'json-repair'] = 'json-repair',
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
         schema_pydantic_base_model: type[BaseModel] = None,
         schema_check_type: Literal['dict', 'list'] = 'dict',
     ) -> dict | list | None:
@@ -67,7 +76,7 @@ class JsonOutputExtractor:
             - 从 markdown-code-cell 中提取 json 数据。
 
         实现:
-            - 正则提取 markdown-code-cell 中的内容。默认提取最后一个。
+            - 查找 markdown-code-cell 中的内容。默认提取最后一个。
             - 使用 json 相关库加载和转换数据。有多种加载工具，因为该工具类设计面对的是 LLM 的输出，默认使用 'json-repair' 。
             - 使用 pydantic 解析具体字段的正确性。静默判断。
 
@@ -83,10 +92,11 @@ class JsonOutputExtractor:
         Args:
             raw_str (str): LLM 输出的 str 部分。
             index_to_choose (int, optional): 选择提取的索引。可能会输出多个结果。默认提取最后一个。
-            json_loader_name (Literal['json', 'json5', 'json-repair']): 加载 json 数据的方法。3 个加载包的区别是:
+            json_loader_name (Literal['json', 'json5', 'json-repair', 'fast-then-repair']): 加载 json 数据的方法。区别是:
                 - json: 最严格，需要完全符合 json 定义。
                 - json5: 符合 js 的定义可以正常解析。
                 - json-repair: 大概有 json 数据的结构，会尝试自动修复。
+                - fast-then-repair: 依次尝试 orjson/msgspec/json 、json5 、json-repair ，仅失败时使用更慢的层级。
                 默认选择 json-repair ，这样最节省 LLM 推理资源。需要 schema-check 后面会有进一步判断操作。
             schema_pydantic_base_model (type[BaseModel], optional): pydantic 定义的数据类。
                 当有这个参数，会进行 structured-output 检测。
@@ -99,81 +109,199 @@ class JsonOutputExtractor:
                     可能有多种原因，或许需要重试机制。(最简单，也是这个工具类的目的。)
                     正常解析也会遇到 None ，但是无论那种原因，None 都不可以用，需要再次生成。
         """
-        # 正则匹配
-        raw_json_str = JsonOutputExtractor.re_match(
+        outcome, structured_data = JsonOutputExtractor.extract_json_with_outcome(
+            raw_str=raw_str,
+            index_to_choose=index_to_choose,
+            json_loader_name=json_loader_name,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+            schema_check_type=schema_check_type,
+        )
+        return structured_data
+
+    # ==== 暴露方法。 ====
+    @staticmethod
+    def extract_json_with_outcome(
+        raw_str: str,
+        index_to_choose: int = -1,
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
+        schema_pydantic_base_model: type[BaseModel] = None,
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> tuple[ExtractionOutcome, dict | list | None]:
+        """
+        与 extract_json_from_str 相同，但同时返回结果代码，区分失败的原因。
+
+        Args:
+            同 extract_json_from_str 。
+
+        Returns:
+            tuple[ExtractionOutcome, Union[Union[dict, list], None]]:
+                - ExtractionOutcome: 结果代码。OK 时提取结果不为 None 。
+                - Union[Union[dict, list], None]: 提取结果。
+        """
+        result = JsonOutputExtractor.extract_json_result(
             raw_str=raw_str,
             index_to_choose=index_to_choose,
+            json_loader_name=json_loader_name,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+            schema_check_type=schema_check_type,
         )
-        if not raw_json_str:
-            return None  # 输出 1 。没有 json-output 。
+        return result.outcome, result.structured_data
+
+    # ==== 暴露方法。 ====
+    @staticmethod
+    def extract_json_result(
+        raw_str: str,
+        index_to_choose: int = -1,
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
+        schema_pydantic_base_model: type[BaseModel] = None,
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> ExtractionResult:
+        """
+        与 extract_json_from_str 相同，但返回 ExtractionResult ，包含失败的阶段、异常的类名、出错位置和片段。
+
+        调用方可以根据失败的阶段选择恢复方法，见 ExtractionResult.get_recovery_action 。
+
+        Args:
+            同 extract_json_from_str 。
+
+        Returns:
+            ExtractionResult: 提取结果。offset 为在 raw_str 中的偏移。
+        """
+        # 查找 markdown-code-cell
+        block = JsonFenceScanner.find_json_block_span(
+            raw_str=raw_str,
+            index_to_choose=index_to_choose,
+        )
+        if block is None or block.content_start == block.content_end:
+            logger.warning("No JSON outputs.")
+            return ExtractionResult(outcome=ExtractionOutcome.NO_FENCE)  # 输出 1 。没有 json-output 。
+        raw_json_str = raw_str[block.content_start:block.content_end]
         # 转换为 python 中的 structured-data 。
-        raw_structured_data = JsonOutputExtractor.load_structured_data_from_raw_json_str(
+        raw_structured_data, error = JsonLoader.loads_or_error(
             raw_json_str=raw_json_str,
             json_loader_name=json_loader_name,
         )
         if not raw_structured_data:
-            return None  # 输出 2 。structured-data 格式错误。
+            position = JsonLoader.locate_error(raw_json_str=raw_json_str, error=error)
+            return ExtractionResult.from_failure(
+                outcome=ExtractionOutcome.LOAD_FAILURE,
+                raw_str=raw_str,
+                offset=block.content_start + (position or 0),
+                error=error,
+            )  # 输出 2 。structured-data 格式错误。
         # schema 检测。只有需要的时候才检测。
         if schema_pydantic_base_model:
-            if schema_check_type == 'dict' and not JsonOutputExtractor.check_dict_schema(
-                raw_dict_structured_data=raw_structured_data,
+            error = JsonOutputExtractor.find_schema_error(
+                raw_structured_data=raw_structured_data,
                 schema_pydantic_base_model=schema_pydantic_base_model,
-            ):
-                return None  # 输出 3 。需要 schema 检测，并且检测未通过。(not None，2 个条件都为True。)
-            elif schema_check_type == 'list' and not JsonOutputExtractor.check_list_schema(
-                raw_list_structured_data=raw_structured_data,
-                schema_pydantic_base_model=schema_pydantic_base_model,
-            ):
-                return None  # 输出 3 。需要 schema 检测，并且检测未通过。(not None，2 个条件都为 True 。)
+                schema_check_type=schema_check_type,
+            )
+            if error is not None:
+                return ExtractionResult.from_failure(
+                    outcome=ExtractionOutcome.SCHEMA_FAILURE,
+                    raw_str=raw_str,
+                    offset=block.content_start,
+                    error=error,
+                )  # 输出 3 。需要 schema 检测，并且检测未通过。
         # 通过所有的检测。或者不需要 schema 检测。
-        return raw_structured_data  # 输出 4 。不需要 schema 检测。或者，需要 schema 检测，同时检测通过。
+        return ExtractionResult(outcome=ExtractionOutcome.OK, structured_data=raw_structured_data)  # 输出 4 。
 
-    # ==== 基础方法。正则匹配。 ====
+    # ==== 暴露方法。批量处理。 ====
+    @staticmethod
+    def extract_many(
+        raw_strs: Iterable[str] | None = None,
+        jsonl_path: str | Path | None = None,
+        jsonl_content_key: str = 'content',
+        index_to_choose: int = -1,
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
+        schema_pydantic_base_model: type[BaseModel] = None,
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+        max_workers: int | None = None,
+        chunk_size: int = 256,
+    ) -> list[tuple[ExtractionOutcome, dict | list | None]]:
+        """
+        批量提取。多进程分块运行 extract_json_with_outcome ，结果与输入顺序一致。
+
+        输入为 raw_strs 和 jsonl_path 之一。jsonl_path 以 mmap 逐行读取，不需要一次性加载整个文件。
+
+        Args:
+            raw_strs (Iterable[str], optional): 全部的原始字符串。可以是惰性的迭代器。
+            jsonl_path (Union[str, Path], optional): JSONL 文件的路径。每行为 str ，或为包含原始字符串的 dict 。
+            jsonl_content_key (str): 每行为 dict 时，原始字符串所在的 key 。
+            index_to_choose, json_loader_name, schema_pydantic_base_model, schema_check_type: 同 extract_json_from_str 。
+                schema_pydantic_base_model 需要定义在模块的顶层，才可以传递给工作进程。
+            max_workers (int, optional): 进程数量。默认为 CPU 数量。为 0 时在当前进程中运行。
+            chunk_size (int): 每个任务处理的字符串数量。
+
+        Returns:
+            list[tuple[ExtractionOutcome, Union[Union[dict, list], None]]]: 每条输入的结果代码和提取结果。
+        """
+        if (raw_strs is None) == (jsonl_path is None):
+            raise ValueError("raw_strs 和 jsonl_path 需要且仅需要指定一个。")
+        if jsonl_path is not None:
+            raw_strs = BatchExtraction.iter_jsonl_contents(jsonl_path=jsonl_path, content_key=jsonl_content_key)
+        return BatchExtraction.run(
+            extract_with_outcome=JsonOutputExtractor.extract_json_with_outcome,
+            raw_strs=raw_strs,
+            extract_kwargs=dict(
+                index_to_choose=index_to_choose,
+                json_loader_name=json_loader_name,
+                schema_pydantic_base_model=schema_pydantic_base_model,
+                schema_check_type=schema_check_type,
+            ),
+            max_workers=max_workers,
+            chunk_size=chunk_size,
+        )
+
+    # ==== 基础方法。查找 code-cell 。 ====
     @staticmethod
     def re_match(
         raw_str: str,
         index_to_choose: int = -1
     ) -> str | None:
         """
-        正则查找 markdown-code-cell ，提取其中的结果。默认选择最后一个匹配项。
+        查找 markdown-code-cell ，提取其中的结果。默认选择最后一个匹配项。
+
+        保留原本的方法名。实现已由正则改为 JsonFenceScanner ，支持 `JSON` 和 `jsonc` 标记，以及未闭合的最后一个 code-cell 。
 
         Args:
             raw_str (str): 完全未处理的字符串结果
             index_to_choose (int): 选择提取的索引。
                 可能会输出多个结果。默认提取最后一个。
-                可进行自定义，但是一般 LLM 的输出限制会指定最后一个。
+                可进行自定义，但是一般 LLM 的输出限制会指定最后一个。支持正负索引。
 
         Returns:
             Union[str, None]:
                 - str: 正常提取的结果。
-                - None: 完全没有匹配结果。
+                - None: 没有对应索引的匹配结果。
         """
-        # 正则匹配。默认是 markdown-cell 中 json 数据。
-        pattern = r'```json(.*?)```'
-        matches = re.findall(pattern, raw_str, re.DOTALL)
+        # 查找 markdown-cell 中 json 数据。不构建全部匹配的列表，默认从末尾反向查找。
+        raw_json_str = JsonFenceScanner.find_json_block(
+            raw_str=raw_str,
+            index_to_choose=index_to_choose,
+        )
         # 如果没有找到。一般在 prompt 中指定，就不会发生这种情况。
-        if not matches:
+        if raw_json_str is None:
             logger.warning("No JSON outputs.")
             return None  # 输出 1 。提取失败。
-        # 提取结果。可能需要根据任务而定。
-        raw_json_str: str = matches[index_to_choose]
         return raw_json_str  # 输出 2 。提取成功。
 
     # ==== 基础方法。加载json。 ====
     @staticmethod
     def load_structured_data_from_raw_json_str(
         raw_json_str: str,
-        json_loader_name: Literal['json', 'json5', 'json-repair'] = 'json-repair',
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
     ) -> dict | list | None:
         """
         一些情况下，LLM 输出会带有奇怪格式。进行加载检验。
 
         Args:
             raw_json_str (str): 可能是 str 的 structured-data ，需要转换为 python 中的 structured-data 。
-            json_loader_name (Literal['json', 'json5', 'json-repair']): 加载 json 数据的方法。3 个加载包的区别是:
+            json_loader_name (Literal['json', 'json5', 'json-repair', 'fast-then-repair']): 加载 json 数据的方法。区别是:
                 - json: 最严格，需要完全符合 json 定义。
                 - json5: 符合 js 的定义可以正常解析。
                 - json-repair: 大概有 json 数据的结构，会尝试自动修复。
+                - fast-then-repair: 依次尝试 orjson/msgspec/json 、json5 、json-repair ，仅失败时使用更慢的层级。
                 默认选择 json-repair ，这样最节省 LLM 推理资源。需要 schema-check 后面会有进一步判断操作。
 
         Returns:
@@ -181,20 +309,12 @@ class JsonOutputExtractor:
                 - Union[dict, list]: 转换成功。
                 - None: 转换失败。
         """
-        try:
-            # 尝试进行转换。# 输出 2 。成功转换。
-            if json_loader_name == 'json':
-                return json.loads(raw_json_str)
-            elif json_loader_name == 'json5':
-                return json5.loads(raw_json_str)
-            elif json_loader_name == 'json-repair':
-                return json_repair.loads(raw_json_str)
-        except Exception as e:
-            # 转换失败。打印错误，打印原始字符串。
-            logger.error(e)
-            logger.error(raw_json_str)
-            logger.error("Fail to load structured data from raw_json_str.")
-            return None  # 输出 1 。structured data 格式错误。
+        # 失败时仅记录异常的类名，原始字符串限速和采样地记录。
+        raw_structured_data, error = JsonLoader.loads_or_error(
+            raw_json_str=raw_json_str,
+            json_loader_name=json_loader_name,
+        )
+        return raw_structured_data
 
     # ==== 基础方法。检查schema。 ====
     @staticmethod
@@ -225,14 +345,11 @@ class JsonOutputExtractor:
         """
         if not isinstance(raw_dict_structured_data, dict):
             return None
-        try:
-            # dataclass 定义检测，试转换。
-            schema_pydantic_base_model(**raw_dict_structured_data)
-        except Exception as e:
-            # 转换失败。打印错误，打印原始字符串。
-            logger.error(e)
-            logger.error(raw_dict_structured_data)
-            logger.error("Failed in dict schema.")
+        # dataclass 定义检测。使用按 schema 缓存的检验方法，失败时不打印原始数据。
+        if not SchemaValidatorCache.check_dict(
+            raw_dict_structured_data=raw_dict_structured_data,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+        ):
             return None  # 输出 1 。不符合 dataclass 定义。可能是字段，可能是数据类型。
         return raw_dict_structured_data  # 输出 2 。通过检测。但是不进行额外处理。
 
@@ -268,34 +385,108 @@ class JsonOutputExtractor:
         """
         if not isinstance(raw_list_structured_data, list):
             return None
-        try:
-            # dataclass 定义检测，试转换。
-            schema_pydantic_base_model(items=raw_list_structured_data)
-        except Exception as e:
-            # 转换失败。打印错误，打印原始字符串。
-            logger.error(e)
-            logger.error(raw_list_structured_data)
-            logger.error("Failed in list schema.")
+        # dataclass 定义检测。仅检验 `items` 字段，不构建外层的数据类。
+        if not SchemaValidatorCache.check_list(
+            raw_list_structured_data=raw_list_structured_data,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+        ):
             return None  # 输出 1 。不符合 dataclass 定义。可能是字段，可能是数据类型。
         return raw_list_structured_data  # 输出 2 。通过检测。但是不进行额外处理。
 
+    # ==== 基础方法。检查schema。 ====
+    @staticmethod
+    def find_schema_error(
+        raw_structured_data: dict | list,
+        schema_pydantic_base_model: type[BaseModel],
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> Exception | None:
+        """
+        与 check_dict_schema 和 check_list_schema 相同，但返回检验失败的异常。通过时返回 None 。
+
+        类型不是 dict 或 list 时返回 TypeError 。
+        """
+        expected_type = dict if schema_check_type == 'dict' else list
+        if not isinstance(raw_structured_data, expected_type):
+            return TypeError(f"Expected {expected_type.__name__}, got {type(raw_structured_data).__name__}.")
+        if schema_check_type == 'dict':
+            return SchemaValidatorCache.find_dict_error(
+                raw_dict_structured_data=raw_structured_data,
+                schema_pydantic_base_model=schema_pydantic_base_model,
+            )
+        return SchemaValidatorCache.find_list_error(
+            raw_list_structured_data=raw_structured_data,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+        )
+
+    # ==== 基础方法。本地修复。 ====
+    @staticmethod
+    def repair_json_block(
+        raw_str: str,
+        index_to_choose: int = -1,
+        schema_pydantic_base_model: type[BaseModel] = None,
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> tuple[str, dict | list] | None:
+        """
+        在本地修复格式错误的 json 的 code-cell 。用于 LOAD_FAILURE ，不需要请求 LLM 。
+
+        code-cell 格式错误常见的原因是内容中有嵌套的 code-cell ，导致提前闭合，或者输出被截断。
+        因此从 code-cell 内容的起点到字符串末尾整体使用 json-repair 修复，而不仅是 code-cell 的内容。
+
+        Args:
+            raw_str (str): LLM 输出的 str 部分。
+            index_to_choose, schema_pydantic_base_model, schema_check_type: 同 extract_json_from_str 。
+
+        Returns:
+            Union[tuple[str, Union[dict, list]], None]:
+                - tuple[str, Union[dict, list]]: 替换为修复结果的字符串，以及修复后的结构化数据。
+                - None: 无法修复，或修复结果未通过 schema 检测。
+        """
+        block = JsonFenceScanner.find_json_block_span(raw_str=raw_str, index_to_choose=index_to_choose)
+        if block is None:
+            return None
+        # 修复范围有 2 种: 仅 code-cell 的内容，保留之后的文本；或到字符串末尾，之后的文本被视为 json 的一部分。
+        # 之后还有 code-cell 的标记时，更可能是嵌套导致的提前闭合，优先修复到字符串末尾。
+        repair_ranges = [(block.content_end, block.end), (len(raw_str), len(raw_str))]
+        if '```' in raw_str[block.end:]:
+            repair_ranges.reverse()
+        for repair_end, keep_start in repair_ranges:
+            try:
+                raw_structured_data = json_repair.loads(raw_str[block.content_start:repair_end])
+            except Exception as e:
+                logger.error(f"Fail to repair structured data: {type(e).__name__}.")
+                continue
+            if not isinstance(raw_structured_data, (dict, list)) or not raw_structured_data:
+                continue
+            if schema_pydantic_base_model and JsonOutputExtractor.find_schema_error(
+                raw_structured_data=raw_structured_data,
+                schema_pydantic_base_model=schema_pydantic_base_model,
+                schema_check_type=schema_check_type,
+            ) is not None:
+                continue
+            repaired_str = (
+                raw_str[:block.start]
+                + JsonInputProcessor.put_in_markdown(raw_structured_data)
+                + raw_str[keep_start:]
+            )
+            return repaired_str, raw_structured_data
+        return None
+
     # ==== 暂未添加的方法。 ====
     @staticmethod
     def delete_last_json(
         text: str
     ) -> str:
         """
-        使用正则方法，从原始字符串中删除最后一个 markdown 的 json-cell 。
+        从原始字符串中删除最后一个 markdown 的 json-cell 。
 
         Args:
             text (str): 原始文本。
 
         Returns:
-            str: 删除最后后一个 markdown 的 json-cell 的原始文本。
+            str: 删除最后后一个 markdown 的 json-cell 的原始文本。没有 json-cell 时返回原始文本。
         """
-        pattern = r'```json(.*?)```'
-        matches = list(re.finditer(pattern, text, re.DOTALL))
-        last = matches[-1]
-        start, end = last.span()
-        return text[:start] + text[end:]
+        last = JsonFenceScanner.find_json_block_span(raw_str=text, index_to_choose=-1)
+        if last is None:
+            return text
+        return text[:last.start] + text[last.end:]
 
@@ -0,0 +1,100 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/content_processors/payload_logger.py
+
+References:
+    None
+
+Synopsis:
+    限速和采样的原始数据日志。
+
+Notes:
+    提取失败时打印完整的原始字符串，在高负载下格式化和写入大量日志会消耗可观的 CPU 和磁盘 I/O 。
+    这个工具类:
+        - 采样: 仅以 sample_rate 的概率记录。
+        - 限速: 每 interval_seconds 最多记录 max_per_interval 条。
+        - 截断: 仅记录前 max_length 个字符。
+    未被记录时不会格式化原始数据。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+import random
+import threading
+import time
+
+from typing import TYPE_CHECKING, Any
+# if TYPE_CHECKING:
+
+
+class PayloadLogger:
+    """
+    工具类，限速和采样地记录原始数据。配置为类属性，全局共享。
+
+    主要方法:
+        - log: 记录一条原始数据。
+        - configure: 修改配置。
+    """
+
+    sample_rate: float = 0.1
+    max_per_interval: int = 5
+    interval_seconds: float = 60.0
+    max_length: int = 500
+
+    _lock = threading.Lock()
+    _window_start: float = 0.0
+    _window_count: int = 0
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def log(
+        message: str,
+        payload: Any,
+    ) -> bool:
+        """
+        以 error 级别记录一条原始数据。
+
+        Args:
+            message (str): 说明。
+            payload (Any): 原始数据。仅在被记录时转换为字符串。
+
+        Returns:
+            bool: 是否被记录。
+        """
+        if random.random() >= PayloadLogger.sample_rate:
+            return False
+        with PayloadLogger._lock:
+            now = time.monotonic()
+            if now - PayloadLogger._window_start >= PayloadLogger.interval_seconds:
+                PayloadLogger._window_start = now
+                PayloadLogger._window_count = 0
+            if PayloadLogger._window_count >= PayloadLogger.max_per_interval:
+                return False
+            PayloadLogger._window_count += 1
+        payload_str = str(payload)
+        if len(payload_str) > PayloadLogger.max_length:
+            payload_str = f"{payload_str[:PayloadLogger.max_length]}... ({len(payload_str)} chars)"
+        logger.error(f"{message} Payload: {payload_str}")
+        return True
+
+    # ==== 配置方法。 ====
+    @staticmethod
+    def configure(
+        sample_rate: float | None = None,
+        max_per_interval: int | None = None,
+        interval_seconds: float | None = None,
+        max_length: int | None = None,
+    ) -> None:
+        """修改全局配置。未指定的参数保持不变，限速的计数重新开始。调试时可以设置 sample_rate=1.0 。"""
+        if sample_rate is not None:
+            PayloadLogger.sample_rate = sample_rate
+        if max_per_interval is not None:
+            PayloadLogger.max_per_interval = max_per_interval
+        if interval_seconds is not None:
+            PayloadLogger.interval_seconds = interval_seconds
+        if max_length is not None:
+            PayloadLogger.max_length = max_length
+        with PayloadLogger._lock:
+            PayloadLogger._window_start = 0.0
+            PayloadLogger._window_count = 0
@@ -0,0 +1,204 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/content_processors/schema_validator_cache.py
+
+References:
+    None
+
+Synopsis:
+    按 schema 缓存的 pydantic 检验方法。JsonOutputExtractor 和 StructuredDataExtractor 共用。
+
+Notes:
+    原本的检验方法每次调用都会构建完整的数据类:
+        ```python
+        schema_pydantic_base_model(**raw_dict_structured_data)
+        schema_pydantic_base_model(items=raw_list_structured_data)
+        ```
+    实际场景是每分钟检验数千个输出，但 schema 只有少数几个。因此按 schema 缓存检验方法:
+        - dict: 缓存 model_validate ，避免展开 kwargs 。
+        - list: 约定的 `items` 字段单独构建 TypeAdapter ，保留 Field 中的约束 (例如 min_length) 。
+            仅检验通过与否时，不需要构建外层的数据类。
+            如果数据类定义了 validator ，或有 `items` 以外的必需字段，TypeAdapter 的结果可能不同，回退为 model_validate 。
+
+    检验失败仅记录错误数量和第一个错误的位置，不记录完整的数据。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+import functools
+from pydantic import TypeAdapter, ValidationError
+
+from typing import TYPE_CHECKING, Annotated, Any, Callable
+if TYPE_CHECKING:
+    from pydantic import BaseModel
+
+
+class SchemaValidatorCache:
+    """
+    工具类，按 schema 缓存检验方法。
+
+    主要方法:
+        - validate_dict / validate_list: 检验并构建数据类。失败时抛出 ValidationError 。
+        - check_dict / check_list: 仅检验通过与否。
+    """
+
+    # ==== 主要方法。构建数据类。 ====
+    @staticmethod
+    def validate_dict(
+        raw_dict_structured_data: dict,
+        schema_pydantic_base_model: type[BaseModel],
+    ) -> BaseModel:
+        """
+        检验 dict 并构建数据类。等价于 schema_pydantic_base_model(**raw_dict_structured_data) 。
+
+        Raises:
+            ValidationError: 不符合 schema 。
+        """
+        model_validator = SchemaValidatorCache.get_model_validator(schema_pydantic_base_model)
+        return model_validator(raw_dict_structured_data)
+
+    # ==== 主要方法。构建数据类。 ====
+    @staticmethod
+    def validate_list(
+        raw_list_structured_data: list,
+        schema_pydantic_base_model: type[BaseModel],
+    ) -> BaseModel:
+        """
+        检验 list 并构建数据类。等价于 schema_pydantic_base_model(items=raw_list_structured_data) 。
+
+        Raises:
+            ValidationError: 不符合 schema 。
+        """
+        model_validator = SchemaValidatorCache.get_model_validator(schema_pydantic_base_model)
+        return model_validator({'items': raw_list_structured_data})
+
+    # ==== 主要方法。仅检验。 ====
+    @staticmethod
+    def check_dict(
+        raw_dict_structured_data: dict,
+        schema_pydantic_base_model: type[BaseModel],
+    ) -> bool:
+        """仅检验 dict 是否符合 schema 。"""
+        return SchemaValidatorCache.find_dict_error(
+            raw_dict_structured_data=raw_dict_structured_data,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+        ) is None
+
+    # ==== 主要方法。仅检验。 ====
+    @staticmethod
+    def check_list(
+        raw_list_structured_data: list,
+        schema_pydantic_base_model: type[BaseModel],
+    ) -> bool:
+        """仅检验 list 是否符合 schema 。不构建外层的数据类。"""
+        return SchemaValidatorCache.find_list_error(
+            raw_list_structured_data=raw_list_structured_data,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+        ) is None
+
+    # ==== 基础方法。仅检验。 ====
+    @staticmethod
+    def find_dict_error(
+        raw_dict_structured_data: dict,
+        schema_pydantic_base_model: type[BaseModel],
+    ) -> Exception | None:
+        """检验 dict ，返回检验失败的异常。通过时返回 None 。"""
+        try:
+            SchemaValidatorCache.validate_dict(
+                raw_dict_structured_data=raw_dict_structured_data,
+                schema_pydantic_base_model=schema_pydantic_base_model,
+            )
+        except Exception as e:
+            SchemaValidatorCache.log_validation_error(e)
+            return e
+        return None
+
+    # ==== 基础方法。仅检验。 ====
+    @staticmethod
+    def find_list_error(
+        raw_list_structured_data: list,
+        schema_pydantic_base_model: type[BaseModel],
+    ) -> Exception | None:
+        """检验 list ，返回检验失败的异常。通过时返回 None 。"""
+        items_validator = SchemaValidatorCache.get_items_validator(schema_pydantic_base_model)
+        try:
+            items_validator(raw_list_structured_data)
+        except Exception as e:
+            SchemaValidatorCache.log_validation_error(e)
+            return e
+        return None
+
+    # ==== 基础方法。缓存。 ====
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get_model_validator(
+        schema_pydantic_base_model: type[BaseModel],
+    ) -> Callable[[Any], BaseModel]:
+        """缓存数据类的 model_validate 。"""
+        return schema_pydantic_base_model.model_validate
+
+    # ==== 基础方法。缓存。 ====
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get_items_validator(
+        schema_pydantic_base_model: type[BaseModel],
+    ) -> Callable[[list], Any]:
+        """
+        缓存 `items` 字段的检验方法。
+
+        由 `items` 字段的类型和 Field 约束合成 TypeAdapter 。无法等价合成时，回退为检验整个数据类。
+        """
+        if not SchemaValidatorCache._is_items_only_model(schema_pydantic_base_model):
+            model_validator = SchemaValidatorCache.get_model_validator(schema_pydantic_base_model)
+            return lambda raw_list_structured_data: model_validator({'items': raw_list_structured_data})
+        items_field = schema_pydantic_base_model.model_fields['items']
+        if items_field.metadata:
+            items_type = Annotated[(items_field.annotation, *items_field.metadata)]
+        else:
+            items_type = items_field.annotation
+        return TypeAdapter(items_type).validate_python
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def log_validation_error(
+        e: Exception,
+    ) -> None:
+        """仅记录错误数量和第一个错误，避免格式化完整的数据。"""
+        if not isinstance(e, ValidationError):
+            # 自定义 validator 中的其他异常。
+            logger.error(f"Failed in schema: {type(e).__name__}.")
+            return
+        first_error = e.errors(include_url=False, include_input=False)[0]
+        logger.error(
+            f"Failed in schema {e.title}: {e.error_count()} errors, "
+            f"first at {first_error['loc']}: {first_error['type']}."
+        )
+
+    # ==== 内部方法。 ====
+    @staticmethod
+    def _is_items_only_model(
+        schema_pydantic_base_model: type[BaseModel],
+    ) -> bool:
+        """数据类是否仅由约定的 `items` 字段决定检验结果。"""
+        model_fields = schema_pydantic_base_model.model_fields
+        if 'items' not in model_fields:
+            return False
+        # 其他必需字段在 schema(items=...) 中一定缺失，TypeAdapter 无法得到相同结果。
+        if any(field.is_required() for name, field in model_fields.items() if name != 'items'):
+            return False
+        # 自定义的 validator 和 strict 等配置只在数据类中生效。
+        decorators = schema_pydantic_base_model.__pydantic_decorators__
+        if (
+            decorators.validators
+            or decorators.field_validators
+            or decorators.root_validators
+            or decorators.model_validators
+        ):
+            return False
+        if schema_pydantic_base_model.model_config.get('strict'):
+            return False
+        # 字段的 alias 会改变 `items` 的输入名称。
+        if schema_pydantic_base_model.model_fields['items'].alias not in (None, 'items'):
+            return False
+        return True
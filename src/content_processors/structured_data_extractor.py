@@ -15,13 +15,16 @@ Notes:
 from __future__ import annotations
 from loguru import logger
 
-import json
-import json5
-import json_repair
-import re
+from src.content_processors.batch_extraction import BatchExtraction
+from src.content_processors.extraction_result import ExtractionOutcome, ExtractionResult
+from src.content_processors.json_fence_scanner import JsonFenceScanner
+from src.content_processors.json_loader import JsonLoader
+from src.content_processors.schema_validator_cache import SchemaValidatorCache
 
 from typing import TYPE_CHECKING, Literal, cast
 if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
     from pydantic import BaseModel
 
 
@@ -33,11 +36,14 @@ class StructuredDataExtractor:
     最终方法返回 BaseModel 或者 None 。None 无论是什么原因，都需要重新生成。
 
     流程为:
-        raw_str (str) --re--> raw_json_str (str) --json.loads--> raw_structured_data (JSONReturnType)
+        raw_str (str) --scanner--> raw_json_str (str) --json.loads--> raw_structured_data (JSONReturnType)
         --schema--> structured_data (BaseModel)
 
     主要方法:
         - extract_structured_data_from_str: 封装所有操作的方法，需要指定相关参数。
+        - extract_structured_data_with_outcome: 同时返回结果代码，区分失败的原因。
+        - extract_structured_data_result: 返回 ExtractionResult ，包含失败的阶段和出错位置。
+        - extract_many: 批量提取，多进程分块运行。
 
     注意:
         - 最终结果的提取，dict和list不同:
@@ -51,7 +57,7 @@ class StructuredDataExtractor:
         raw_str: str,
         schema_pydantic_base_model: type[BaseModel],
         index_to_choose: int = -1,
-        json_loader_name: Literal['json', 'json5', 'json-repair'] = 'json-repair',
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
         schema_check_type: Literal['dict', 'list'] = 'dict',
     ) -> BaseModel | None:
         """
@@ -61,7 +67,7 @@ class StructuredDataExtractor:
             - 从 markdown-code-cell 中提取 json 数据。
 
         实现:
-            - 正则提取 markdown-code-cell 中的内容。默认提取最后一个。
+            - 查找 markdown-code-cell 中的内容。默认提取最后一个。
             - 使用 json 相关库加载和转换数据。有多种加载工具，因为该工具类设计面对的是 LLM 的输出，默认使用 'json-repair' 。
             - 使用 pydantic 解析具体字段的正确性。静默判断。
 
@@ -75,10 +81,11 @@ class StructuredDataExtractor:
         Args:
             raw_str (str): LLM 输出的 str 部分。
             index_to_choose (int, optional): 选择提取的索引。可能会输出多个结果。默认提取最后一个。
-            json_loader_name (Literal['json', 'json5', 'json-repair']): 加载 json 数据的方法。3 个加载包的区别是:
+            json_loader_name (Literal['json', 'json5', 'json-repair', 'fast-then-repair']): 加载 json 数据的方法。区别是:
                 - json: 最严格，需要完全符合 json 定义。
                 - json5: 符合 js 的定义可以正常解析。
                 - json-repair: 大概有 json 数据的结构，会尝试自动修复。
+                - fast-then-repair: 依次尝试 orjson/msgspec/json 、json5 、json-repair ，仅失败时使用更慢的层级。
                 默认选择 json-repair ，这样最节省 LLM 推理资源。需要 schema-check 后面会有进一步判断操作。
             schema_pydantic_base_model (type[BaseModel], optional): pydantic 定义的数据类。当有这个参数，会进行 structured-output 检测。
             schema_check_type (Literal['dict', 'list']): 检验 schema 的方法。2 种方式为 dict 或 list 。
@@ -90,71 +97,191 @@ class StructuredDataExtractor:
                     可能有多种原因，或许需要重试机制。(最简单，也是这个工具类的目的。)
                     正常解析也会遇到 None ，但是无论那种原因， None 都不可以用，需要再次生成。
         """
-        # 正则匹配
-        raw_json_str = StructuredDataExtractor.re_match(
-            raw_str=raw_str, index_to_choose=index_to_choose
+        outcome, structured_data = StructuredDataExtractor.extract_structured_data_with_outcome(
+            raw_str=raw_str,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+            index_to_choose=index_to_choose,
+            json_loader_name=json_loader_name,
+            schema_check_type=schema_check_type,
         )
-        if not raw_json_str:
-            return None  # 输出 1 。没有 json-output 。
+        return structured_data
+
+    # ====暴露方法。====
+    @staticmethod
+    def extract_structured_data_with_outcome(
+        raw_str: str,
+        schema_pydantic_base_model: type[BaseModel],
+        index_to_choose: int = -1,
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> tuple[ExtractionOutcome, BaseModel | None]:
+        """
+        与 extract_structured_data_from_str 相同，但同时返回结果代码，区分失败的原因。
+
+        Args:
+            同 extract_structured_data_from_str 。
+
+        Returns:
+            tuple[ExtractionOutcome, Optional[BaseModel]]:
+                - ExtractionOutcome: 结果代码。OK 时提取结果不为 None 。
+                - Optional[BaseModel]: 提取结果。
+        """
+        result = StructuredDataExtractor.extract_structured_data_result(
+            raw_str=raw_str,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+            index_to_choose=index_to_choose,
+            json_loader_name=json_loader_name,
+            schema_check_type=schema_check_type,
+        )
+        return result.outcome, result.structured_data
+
+    # ====暴露方法。====
+    @staticmethod
+    def extract_structured_data_result(
+        raw_str: str,
+        schema_pydantic_base_model: type[BaseModel],
+        index_to_choose: int = -1,
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> ExtractionResult:
+        """
+        与 extract_structured_data_from_str 相同，但返回 ExtractionResult ，包含失败的阶段、异常的类名、出错位置和片段。
+
+        Args:
+            同 extract_structured_data_from_str 。
+
+        Returns:
+            ExtractionResult: 提取结果。offset 为在 raw_str 中的偏移。
+        """
+        # 查找 markdown-code-cell
+        block = JsonFenceScanner.find_json_block_span(raw_str=raw_str, index_to_choose=index_to_choose)
+        if block is None or block.content_start == block.content_end:
+            logger.warning("No JSON outputs.")
+            return ExtractionResult(outcome=ExtractionOutcome.NO_FENCE)  # 输出 1 。没有 json-output 。
+        raw_json_str = raw_str[block.content_start:block.content_end]
         # 转换为 python 中的 structured-data
-        raw_structured_data = StructuredDataExtractor.load_structured_data_from_raw_json_str(
+        raw_structured_data, error = JsonLoader.loads_or_error(
             raw_json_str=raw_json_str, json_loader_name=json_loader_name
         )
         if not raw_structured_data:
-            return None  # 输出 2 。structured-data 格式错误。
+            position = JsonLoader.locate_error(raw_json_str=raw_json_str, error=error)
+            return ExtractionResult.from_failure(
+                outcome=ExtractionOutcome.LOAD_FAILURE,
+                raw_str=raw_str,
+                offset=block.content_start + (position or 0),
+                error=error,
+            )  # 输出 2 。structured-data 格式错误。
         # 获取由 pydantic 的 BaseModel 加载的 structured-data 。
-        return StructuredDataExtractor.get_structured_data(
+        structured_data, error = StructuredDataExtractor.get_structured_data_or_error(
             raw_structured_data=raw_structured_data,
             schema_pydantic_base_model=schema_pydantic_base_model,
             schema_check_type=schema_check_type,
         )
+        if structured_data is None:
+            return ExtractionResult.from_failure(
+                outcome=ExtractionOutcome.SCHEMA_FAILURE,
+                raw_str=raw_str,
+                offset=block.content_start,
+                error=error,
+            )  # 输出 3 。未通过 schema 检测。
+        return ExtractionResult(outcome=ExtractionOutcome.OK, structured_data=structured_data)  # 输出 4 。通过检测。
+
+    # ====暴露方法。批量处理。====
+    @staticmethod
+    def extract_many(
+        schema_pydantic_base_model: type[BaseModel],
+        raw_strs: Iterable[str] | None = None,
+        jsonl_path: str | Path | None = None,
+        jsonl_content_key: str = 'content',
+        index_to_choose: int = -1,
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+        max_workers: int | None = None,
+        chunk_size: int = 256,
+    ) -> list[tuple[ExtractionOutcome, BaseModel | None]]:
+        """
+        批量提取。多进程分块运行 extract_structured_data_with_outcome ，结果与输入顺序一致。
+
+        输入为 raw_strs 和 jsonl_path 之一。jsonl_path 以 mmap 逐行读取，不需要一次性加载整个文件。
+
+        Args:
+            schema_pydantic_base_model (type[BaseModel]): pydantic 定义的数据类。需要定义在模块的顶层，才可以传递给工作进程。
+            raw_strs (Iterable[str], optional): 全部的原始字符串。可以是惰性的迭代器。
+            jsonl_path (Union[str, Path], optional): JSONL 文件的路径。每行为 str ，或为包含原始字符串的 dict 。
+            jsonl_content_key (str): 每行为 dict 时，原始字符串所在的 key 。
+            index_to_choose, json_loader_name, schema_check_type: 同 extract_structured_data_from_str 。
+            max_workers (int, optional): 进程数量。默认为 CPU 数量。为 0 时在当前进程中运行。
+            chunk_size (int): 每个任务处理的字符串数量。
+
+        Returns:
+            list[tuple[ExtractionOutcome, Optional[BaseModel]]]: 每条输入的结果代码和提取结果。
+        """
+        if (raw_strs is None) == (jsonl_path is None):
+            raise ValueError("raw_strs 和 jsonl_path 需要且仅需要指定一个。")
+        if jsonl_path is not None:
+            raw_strs = BatchExtraction.iter_jsonl_contents(jsonl_path=jsonl_path, content_key=jsonl_content_key)
+        return BatchExtraction.run(
+            extract_with_outcome=StructuredDataExtractor.extract_structured_data_with_outcome,
+            raw_strs=raw_strs,
+            extract_kwargs=dict(
+                schema_pydantic_base_model=schema_pydantic_base_model,
+                index_to_choose=index_to_choose,
+                json_loader_name=json_loader_name,
+                schema_check_type=schema_check_type,
+            ),
+            max_workers=max_workers,
+            chunk_size=chunk_size,
+        )
 
-    # ====基础方法。正则匹配。====
+    # ====基础方法。查找 code-cell 。====
     @staticmethod
     def re_match(
         raw_str: str,
         index_to_choose: int = -1
     ) -> str | None:
         """
-        正则查找 markdown-code-cell ，提取其中的结果。默认选择最后一个匹配项。
+        查找 markdown-code-cell ，提取其中的结果。默认选择最后一个匹配项。
+
+        保留原本的方法名。实现已由正则改为 JsonFenceScanner ，支持 `JSON` 和 `jsonc` 标记，以及未闭合的最后一个 code-cell 。
 
         Args:
             raw_str (str): 完全未处理的字符串结果
             index_to_choose (int): 选择提取的索引。
                 可能会输出多个结果。默认提取最后一个。
-                可进行自定义，但是一般 LLM 的输出限制会指定最后一个。
+                可进行自定义，但是一般 LLM 的输出限制会指定最后一个。支持正负索引。
 
         Returns:
             Union[str, None]:
                 - str: 正常提取的结果。
-                - None: 完全没有匹配结果。
+                - None: 没有对应索引的匹配结果。
         """
-        # 正则匹配。默认是 markdown-cell 中 json 数据。
-        pattern = r'```json(.*?)```'
-        matches = re.findall(pattern, raw_str, re.DOTALL)
+        # 查找 markdown-cell 中 json 数据。不构建全部匹配的列表，默认从末尾反向查找。
+        raw_json_str = JsonFenceScanner.find_json_block(
+            raw_str=raw_str,
+            index_to_choose=index_to_choose,
+        )
         # 如果没有找到。一般在 prompt 中指定，就不会发生这种情况。
-        if not matches:
+        if raw_json_str is None:
             logger.warning("No JSON outputs.")
             return None  # 输出 1 。提取失败。
-        # 提取结果。可能需要根据任务而定。
-        raw_json_str: str = matches[index_to_choose]
         return raw_json_str  # 输出 2 。提取成功。
 
     # ====基础方法。加载json。====
     @staticmethod
     def load_structured_data_from_raw_json_str(
         raw_json_str: str,
-        json_loader_name: Literal['json', 'json5', 'json-repair'] = 'json-repair',
+        json_loader_name: Literal['json', 'json5', 'json-repair', 'fast-then-repair'] = 'json-repair',
     ) -> dict | list | None:
         """
         一些情况下，LLM 输出会带有奇怪格式。进行加载检验。
 
         Args:
             raw_json_str (str): 可能是 str 的 structured-data ，需要转换为 python 中的 structured-data 。
-            json_loader_name (Literal['json', 'json5', 'json-repair']): 加载 json 数据的方法。3 个加载包的区别是:
+            json_loader_name (Literal['json', 'json5', 'json-repair', 'fast-then-repair']): 加载 json 数据的方法。区别是:
                 - json: 最严格，需要完全符合 json 定义。
                 - json5: 符合 js 的定义可以正常解析。
                 - json-repair: 大概有 json 数据的结构，会尝试自动修复。
+                - fast-then-repair: 依次尝试 orjson/msgspec/json 、json5 、json-repair ，仅失败时使用更慢的层级。
                 默认选择 json-repair ，这样最节省 LLM 推理资源。需要 schema-check 后面会有进一步判断操作。
 
         Returns:
@@ -162,20 +289,12 @@ class StructuredDataExtractor:
                 - Union[dict, list]: 转换成功。
                 - None: 转换失败。
         """
-        try:
-            # 尝试进行转换。# 输出 2。成功转换。
-            if json_loader_name == 'json':
-                return json.loads(raw_json_str)
-            elif json_loader_name == 'json5':
-                return json5.loads(raw_json_str)
-            elif json_loader_name == 'json-repair':
-                return json_repair.loads(raw_json_str)
-        except Exception as e:
-            # 转换失败。打印错误，打印原始字符串。
-            logger.error(e)
-            logger.error(raw_json_str)
-            logger.error("Fail to load structured data from raw_json_str.")
-            return None  # 输出1。structured data格式错误。
+        # 失败时仅记录异常的类名，原始字符串限速和采样地记录。
+        raw_structured_data, error = JsonLoader.loads_or_error(
+            raw_json_str=raw_json_str,
+            json_loader_name=json_loader_name,
+        )
+        return raw_structured_data
 
     # ====基础方法。将python数据加载为pydantic结构化数据。====
     @staticmethod
@@ -202,23 +321,47 @@ class StructuredDataExtractor:
                 - None: 未通过检测。
             这个方法可以设计为输出 bool ，但为了和这个工具类中其他方法统一，设计为相同的输出方式。实际输出值仅用于逻辑判断。
         """
+        structured_data, error = StructuredDataExtractor.get_structured_data_or_error(
+            raw_structured_data=raw_structured_data,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+            schema_check_type=schema_check_type,
+        )
+        return structured_data
+
+    # ====基础方法。将python数据加载为pydantic结构化数据。====
+    @staticmethod
+    def get_structured_data_or_error(
+        raw_structured_data: dict | list,
+        schema_pydantic_base_model: type[BaseModel],
+        schema_check_type: Literal['dict', 'list'] = 'dict',
+    ) -> tuple[BaseModel | None, Exception | None]:
+        """
+        与 get_structured_data 相同，但同时返回检验失败的异常。类型不一致时为 TypeError 。
+
+        Returns:
+            tuple[Optional[BaseModel], Optional[Exception]]: (数据类, None) 或 (None, 异常) 。
+        """
         # 冗余性检查，输入的数据类型需要和进行加载的数据类型一致。
-        if schema_check_type == 'dict' and not isinstance(raw_structured_data, dict):
-            return None
-        if schema_check_type == 'list' and not isinstance(raw_structured_data, list):
-            return None
+        expected_type = dict if schema_check_type == 'dict' else list
+        if not isinstance(raw_structured_data, expected_type):
+            return None, TypeError(f"Expected {expected_type.__name__}, got {type(raw_structured_data).__name__}.")
         try:
-            # 按照数据类别进行加载
+            # 按照数据类别进行加载。使用按 schema 缓存的检验方法。
             if schema_check_type == 'dict':
                 raw_structured_data = cast('dict', raw_structured_data)
-                return schema_pydantic_base_model(**raw_structured_data)  # 输出 2 。通过检测。使用 .model_dump() 方法获取。
+                return SchemaValidatorCache.validate_dict(
+                    raw_dict_structured_data=raw_structured_data,
+                    schema_pydantic_base_model=schema_pydantic_base_model,
+                ), None  # 输出 2 。通过检测。使用 .model_dump() 方法获取。
             elif schema_check_type == 'list':
                 raw_structured_data = cast('list', raw_structured_data)
-                return schema_pydantic_base_model(items=raw_structured_data)  # 输出 2 。通过检测。使用 .model_dump().item 方法获取。
+                return SchemaValidatorCache.validate_list(
+                    raw_list_structured_data=raw_structured_data,
+                    schema_pydantic_base_model=schema_pydantic_base_model,
+                ), None  # 输出 2 。通过检测。使用 .model_dump().item 方法获取。
         except Exception as e:
-            # 转换失败。打印错误，打印原始字符串。
-            logger.error(e)
-            logger.error(raw_structured_data)
-            logger.error("Failed in schema.")
-            return None  # 输出1。不符合 dataclass 定义。可能是字段，可能是数据类型。
+            # 转换失败。仅打印错误摘要，不打印原始数据。
+            SchemaValidatorCache.log_validation_error(e)
+            return None, e  # 输出1。不符合 dataclass 定义。可能是字段，可能是数据类型。
 
+        return None, ValueError(f"Unknown schema_check_type: {schema_check_type}")
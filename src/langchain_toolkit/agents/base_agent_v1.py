@@ -23,6 +23,8 @@ Notes:
         - 历史兼容: 我目前已发表的论文中，有基于这种实现方法的工程。
 
     使用我构建的工具类 JsonOutputExtractor ，但是简化大量可设置的参数。
+    加载 json 使用 'fast-then-repair' 模式，格式正确的输出不经过 json-repair 。
+    提取失败时先在本地分阶段修复 (JsonLocalRepair) ，全部失败时才重新请求 LLM 。
 
     预期的派生类:
         - NormalAgent: 普通的对话 agent 。完全没有结构化数据相关的需求。
@@ -35,8 +37,16 @@ from loguru import logger
 
 # 下面这个工具类是必要的，需要在具体项目中设定具体的导入路径。
 from src.content_processors.json_output_extractor import JsonOutputExtractor
+from src.content_processors.incremental_json_extractor import IncrementalJsonExtractor
+from src.content_processors.json_local_repair import JsonLocalRepair
+from src.langchain_message_processors.merge_chunks import merge_chunks_into_message
+from src.agnostic_utils.async_tools import run_first_valid
+from src.agnostic_utils.adaptive_concurrency import AdaptiveConcurrencyLimiter
+from src.agnostic_utils.retry_policy import RetryPolicy
 
 from langchain_core.messages import AIMessage
+import asyncio
+import weakref
 from collections import Counter
 
 from typing import TYPE_CHECKING, Literal, Self, cast
@@ -46,6 +56,7 @@ if TYPE_CHECKING:
     from langchain_core.messages import AnyMessage, SystemMessage
     from langchain_core.prompts import ChatPromptTemplate
     from pydantic import BaseModel
+    from src.content_processors.extraction_result import ExtractionResult
 
 
 class BaseAgent:
@@ -76,6 +87,11 @@ class BaseAgent:
         is_need_structured_output: bool = False,
         schema_pydantic_base_model: type[BaseModel] = None,
         schema_check_type: Literal['dict', 'list'] = 'dict',
+        is_stream_early_stop: bool = False,
+        num_candidates: int = 1,
+        max_concurrent_candidates: int | None = None,
+        retry_policy: RetryPolicy | None = None,
+        concurrency_limiter: AdaptiveConcurrencyLimiter | None = None,
     ):
         """
         必要的初始化参数。
@@ -92,13 +108,30 @@ class BaseAgent:
             is_need_structured_output (bool, optional): 是否需要结构化输出。如果不需要，仅一次响应。
             schema_pydantic_base_model (type[BaseModel], optional): 在需要结构化输出的情况下，进行 dataclass 检验。不指定，则不校验。
             schema_check_type (Literal['dict', 'list'], optional): 在需要结构化输出的情况下，进行 dataclass 检验的类型。常用为 dict 。
+            is_stream_early_stop (bool, optional): 异步请求时，是否以流式输出提前检验。
+                json 的 code-cell 闭合或格式错误时立即检验，检验失败即取消生成并重试。
+                仅适用于 prompt 要求只输出一个 json 的 code-cell 的情况，中间的示例 code-cell 也会被检验。
+            num_candidates (int, optional): 异步请求时，同时生成的候选数量。大于 1 时返回第一个有效的结果，取消其余的生成。
+                全部生成的数量不超过 max_retries 。用于延迟敏感的请求，会增加 token 消耗。
+            max_concurrent_candidates (int, optional): 同一个 agent 的全部调用中，同时运行的候选数量上限。默认为 num_candidates 。
+            retry_policy (RetryPolicy, optional): 每次请求 LLM 时，网络错误等异常的重试策略。默认为最多 3 次尝试。
+                与 max_retries 不同，max_retries 是结构化输出不符合要求时重新生成的次数。
+            concurrency_limiter (AdaptiveConcurrencyLimiter, optional): a_call_llm 的自适应并发上限。
+                同一个供应商的 agent 应共用同一个实例，见 AdaptiveConcurrencyLimiter.get_shared 。默认不限制。
         """
         self._chat_prompt_template = chat_prompt_template
         self._llm = llm
         self._max_retries = max_retries
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._concurrency_limiter = concurrency_limiter
         self._is_need_structured_output = is_need_structured_output
         self._schema_pydantic_base_model = schema_pydantic_base_model
         self._schema_check_type = schema_check_type
+        self._is_stream_early_stop = is_stream_early_stop
+        self._num_candidates = num_candidates
+        self._max_concurrent_candidates = max_concurrent_candidates or num_candidates
+        # asyncio.Semaphore 绑定创建时的事件循环。同一个 agent 可能在多次 asyncio.run 中使用，每个事件循环一个。
+        self._candidate_semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
 
     # ==== 常见的默认统一方法。 ====
     def process_state(
@@ -166,13 +199,67 @@ class BaseAgent:
         llm: BaseChatModel,
         chat_history: list[AnyMessage],
     ) -> AIMessage:
-        """ call_llm 的异步版本。"""
+        """ call_llm 的异步版本。指定 concurrency_limiter 时，在自适应的并发上限内请求。"""
         llm_chain = chat_prompt_template | llm
-        response = await llm_chain.ainvoke(input={'chat_history': chat_history})
+        if self._concurrency_limiter is None:
+            response = await llm_chain.ainvoke(input={'chat_history': chat_history})
+        else:
+            response = await self._concurrency_limiter.run(
+                lambda: llm_chain.ainvoke(input={'chat_history': chat_history})
+            )
         response = cast('AIMessage', response)
         # assert isinstance(response, AIMessage)
         return response
 
+    # ==== 最基础方法。 ====
+    async def a_stream_llm_with_early_stop(
+        self,
+        chat_prompt_template: ChatPromptTemplate,
+        llm: BaseChatModel,
+        chat_history: list[AnyMessage],
+    ) -> AIMessage | None:
+        """
+        以流式输出请求 LLM ，在生成过程中检验 json 的 code-cell 。
+
+        实现:
+            - 每个 chunk 输入 IncrementalJsonExtractor ，维护 fence/bracket 状态。
+            - json 的 code-cell 括号不匹配，或闭合后加载、检验失败，立即关闭流，取消剩余的生成。
+            - 检验通过则继续接收至结束，合并 chunks 为完整的 AIMessage 。最终结果仍由 get_structured_output 判断。
+
+        Args:
+            chat_prompt_template (ChatPromptTemplate): 构建的 chat-prompt-template ，一般仅包含 system-prompt 。
+            llm (BaseChatModel): chat-model，可以生成内容。
+            chat_history (list[AnyMessage]): 过去的对话记录。
+
+        Returns:
+            Union[AIMessage, None]:
+                - AIMessage: 完整的响应。
+                - None: 生成被提前取消。需要重试。
+        """
+        incremental_json_extractor = IncrementalJsonExtractor(
+            json_loader_name='fast-then-repair',
+            schema_pydantic_base_model=self._schema_pydantic_base_model,
+            schema_check_type=self._schema_check_type,
+        )
+        llm_chain = chat_prompt_template | llm
+        stream = llm_chain.astream(input={'chat_history': chat_history})
+        chunks = []
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
+                incremental_json_extractor.feed_chunk(chunk)
+                if incremental_json_extractor.is_malformed:
+                    logger.warning("Cancel generation: malformed JSON output.")
+                    return None
+        finally:
+            # 关闭流，提前退出时会取消对应的请求。
+            await stream.aclose()
+        if not chunks:
+            return None
+        response = merge_chunks_into_message(chunks)
+        response = cast('AIMessage', response)
+        return response
+
     # ==== 主要方法。 ====
     def call_llm_with_retry(
         self,
@@ -184,6 +271,7 @@ class BaseAgent:
         需要使用:
             - JsonOutputExtractor: 已构建的工具类。
             - self.call_llm: 进行一般请求。
+            - self._retry_policy: 每次请求的重试策略。
             - self._chat_prompt_template (ChatPromptTemplate): 构建的 chat-prompt-template ，一般仅包含 system-prompt 。
             - self._llm (BaseChatModel): chat-model，可以生成内容。
             - self._is_need_structured_output: 是否需要结构化输出。如果不需要，仅一次响应。
@@ -199,22 +287,31 @@ class BaseAgent:
         """
         # 如果不需要结构化输出，得到一次请求的响应即可。
         if not self._is_need_structured_output:
-            return self.call_llm(
-                chat_prompt_template=self._chat_prompt_template,
-                llm=self._llm,
-                chat_history=chat_history,
+            return self._retry_policy.run(
+                lambda: self.call_llm(
+                    chat_prompt_template=self._chat_prompt_template,
+                    llm=self._llm,
+                    chat_history=chat_history,
+                )
             )
         # 如果需要结构化输出，在最大可重试次数内进行请求。
         for _ in range(self._max_retries):
-            response = self.call_llm(
-                chat_prompt_template=self._chat_prompt_template,
-                llm=self._llm,
-                chat_history=chat_history,
+            response = self._retry_policy.run(
+                lambda: self.call_llm(
+                    chat_prompt_template=self._chat_prompt_template,
+                    llm=self._llm,
+                    chat_history=chat_history,
+                )
             )
             # 检测响应内容，是否符合结构化输出要求。
-            if self.get_structured_output(raw_str=response.content):
+            result = self.get_structured_output_result(raw_str=response.content)
+            if result.is_ok:
                 # 如果是有内容的，返回响应。
                 return response
+            # V1 没有 formatter 。先分阶段在本地修复，全部失败时才重新生成。
+            repaired_response = self.repair_response(response=response)
+            if repaired_response is not None:
+                return repaired_response
 
     # ==== 主要方法。 ====
     async def a_call_llm_with_retry(
@@ -224,23 +321,73 @@ class BaseAgent:
         """ call_llm_with_retry 的异步版本。"""
         # 如果不需要结构化输出，得到一次请求的响应即可。
         if not self._is_need_structured_output:
-            return await self.a_call_llm(
-                chat_prompt_template=self._chat_prompt_template,
-                llm=self._llm,
-                chat_history=chat_history,
+            return await self._retry_policy.arun(
+                lambda: self.a_call_llm(
+                    chat_prompt_template=self._chat_prompt_template,
+                    llm=self._llm,
+                    chat_history=chat_history,
+                )
+            )
+        # 如果需要结构化输出，并发生成多个候选，返回第一个有效的结果。
+        if self._num_candidates > 1:
+            return await run_first_valid(
+                candidate_factory=lambda: self.a_generate_candidate(chat_history=chat_history),
+                is_valid=lambda response: response is not None,
+                num_candidates=self._num_candidates,
+                budget=self._max_retries,
+                semaphore=self._get_candidate_semaphore(),
+                # 与顺序的重试一致，不可重试的异常原样抛出。
+                is_fatal=lambda error: not self._retry_policy.is_retryable(error),
             )
         # 如果需要结构化输出，在最大可重试次数内进行请求。
         for _ in range(self._max_retries):
-            response = await self.a_call_llm(
-                chat_prompt_template=self._chat_prompt_template,
-                llm=self._llm,
-                chat_history=chat_history,
-            )
-            # 检测响应内容，是否符合结构化输出要求。
-            if self.get_structured_output(raw_str=response.content):
-                # 如果是有内容的，返回响应。
+            response = await self.a_generate_candidate(chat_history=chat_history)
+            if response is not None:
                 return response
 
+    # ==== 主要方法。 ====
+    async def a_generate_candidate(
+        self,
+        chat_history: list[AnyMessage],
+    ) -> AIMessage | None:
+        """
+        生成一次，并检验和在本地修复结构化输出。a_call_llm_with_retry 中的一次尝试。
+
+        Args:
+            chat_history (list[AnyMessage]): 过去的对话记录。
+
+        Returns:
+            Union[AIMessage, None]:
+                - AIMessage: 符合结构化输出要求的响应。
+                - None: 生成被提前取消，或无法提取结构化输出。需要重试。
+        """
+        if self._is_stream_early_stop:
+            response = await self._retry_policy.arun(
+                lambda: self.a_stream_llm_with_early_stop(
+                    chat_prompt_template=self._chat_prompt_template,
+                    llm=self._llm,
+                    chat_history=chat_history,
+                )
+            )
+            if response is None:
+                # 生成已被提前取消。
+                return None
+        else:
+            response = await self._retry_policy.arun(
+                lambda: self.a_call_llm(
+                    chat_prompt_template=self._chat_prompt_template,
+                    llm=self._llm,
+                    chat_history=chat_history,
+                )
+            )
+        # 检测响应内容，是否符合结构化输出要求。
+        result = self.get_structured_output_result(raw_str=response.content)
+        if result.is_ok:
+            # 如果是有内容的，返回响应。
+            return response
+        # V1 没有 formatter 。先分阶段在本地修复，全部失败时才重新生成。
+        return self.repair_response(response=response)
+
     # ==== 工具方法。 ====
     def get_structured_output(
         self,
@@ -265,10 +412,63 @@ class BaseAgent:
         return JsonOutputExtractor.extract_json_from_str(
             raw_str=raw_str,
             index_to_choose=-1,
-            json_loader_name='json-repair',
+            json_loader_name='fast-then-repair',
+            schema_pydantic_base_model=self._schema_pydantic_base_model,
+            schema_check_type=self._schema_check_type,
+        )
+
+    # ==== 工具方法。 ====
+    def get_structured_output_result(
+        self,
+        raw_str: str,
+    ) -> ExtractionResult:
+        """
+        与 get_structured_output 相同，但返回 ExtractionResult ，用于区分失败的阶段。
+
+        Args:
+            raw_str (str): 原始 LLM 输出的字符串。
+
+        Returns:
+            ExtractionResult: 提取结果。
+        """
+        return JsonOutputExtractor.extract_json_result(
+            raw_str=raw_str,
+            index_to_choose=-1,
+            json_loader_name='fast-then-repair',
+            schema_pydantic_base_model=self._schema_pydantic_base_model,
+            schema_check_type=self._schema_check_type,
+        )
+
+    # ==== 工具方法。 ====
+    def repair_response(
+        self,
+        response: AIMessage,
+    ) -> AIMessage | None:
+        """
+        在本地分阶段修复结构化输出，不重新请求 LLM 。见 JsonLocalRepair 。
+
+        依次尝试: json-repair 、按 schema 转换结构。最后一个 code-cell 中没有 json 时，再尝试其他的 json 的 code-cell 和没有 code-cell 包裹的 json 。
+        修复成功时，返回的 AIMessage 中的 json 被替换为修复后的 code-cell ，之后的 get_structured_output 可以直接提取。
+        各个阶段的命中率见 JsonLocalRepair.get_stage_hit_rates 。
+
+        Args:
+            response (AIMessage): 未能提取结构化输出的响应。
+
+        Returns:
+            Union[AIMessage, None]:
+                - AIMessage: 修复后的响应。
+                - None: 无法修复。需要重新生成。
+        """
+        if not isinstance(response.content, str):
+            return None
+        repaired = JsonLocalRepair.repair(
+            raw_str=response.content,
             schema_pydantic_base_model=self._schema_pydantic_base_model,
             schema_check_type=self._schema_check_type,
         )
+        if repaired is None:
+            return None
+        return response.model_copy(update={'content': repaired.repaired_str})
 
     # ==== 工具方法。 ====
     def format_system_prompt_template(
@@ -306,3 +506,10 @@ class BaseAgent:
         """
         raise NotImplementedError
 
+    # ==== 内部方法。 ====
+    def _get_candidate_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._candidate_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._candidate_semaphores[loop] = asyncio.Semaphore(self._max_concurrent_candidates)
+        return semaphore
@@ -14,7 +14,7 @@ Notes:
         - features:
             - system-message 分离: system-message 不再作为 agent 实现上的固有属性，而是可以独立修改的。这有助于:
                 - context-engineering: 可以直接将 system-prompt 进行卸载，从而修改 agent 身份。(更高效的 MAS 。)
-                - batch-processing: 所有 context 可独立整合，批量处理。(在这个实现下，不用担心错误和重试。)
+                - batch-processing: 所有 context 可独立整合，批量处理。(在这个实现下，不用担心错误和重试。) 见 a_call_llm_with_retry_batch 。
             - 结构化输出分离: 由另一具有结构化输出模型执行对应数据提取。
                 - 优势:
                     - 自由输出: 无 system-message 限制，模型完全自主决定输出内容，数据总是会被正常识别。
@@ -26,25 +26,40 @@ Notes:
                     - llm 完全无状态，并且适用于修改和异步和多线程编程。
                     - 不再使用 ChatPromptTemplate ，仅使用 list[AnyMessage] ，显式控制全部的全部 context 。
 
-    可能会增加的机制:
-        - 回溯: 当 main-llm 输出出现问题，formatter-llm 无法正确提取信息，可以执行重试。(但该结构设计为更大的 agent-flow 会更好。)
+    恢复机制:
+        - 本地提取: main-llm 的输出中已有符合 schema 的 json 时直接使用，格式错误时在本地修复，均不请求 formatter-llm 。
+        - 回溯: 当 main-llm 输出出现问题，formatter-llm 无法正确提取信息，重新生成 main-llm 的输出。(但该结构设计为更大的 agent-flow 会更好。)
+        - 缓存: 指定 formatter_response_cache 时，相同输出的 formatter 结果被缓存，见 StructuredOutputCache 。
 """
 
 from __future__ import annotations
 from loguru import logger
 
+from src.content_processors.json_output_extractor import JsonOutputExtractor
+from src.content_processors.schema_validator_cache import SchemaValidatorCache
+from src.agnostic_utils.adaptive_concurrency import AdaptiveConcurrencyLimiter
+from src.agnostic_utils.async_tools import map_concurrent, run_first_valid
+from src.agnostic_utils.offload import OffloadPool
+from src.agnostic_utils.retry_policy import RetryPolicy
+from src.langchain_toolkit.agents.structured_output_cache import StructuredOutputCache
+
 from langchain_core.messages import (
     HumanMessage,
     AIMessage,
 )
+import asyncio
+import threading
+import weakref
+from collections import Counter
 from pydantic import BaseModel, Field
 
-from typing import TYPE_CHECKING, cast
+from typing import TYPE_CHECKING, Awaitable, cast
 if TYPE_CHECKING:
     from langchain_core.runnables import RunnableConfig
     from langchain_core.language_models import BaseChatModel
     from langchain_core.messages import AnyMessage, SystemMessage, AIMessage
     from pydantic import BaseModel
+    from src.agnostic_utils.response_cache import ResponseCache
 
 
 class BaseAgentResponse(BaseModel):
@@ -93,6 +108,12 @@ class BaseAgent:
         schema_pydantic_base_model: type[BaseModel] = None,
         formatter_llm_system_message: SystemMessage | None = None,
         formatter_llm_max_retries: int = 3,
+        num_candidates: int = 1,
+        max_concurrent_candidates: int | None = None,
+        main_llm_retry_policy: RetryPolicy | None = None,
+        formatter_llm_retry_policy: RetryPolicy | None = None,
+        formatter_response_cache: ResponseCache | None = None,
+        concurrency_limiter: AdaptiveConcurrencyLimiter | None = None,
     ):
         """
         必要的初始化参数。
@@ -105,20 +126,48 @@ class BaseAgent:
             main_llm (BaseChatModel): 任意的 llm ，可以生成内容。(甚至是 runnable 即可。)
             main_llm_system_message (SystemMessage): main_llm 的指令。
             main_llm_max_retries (int): 最大尝试生成次数。默认为 3 。
+                每次生成的请求再按 main_llm_retry_policy 重试，因此 main_llm 的请求数量最多为
+                main_llm_max_retries * main_llm_retry_policy.max_attempts 。默认为 3 * 3 = 9 。
             is_need_structured_output (bool, optional): 是否需要结构化输出。如果不需要，返回的输出中 structured_output 为 None 。
             formatter_llm (BaseChatModel, optional): 有 with_structured_output 实现的 llm ，会被用于 structured_llm 的构造。
             schema_pydantic_base_model (type[BaseModel], optional): 在需要结构化输出的情况下，进行 dataclass 检验。(这里的 docstring 对 formatter 很重要。)
             formatter_llm_system_message (SystemMessage, optional): formatter 的指令。(有常见通用指令，也可以具体自定义。)
             formatter_llm_max_retries (int): 最大尝试生成次数。默认为 3 。
+            num_candidates (int): 需要结构化输出时，同时生成的候选数量。大于 1 时返回第一个有效的结果，取消其余的生成。
+                全部生成的数量不超过 main_llm_max_retries 。用于延迟敏感的请求，会增加 token 消耗。
+            max_concurrent_candidates (int, optional): 同一个 agent 的全部调用中，同时运行的候选数量上限。默认为 num_candidates 。
+            main_llm_retry_policy (RetryPolicy, optional): 请求 main_llm 的重试策略。默认为最多 main_llm_max_retries 次尝试。
+                可以与其他 agent 共用同一个实例，统计全部的重试。
+            formatter_llm_retry_policy (RetryPolicy, optional): 请求 formatter_llm 的重试策略。默认为最多 formatter_llm_max_retries 次尝试。
+            formatter_response_cache (ResponseCache, optional): formatter_llm 提取结果的缓存。默认不缓存。
+            concurrency_limiter (AdaptiveConcurrencyLimiter, optional): main_llm 和 formatter_llm 的请求的自适应并发上限。
+                同一个供应商的 agent 应共用同一个实例，见 AdaptiveConcurrencyLimiter.get_shared 。默认不限制。
         """
         # main llm
         self._main_llm = main_llm
         self._main_llm_system_message = main_llm_system_message
         self._main_llm_max_retries = main_llm_max_retries
+        self._main_llm_retry_policy = main_llm_retry_policy or RetryPolicy(max_attempts=main_llm_max_retries)
         # formatter llm
         self._is_need_structured_output = is_need_structured_output
         self._formatter_llm_system_message = formatter_llm_system_message  # 这个参数应该作为 BaseAgent 的内部属性，调用主要方法自动使用。
         self._formatter_llm_max_retries = formatter_llm_max_retries  # 这个参数应该作为 BaseAgent 的内部属性，调用主要方法自动使用。
+        self._formatter_llm_retry_policy = formatter_llm_retry_policy or RetryPolicy(max_attempts=formatter_llm_max_retries)
+        self._schema_pydantic_base_model = schema_pydantic_base_model  # 用于在本地提取 main_llm 输出中的 json 。
+        self.formatter_elision_counter: Counter[str] = Counter()  # 在本地提取结构化输出的结果，见 extract_structured_output_locally 。
+        self._formatter_elision_lock = threading.Lock()  # extract_structured_output_locally 在 'parsing' 线程池中运行，Counter 的 += 不是原子的。
+        self._structured_output_cache = None
+        if formatter_response_cache is not None and schema_pydantic_base_model is not None:
+            self._structured_output_cache = StructuredOutputCache(
+                response_cache=formatter_response_cache,
+                schema_pydantic_base_model=schema_pydantic_base_model,
+            )
+        self._concurrency_limiter = concurrency_limiter
+        # candidates
+        self._num_candidates = num_candidates
+        self._max_concurrent_candidates = max_concurrent_candidates or num_candidates
+        # asyncio.Semaphore 绑定创建时的事件循环。同一个 agent 可能在多次 asyncio.run 中使用，每个事件循环一个。
+        self._candidate_semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
         # build structured llm
         self._structured_llm = None
         if is_need_structured_output:
@@ -133,7 +182,6 @@ class BaseAgent:
             self._structured_llm = self._build_structured_llm(
                 llm=formatter_llm,
                 schema_pydantic_base_model=schema_pydantic_base_model,
-                max_retries=formatter_llm_max_retries,
             )
 
     # ==== 常见的默认统一方法。 ====
@@ -181,46 +229,259 @@ class BaseAgent:
         Returns:
             dict[str, AIMessage | None]: LLM 的增量响应。按照指定要求，符合不同要求的 structured-output 。
         """
-        # 获取 main_llm 的输出。
-        # 自实现简单重试机制，避免网络问题。
-        response = None
-        for _ in range(self._main_llm_max_retries):
-            try:
-                response = await self.a_call_llm(
-                    llm=self._main_llm,
-                    messages=messages,
-                )
-                break
-            except Exception as e:
-                logger.error(e)
-        if response is None:
-            raise RuntimeError("main llm 达到最大重试次数。")
         # 如果不需要结构化输出，直接返回响应结果。
         if not self._is_need_structured_output:
+            response = await self.a_call_main_llm(messages=messages)
             logger.debug(f"Type of response: {type(response)}")
             return BaseAgentResponse(
                 ai_message=response,
                 structured_output=None,
             )  # 输出1: 仅输出 ai_message ，没有 structured_output 。
-        # 如果需要结构化输出，在最大可重试次数内进行请求。
-        else:
-            structured_output = None
-            for _ in range(self._formatter_llm_max_retries):
-                try:
-                    structured_output = await self.get_structured_output(
-                        raw_str=response.content,
-                        structured_llm=self._structured_llm,
-                        formatter_system_message=self._formatter_llm_system_message,
-                    )
-                    break
-                except Exception as e:
-                    logger.error(e)
+        # 如果需要结构化输出，根据失败的阶段选择恢复方法:
+        #     - main_llm 输出中有可用的 json : 在本地提取或修复，不请求 formatter 。
+        #     - formatter 失败: 仅重新请求 formatter 。
+        #     - formatter 达到最大重试次数: 回溯，重新生成 main_llm 的输出。
+        #     - num_candidates 大于 1 时: 并发生成多个候选，返回第一个有效的结果，取消其余的生成。
+        if self._num_candidates > 1:
+            agent_response = await run_first_valid(
+                candidate_factory=lambda: self.a_generate_candidate(messages=messages),
+                is_valid=lambda candidate: candidate is not None,
+                num_candidates=self._num_candidates,
+                budget=self._main_llm_max_retries,
+                semaphore=self._get_candidate_semaphore(),
+                # 与顺序的重试一致，不可重试的异常原样抛出。
+                is_fatal=self._is_fatal_error,
+            )
+            if agent_response is None:
+                raise RuntimeError("全部候选均未能提取结构化输出。")
+            return agent_response
+        for _ in range(self._main_llm_max_retries):
+            agent_response = await self.a_generate_candidate(messages=messages)
+            if agent_response is not None:
+                return agent_response
+            logger.warning("formatter llm 达到最大重试次数，重新生成 main llm 的输出。")
+        raise RuntimeError("formatter llm 达到最大重试次数。")
+
+    # ==== 暴露方法。批量处理。 ====
+    async def a_call_llm_with_retry_batch(
+        self,
+        messages_list: list[list[AnyMessage]],
+        max_concurrency: int | None = None,
+        return_exceptions: bool = False,
+    ) -> list[BaseAgentResponse | Exception]:
+        """
+        批量处理多个独立的 context 。a_call_llm_with_retry 的批量版本。
+
+        实现:
+            - main_llm: 使用 abatch 批量请求，max_concurrency 限制并发。
+            - 结构化输出: 先在本地提取，其余的成功输出作为第二个批次使用 abatch 请求 formatter 。
+                formatter 失败的部分仅重新请求 formatter ，最多 formatter_llm_max_retries 次。不可重试的异常不再重试。
+            - 并发: 指定 concurrency_limiter 时，每个请求分别经过 limiter ，延迟和限流反馈给 AIMD 的上限。
+            - 重试: 每一轮仅重新生成失败的部分，最多 main_llm_max_retries 轮。轮之间按 main_llm_retry_policy 退避。
+                不可重试的异常 (例如 context 过长) 不再重试。
+            - 结果与输入顺序一致。
+
+        Args:
+            messages_list (list[list[AnyMessage]]): 多个独立的 messages 。
+            max_concurrency (int, optional): abatch 的最大并发数量。默认不限制。
+            return_exceptions (bool): 失败的部分是否以异常作为结果。否则任何一个失败都会抛出 RuntimeError 。
+
+        Returns:
+            list[Union[BaseAgentResponse, Exception]]: 与输入顺序一致的结果。
+        """
+        results: list[BaseAgentResponse | Exception | None] = [None] * len(messages_list)
+        errors: dict[int, Exception] = {}
+        pending = list(range(len(messages_list)))
+        for round_index in range(self._main_llm_max_retries):
+            if round_index > 0:
+                await asyncio.sleep(self._main_llm_retry_policy.compute_delay(attempt=round_index - 1))
+            responses = await self._a_batch(
+                runnable=self._main_llm,
+                inputs=[messages_list[i] for i in pending],
+                max_concurrency=max_concurrency,
+            )
+            generated = []
+            for i, response in zip(pending, responses):
+                if isinstance(response, Exception):
+                    errors[i] = response
+                    if not self._main_llm_retry_policy.is_retryable(response):
+                        logger.error(f"main llm failed, not retrying: {type(response).__name__}.")
+                        results[i] = response
+                    continue
+                generated.append((i, cast('AIMessage', response)))
+            if not self._is_need_structured_output:
+                for i, response in generated:
+                    results[i] = BaseAgentResponse(ai_message=response, structured_output=None)
+            else:
+                await self._a_format_batch(generated=generated, results=results, max_concurrency=max_concurrency)
+            pending = [i for i in pending if results[i] is None]
+            if not pending:
+                break
+            logger.warning(f"Regenerating {len(pending)} of {len(messages_list)} failed messages.")
+        # 达到最大重试次数的部分，以及不可重试的部分。
+        for i in range(len(messages_list)):
+            if results[i] is None:
+                results[i] = RuntimeError("达到最大重试次数。")
+                if i in errors:
+                    results[i].__cause__ = errors[i]
+        failed = [result for result in results if isinstance(result, Exception)]
+        if failed and not return_exceptions:
+            raise RuntimeError(f"{len(failed)} of {len(messages_list)} messages failed.") from failed[0]
+        return results
+
+    # ==== 内部方法。批量处理。 ====
+    async def _a_format_batch(
+        self,
+        generated: list[tuple[int, AIMessage]],
+        results: list,
+        max_concurrency: int | None,
+    ) -> None:
+        """批量提取结构化输出。成功的部分写入 results 。"""
+        to_format = []
+        # 在 'parsing' 线程池中一次完成全部的本地提取，不阻塞事件循环。
+        local_structured_outputs = await OffloadPool.get('parsing').run(
+            lambda: [self.extract_structured_output_locally(raw_str=response.content) for _, response in generated]
+        )
+        for (i, response), structured_output in zip(generated, local_structured_outputs):
+            if structured_output is None and self._structured_output_cache is not None:
+                structured_output = self._structured_output_cache.get(
+                    system_message=self._formatter_llm_system_message,
+                    raw_str=response.content,
+                )
+            if structured_output is not None:
+                results[i] = BaseAgentResponse(ai_message=response, structured_output=structured_output)
+            else:
+                to_format.append((i, response))
+        for _ in range(self._formatter_llm_max_retries):
+            if not to_format:
+                return
+            structured_outputs = await self._a_batch(
+                runnable=self._structured_llm,
+                inputs=[
+                    [self._formatter_llm_system_message, HumanMessage(response.content)]
+                    for _, response in to_format
+                ],
+                max_concurrency=max_concurrency,
+            )
+            failed = []
+            for (i, response), structured_output in zip(to_format, structured_outputs):
+                if isinstance(structured_output, Exception) and not self._formatter_llm_retry_policy.is_retryable(structured_output):
+                    # 与 a_call_formatter_with_retry 相同，不可重试的异常不再重试，也不重新生成。
+                    logger.error(f"formatter llm failed, not retrying: {type(structured_output).__name__}.")
+                    results[i] = structured_output
+                elif structured_output is None or isinstance(structured_output, Exception):
+                    failed.append((i, response))
+                else:
+                    results[i] = BaseAgentResponse(ai_message=response, structured_output=structured_output)
+                    if self._structured_output_cache is not None:
+                        self._structured_output_cache.set(
+                            system_message=self._formatter_llm_system_message,
+                            raw_str=response.content,
+                            structured_output=structured_output,
+                        )
+            to_format = failed
+
+    async def _a_batch(
+        self,
+        runnable,
+        inputs: list,
+        max_concurrency: int | None,
+    ) -> list:
+        """
+        批量请求，结果与输入顺序一致，失败的部分以异常作为结果。
+
+        没有 concurrency_limiter 时使用 abatch 。否则每个输入分别经过 concurrency_limiter.run ，
+        abatch 的请求不会绕过 AIMD 的上限，延迟和限流也会反馈给 limiter 。
+        """
+        if self._concurrency_limiter is None:
+            config = {'max_concurrency': max_concurrency} if max_concurrency is not None else None
+            return await runnable.abatch(inputs, config=config, return_exceptions=True)
+        results = [None] * len(inputs)
+        async for map_result in map_concurrent(
+            lambda one_input: self._concurrency_limiter.run(lambda: runnable.ainvoke(one_input)),
+            inputs,
+            max_concurrency=max_concurrency or max(1, len(inputs)),
+        ):
+            results[map_result.index] = map_result.error if map_result.error is not None else map_result.result
+        return results
+
+    # ==== 主要方法。 ====
+    async def a_generate_candidate(
+        self,
+        messages: list[AnyMessage],
+    ) -> BaseAgentResponse | None:
+        """
+        生成一次 main_llm 的输出，并提取结构化输出。a_call_llm_with_retry 中的一次尝试。
+
+        Returns:
+            Union[BaseAgentResponse, None]: 包含结构化输出的响应。formatter 达到最大重试次数时为 None 。
+        """
+        response = await self.a_call_main_llm(messages=messages)
+        structured_output = await self.a_extract_structured_output_locally(raw_str=response.content)
+        if structured_output is None:
+            structured_output = await self.a_call_formatter_with_retry(raw_str=response.content)
+        if structured_output is None:
+            return None
+        return BaseAgentResponse(
+            ai_message=response,
+            structured_output=structured_output,
+        )  # 输出2: 仅输出 ai_message ，同时提供 structured_output 。
+
+    # ==== 主要方法。 ====
+    async def a_call_main_llm(
+        self,
+        messages: list[AnyMessage],
+    ) -> AIMessage:
+        """
+        获取 main_llm 的输出。按 main_llm_retry_policy 重试，避免网络问题。
+
+        Raises:
+            RuntimeError: main_llm 达到最大重试次数。
+            Exception: 不可重试的异常，例如认证失败或 context 过长。原样抛出。
+        """
+        try:
+            return await self._main_llm_retry_policy.arun(
+                lambda: self.a_call_llm(
+                    llm=self._main_llm,
+                    messages=messages,
+                )
+            )
+        except Exception as e:
+            if not self._main_llm_retry_policy.is_retryable(e):
+                raise
+            raise RuntimeError("main llm 达到最大重试次数。") from e
+
+    # ==== 主要方法。 ====
+    async def a_call_formatter_with_retry(
+        self,
+        raw_str: str,
+    ) -> BaseModel | None:
+        """
+        仅重新请求 formatter ，直至提取出结构化输出。按 formatter_llm_retry_policy 重试。
+
+        Returns:
+            Union[BaseModel, None]: 结构化输出。达到最大重试次数时为 None 。
+
+        Raises:
+            Exception: 不可重试的异常，例如认证失败。此时重新生成 main_llm 的输出没有意义。
+        """
+        async def call_formatter() -> BaseModel:
+            structured_output = await self.get_structured_output(
+                raw_str=raw_str,
+                structured_llm=self._structured_llm,
+                formatter_system_message=self._formatter_llm_system_message,
+            )
             if structured_output is None:
-                raise RuntimeError("formatter llm 达到最大重试次数。")
-            return BaseAgentResponse(
-                ai_message=response,
-                structured_output=structured_output,
-            )  # 输出2: 仅输出 ai_message ，同时提供 structured_output 。
+                raise ValueError("formatter llm 没有输出结构化数据。")
+            return structured_output
+
+        try:
+            return await self._formatter_llm_retry_policy.arun(call_formatter)
+        except Exception as e:
+            if not self._formatter_llm_retry_policy.is_retryable(e):
+                raise
+            logger.error(f"formatter llm failed: {type(e).__name__}.")
+            return None
 
     # ==== 主要方法。 ====
     async def a_call_llm(
@@ -244,7 +505,10 @@ class BaseAgent:
             AIMessage: LLM 的增量响应。如果包含 tool-use 的内容，会包含在 AIMessage 中。
         """
         # assert isinstance(messages[0], SystemMessage)  # 断言第一个 message 类型，非必要，部分推理框架有默认配置。
-        response = await llm.ainvoke(input=messages)
+        if self._concurrency_limiter is None:
+            response = await llm.ainvoke(input=messages)
+        else:
+            response = await self._concurrency_limiter.run(lambda: llm.ainvoke(input=messages))
         response = cast('AIMessage', response)
         # assert isinstance(response, AIMessage)
         return response
@@ -273,13 +537,86 @@ class BaseAgent:
         Returns:
             BaseModel: 基于初始定义 schema 的 pydantic-base-model 。
         """
-        response = await structured_llm.ainvoke(
-            input=[
+        def extract() -> Awaitable[BaseModel]:
+            messages = [
                 formatter_system_message,
                 HumanMessage(raw_str),
-            ],
+            ]
+            # 与 a_call_llm 一致，formatter 的请求也计入 concurrency_limiter 。缓存命中时不请求，不计入。
+            if self._concurrency_limiter is None:
+                return structured_llm.ainvoke(input=messages)
+            return self._concurrency_limiter.run(lambda: structured_llm.ainvoke(input=messages))
+
+        if self._structured_output_cache is None:
+            return await extract()
+        return await self._structured_output_cache.aget_or_extract(
+            system_message=formatter_system_message,
+            raw_str=raw_str,
+            extract=extract,
+        )
+
+    # ==== 工具方法。 ====
+    async def a_extract_structured_output_locally(
+        self,
+        raw_str: str,
+    ) -> BaseModel | None:
+        """extract_structured_output_locally 的异步版本。json 的解析、修复和检验在 'parsing' 线程池中运行，不阻塞事件循环。"""
+        if not isinstance(raw_str, str) or '```' not in raw_str:
+            # 没有 code-cell ，不需要解析。
+            return self.extract_structured_output_locally(raw_str=raw_str)
+        return await OffloadPool.get('parsing').run(self.extract_structured_output_locally, raw_str=raw_str)
+
+    # ==== 工具方法。 ====
+    def extract_structured_output_locally(
+        self,
+        raw_str: str,
+    ) -> BaseModel | None:
+        """
+        在本地从 main_llm 的输出中提取结构化输出，成功时不请求 formatter 。
+
+        实现:
+            - 有 json 的 code-cell ，并且符合 schema: 直接使用。
+            - 有 json 的 code-cell ，但格式错误 (LOAD_FAILURE): 在本地修复，修复结果符合 schema 时使用。
+            - 其他情况 (没有 code-cell 、不符合 schema): 仍由 formatter 从原始输出中提取。
+        结果记录在 self.formatter_elision_counter 中: 'hit', 'repaired', 'miss' 。
+
+        Args:
+            raw_str (str): main_llm 输出的字符串。
+
+        Returns:
+            Union[BaseModel, None]:
+                - BaseModel: 通过 schema 检测的结构化输出。
+                - None: 无法在本地提取。需要请求 formatter 。
+        """
+        if not isinstance(raw_str, str) or '```' not in raw_str:
+            self._count_formatter_elision('miss')
+            return None
+        # 以严格的 json 区分失败的阶段，格式错误即为 LOAD_FAILURE 。
+        result = JsonOutputExtractor.extract_json_result(
+            raw_str=raw_str,
+            json_loader_name='json',
+            schema_pydantic_base_model=self._schema_pydantic_base_model,
+        )
+        raw_structured_data = None
+        if result.is_ok:
+            self._count_formatter_elision('hit')
+            raw_structured_data = result.structured_data
+        elif result.get_recovery_action(is_formatter_available=True) == 'repair':
+            repaired = JsonOutputExtractor.repair_json_block(
+                raw_str=raw_str,
+                schema_pydantic_base_model=self._schema_pydantic_base_model,
+            )
+            if repaired is not None:
+                self._count_formatter_elision('repaired')
+                _, raw_structured_data = repaired
+        if raw_structured_data is None:
+            self._count_formatter_elision('miss')
+            return None
+        logger.debug("Extracted structured output locally, skipped formatter llm.")
+        return SchemaValidatorCache.validate_dict(
+            raw_dict_structured_data=raw_structured_data,
+            schema_pydantic_base_model=self._schema_pydantic_base_model,
         )
-        return response
 
     # ==== 工具方法。 ====
     def _build_structured_llm(
@@ -287,7 +624,6 @@ class BaseAgent:
         llm: BaseChatModel,
         schema_pydantic_base_model: type[BaseModel],
         # system_message: SystemMessage,
-        max_retries: int = 3,
     ) -> BaseChatModel:
         """
         构造 structured_llm 的方法。
@@ -299,16 +635,34 @@ class BaseAgent:
         Args:
             llm (BaseChatModel): 基础的用于推理的基座模型。需要具有结构化提取功能。
             schema_pydantic_base_model (BaseModel): 基于 pydantic 定义的 schema 。
-            max_retries (int): 最大重试次数。基于 runnable 本身的实现。
 
         Returns:
-            BaseChatModel: 被限制为仅会进行结构化输出的 structured_llm 。
+            BaseChatModel: 被限制为仅会进行结构化输出的 structured_llm 。重试由 formatter_llm_retry_policy 实现。
         """
         structured_llm = llm.with_structured_output(
             schema=schema_pydantic_base_model,
-        ).with_retry(
-            stop_after_attempt=max_retries,
         )
         structured_llm = cast('BaseChatModel', structured_llm)
         return structured_llm
 
+    # ==== 内部方法。 ====
+    def _count_formatter_elision(
+        self,
+        outcome: str,
+    ) -> None:
+        with self._formatter_elision_lock:
+            self.formatter_elision_counter[outcome] += 1
+
+    def _get_candidate_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._candidate_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._candidate_semaphores[loop] = asyncio.Semaphore(self._max_concurrent_candidates)
+        return semaphore
+
+    def _is_fatal_error(
+        self,
+        error: BaseException,
+    ) -> bool:
+        """main_llm 或 formatter_llm 的重试策略判断为不可重试的异常。a_generate_candidate 原样抛出这些异常。"""
+        return not self._main_llm_retry_policy.is_retryable(error) or not self._formatter_llm_retry_policy.is_retryable(error)
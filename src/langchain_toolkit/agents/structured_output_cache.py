@@ -0,0 +1,139 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/langchain_toolkit/agents/structured_output_cache.py
+
+References:
+    None
+
+Synopsis:
+    结构化提取 (formatter) 的结果缓存。StructuredOutputHelper 和 BaseAgent (V2) 共用。
+
+Notes:
+    结构化提取是确定性的任务: 相同的指令、相同的文本、相同的 schema ，结果可以复用。
+    重新运行 pipeline 或评测时，不需要再次请求 formatter 。
+
+    key 为 system-message 的内容、被提取的文本、schema 的 json-schema 的 hash 。
+    修改 schema 的定义 (字段、docstring) 会改变 key ，不会读取到旧的结果。
+    value 为 model_dump_json 的结果，读取时以 model_validate_json 还原。
+
+    后端见 src/agnostic_utils/response_cache.py 。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.agnostic_utils.response_cache import ResponseCache
+
+import json
+
+from typing import TYPE_CHECKING, Awaitable, Callable
+if TYPE_CHECKING:
+    from langchain_core.messages import SystemMessage
+    from pydantic import BaseModel
+
+
+class StructuredOutputCache:
+    """
+    结构化提取的结果缓存。一个实例对应一个 schema 。
+
+    主要方法:
+        - aget_or_extract: 读取缓存，不存在时提取并写入。相同的并发请求只提取一次。
+        - get / set: 直接读取和写入。用于批量提取。
+    """
+
+    def __init__(
+        self,
+        response_cache: ResponseCache,
+        schema_pydantic_base_model: type[BaseModel],
+    ):
+        """
+        Args:
+            response_cache (ResponseCache): 缓存的后端。可以在多个实例之间共用。
+            schema_pydantic_base_model (type[BaseModel]): 基于 pydantic 定义的 schema 。
+        """
+        self._response_cache = response_cache
+        self._schema_pydantic_base_model = schema_pydantic_base_model
+        self._schema_json = json.dumps(
+            schema_pydantic_base_model.model_json_schema(),
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+
+    # ==== 主要方法。 ====
+    async def aget_or_extract(
+        self,
+        system_message: SystemMessage,
+        raw_str: str,
+        extract: Callable[[], Awaitable[BaseModel | None]],
+    ) -> BaseModel | None:
+        """
+        读取缓存，不存在时提取并写入。
+
+        Args:
+            system_message (SystemMessage): 提取指令。
+            raw_str (str): 被提取的文本。
+            extract (Callable[[], Awaitable[Union[BaseModel, None]]]): 提取的协程。结果为 None 时不写入缓存。
+
+        Returns:
+            Union[BaseModel, None]: 结构化数据。
+        """
+        key = self.make_key(system_message=system_message, raw_str=raw_str)
+
+        async def compute() -> str | None:
+            structured_output = await extract()
+            if structured_output is None:
+                return None
+            return structured_output.model_dump_json()
+
+        value = await self._response_cache.aget_or_compute(key=key, compute=compute)
+        if value is None:
+            return None
+        try:
+            return self._schema_pydantic_base_model.model_validate_json(value)
+        except ValueError as e:
+            # schema 的校验逻辑改变，但 json-schema 没有改变。重新提取。
+            logger.warning(f"Cached structured output is invalid, extracting again: {type(e).__name__}.")
+            structured_output = await extract()
+            if structured_output is not None:
+                self._response_cache.set(key=key, value=structured_output.model_dump_json())
+            return structured_output
+
+    # ==== 主要方法。 ====
+    def get(
+        self,
+        system_message: SystemMessage,
+        raw_str: str,
+    ) -> BaseModel | None:
+        """读取缓存。不存在或无法还原时为 None 。"""
+        value = self._response_cache.get(key=self.make_key(system_message=system_message, raw_str=raw_str))
+        if value is None:
+            return None
+        try:
+            return self._schema_pydantic_base_model.model_validate_json(value)
+        except ValueError:
+            return None
+
+    # ==== 主要方法。 ====
+    def set(
+        self,
+        system_message: SystemMessage,
+        raw_str: str,
+        structured_output: BaseModel,
+    ) -> None:
+        """写入缓存。"""
+        self._response_cache.set(
+            key=self.make_key(system_message=system_message, raw_str=raw_str),
+            value=structured_output.model_dump_json(),
+        )
+
+    # ==== 工具方法。 ====
+    def make_key(
+        self,
+        system_message: SystemMessage,
+        raw_str: str,
+    ) -> str:
+        """以 system-message 的内容、被提取的文本、schema 构建 key 。"""
+        content = system_message.content
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False, sort_keys=True)
+        return ResponseCache.make_key(content, raw_str, self._schema_json)
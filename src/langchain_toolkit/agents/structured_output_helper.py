@@ -17,18 +17,25 @@ Notes:
         - 异构 agent，更高的灵活性。
         - 仅一条文本，价格低，任务简单。
         - 但是，提取的结果可能不是原始 agent 的本意。
+
+    指定 response_cache 时，相同文本的提取结果会被缓存，见 StructuredOutputCache 。
 """
 
 from __future__ import annotations
 from loguru import logger
 
+from src.agnostic_utils.adaptive_concurrency import AdaptiveConcurrencyLimiter
+from src.agnostic_utils.retry_policy import RetryPolicy
+from src.langchain_toolkit.agents.structured_output_cache import StructuredOutputCache
+
 from langchain_core.messages import SystemMessage, HumanMessage
 
-from typing import TYPE_CHECKING, cast
+from typing import TYPE_CHECKING, Awaitable, cast
 if TYPE_CHECKING:
     from langchain_core.runnables import RunnableConfig
     from langchain_core.language_models import BaseChatModel
     from pydantic import BaseModel
+    from src.agnostic_utils.response_cache import ResponseCache
 
 
 class StructuredOutputHelper:
@@ -42,6 +49,9 @@ class StructuredOutputHelper:
         schema_pydantic_base_model: type[BaseModel],
         system_message: SystemMessage,
         max_retries: int = 3,
+        retry_policy: RetryPolicy | None = None,
+        response_cache: ResponseCache | None = None,
+        concurrency_limiter: AdaptiveConcurrencyLimiter | None = None,
     ):
         """
         构造结构化输出提取工具的必要参数。
@@ -50,13 +60,23 @@ class StructuredOutputHelper:
             llm (BaseChatModel): 基础的用于推理的基座模型。需要具有结构化提取功能。
             schema_pydantic_base_model (BaseModel): 基于 pydantic 定义的 schema 。
             system_message (SystemMessage): 提取指令。在这个实现中，它不与 llm 绑定，可进行修改。
-            max_retries (int): 最大重试次数。基于 runnable 本身的实现。
+            max_retries (int): 最大尝试次数。仅在没有指定 retry_policy 时使用。
+            retry_policy (RetryPolicy, optional): 重试策略。可以与 agent 共用同一个实例，统计全部的重试。
+            response_cache (ResponseCache, optional): 提取结果的缓存。默认不缓存。
+            concurrency_limiter (AdaptiveConcurrencyLimiter, optional): 请求 llm 的自适应并发上限。默认不限制。
         """
         self._system_message = system_message
+        self._retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries)
+        self._concurrency_limiter = concurrency_limiter
+        self._structured_output_cache = None
+        if response_cache is not None:
+            self._structured_output_cache = StructuredOutputCache(
+                response_cache=response_cache,
+                schema_pydantic_base_model=schema_pydantic_base_model,
+            )
         self._structured_llm = self._build_structured_llm(
             llm=llm,
             schema_pydantic_base_model=schema_pydantic_base_model,
-            max_retries=max_retries,
         )
 
     # ==== 常见的默认统一方法。 ====
@@ -103,13 +123,26 @@ class StructuredOutputHelper:
             BaseModel: 基于 pydantic 定义的 schema 的数据对象。
                 调用该方法的函数，可以进一步确认提取的 schema 的定义。
         """
-        response = await self._structured_llm.ainvoke(
-            input=[
-                self._system_message,
-                HumanMessage(content=raw_str),
-            ]
+        def call_structured_llm() -> Awaitable[BaseModel]:
+            return self._structured_llm.ainvoke(
+                input=[
+                    self._system_message,
+                    HumanMessage(content=raw_str),
+                ]
+            )
+
+        def extract() -> Awaitable[BaseModel]:
+            if self._concurrency_limiter is None:
+                return self._retry_policy.arun(call_structured_llm)
+            return self._retry_policy.arun(lambda: self._concurrency_limiter.run(call_structured_llm))
+
+        if self._structured_output_cache is None:
+            return await extract()
+        return await self._structured_output_cache.aget_or_extract(
+            system_message=self._system_message,
+            raw_str=raw_str,
+            extract=extract,
         )
-        return response
 
     # ==== 内部构建方法。 ====
     def _build_structured_llm(
@@ -117,7 +150,6 @@ class StructuredOutputHelper:
         llm: BaseChatModel,
         schema_pydantic_base_model: type[BaseModel],
         # system_message: SystemMessage,
-        max_retries: int = 3,
     ) -> BaseChatModel:
         """
         构造 structured_llm 的方法。
@@ -129,15 +161,12 @@ class StructuredOutputHelper:
         Args:
             llm (BaseChatModel): 基础的用于推理的基座模型。需要具有结构化提取功能。
             schema_pydantic_base_model (BaseModel): 基于 pydantic 定义的 schema 。
-            max_retries (int): 最大重试次数。基于 runnable 本身的实现。
 
         Returns:
-            BaseChatModel: 被限制为仅会进行结构化输出的 structured_llm 。
+            BaseChatModel: 被限制为仅会进行结构化输出的 structured_llm 。重试由 retry_policy 实现。
         """
         structured_llm = llm.with_structured_output(
             schema=schema_pydantic_base_model,
-        ).with_retry(
-            stop_after_attempt=max_retries,
         )
         structured_llm = cast('BaseChatModel', structured_llm)
         return structured_llm
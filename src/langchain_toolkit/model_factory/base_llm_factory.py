@@ -17,6 +17,22 @@ Notes:
     pip install -U langchain-openai
     ```
 
+    连接复用: 相同 base_url 和 api_key 的 LLM 共享 httpx client ，见 HttpClientRegistry 。
+        在 model_configs 中指定 http_client 或 http_async_client 时使用指定的 client 。
+        使用 openai_proxy (model_configs 中或环境变量 OPENAI_PROXY) 时不共享，ChatOpenAI 不接受同时指定。
+
+    供应商: 以 PROVIDER_SPECS 表描述 (base_url 和 api_key 的环境变量) 。
+        新的 gateway 通过 register_provider 添加，不需要新的方法。
+
+    复用: 相同 (model_client, model_name, model_configs) 的 LLM 只构建一次，以弱引用记录。
+        只要有 agent 持有该 LLM ，之后的 create_llm 直接返回同一个实例。
+        环境变量或供应商改变后，调用 invalidate 。
+        返回的实例是共享的，不要修改它的属性，需要不同的配置时使用不同的 model_configs 。
+
+    限速: 指定 is_rate_limited=True 时，同一个模型的全部 LLM 共享 RPM 和 TPM 的令牌桶，见 RateLimiterFactory 。
+
+    实验重放: 指定 response_cache 时，返回的 LLM 被包装为 CachedChatModel ，见 cached_chat_model.py 。
+
     如果需要:
         - 使用具体厂商的一些功能: 使用 SpecificLLMFactory 。
         - 使用本地模型: 使用 SpecificLLMFactory ，以及参考 LocalLLMFactory 具体去实现。
@@ -29,112 +45,225 @@ Notes:
 from __future__ import annotations
 from loguru import logger
 
+from src.agnostic_utils.http_client_registry import HttpClientRegistry
+from src.langchain_toolkit.model_factory.cached_chat_model import CachedChatModel
+from src.langchain_toolkit.model_factory.rate_limited_chat_model import RateLimitedChatModel
+from src.langchain_toolkit.model_factory.rate_limiter_factory import RateLimiterFactory
+
 from langchain_openai import ChatOpenAI
+import json
 import os
+import threading
+import weakref
 from dotenv import load_dotenv
 
-from typing import TYPE_CHECKING, Literal
-# if TYPE_CHECKING:
+from typing import TYPE_CHECKING, Literal, NamedTuple
+if TYPE_CHECKING:
+    from src.agnostic_utils.response_cache import ResponseCache
+
+
+class LLMProviderSpec(NamedTuple):
+    """
+    以 openai 兼容 API 访问的供应商。
+
+    Attributes:
+        api_key_env (str): api_key 的环境变量。
+        base_url_env (str, optional): base_url 的环境变量。None 为使用 SDK 默认的地址。
+    """
+
+    api_key_env: str
+    base_url_env: str | None = None
 
 
 class BaseLLMFactory:
     """
     默认的全部以 openai 兼容 API 实现的 LLM-factory 。
+
+    主要方法:
+        - create_llm: 按供应商构建 LLM 。相同的参数返回同一个实例。
+        - register_provider: 添加或覆盖供应商。
+        - invalidate: 清除复用的实例。
     """
+
+    PROVIDER_SPECS: dict[str, LLMProviderSpec] = {
+        'openai': LLMProviderSpec(api_key_env='OPENAI_API_KEY_'),
+        'google': LLMProviderSpec(api_key_env='GEMINI_API_KEY', base_url_env='GEMINI_API_BASE_URL'),
+        'anthropic': LLMProviderSpec(api_key_env='ANTHROPIC_API_KEY', base_url_env='ANTHROPIC_API_BASE_URL'),
+        'dashscope': LLMProviderSpec(api_key_env='DASHSCOPE_API_KEY', base_url_env='DASHSCOPE_API_BASE_URL'),
+        'deepseek': LLMProviderSpec(api_key_env='DEEPSEEK_API_KEY', base_url_env='DEEPSEEK_API_BASE_URL'),
+    }
+
+    _llm_registry: weakref.WeakValueDictionary[tuple[str, str, str], ChatOpenAI] = weakref.WeakValueDictionary()
+    _lock = threading.Lock()
+
     # ====主要方法。====
     @staticmethod
     def create_llm(
-        model_client: Literal['openai', 'google', 'anthropic', 'dashscope', 'deepseek'],
+        model_client: Literal['openai', 'google', 'anthropic', 'dashscope', 'deepseek'] | str,
         model_name: str,
         model_configs: dict = None,
-    ) -> ChatOpenAI:
+        is_rate_limited: bool = False,
+        response_cache: ResponseCache | None = None,
+        response_cache_mode: Literal['record', 'replay', 'replay-or-call'] = 'replay-or-call',
+    ) -> ChatOpenAI | RateLimitedChatModel | CachedChatModel:
         """
-        使用 strategy-pattern 封装的全部的方法。
+        按 PROVIDER_SPECS 构建 LLM 。相同的参数返回同一个实例。
 
         复杂构造仍需要传递对象参数。
         可以直接使用该工具类中其他方法。
 
         Args:
-            model_client (Literal['openai', 'google', 'anthropic', 'dashscope', 'deepseek']): 模型的供应商。
+            model_client (str): 模型的供应商。PROVIDER_SPECS 中的 key ，默认有 'openai', 'google', 'anthropic', 'dashscope', 'deepseek' 。
             model_name (str): 具体模型的型号。
             model_configs (dict, optional): 对于 ChatOpenAI 构造函数指定的 kwargs 。
+            is_rate_limited (bool): 是否以 (model_client, model_name) 共享的令牌桶限速。默认不限速。
+            response_cache (ResponseCache, optional): 完整响应的缓存。指定时返回 CachedChatModel 。默认不缓存。
+            response_cache_mode (Literal['record', 'replay', 'replay-or-call']): 缓存的模式。
 
         Returns:
-            ChatOpenAI: langchain 中可用于对话的 LLM 。
+            Union[ChatOpenAI, RateLimitedChatModel, CachedChatModel]: langchain 中可用于对话的 LLM 。
+                同时限速和缓存时，缓存在外层，缓存命中的请求不消耗额度。
+
+        Raises:
+            ValueError: 未知的 model_client 。
         """
-        if model_client == 'openai':
-            return BaseLLMFactory.create_openai_llm(model_name=model_name, model_configs=model_configs)
-        elif model_client == 'google':
-            return BaseLLMFactory.create_google_llm(model_name=model_name, model_configs=model_configs)
-        elif model_client == 'anthropic':
-            return BaseLLMFactory.create_anthropic_llm(model_name=model_name, model_configs=model_configs)
-        elif model_client == 'dashscope':
-            return BaseLLMFactory.create_dashscope_llm(model_name=model_name, model_configs=model_configs)
-        elif model_client == 'deepseek':
-            return BaseLLMFactory.create_deepseek_llm(model_name=model_name, model_configs=model_configs)
+        key = (model_client, model_name, BaseLLMFactory.canonicalize_model_configs(model_configs))
+        with BaseLLMFactory._lock:
+            llm = BaseLLMFactory._llm_registry.get(key)
+            if llm is None:
+                llm = BaseLLMFactory.create_provider_llm(
+                    model_client=model_client,
+                    model_name=model_name,
+                    model_configs=model_configs,
+                )
+                BaseLLMFactory._llm_registry[key] = llm
+        if is_rate_limited:
+            llm = RateLimitedChatModel.wrap(
+                llm=llm,
+                rate_limiter=RateLimiterFactory.get_rate_limiter(model_client=model_client, model_name=model_name),
+            )
+        return CachedChatModel.wrap(llm=llm, response_cache=response_cache, mode=response_cache_mode)
 
+    # ====主要方法。====
     @staticmethod
-    def create_openai_llm(
+    def register_provider(
+        model_client: str,
+        api_key_env: str,
+        base_url_env: str | None = None,
+    ) -> None:
+        """添加或覆盖供应商。覆盖时清除该供应商复用的实例。"""
+        BaseLLMFactory.PROVIDER_SPECS[model_client] = LLMProviderSpec(api_key_env=api_key_env, base_url_env=base_url_env)
+        BaseLLMFactory.invalidate(model_client=model_client)
+
+    # ====主要方法。====
+    @staticmethod
+    def invalidate(
+        model_client: str | None = None,
+        model_name: str | None = None,
+    ) -> int:
+        """
+        清除复用的实例。已经被持有的实例不受影响，之后的 create_llm 会重新构建。
+
+        Args:
+            model_client (str, optional): 仅清除该供应商的实例。默认全部。
+            model_name (str, optional): 仅清除该模型的实例。默认全部。
+
+        Returns:
+            int: 清除的数量。
+        """
+        with BaseLLMFactory._lock:
+            keys = [
+                key for key in list(BaseLLMFactory._llm_registry.keys())
+                if (model_client is None or key[0] == model_client)
+                and (model_name is None or key[1] == model_name)
+            ]
+            for key in keys:
+                BaseLLMFactory._llm_registry.pop(key, None)
+        return len(keys)
+
+    # ====构建方法。====
+    @staticmethod
+    def create_provider_llm(
+        model_client: str,
         model_name: str,
         model_configs: dict = None,
     ) -> ChatOpenAI:
+        """按 PROVIDER_SPECS 构建新的 LLM ，不复用。"""
+        spec = BaseLLMFactory.PROVIDER_SPECS.get(model_client)
+        if spec is None:
+            raise ValueError(f"Unknown model_client: {model_client}")
+        base_url = os.environ[spec.base_url_env] if spec.base_url_env is not None else None
+        api_key = os.environ[spec.api_key_env]
         llm = ChatOpenAI(
             model_name=model_name,
-            # base_url=os.environ['OPENAI_API_BASE_URL'],
-            api_key=os.environ['OPENAI_API_KEY_'],
-            **(model_configs or {}),
+            api_key=api_key,
+            # 没有 base_url_env 时不传入 base_url ，保留 ChatOpenAI 从环境变量读取的默认值。
+            **({'base_url': base_url} if base_url is not None else {}),
+            **BaseLLMFactory.get_http_client_configs(base_url=base_url, api_key=api_key, model_configs=model_configs),
         )
+        logger.debug(f"Created {model_client} llm: {model_name}")
         return llm
 
+    @staticmethod
+    def create_openai_llm(
+        model_name: str,
+        model_configs: dict = None,
+    ) -> ChatOpenAI:
+        return BaseLLMFactory.create_provider_llm(model_client='openai', model_name=model_name, model_configs=model_configs)
+
     @staticmethod
     def create_google_llm(
         model_name: str,
         model_configs: dict = None,
     ) -> ChatOpenAI:
-        llm = ChatOpenAI(
-            model_name=model_name,
-            base_url=os.environ['GEMINI_API_BASE_URL'],
-            api_key=os.environ['GEMINI_API_KEY'],
-            **(model_configs or {}),
-        )
-        return llm
+        return BaseLLMFactory.create_provider_llm(model_client='google', model_name=model_name, model_configs=model_configs)
 
     @staticmethod
     def create_anthropic_llm(
         model_name: str,
         model_configs: dict = None,
     ) -> ChatOpenAI:
-        llm = ChatOpenAI(
-            model_name=model_name,
-            base_url=os.environ['ANTHROPIC_API_BASE_URL'],
-            api_key=os.environ['ANTHROPIC_API_KEY'],
-            **(model_configs or {}),
-        )
-        return llm
+        return BaseLLMFactory.create_provider_llm(model_client='anthropic', model_name=model_name, model_configs=model_configs)
 
     @staticmethod
     def create_dashscope_llm(
         model_name: str,
         model_configs: dict = None,
     ) -> ChatOpenAI:
-        llm = ChatOpenAI(
-            model_name=model_name,
-            base_url=os.environ['DASHSCOPE_API_BASE_URL'],
-            api_key=os.environ['DASHSCOPE_API_KEY'],
-            **(model_configs or {}),
-        )
-        return llm
+        return BaseLLMFactory.create_provider_llm(model_client='dashscope', model_name=model_name, model_configs=model_configs)
 
     @staticmethod
     def create_deepseek_llm(
         model_name: str,
         model_configs: dict = None,
     ) -> ChatOpenAI:
-        llm = ChatOpenAI(
-            model_name=model_name,
-            base_url=os.environ['DEEPSEEK_API_BASE_URL'],
-            api_key=os.environ['DEEPSEEK_API_KEY'],
-            **(model_configs or {}),
+        return BaseLLMFactory.create_provider_llm(model_client='deepseek', model_name=model_name, model_configs=model_configs)
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def canonicalize_model_configs(
+        model_configs: dict | None,
+    ) -> str:
+        """
+        model_configs 的规范化表示，用于复用的 key 。
+
+        不能序列化的值 (例如 http_client, callbacks) 以对象的 id 区分，仅在传入同一个对象时复用。
+        """
+        return json.dumps(
+            model_configs or {},
+            sort_keys=True,
+            default=lambda value: f"{type(value).__qualname__}@{id(value)}",
         )
-        return llm
 
+    # ==== 工具方法。 ====
+    @staticmethod
+    def get_http_client_configs(
+        base_url: str | None,
+        api_key: str,
+        model_configs: dict | None = None,
+    ) -> dict:
+        """在 model_configs 中加入共享的 httpx client 。model_configs 中已指定的 client 优先。使用 openai_proxy 时不加入。"""
+        return {
+            **HttpClientRegistry.get_openai_client_kwargs(base_url=base_url, api_key=api_key, model_configs=model_configs),
+            **(model_configs or {}),
+        }
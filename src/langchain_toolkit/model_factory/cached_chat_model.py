@@ -0,0 +1,213 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/langchain_toolkit/model_factory/cached_chat_model.py
+
+References:
+    None
+
+Synopsis:
+    缓存 LLM 的完整响应，用于记录和重放实验。
+
+Notes:
+    消融实验重新运行时，大部分 agent 的调用与之前的运行完全相同。
+    CachedChatModel 包装任意的 BaseChatModel ，以 messages 和生成参数为 key 缓存完整的 ChatResult ，
+    包括 AIMessage 的 response_metadata 、usage_metadata 和 tool_calls 。
+
+    模式:
+        - 'record': 总是请求 LLM ，并写入缓存。覆盖之前的记录。
+        - 'replay': 仅从缓存读取。不存在时抛出 ReplayMissError ，不会请求 LLM 。用于离线、确定性地重放。
+        - 'replay-or-call': 从缓存读取，不存在时请求 LLM 并写入缓存。
+
+    key 为以下内容的规范化序列化的 hash:
+        - messages: 仅使用 type, content, name, tool_calls, tool_call_id 。
+            不使用 message 的 id 和 response_metadata ，它们在每次运行中不同。
+        - 生成参数: 被包装的 LLM 的 _get_invocation_params ，包括模型名称、temperature 、stop 和绑定的 tools 等。
+
+    存储建议使用 MmapResponseCache (只追加的数据文件和内存中的索引) ，重放时仅需要一次 mmap 切片和 json 解析。
+    BaseLLMFactory.create_llm 和 LocalLLMFactory.create_openai_llm 可以通过 response_cache 参数直接构建。
+
+    限制:
+        - 流式输出不会逐个 token 重放，astream 会得到一个完整的 chunk 。
+        - with_structured_output 使用 BaseChatModel 默认的 tool-calling 实现，而不是被包装的 LLM 的实现。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.agnostic_utils.response_cache import ResponseCache
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict
+import json
+
+from typing import TYPE_CHECKING, Any, Literal
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+    from langchain_core.messages import BaseMessage
+    from langchain_core.runnables import Runnable
+
+
+class ReplayMissError(KeyError):
+    """'replay' 模式下，缓存中没有对应的响应。"""
+
+
+class CachedChatModel(BaseChatModel):
+    """
+    缓存完整响应的 chat-model 。
+
+    主要方法:
+        - 与 BaseChatModel 相同。invoke, ainvoke, batch, abatch 均经过缓存。
+        - make_key: 以 messages 和生成参数构建 key 。
+
+    状态:
+        - response_cache.stats: 缓存的命中和未命中次数。
+    """
+
+    llm: BaseChatModel
+    """被包装的 LLM 。"""
+    response_cache: ResponseCache
+    """响应的存储。"""
+    mode: Literal['record', 'replay', 'replay-or-call'] = 'replay-or-call'
+    """缓存的模式。"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.llm._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {'mode': self.mode, **self.llm._identifying_params}
+
+    # ==== 主要方法。 ====
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        key = self.make_key(messages=messages, stop=stop, **kwargs)
+        if self.mode != 'record':
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return CachedChatModel.loads_chat_result(cached)
+            if self.mode == 'replay':
+                raise ReplayMissError(f"No recorded response for key {key}.")
+        chat_result = self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self.response_cache.set(key, CachedChatModel.dumps_chat_result(chat_result))
+        return chat_result
+
+    # ==== 主要方法。 ====
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        key = self.make_key(messages=messages, stop=stop, **kwargs)
+
+        async def call_llm() -> str:
+            chat_result = await self.llm._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return CachedChatModel.dumps_chat_result(chat_result)
+
+        if self.mode == 'record':
+            value = await call_llm()
+            self.response_cache.set(key, value)
+        elif self.mode == 'replay':
+            value = self.response_cache.get(key)
+            if value is None:
+                raise ReplayMissError(f"No recorded response for key {key}.")
+        else:
+            # 相同的并发请求只请求一次 LLM 。
+            value = await self.response_cache.aget_or_compute(key=key, compute=call_llm)
+        return CachedChatModel.loads_chat_result(value)
+
+    # ==== 主要方法。 ====
+    def bind_tools(
+        self,
+        tools: Sequence[Any],
+        **kwargs: Any,
+    ) -> Runnable:
+        """由被包装的 LLM 转换 tools 的格式，绑定在这个 chat-model 上。绑定的参数会成为 key 的一部分。"""
+        binding = self.llm.bind_tools(tools, **kwargs)
+        return self.bind(**binding.kwargs)
+
+    # ==== 工具方法。 ====
+    def make_key(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        **kwargs: Any,
+    ) -> str:
+        """以规范化的 messages 和生成参数构建 key 。"""
+        canonical_messages = [
+            {
+                'type': message.type,
+                'content': message.content,
+                'name': message.name,
+                'tool_calls': getattr(message, 'tool_calls', None) or None,
+                'tool_call_id': getattr(message, 'tool_call_id', None),
+            }
+            for message in messages
+        ]
+        invocation_params = self.llm._get_invocation_params(stop=stop, **kwargs)
+        return ResponseCache.make_key(
+            json.dumps(canonical_messages, ensure_ascii=False, sort_keys=True, default=str),
+            json.dumps(invocation_params, ensure_ascii=False, sort_keys=True, default=str),
+        )
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def dumps_chat_result(
+        chat_result: ChatResult,
+    ) -> str:
+        """序列化完整的 ChatResult 。"""
+        return json.dumps(
+            {
+                'generations': [
+                    {
+                        'message': message_to_dict(generation.message),
+                        'generation_info': generation.generation_info,
+                    }
+                    for generation in chat_result.generations
+                ],
+                'llm_output': chat_result.llm_output,
+            },
+            ensure_ascii=False,
+            default=str,
+        )
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def loads_chat_result(
+        value: str,
+    ) -> ChatResult:
+        """还原 dumps_chat_result 的结果。"""
+        data = json.loads(value)
+        generations = [
+            ChatGeneration(
+                message=messages_from_dict([generation['message']])[0],
+                generation_info=generation['generation_info'],
+            )
+            for generation in data['generations']
+        ]
+        return ChatResult(generations=generations, llm_output=data['llm_output'])
+
+    # ==== 构建方法。 ====
+    @staticmethod
+    def wrap(
+        llm: BaseChatModel,
+        response_cache: ResponseCache | None,
+        mode: Literal['record', 'replay', 'replay-or-call'] = 'replay-or-call',
+    ) -> BaseChatModel:
+        """response_cache 为 None 时返回原本的 llm ，否则包装为 CachedChatModel 。"""
+        if response_cache is None:
+            return llm
+        logger.info(f"Caching responses of {llm._llm_type} in {mode} mode.")
+        return CachedChatModel(llm=llm, response_cache=response_cache, mode=mode)
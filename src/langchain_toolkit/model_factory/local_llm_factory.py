@@ -25,13 +25,17 @@ from loguru import logger
 # from langchain_ollama.chat_models import ChatOllama  # from langchain_community.chat_models import ChatOllama
 # from langchain.llms import LlamaCpp
 # from langchain.llms import GPT4All
+from src.agnostic_utils.http_client_registry import HttpClientRegistry
+from src.langchain_toolkit.model_factory.cached_chat_model import CachedChatModel
+
 from langchain_openai import ChatOpenAI
 
 from pydantic import SecretStr
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal
 if TYPE_CHECKING:
     from langchain_core.language_models import BaseChatModel
+    from src.agnostic_utils.response_cache import ResponseCache
 
 
 class LocalLLMFactory:
@@ -52,7 +56,9 @@ class LocalLLMFactory:
         use_responses_api: bool | None,
         max_retries: int | None,
         model_configs: dict,
-    ) -> ChatOpenAI:
+        response_cache: ResponseCache | None = None,
+        response_cache_mode: Literal['record', 'replay', 'replay-or-call'] = 'replay-or-call',
+    ) -> ChatOpenAI | CachedChatModel:
         """
         使用相关推理框架，在本地运行模型。
         需要额外的工程实现模型部署。
@@ -73,9 +79,11 @@ class LocalLLMFactory:
             use_responses_api (bool, optional):
             max_retries (int, optional):
             model_configs (dict): 对于 ChatOpenAI 构造函数指定的 kwargs 。
+            response_cache (ResponseCache, optional): 完整响应的缓存。指定时返回 CachedChatModel 。默认不缓存。
+            response_cache_mode (Literal['record', 'replay', 'replay-or-call']): 缓存的模式。
 
         Returns:
-            ChatOpenAI: langchain 中基础的 chat-model 。
+            Union[ChatOpenAI, CachedChatModel]: langchain 中基础的 chat-model 。
         """
         logger.debug(f"Model configs: {model_configs}")
         llm = ChatOpenAI(
@@ -88,10 +96,17 @@ class LocalLLMFactory:
             use_responses_api=use_responses_api,
             max_retries=max_retries,
             api_key=api_key,  # trust me. I know what I am doing.
-            **model_configs,
+            **{
+                **HttpClientRegistry.get_openai_client_kwargs(
+                    base_url=base_url,
+                    api_key=api_key.get_secret_value() if isinstance(api_key, SecretStr) else api_key,
+                    model_configs=model_configs,
+                ),
+                **model_configs,
+            },  # 共享 httpx client ，model_configs 中指定的 client 优先。
         )
         logger.info(f"Created {model_name}")
-        return llm
+        return CachedChatModel.wrap(llm=llm, response_cache=response_cache, mode=response_cache_mode)
 
     # ==== 常用方法。 ====
     @staticmethod
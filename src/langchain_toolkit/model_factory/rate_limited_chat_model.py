@@ -0,0 +1,213 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/langchain_toolkit/model_factory/rate_limited_chat_model.py
+
+References:
+    None
+
+Synopsis:
+    以共享的 RPM 和 TPM 令牌桶限速的 chat-model 。
+
+Notes:
+    langchain 的 rate_limiter 参数只在请求前获取 1 个请求，不知道 token 的数量。
+    RateLimitedChatModel 包装任意的 BaseChatModel :
+        1. 请求前: 以 messages 的字符数预估输入的 token ，加上 max_tokens ，获取令牌。
+        2. 请求后: 以 TokenNumberExtractor 获取实际的用量，修正 token 桶。
+
+    流式输出: 获取令牌后转发被包装的 LLM 的 _stream 和 _astream ，逐个 chunk 产出。
+        是否流式与被包装的 LLM 相同。用量为各个 chunk 的用量的和，提前结束时不修正。
+
+    与 CachedChatModel 一起使用时，缓存在外层，缓存命中的请求不消耗额度。
+
+    限制:
+        - with_structured_output 使用 BaseChatModel 默认的 tool-calling 实现，而不是被包装的 LLM 的实现。
+            需要被包装的 LLM 的实现 (例如 ChatOpenAI 的 json_schema) 时，对被包装的 LLM 调用，并自行限速。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.agnostic_utils.rate_limiter import DualTokenBucketLimiter
+from src.langchain_toolkit.utils.token_number_extractor import TokenNumberExtractor
+
+from langchain_core.language_models import BaseChatModel
+from pydantic import ConfigDict
+
+from typing import TYPE_CHECKING, Any
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterator, Sequence
+    from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+    from langchain_core.messages import BaseMessage
+    from langchain_core.outputs import ChatGenerationChunk, ChatResult
+    from langchain_core.runnables import Runnable
+
+
+# 预估 token 数量时，每个 token 的平均字符数。对于中文偏大，由请求后的修正补偿。
+_CHARS_PER_TOKEN = 4
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """
+    以共享的令牌桶限速的 chat-model 。
+
+    主要方法:
+        - 与 BaseChatModel 相同。
+        - estimate_tokens: 预估一次请求的 token 数量。
+    """
+
+    llm: BaseChatModel
+    """被包装的 LLM 。"""
+    token_bucket_limiter: DualTokenBucketLimiter
+    """共享的 limiter ，见 RateLimiterFactory 。(BaseChatModel 的 rate_limiter 字段仅支持按请求获取，不使用。)"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"rate-limited-{self.llm._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.llm._identifying_params
+
+    def _get_invocation_params(
+        self,
+        stop: list[str] | None = None,
+        **kwargs: Any,
+    ) -> dict:
+        return self.llm._get_invocation_params(stop=stop, **kwargs)
+
+    def _should_stream(
+        self,
+        *,
+        async_api: bool,
+        run_manager: CallbackManagerForLLMRun | AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> bool:
+        # 与被包装的 LLM 相同。被包装的 LLM 不支持流式输出时，stream 和 astream 由 _generate 得到一个完整的 chunk 。
+        return self.llm._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+
+    # ==== 主要方法。 ====
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        estimated_tokens = self.estimate_tokens(messages=messages, **kwargs)
+        self.token_bucket_limiter.acquire(estimated_tokens=estimated_tokens)
+        chat_result = self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._record_usage(estimated_tokens=estimated_tokens, chat_result=chat_result)
+        return chat_result
+
+    # ==== 主要方法。 ====
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        estimated_tokens = self.estimate_tokens(messages=messages, **kwargs)
+        await self.token_bucket_limiter.aacquire(estimated_tokens=estimated_tokens)
+        chat_result = await self.llm._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        await self.token_bucket_limiter.arecord_usage(
+            estimated_tokens=estimated_tokens,
+            actual_tokens=RateLimitedChatModel._get_actual_tokens(chat_result=chat_result),
+        )
+        return chat_result
+
+    # ==== 主要方法。 ====
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        estimated_tokens = self.estimate_tokens(messages=messages, **kwargs)
+        self.token_bucket_limiter.acquire(estimated_tokens=estimated_tokens)
+        actual_tokens = None
+        for chunk in self.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            actual_tokens = RateLimitedChatModel._add_chunk_tokens(actual_tokens=actual_tokens, chunk=chunk)
+            yield chunk
+        self.token_bucket_limiter.record_usage(estimated_tokens=estimated_tokens, actual_tokens=actual_tokens)
+
+    # ==== 主要方法。 ====
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        estimated_tokens = self.estimate_tokens(messages=messages, **kwargs)
+        await self.token_bucket_limiter.aacquire(estimated_tokens=estimated_tokens)
+        actual_tokens = None
+        async for chunk in self.llm._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            actual_tokens = RateLimitedChatModel._add_chunk_tokens(actual_tokens=actual_tokens, chunk=chunk)
+            yield chunk
+        await self.token_bucket_limiter.arecord_usage(estimated_tokens=estimated_tokens, actual_tokens=actual_tokens)
+
+    # ==== 主要方法。 ====
+    def bind_tools(
+        self,
+        tools: Sequence[Any],
+        **kwargs: Any,
+    ) -> Runnable:
+        """由被包装的 LLM 转换 tools 的格式，绑定在这个 chat-model 上。"""
+        binding = self.llm.bind_tools(tools, **kwargs)
+        return self.bind(**binding.kwargs)
+
+    # ==== 工具方法。 ====
+    def estimate_tokens(
+        self,
+        messages: list[BaseMessage],
+        **kwargs: Any,
+    ) -> int:
+        """预估一次请求的 token 数量: 输入的字符数 / 4 ，加上输出的上限 max_tokens 。"""
+        input_chars = sum(len(str(message.content)) for message in messages)
+        max_tokens = kwargs.get('max_tokens') or getattr(self.llm, 'max_tokens', None) or 0
+        return input_chars // _CHARS_PER_TOKEN + max_tokens
+
+    # ==== 构建方法。 ====
+    @staticmethod
+    def wrap(
+        llm: BaseChatModel,
+        rate_limiter: DualTokenBucketLimiter | None,
+    ) -> BaseChatModel:
+        """rate_limiter 为 None 时返回原本的 llm ，否则包装为 RateLimitedChatModel 。"""
+        if rate_limiter is None:
+            return llm
+        return RateLimitedChatModel(llm=llm, token_bucket_limiter=rate_limiter)
+
+    # ==== 内部方法。 ====
+    def _record_usage(
+        self,
+        estimated_tokens: int,
+        chat_result: ChatResult,
+    ) -> None:
+        self.token_bucket_limiter.record_usage(
+            estimated_tokens=estimated_tokens,
+            actual_tokens=RateLimitedChatModel._get_actual_tokens(chat_result=chat_result),
+        )
+
+    @staticmethod
+    def _add_chunk_tokens(
+        actual_tokens: int | None,
+        chunk: ChatGenerationChunk,
+    ) -> int | None:
+        # 供应商可能在多个 chunk 中分别返回输入和输出的用量 (与 AIMessageChunk 相加时一致) 。
+        chunk_tokens = TokenNumberExtractor.extract_total_token_number(ai_message=chunk.message)
+        if chunk_tokens is None:
+            return actual_tokens
+        return (actual_tokens or 0) + chunk_tokens
+
+    @staticmethod
+    def _get_actual_tokens(
+        chat_result: ChatResult,
+    ) -> int | None:
+        if not chat_result.generations:
+            return None
+        return TokenNumberExtractor.extract_total_token_number(ai_message=chat_result.generations[0].message)
@@ -0,0 +1,186 @@
+"""
+Sources:
+    https://github.com/yuliu625/Yu-Agent-Development-Toolkit/blob/main/src/langchain_toolkit/model_factory/rate_limiter_factory.py
+
+References:
+    - openai: https://platform.openai.com/docs/guides/rate-limits https://platform.openai.com/docs/models
+    - google: https://ai.google.dev/gemini-api/docs/rate-limits
+    - anthropic: https://docs.anthropic.com/en/api/rate-limits
+    - dashscope: https://help.aliyun.com/zh/model-studio/rate-limit
+    - deepseek: https://api-docs.deepseek.com/zh-cn/quick_start/rate_limit
+
+Synopsis:
+    按供应商和模型共享的速率限制器。
+
+Notes:
+    由 _old_or_discarded/model_building_tools/rate_limiter_factory.py 重新实现:
+        - 原本每个 llm 有独立的 InMemoryRateLimiter ，并以 llm_number 平分额度。
+            这要么浪费额度，要么在 llm 数量估计错误时触发 429 。
+        - 现在同一个 (model_client, model_name) 的全部 llm 共享同一个 DualTokenBucketLimiter ，同时限制 RPM 和 TPM 。
+
+    额度以 RATE_LIMIT_SPECS 表描述，按 model_name 的前缀匹配。需要持续更新，或通过 register_rate_limit 覆盖。
+    未知的 TPM 为 None ，即仅限制 RPM 。
+
+    多个进程:
+        同一台机器上的多个 worker 使用相同的 API key 时，各自的进程内的桶互相不知道对方的用量。
+        设置环境变量 RATE_LIMITER_SQLITE_PATH ，或调用 set_backend(SQLiteRateLimitBackend(...)) ，
+        全部进程共享同一个 SQLite 文件中的桶。ProcessManager 启动的子进程继承环境变量。
+
+    使用:
+        - BaseLLMFactory.create_llm(..., is_rate_limited=True) 。
+        - 或 RateLimitedChatModel.wrap(llm, RateLimiterFactory.get_rate_limiter(model_client, model_name)) 。
+"""
+
+from __future__ import annotations
+from loguru import logger
+
+from src.agnostic_utils.rate_limiter import (
+    DualTokenBucketLimiter,
+    InMemoryRateLimitBackend,
+    RateLimitSpec,
+    SQLiteRateLimitBackend,
+)
+
+import os
+import threading
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from src.agnostic_utils.rate_limiter import RateLimitBackend
+
+
+class RateLimiterFactory:
+    """
+    工具类，按供应商和模型提供共享的速率限制器。
+
+    主要方法:
+        - get_rate_limiter: 获取 (model_client, model_name) 共享的 limiter 。
+        - register_rate_limit: 添加或覆盖额度。
+        - set_backend: 设置桶的存储，例如 SQLiteRateLimitBackend 。
+    """
+
+    # model_client -> [(model_name 的前缀, 额度)] 。按顺序匹配，前缀为 '' 的是默认额度。
+    RATE_LIMIT_SPECS: dict[str, list[tuple[str, RateLimitSpec]]] = {
+        'openai': [
+            # o 系列的模型名没有 'gpt-' 前缀，例如 'o3', 'o3-mini', 'o4-mini' 。
+            ('o4-mini', RateLimitSpec(requests_per_minute=1000, tokens_per_minute=100_000)),
+            ('o3', RateLimitSpec(requests_per_minute=500, tokens_per_minute=30_000)),
+            ('o1', RateLimitSpec(requests_per_minute=500, tokens_per_minute=30_000)),
+            ('gpt-', RateLimitSpec(requests_per_minute=500, tokens_per_minute=30_000)),
+            ('', RateLimitSpec(requests_per_minute=60)),
+        ],
+        'google': [
+            ('gemini-2.5-pro', RateLimitSpec(requests_per_minute=150, tokens_per_minute=2_000_000)),
+            ('gemini-2.5-flash', RateLimitSpec(requests_per_minute=1000, tokens_per_minute=1_000_000)),
+            ('', RateLimitSpec(requests_per_minute=10)),
+        ],
+        'anthropic': [
+            ('', RateLimitSpec(requests_per_minute=50)),
+        ],
+        'dashscope': [
+            ('qwen-plus', RateLimitSpec(requests_per_minute=15000, tokens_per_minute=1_200_000)),
+            ('qwen-', RateLimitSpec(requests_per_minute=1200, tokens_per_minute=1_000_000)),
+            ('', RateLimitSpec(requests_per_minute=60)),
+        ],
+        'deepseek': [
+            ('', RateLimitSpec(requests_per_minute=600)),
+        ],
+        'local': [
+            ('', RateLimitSpec(requests_per_minute=6000)),
+        ],
+    }
+
+    _rate_limiters: dict[tuple[str, str], DualTokenBucketLimiter] = {}
+    _backend: RateLimitBackend | None = None
+    _lock = threading.Lock()
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def get_rate_limiter(
+        model_client: str,
+        model_name: str,
+    ) -> DualTokenBucketLimiter:
+        """
+        获取 (model_client, model_name) 共享的 limiter 。不存在时按 RATE_LIMIT_SPECS 创建。
+
+        Args:
+            model_client (str): 模型的供应商。同 BaseLLMFactory 。
+            model_name (str): 具体模型的型号。
+
+        Returns:
+            DualTokenBucketLimiter: 进程内共享的 limiter 。
+        """
+        key = (model_client, model_name)
+        with RateLimiterFactory._lock:
+            rate_limiter = RateLimiterFactory._rate_limiters.get(key)
+            if rate_limiter is None:
+                rate_limiter = DualTokenBucketLimiter(
+                    key=f"{model_client}/{model_name}",
+                    spec=RateLimiterFactory.get_rate_limit_spec(model_client=model_client, model_name=model_name),
+                    backend=RateLimiterFactory.get_backend(),
+                )
+                RateLimiterFactory._rate_limiters[key] = rate_limiter
+            return rate_limiter
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def register_rate_limit(
+        model_client: str,
+        model_name_prefix: str,
+        spec: RateLimitSpec,
+    ) -> None:
+        """添加或覆盖额度。优先于已有的前缀。已经创建的匹配的 limiter 会被替换。"""
+        specs = RateLimiterFactory.RATE_LIMIT_SPECS.setdefault(model_client, [])
+        specs[:] = [(prefix, old_spec) for prefix, old_spec in specs if prefix != model_name_prefix]
+        specs.insert(0, (model_name_prefix, spec))
+        RateLimiterFactory._drop_rate_limiters(
+            lambda key: key[0] == model_client and key[1].startswith(model_name_prefix)
+        )
+
+    # ==== 主要方法。 ====
+    @staticmethod
+    def set_backend(
+        backend: RateLimitBackend,
+    ) -> None:
+        """设置桶的存储，例如在多个进程之间共享。已经创建的 limiter 会被替换。"""
+        RateLimiterFactory._backend = backend
+        RateLimiterFactory._drop_rate_limiters(lambda key: True)
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def get_backend() -> RateLimitBackend:
+        """
+        桶的存储。没有设置时，按环境变量 RATE_LIMITER_SQLITE_PATH 使用 SQLiteRateLimitBackend ，否则为进程内。
+
+        在 _lock 中调用。
+        """
+        if RateLimiterFactory._backend is None:
+            sqlite_path = os.environ.get('RATE_LIMITER_SQLITE_PATH')
+            if sqlite_path:
+                logger.info(f"Sharing rate limits across processes via {sqlite_path}.")
+                RateLimiterFactory._backend = SQLiteRateLimitBackend(db_path=sqlite_path)
+            else:
+                RateLimiterFactory._backend = InMemoryRateLimitBackend()
+        return RateLimiterFactory._backend
+
+    # ==== 工具方法。 ====
+    @staticmethod
+    def get_rate_limit_spec(
+        model_client: str,
+        model_name: str,
+    ) -> RateLimitSpec:
+        """按前缀匹配额度。没有匹配时使用保守的 60 RPM 。"""
+        for prefix, spec in RateLimiterFactory.RATE_LIMIT_SPECS.get(model_client, []):
+            if model_name.startswith(prefix):
+                return spec
+        logger.warning(f"No rate limit for {model_client}/{model_name}, using 60 requests per minute.")
+        return RateLimitSpec(requests_per_minute=60)
+
+    # ==== 内部方法。 ====
+    @staticmethod
+    def _drop_rate_limiters(
+        is_dropped,
+    ) -> None:
+        with RateLimiterFactory._lock:
+            for key in [key for key in RateLimiterFactory._rate_limiters if is_dropped(key)]:
+                del RateLimiterFactory._rate_limiters[key]
@@ -28,6 +28,30 @@ class TokenNumberExtractor:
     根据具体厂商返回的 AIMessage 的 schema ，针对性提取代表当前 ai_message 的 token 数量。
     """
 
+    @staticmethod
+    def extract_total_token_number(
+        ai_message: AIMessage,
+    ) -> int | None:
+        """
+        获取这次请求消耗的全部 token 数量 (输入和输出) 。用于 TPM 限速的修正。
+
+        优先使用 langchain 统一的 usage_metadata ，其次为 response_metadata 中厂商的 token_usage 。
+
+        Returns:
+            Union[int, None]: token 数量。没有用量信息时为 None 。
+        """
+        usage_metadata = getattr(ai_message, 'usage_metadata', None)
+        if usage_metadata and isinstance(usage_metadata.get('total_tokens'), int):
+            return usage_metadata['total_tokens']
+        token_usage = ai_message.response_metadata.get('token_usage') or {}
+        if isinstance(token_usage.get('total_tokens'), int):
+            return token_usage['total_tokens']
+        input_tokens = token_usage.get('prompt_tokens', token_usage.get('input_tokens'))
+        output_tokens = token_usage.get('completion_tokens', token_usage.get('output_tokens'))
+        if isinstance(input_tokens, int) and isinstance(output_tokens, int):
+            return input_tokens + output_tokens
+        return None
+
     @staticmethod
     def extract_token_number_from_ai_message(
         ai_message: AIMessage,
@@ -10,11 +10,14 @@ Synopsis:
 Notes:
     封装了基础的增删改查方法。
     添加了批量处理方法。
+    相同 base_url 和 api_key 的 client 被复用，并共享 httpx 连接池，见 HttpClientRegistry 。
 """
 
 from __future__ import annotations
 from loguru import logger
 
+from src.agnostic_utils.http_client_registry import HttpClientRegistry
+
 from openai import OpenAI
 
 import os
@@ -25,6 +28,8 @@ from typing import TYPE_CHECKING, Sequence
 
 
 class OpenAIFileManager:
+    _clients: dict[tuple[str, str], OpenAI] = {}
+
     @staticmethod
     def create_file(
         base_url: str,
@@ -144,9 +149,15 @@ class OpenAIFileManager:
         base_url: str,
         api_key: str,
     ) -> OpenAI:
-        client = OpenAI(
-            base_url=base_url,
-            api_key=api_key,
-        )
+        """获取 (base_url, api_key) 对应的 client 。不存在时创建，使用共享的 httpx client 。"""
+        key = HttpClientRegistry.make_key(base_url=base_url, api_key=api_key)
+        client = OpenAIFileManager._clients.get(key)
+        if client is None:
+            client = OpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                http_client=HttpClientRegistry.get_client(base_url=base_url, api_key=api_key),
+            )
+            OpenAIFileManager._clients[key] = client
         return client
 
@@ -0,0 +1,3 @@
+"""
+性能对比脚本。不由 pytest 收集，直接运行。
+"""
@@ -0,0 +1,83 @@
+"""
+JsonFenceScanner 与原本正则实现的性能对比。
+
+运行:
+    ```shell
+    python -m tests.benchmarks.json_fence_scanner_benchmark
+    ```
+
+构造 reasoning-model 风格的长输出: 大量推理文本，其中夹杂若干 code-cell ，最后一个是 json 结果。
+"""
+
+from __future__ import annotations
+
+import re
+import timeit
+
+from src.content_processors.json_fence_scanner import JsonFenceScanner
+
+
+_REASONING_PARAGRAPH = (
+    "Let me think about this step by step. First, consider the constraints of the problem, "
+    "then check each candidate answer against them.\n"
+)
+_INTERMEDIATE_BLOCK = '```json\n{"draft": true, "score": 0.5}\n```\n'
+_FINAL_BLOCK = '```json\n{"answer": "final", "score": 0.9}\n```\n'
+
+
+def build_raw_str(
+    total_length: int,
+    intermediate_block_number: int,
+) -> str:
+    """构造总长度约为 total_length 的输出，包含 intermediate_block_number 个中间 code-cell 和最后的结果。"""
+    paragraph_number = max(1, total_length // len(_REASONING_PARAGRAPH))
+    step = max(1, paragraph_number // (intermediate_block_number + 1))
+    parts = []
+    for i in range(paragraph_number):
+        parts.append(_REASONING_PARAGRAPH)
+        if i % step == step - 1 and intermediate_block_number > 0:
+            parts.append(_INTERMEDIATE_BLOCK)
+            intermediate_block_number -= 1
+    parts.append(_FINAL_BLOCK)
+    return ''.join(parts)
+
+
+def regex_find(
+    raw_str: str,
+    index_to_choose: int = -1,
+) -> str | None:
+    """原本 JsonOutputExtractor.re_match 的实现。"""
+    matches = re.findall(r'```json(.*?)```', raw_str, re.DOTALL)
+    if not matches:
+        return None
+    return matches[index_to_choose]
+
+
+def scanner_find(
+    raw_str: str,
+    index_to_choose: int = -1,
+) -> str | None:
+    return JsonFenceScanner.find_json_block(raw_str=raw_str, index_to_choose=index_to_choose)
+
+
+def run_benchmark(
+    total_lengths: tuple[int, ...] = (2_000, 30_000, 60_000),
+    intermediate_block_number: int = 20,
+    number: int = 2_000,
+) -> None:
+    for total_length in total_lengths:
+        raw_str = build_raw_str(total_length=total_length, intermediate_block_number=intermediate_block_number)
+        assert regex_find(raw_str).strip() == scanner_find(raw_str).strip()
+        for index_to_choose in (-1, 0):
+            regex_time = timeit.timeit(lambda: regex_find(raw_str, index_to_choose), number=number)
+            scanner_time = timeit.timeit(lambda: scanner_find(raw_str, index_to_choose), number=number)
+            print(
+                f"length={len(raw_str):>6} index={index_to_choose:>2} "
+                f"regex={regex_time / number * 1e6:8.2f}us "
+                f"scanner={scanner_time / number * 1e6:8.2f}us "
+                f"speedup={regex_time / scanner_time:6.2f}x"
+            )
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,116 @@
+"""
+测试AdaptiveConcurrencyLimiter的增加、减少和并发上限。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.adaptive_concurrency import AdaptiveConcurrencyLimiter
+import asyncio
+
+# if TYPE_CHECKING:
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class TestAdaptiveConcurrencyLimiter:
+    def test_increase_after_successes(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4)
+
+        async def main():
+            for _ in range(20):
+                await limiter.run(lambda: asyncio.sleep(0))
+
+        asyncio.run(main())
+        assert limiter.limit == 4
+        assert [change.reason for change in limiter.history] == ['increase', 'increase']
+        assert limiter.stats['successes'] == 20
+
+    @pytest.mark.parametrize('error', [_StatusError(429), RateLimitError('slow down')])
+    def test_decrease_on_rate_limit(self, error):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+
+        async def fail():
+            raise error
+
+        async def main():
+            with pytest.raises(type(error)):
+                await limiter.run(fail)
+
+        asyncio.run(main())
+        assert limiter.limit == 4
+        assert limiter.history[-1].reason == 'rate-limit'
+        assert limiter.stats['rate_limited'] == 1
+
+    def test_other_errors_keep_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+
+        async def fail():
+            raise _StatusError(500)
+
+        async def main():
+            with pytest.raises(_StatusError):
+                await limiter.run(fail)
+
+        asyncio.run(main())
+        assert limiter.limit == 8
+        assert limiter.stats['errors'] == 1
+
+    def test_one_decrease_per_round_trip(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RateLimitError()
+
+        async def main():
+            await asyncio.gather(*(limiter.run(fail) for _ in range(8)), return_exceptions=True)
+
+        asyncio.run(main())
+        # 同时失败的 8 个请求只减少一次。
+        assert limiter.limit == 4
+        assert limiter.stats['decreases'] == 1
+
+    def test_respects_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=3, max_limit=3)
+        max_in_flight = 0
+
+        async def request():
+            nonlocal max_in_flight
+            max_in_flight = max(max_in_flight, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(*(limiter.run(request) for _ in range(12)))
+
+        asyncio.run(main())
+        assert max_in_flight == 3
+        assert limiter.get_snapshot()['in_flight'] == 0
+
+    def test_decrease_on_latency(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=4, window_size=10)
+
+        async def main():
+            for _ in range(10):
+                await limiter.run(lambda: asyncio.sleep(0.001))
+            for _ in range(10):
+                await limiter.run(lambda: asyncio.sleep(0.05))
+
+        asyncio.run(main())
+        # 减少后重新测量，之后的成功会重新增加。
+        assert limiter.stats['decreases'] >= 1
+        assert any(change.reason == 'latency' for change in limiter.history)
+
+    def test_get_shared(self):
+        limiter = AdaptiveConcurrencyLimiter.get_shared('test/shared', initial_limit=2)
+        assert AdaptiveConcurrencyLimiter.get_shared('test/shared') is limiter
+        assert AdaptiveConcurrencyLimiter.get_shared('test/other') is not limiter
+        assert limiter.limit == 2
@@ -0,0 +1,210 @@
+"""
+测试async_tools中的并发工具。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.async_tools import map_concurrent, run_first_valid, run_parallel
+from src.agnostic_utils.retry_policy import RetryPolicy
+import asyncio
+
+# if TYPE_CHECKING:
+
+
+class TestRunFirstValid:
+    def test_first_valid_wins(self):
+        # 候选依次为: 慢且有效、快但无效、较快且有效。应返回较快的有效结果，并取消慢的候选。
+        delays_and_results = iter([(1.0, 'slow'), (0.01, None), (0.05, 'fast')])
+        cancelled = []
+
+        async def candidate():
+            delay, result = next(delays_and_results)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(result)
+                raise
+            return result
+
+        result = asyncio.run(run_first_valid(
+            candidate_factory=candidate,
+            is_valid=lambda r: r is not None,
+            num_candidates=2,
+            budget=3,
+        ))
+        assert result == 'fast'
+        assert cancelled == ['slow']
+
+    @pytest.mark.parametrize('budget', [1, 4])
+    def test_budget(self, budget):
+        launched = []
+
+        async def candidate():
+            launched.append(1)
+            raise ValueError("invalid")
+
+        result = asyncio.run(run_first_valid(
+            candidate_factory=candidate,
+            is_valid=lambda r: r is not None,
+            num_candidates=2,
+            budget=budget,
+        ))
+        assert result is None
+        assert len(launched) == budget
+
+    def test_fatal_error(self):
+        # 致命的异常不消耗 budget ，取消其余的候选，原样抛出。
+        class AuthenticationError(Exception):
+            status_code = 401
+
+        error = AuthenticationError("invalid api key")
+        launched = []
+        cancelled = []
+
+        async def candidate():
+            launched.append(1)
+            if len(launched) == 1:
+                try:
+                    await asyncio.sleep(1.0)
+                except asyncio.CancelledError:
+                    cancelled.append(1)
+                    raise
+            raise error
+
+        with pytest.raises(AuthenticationError) as exc_info:
+            asyncio.run(run_first_valid(
+                candidate_factory=candidate,
+                is_valid=lambda r: r is not None,
+                num_candidates=2,
+                budget=5,
+                is_fatal=lambda e: not RetryPolicy.is_retryable_error(e),
+            ))
+        assert exc_info.value is error
+        assert len(launched) == 2
+        assert cancelled == [1]
+
+    def test_semaphore(self):
+        running = []
+        max_running = []
+
+        async def candidate():
+            running.append(1)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+            return None
+
+        asyncio.run(run_first_valid(
+            candidate_factory=candidate,
+            is_valid=lambda r: r is not None,
+            num_candidates=4,
+            budget=8,
+            semaphore=asyncio.Semaphore(2),
+        ))
+        assert max(max_running) == 2
+
+
+class TestMapConcurrent:
+    @staticmethod
+    def collect(async_iterator) -> list:
+        async def main():
+            return [map_result async for map_result in async_iterator]
+
+        return asyncio.run(main())
+
+    def test_ordered(self):
+        async def process(x):
+            await asyncio.sleep(0.01 * (5 - x))
+            return x * 2
+
+        results = self.collect(map_concurrent(process, range(5), max_concurrency=5, ordered=True))
+        assert [r.index for r in results] == [0, 1, 2, 3, 4]
+        assert [r.result for r in results] == [0, 2, 4, 6, 8]
+
+    def test_as_completed(self):
+        async def process(x):
+            await asyncio.sleep(0.01 * (5 - x))
+            return x
+
+        results = self.collect(map_concurrent(process, range(5), max_concurrency=5))
+        assert [r.result for r in results] == [4, 3, 2, 1, 0]
+
+    @pytest.mark.parametrize('ordered', [False, True])
+    def test_bounded_window(self, ordered):
+        started = []
+        running = []
+        max_running = []
+
+        async def items():
+            for i in range(20):
+                started.append(i)
+                yield i
+
+        async def process(x):
+            running.append(x)
+            max_running.append(len(running))
+            await asyncio.sleep(0.001 * (x % 3))
+            running.remove(x)
+            return x
+
+        async def main():
+            results = []
+            async for map_result in map_concurrent(process, items(), max_concurrency=3, ordered=ordered):
+                # 只读取了窗口内的输入。
+                assert len(started) <= len(results) + 3
+                results.append(map_result.result)
+            return results
+
+        results = asyncio.run(main())
+        assert sorted(results) == list(range(20))
+        assert max(max_running) <= 3
+
+    def test_exceptions(self):
+        progress = []
+
+        async def process(x):
+            if x == 2:
+                raise ValueError(x)
+            return x
+
+        results = self.collect(map_concurrent(
+            process, range(4), max_concurrency=2, ordered=True,
+            on_progress=lambda completed, failed: progress.append((completed, failed)),
+        ))
+        assert [r.result for r in results] == [0, 1, None, 3]
+        assert isinstance(results[2].error, ValueError)
+        assert progress[-1] == (4, 1)
+
+        with pytest.raises(ValueError):
+            self.collect(map_concurrent(process, range(4), max_concurrency=2, return_exceptions=False))
+
+    def test_cancel_on_break(self):
+        cancelled = []
+
+        async def process(x):
+            try:
+                await asyncio.sleep(0 if x == 0 else 1.0)
+            except asyncio.CancelledError:
+                cancelled.append(x)
+                raise
+            return x
+
+        async def main():
+            map_results = map_concurrent(process, range(100), max_concurrency=4)
+            async for map_result in map_results:
+                break
+            await map_results.aclose()
+            return map_result
+
+        assert asyncio.run(main()).result == 0
+        # 窗口内的其余 3 个 task 被取消，之后的输入没有读取。
+        assert sorted(cancelled) == [1, 2, 3]
+
+    def test_run_parallel(self):
+        async def add(a, b=0):
+            await asyncio.sleep(0.001 * a)
+            return a + b
+
+        results = asyncio.run(run_parallel(add, [((3,), {'b': 1}), ((1,), {}), ((2,), {'b': 2})], max_concurrency=2))
+        assert results == [4, 1, 4]
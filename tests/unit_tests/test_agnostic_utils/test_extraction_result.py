@@ -0,0 +1,63 @@
+"""
+测试ExtractionResult的失败阶段、出错位置和恢复方法。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.content_processors.extraction_result import ExtractionOutcome
+from src.content_processors.json_output_extractor import JsonOutputExtractor
+from src.content_processors.payload_logger import PayloadLogger
+from pydantic import BaseModel
+
+# if TYPE_CHECKING:
+
+
+class _Point(BaseModel):
+    x: int
+    y: int
+
+
+_test_extract_json_result_cases = [
+    ('no json here', ExtractionOutcome.NO_FENCE, None, 'regenerate'),
+    ('text\n```json\n{"x": 1 "y": 2}\n```', ExtractionOutcome.LOAD_FAILURE, 21, 'repair'),
+    ('text\n```json\n{"x": 1, "y": "a"}\n```', ExtractionOutcome.SCHEMA_FAILURE, 12, 'regenerate'),
+    ('text\n```json\n{"x": 1, "y": 2}\n```', ExtractionOutcome.OK, None, None),
+]
+
+
+class TestExtractionResult:
+    @pytest.mark.parametrize('raw_str, expected_outcome, expected_offset, expected_action', _test_extract_json_result_cases)
+    def test_extract_json_result(self, raw_str, expected_outcome, expected_offset, expected_action):
+        result = JsonOutputExtractor.extract_json_result(
+            raw_str=raw_str,
+            json_loader_name='json',
+            schema_pydantic_base_model=_Point,
+        )
+        assert result.outcome == expected_outcome
+        assert result.offset == expected_offset
+        if result.is_ok:
+            assert result.structured_data == {'x': 1, 'y': 2}
+        else:
+            assert result.structured_data is None
+            assert result.get_recovery_action(is_formatter_available=False) == expected_action
+        if expected_offset is not None:
+            assert result.snippet in raw_str
+            assert result.error_type is not None
+
+    def test_repair_json_block(self):
+        raw_str = 'text\n```json\n{"x": 1, "y": 2\n```\nbye'
+        repaired_str, structured_data = JsonOutputExtractor.repair_json_block(
+            raw_str=raw_str,
+            schema_pydantic_base_model=_Point,
+        )
+        assert structured_data == {'x': 1, 'y': 2}
+        assert JsonOutputExtractor.extract_json_from_str(repaired_str, json_loader_name='json') == structured_data
+        assert repaired_str.endswith('```\nbye')
+
+    def test_payload_logger(self):
+        PayloadLogger.configure(sample_rate=1.0, max_per_interval=2, interval_seconds=60.0)
+        try:
+            assert [PayloadLogger.log("test", 'x' * 1000) for _ in range(3)] == [True, True, False]
+        finally:
+            PayloadLogger.configure(sample_rate=0.1, max_per_interval=5)
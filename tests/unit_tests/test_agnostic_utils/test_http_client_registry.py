@@ -0,0 +1,58 @@
+"""
+测试HttpClientRegistry的共享和关闭。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.http_client_registry import HttpClientRegistry
+import asyncio
+import httpx
+
+# if TYPE_CHECKING:
+
+
+class TestHttpClientRegistry:
+    def test_shared_by_base_url_and_api_key(self):
+        client = HttpClientRegistry.get_client(base_url='http://a', api_key='k1')
+        assert HttpClientRegistry.get_client(base_url='http://a', api_key='k1') is client
+        assert HttpClientRegistry.get_client(base_url='http://a', api_key='k2') is not client
+        assert HttpClientRegistry.get_client(base_url='http://b', api_key='k1') is not client
+
+    def test_key_does_not_contain_api_key(self):
+        assert 'secret' not in ''.join(HttpClientRegistry.make_key(base_url='http://a', api_key='secret'))
+
+    def test_close_all_recreates_clients(self):
+        client = HttpClientRegistry.get_client(base_url='http://c', api_key='k')
+        HttpClientRegistry.close_all()
+        assert client.is_closed
+        assert HttpClientRegistry.get_client(base_url='http://c', api_key='k') is not client
+
+    def test_aclose_all(self):
+        async def main():
+            client = HttpClientRegistry.get_async_client(base_url='http://d', api_key='k')
+            await HttpClientRegistry.aclose_all()
+            return client
+
+        assert asyncio.run(main()).is_closed
+
+    def test_openai_client_kwargs(self):
+        kwargs = HttpClientRegistry.get_openai_client_kwargs(base_url='http://e', api_key='k')
+        assert kwargs['http_client'] is HttpClientRegistry.get_client(base_url='http://e', api_key='k')
+        assert kwargs['http_async_client'] is HttpClientRegistry.get_async_client(base_url='http://e', api_key='k')
+
+    def test_openai_client_kwargs_with_proxy(self, monkeypatch):
+        assert HttpClientRegistry.get_openai_client_kwargs(base_url='http://e', api_key='k', model_configs={'openai_proxy': 'http://proxy:1'}) == {}
+        monkeypatch.setenv('OPENAI_PROXY', 'http://proxy:1')
+        assert HttpClientRegistry.get_openai_client_kwargs(base_url='http://e', api_key='k') == {}
+
+    def test_tcp_keepalive_transport(self, monkeypatch):
+        for name in ('HTTP_PROXY', 'HTTPS_PROXY', 'ALL_PROXY', 'http_proxy', 'https_proxy', 'all_proxy'):
+            monkeypatch.delenv(name, raising=False)
+        client_kwargs = HttpClientRegistry._get_client_kwargs(is_async=False)
+        assert isinstance(client_kwargs['transport'], httpx.HTTPTransport)
+        # 环境变量中有代理时不指定 transport ，由 httpx 读取代理。
+        monkeypatch.setenv('HTTPS_PROXY', 'http://proxy:1')
+        client_kwargs = HttpClientRegistry._get_client_kwargs(is_async=True)
+        assert 'transport' not in client_kwargs
+        assert client_kwargs['limits'].max_connections == 1000
@@ -0,0 +1,123 @@
+"""
+测试ImageEncoder的编码、类型识别、缓存和缩小。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.content_processors.content_block_processor import ContentBlockProcessor
+from src.content_processors.image_encoder import ImageEncoder, _ENCODE_CHUNK_SIZE
+import asyncio
+import base64
+import io
+import os
+
+# if TYPE_CHECKING:
+
+_PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    ImageEncoder.clear_cache()
+    ImageEncoder.stats.clear()
+    yield
+    ImageEncoder.clear_cache()
+
+
+class TestImageEncoder:
+    @pytest.mark.parametrize('size', [0, 1, 2, 3, _ENCODE_CHUNK_SIZE - 1, _ENCODE_CHUNK_SIZE, 2 * _ENCODE_CHUNK_SIZE + 1])
+    def test_encode_base64(self, size):
+        data = os.urandom(size)
+        assert ImageEncoder.encode_base64(data) == base64.b64encode(data).decode('ascii')
+
+    @pytest.mark.parametrize('header, mime_type', [
+        (_PNG_HEADER, 'image/png'),
+        (b'\xff\xd8\xff\xe0', 'image/jpeg'),
+        (b'GIF89a', 'image/gif'),
+        (b'RIFF\x00\x00\x00\x00WEBPVP8 ', 'image/webp'),
+        (b'BM', 'image/bmp'),
+        (b'II*\x00', 'image/tiff'),
+        (b'not an image', None),
+    ])
+    def test_detect_mime_type(self, header, mime_type):
+        assert ImageEncoder.detect_mime_type(header + b'\x00' * 8) == mime_type
+
+    def test_content_block(self, tmp_path):
+        data = b'\xff\xd8\xff\xe0' + os.urandom(1000)
+        path = tmp_path / 'image.bin'
+        path.write_bytes(data)
+        content_block = ContentBlockProcessor.get_image_content_block_from_uri(uri=str(path))
+        assert content_block == {
+            'type': 'image',
+            'source_type': 'base64',
+            'mime_type': 'image/jpeg',
+            'data': base64.b64encode(data).decode('ascii'),
+        }
+        content_block = ContentBlockProcessor.get_image_content_block_from_uri(uri=str(path), image_type='png')
+        assert content_block['mime_type'] == 'image/png'
+
+    def test_cache(self, tmp_path):
+        path = tmp_path / 'image.png'
+        path.write_bytes(_PNG_HEADER + os.urandom(100))
+        first = ImageEncoder.encode_file(path)
+        second = ImageEncoder.encode_file(path)
+        assert second is first
+        assert (ImageEncoder.stats['hits'], ImageEncoder.stats['misses']) == (1, 1)
+
+        # 内容相同的其他文件共用缓存。
+        copy_path = tmp_path / 'copy.png'
+        copy_path.write_bytes(path.read_bytes())
+        assert ImageEncoder.encode_file(copy_path) is first
+
+        # 修改后重新编码。
+        data = _PNG_HEADER + os.urandom(100)
+        path.write_bytes(data)
+        os.utime(path, ns=(0, 10 ** 9))
+        assert ImageEncoder.encode_file(path).base64_str == base64.b64encode(data).decode('ascii')
+
+    def test_cache_eviction(self, tmp_path):
+        ImageEncoder.configure_cache(max_cache_chars=300)
+        try:
+            for i in range(3):
+                path = tmp_path / f'{i}.png'
+                path.write_bytes(_PNG_HEADER + os.urandom(100))
+                ImageEncoder.encode_file(path)
+            assert ImageEncoder.stats['evictions'] == 1
+        finally:
+            ImageEncoder.configure_cache(max_cache_chars=256 * 1024 * 1024)
+
+    def test_async(self, tmp_path):
+        path = tmp_path / 'image.gif'
+        path.write_bytes(b'GIF89a' + os.urandom(10))
+        content_block = asyncio.run(ContentBlockProcessor.a_get_image_content_block_from_uri(uri=str(path)))
+        assert content_block['mime_type'] == 'image/gif'
+
+
+class TestImageEncoderBudget:
+    def test_max_pixels(self, tmp_path):
+        image_module = pytest.importorskip('PIL.Image')
+        path = tmp_path / 'large.png'
+        image_module.new('RGB', (400, 200), color=(10, 20, 30)).save(path)
+        encoded_image = ImageEncoder.encode_file(path, max_pixels=20_000)
+        assert encoded_image.is_transformed
+        assert encoded_image.mime_type == 'image/png'
+        resized = image_module.open(io.BytesIO(base64.b64decode(encoded_image.base64_str)))
+        assert resized.width * resized.height <= 20_000
+        assert resized.size == (200, 100)
+
+        # 不超过预算时使用原图。
+        encoded_image = ImageEncoder.encode_file(path, max_pixels=80_000)
+        assert not encoded_image.is_transformed
+        assert encoded_image.base64_str == base64.b64encode(path.read_bytes()).decode('ascii')
+
+    def test_max_bytes(self, tmp_path):
+        image_module = pytest.importorskip('PIL.Image')
+        path = tmp_path / 'noise.png'
+        image_module.frombytes('RGB', (256, 256), os.urandom(256 * 256 * 3)).save(path)
+        encoded_image = ImageEncoder.encode_file(path, max_bytes=20_000)
+        assert encoded_image.is_transformed
+        assert encoded_image.mime_type == 'image/jpeg'
+        assert encoded_image.num_bytes <= 20_000
+        content_block = ContentBlockProcessor.get_image_content_block_from_uri(uri=str(path), image_type='png', max_bytes=20_000)
+        assert content_block['mime_type'] == 'image/jpeg'
@@ -0,0 +1,32 @@
+"""
+测试IncrementalJsonExtractor在流式增量下的提取结果。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.content_processors.incremental_json_extractor import IncrementalJsonExtractor
+
+# if TYPE_CHECKING:
+
+
+_test_feed_cases = [
+    # fence 和语言标记跨越增量。
+    (['reasoning `', '``js', 'on\n{"a": ', '1}\n`', '``'], [{'a': 1}], False),
+    # 字符串中的括号和反引号不影响判断。
+    (['```JSON\n{"a": "}]`"', '}\n```'], [{'a': '}]`'}], False),
+    # 非 json 的 code-cell 被跳过。
+    (['```python\nx = [1}\n```\n', '```json\n[1, 2]\n```'], [[1, 2]], False),
+    # 括号不匹配，未闭合时即判定为格式错误。
+    (['```json\n{"a": [1}', '  \n'], [], True),
+]
+
+
+class TestIncrementalJsonExtractor:
+    @pytest.mark.parametrize('deltas, expected, is_malformed', _test_feed_cases)
+    def test_feed(self, deltas, expected, is_malformed):
+        extractor = IncrementalJsonExtractor(json_loader_name='json')
+        for delta in deltas:
+            extractor.feed(delta)
+        assert extractor.structured_data_list == expected
+        assert extractor.is_malformed == is_malformed
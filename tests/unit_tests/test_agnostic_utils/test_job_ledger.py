@@ -0,0 +1,104 @@
+"""
+测试JobLedger的记录、恢复和去重。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.job_ledger import JobLedger
+from src.agnostic_utils.process_manager import ProcessJob, ProcessManager
+import asyncio
+import sys
+
+# if TYPE_CHECKING:
+
+
+def _python(code: str) -> list[str]:
+    return [sys.executable, '-c', code]
+
+
+class TestJobLedger:
+    def test_make_job_key(self):
+        job = ProcessJob(args=_python('print(1)'), name='a')
+        assert JobLedger.make_job_key(job) == JobLedger.make_job_key(job._replace(name='b', timeout=1.0))
+        assert JobLedger.make_job_key(job) != JobLedger.make_job_key(job._replace(env={'SEED': '1'}))
+        assert JobLedger.make_job_key(job) != JobLedger.make_job_key(job._replace(args=_python('print(2)')))
+
+    def test_path_args(self, tmp_path):
+        # 与 subprocess 一致，接受 pathlib.Path 的参数，与相同路径的 str 是同一个任务。
+        script_path = tmp_path / 'job.py'
+        script_path.write_text('print(1)')
+        job = ProcessJob(args=[sys.executable, script_path], cwd=tmp_path)
+        assert JobLedger.make_job_key(job) == JobLedger.make_job_key(job._replace(args=[sys.executable, str(script_path)], cwd=str(tmp_path)))
+        final_events = ProcessManager.run_processes_with_restart(
+            args_list=[[sys.executable, script_path], [sys.executable, str(script_path)]],
+            max_retries=1,
+            ledger_path=str(tmp_path / 'ledger.sqlite'),
+        )
+        assert [(event.kind, event.reason) for event in final_events] == [('succeeded', None), ('skipped', 'duplicate')]
+
+    def test_resume(self, tmp_path):
+        ledger_path = str(tmp_path / 'ledger.sqlite')
+        marker_path = tmp_path / 'marker'
+        # 第一次运行: 第 2 个任务失败。
+        args_list = [
+            _python('print(0)'),
+            _python(f"import pathlib, sys; sys.exit(0 if pathlib.Path({str(marker_path)!r}).exists() else 1)"),
+            _python('print(0)'),
+        ]
+        final_events = ProcessManager.run_processes_with_restart(
+            args_list=args_list, max_retries=1, retry_interval=0, ledger_path=ledger_path,
+        )
+        assert [event.kind for event in final_events] == ['succeeded', 'failed', 'skipped']
+        assert final_events[2].reason == 'duplicate'
+
+        # 第二次运行: 只运行未完成的任务。
+        marker_path.touch()
+        final_events = ProcessManager.run_processes_with_restart(
+            args_list=args_list, max_retries=1, retry_interval=0, ledger_path=ledger_path,
+        )
+        assert [(event.kind, event.reason) for event in final_events] == [
+            ('skipped', 'completed'), ('succeeded', None), ('skipped', 'duplicate'),
+        ]
+
+        job_ledger = JobLedger(db_path=ledger_path)
+        records = job_ledger.get_records()
+        assert [record.status for record in records] == ['succeeded', 'succeeded']
+        assert [record.attempts for record in records] == [1, 2]
+        attempts = job_ledger.get_attempts(records[1].job_key)
+        assert [returncode for _, _, returncode, *_ in attempts] == [1, 0]
+        job_ledger.close()
+
+    def test_interrupted_job_is_rerun(self, tmp_path):
+        job_ledger = JobLedger(db_path=tmp_path / 'ledger.sqlite')
+        job = ProcessJob(args=_python('import time; time.sleep(30)'), log_path=str(tmp_path / 'job.log'))
+
+        async def interrupt():
+            async for event in ProcessManager.arun_jobs(jobs=[job], job_ledger=job_ledger):
+                if event.kind == 'started':
+                    break
+
+        asyncio.run(interrupt())
+        record = job_ledger.get_record(JobLedger.make_job_key(job))
+        assert record.status == 'running'
+        assert record.log_path == str(tmp_path / 'job.log')
+
+        async def resume():
+            return [event async for event in ProcessManager.arun_jobs(jobs=[job._replace(timeout=0.2)], job_ledger=job_ledger, max_retries=0)]
+
+        events = asyncio.run(resume())
+        assert 'started' in [event.kind for event in events]
+        assert job_ledger.get_record(JobLedger.make_job_key(job)).attempts == 2
+        job_ledger.close()
+
+    def test_spawn_error(self, tmp_path):
+        job_ledger = JobLedger(db_path=tmp_path / 'ledger.sqlite')
+        job = ProcessJob(args=['/nonexistent/command'])
+
+        async def main():
+            return [event async for event in ProcessManager.arun_jobs(jobs=[job], job_ledger=job_ledger, max_retries=0)]
+
+        asyncio.run(main())
+        record = job_ledger.get_record(JobLedger.make_job_key(job))
+        assert (record.status, record.attempts, record.reason) == ('failed', 1, 'spawn-error')
+        job_ledger.close()
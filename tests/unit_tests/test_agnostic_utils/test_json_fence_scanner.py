@@ -0,0 +1,41 @@
+"""
+测试JsonFenceScanner的查找结果。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.content_processors.json_fence_scanner import JsonFenceScanner
+
+# if TYPE_CHECKING:
+
+
+_MULTI_BLOCK_STR = (
+    'reasoning ```json{"a": 1}``` more reasoning\n'
+    '```python\nprint(1)\n```\n'
+    '```JSON\n[1, 2]\n```\n'
+    '```jsonc\n{"b": 2}\n```'
+)
+
+_test_find_json_block_cases = [
+    (dict(raw_str=_MULTI_BLOCK_STR, index_to_choose=-1), '\n{"b": 2}\n'),
+    (dict(raw_str=_MULTI_BLOCK_STR, index_to_choose=-2), '\n[1, 2]\n'),
+    (dict(raw_str=_MULTI_BLOCK_STR, index_to_choose=-3), '{"a": 1}'),
+    (dict(raw_str=_MULTI_BLOCK_STR, index_to_choose=-4), None),
+    (dict(raw_str=_MULTI_BLOCK_STR, index_to_choose=0), '{"a": 1}'),
+    (dict(raw_str=_MULTI_BLOCK_STR, index_to_choose=2), '\n{"b": 2}\n'),
+    (dict(raw_str=_MULTI_BLOCK_STR, index_to_choose=3), None),
+    (dict(raw_str='no code-cell at all'), None),
+    # 未闭合的最后一个 code-cell 。
+    (dict(raw_str='```json{"a": 1}```\n```json\n{"b": 2'), '\n{"b": 2'),
+    (dict(raw_str='```json{"a": 1}```\n```json\n{"b": 2', is_allow_unterminated=False), '{"a": 1}'),
+    # 结束 fence 后紧跟文本，回退为严格配对。
+    (dict(raw_str='```json{"a": 1}```json is above'), '{"a": 1}'),
+]
+
+
+class TestJsonFenceScanner:
+    @pytest.mark.parametrize('inputs, expected', _test_find_json_block_cases)
+    def test_find_json_block(self, inputs, expected):
+        raw_json_str = JsonFenceScanner.find_json_block(**inputs)
+        assert raw_json_str == expected
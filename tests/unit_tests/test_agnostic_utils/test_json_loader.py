@@ -0,0 +1,25 @@
+"""
+测试JsonLoader的'fast-then-repair'模式的层级。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.content_processors.json_loader import JsonLoader
+
+# if TYPE_CHECKING:
+
+
+_test_loads_fast_then_repair_cases = [
+    ('{"a": 1, "b": [true, null]}', {'a': 1, 'b': [True, None]}, JsonLoader.get_fast_loader_name()),
+    ("{'a': 1, 'b': [2, 3,],}", {'a': 1, 'b': [2, 3]}, 'json5'),
+    ('{"a": 1, "b": [2, 3', {'a': 1, 'b': [2, 3]}, 'json-repair'),
+]
+
+
+class TestJsonLoader:
+    @pytest.mark.parametrize('raw_json_str, expected, expected_tier', _test_loads_fast_then_repair_cases)
+    def test_loads_fast_then_repair(self, raw_json_str, expected, expected_tier):
+        structured_data, tier = JsonLoader.loads_fast_then_repair(raw_json_str)
+        assert structured_data == expected
+        assert tier == expected_tier
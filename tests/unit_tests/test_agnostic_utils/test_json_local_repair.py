@@ -0,0 +1,76 @@
+"""
+测试JsonLocalRepair的各个修复阶段。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.content_processors.json_local_repair import JsonLocalRepair
+from src.content_processors.json_output_extractor import JsonOutputExtractor
+from pydantic import BaseModel
+
+# if TYPE_CHECKING:
+
+
+class _Point(BaseModel):
+    x: int
+    y: int
+
+
+class _Points(BaseModel):
+    items: list[_Point]
+
+
+_test_repair_cases = [
+    (
+        'draft:\n```json\n{"x": 1, "y": 2}\n```\nfinal:\n```json\n(same as above)\n```',
+        _Point, 'dict', 'other-fence', {'x': 1, 'y': 2},
+    ),
+    ('The answer is {"x": 3, "y": 4}. Done.', _Point, 'dict', 'unfenced', {'x': 3, 'y': 4}),
+    # 最后一个 code-cell 是回答时，不使用之前的草稿和示例。
+    (
+        'draft:\n```json\n{"x": 1, "y": 2}\n```\nfinal:\n```json\n{"x": 1, "y": "?"}\n```',
+        _Point, 'dict', None, None,
+    ),
+    ('e.g. {"x": 0, "y": 0}\n```json\n{"x": "a", "y": "b"}\n```', _Point, 'dict', None, None),
+    (
+        'draft:\n```json\n{"x": 1, "y": 2}\n```\nfinal:\n```json\n{"x": 5, "y": 6\n```',
+        _Point, 'dict', 'json-repair', {'x': 5, 'y': 6},
+    ),
+    ('```json\n{"x": 1, "y": 2\n```', _Point, 'dict', 'json-repair', {'x': 1, 'y': 2}),
+    ('```json\n[{"x": 1, "y": 2}]\n```', _Point, 'dict', 'coerce', {'x': 1, 'y': 2}),
+    ('```json\n{"points": [{"x": 1, "y": 2}]}\n```', _Points, 'list', 'coerce', [{'x': 1, 'y': 2}]),
+    ('no structured output', _Point, 'dict', None, None),
+]
+
+
+class TestJsonLocalRepair:
+    @pytest.mark.parametrize(
+        'raw_str, schema_pydantic_base_model, schema_check_type, expected_stage, expected',
+        _test_repair_cases,
+    )
+    def test_repair(self, raw_str, schema_pydantic_base_model, schema_check_type, expected_stage, expected):
+        result = JsonLocalRepair.repair(
+            raw_str=raw_str,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+            schema_check_type=schema_check_type,
+        )
+        if expected_stage is None:
+            assert result is None
+            return
+        assert result.stage == expected_stage
+        assert result.structured_data == expected
+        # 修复后的字符串可以直接提取最后一个 code-cell 。
+        assert JsonOutputExtractor.extract_json_from_str(
+            raw_str=result.repaired_str,
+            json_loader_name='json',
+            schema_pydantic_base_model=schema_pydantic_base_model,
+            schema_check_type=schema_check_type,
+        ) == expected
+
+    def test_get_stage_hit_rates(self):
+        JsonLocalRepair.repair('The answer is {"x": 3, "y": 4}.', _Point)
+        hit_rates = JsonLocalRepair.get_stage_hit_rates()
+        assert set(hit_rates) == {'other-fence', 'unfenced', 'json-repair', 'coerce', 'unrepaired'}
+        assert hit_rates['unfenced'] > 0
+        assert sum(hit_rates.values()) == pytest.approx(1.0)
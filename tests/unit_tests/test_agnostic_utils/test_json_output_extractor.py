@@ -7,7 +7,10 @@
 from __future__ import annotations
 import pytest
 
+import json
+
 from tests.data.json_output_extractor_cases import JSON_OUTPUT_EXTRACTOR_CASES
+from src.content_processors.extraction_result import ExtractionOutcome
 from src.content_processors.json_output_extractor import JsonOutputExtractor
 
 
@@ -20,3 +23,21 @@ class TestJsonOutputExtractor:
         json_data = JsonOutputExtractor.extract_json_from_str(**inputs)
         assert json_data == expected
 
+
+    @pytest.mark.parametrize('max_workers', [0, 2])
+    def test_extract_many(self, max_workers):
+        raw_strs = [inputs['raw_str'] for inputs, expected in JSON_OUTPUT_EXTRACTOR_CASES] + ['no json', '```json{"a": ```']
+        results = JsonOutputExtractor.extract_many(raw_strs=raw_strs, max_workers=max_workers, chunk_size=2)
+        assert [structured_data for outcome, structured_data in results] == (
+            [expected for inputs, expected in JSON_OUTPUT_EXTRACTOR_CASES] + [None, {'a': ''}]
+        )
+        assert results[-2][0] == ExtractionOutcome.NO_FENCE
+
+    def test_extract_many_from_jsonl(self, tmp_path):
+        jsonl_path = tmp_path / 'completions.jsonl'
+        jsonl_path.write_text(
+            '\n'.join(json.dumps({'content': inputs['raw_str']}) for inputs, expected in JSON_OUTPUT_EXTRACTOR_CASES),
+            encoding='utf-8',
+        )
+        results = JsonOutputExtractor.extract_many(jsonl_path=jsonl_path, max_workers=0)
+        assert [outcome for outcome, structured_data in results] == [ExtractionOutcome.OK] * len(JSON_OUTPUT_EXTRACTOR_CASES)
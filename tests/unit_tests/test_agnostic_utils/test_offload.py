@@ -0,0 +1,93 @@
+"""
+测试OffloadPool、offload装饰器和async_wrap。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.async_tools import async_wrap
+from src.agnostic_utils.offload import OffloadPool, offload
+import asyncio
+import os
+import threading
+import time
+
+# if TYPE_CHECKING:
+
+
+def _square(x: int) -> int:
+    return x * x
+
+
+def _get_pid() -> int:
+    return os.getpid()
+
+
+class TestOffloadPool:
+    def test_async_wrap(self):
+        result = asyncio.run(async_wrap(lambda a, b=0: (threading.current_thread().name, a + b), 1, b=2))
+        thread_name, value = result
+        assert value == 3
+        assert thread_name.startswith('offload-default')
+
+    def test_max_workers_and_pending(self):
+        pool = OffloadPool.configure('test-bounded', max_workers=2, max_pending=3)
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def work():
+            with lock:
+                running.append(1)
+                max_running.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+
+        async def main():
+            await asyncio.gather(*(pool.run(work) for _ in range(8)))
+
+        asyncio.run(main())
+        metrics = pool.get_metrics()
+        assert max(max_running) == 2
+        assert metrics['peak_pending'] == 3
+        assert metrics['completed'] == 8
+        assert metrics['pending'] == 0
+        assert metrics['throttled'] > 0
+        pool.shutdown()
+
+    def test_failure(self):
+        pool = OffloadPool.configure('test-failure', max_workers=1)
+
+        def fail():
+            raise ValueError("failed")
+
+        with pytest.raises(ValueError):
+            asyncio.run(pool.run(fail))
+        assert pool.get_metrics()['failed'] == 1
+        pool.shutdown()
+
+    def test_offload_decorator(self):
+        @offload('parsing')
+        def parse(raw_str: str) -> str:
+            return threading.current_thread().name + raw_str
+
+        assert asyncio.run(parse('!')).startswith('offload-parsing')
+        assert parse.__wrapped__('!').endswith('!')
+
+    def test_process_pool(self):
+        pool = OffloadPool.configure('test-process', kind='process', max_workers=2)
+
+        async def main():
+            return await asyncio.gather(*(pool.run(_square, i) for i in range(4))), await pool.run(_get_pid)
+
+        squares, pid = asyncio.run(main())
+        assert squares == [0, 1, 4, 9]
+        assert pid != os.getpid()
+        pool.shutdown()
+
+    def test_unknown_pool(self):
+        with pytest.raises(KeyError):
+            OffloadPool.get('test-unknown')
+        with pytest.raises(ValueError):
+            OffloadPool(name='test-invalid', kind='fiber')
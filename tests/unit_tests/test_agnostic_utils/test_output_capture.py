@@ -0,0 +1,97 @@
+"""
+测试ProcessOutputCapture的环形缓冲、日志轮转和回调。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.output_capture import OutputRingBuffer, ProcessOutputCapture, RotatingLogFile
+import asyncio
+
+# if TYPE_CHECKING:
+
+
+class TestOutputRingBuffer:
+    @pytest.mark.parametrize(
+        ('max_lines', 'max_chars', 'expected'),
+        [
+            (3, None, ['c', 'dd', 'eee']),
+            (10, 5, ['dd', 'eee']),
+            (None, None, ['a', 'b', 'c', 'dd', 'eee']),
+        ],
+    )
+    def test_limits(self, max_lines, max_chars, expected):
+        buffer = OutputRingBuffer(max_lines=max_lines, max_chars=max_chars)
+        for line in ['a', 'b', 'c', 'dd', 'eee']:
+            buffer.append(line)
+        assert buffer.get_lines() == expected
+        assert buffer.total_lines == 5
+        assert buffer.dropped_lines == 5 - len(expected)
+        assert buffer.get_lines(last_n=1) == ['eee']
+
+
+class TestRotatingLogFile:
+    def test_rotation(self, tmp_path):
+        log_file = RotatingLogFile(path=tmp_path / 'log.txt', max_bytes=10, backup_count=2)
+        for i in range(6):
+            log_file.write_line(f"line{i}")
+        log_file.close()
+        # 每行 6 字节，2 行超过 10 字节，即每个文件 1 行。只保留 2 个旧文件。
+        assert (tmp_path / 'log.txt').read_text() == 'line5\n'
+        assert (tmp_path / 'log.txt.1').read_text() == 'line4\n'
+        assert (tmp_path / 'log.txt.2').read_text() == 'line3\n'
+        assert not (tmp_path / 'log.txt.3').exists()
+
+
+class TestProcessOutputCapture:
+    @staticmethod
+    def feed(output: ProcessOutputCapture, stream_name: str, chunks: list[bytes]) -> None:
+        async def main():
+            stream = asyncio.StreamReader()
+            for chunk in chunks:
+                stream.feed_data(chunk)
+            stream.feed_eof()
+            await output.afeed(stream_name=stream_name, stream=stream)
+
+        asyncio.run(main())
+
+    def test_lines_and_callback(self, tmp_path):
+        forwarded = []
+        output = ProcessOutputCapture(
+            max_lines=2,
+            tail_lines=3,
+            log_path=tmp_path / 'log.txt',
+            on_line=lambda stream_name, line: forwarded.append((stream_name, line)),
+        )
+        # 多字节的字符被块的边界截断。
+        text = '第一行\r\n第二行\n第三'.encode('utf-8')
+        self.feed(output, 'stdout', [text[:4], text[4:], '行'.encode('utf-8')])
+        self.feed(output, 'stderr', [b'error\n'])
+        output.close()
+        assert output.stdout.get_lines() == ['第二行', '第三行']
+        assert output.stderr.get_lines() == ['error']
+        assert output.get_tail() == ('第二行', '第三行', 'error')
+        assert forwarded[0] == ('stdout', '第一行')
+        assert forwarded[-1] == ('stderr', 'error')
+        assert (tmp_path / 'log.txt').read_text(encoding='utf-8') == '第一行\n第二行\n第三行\n[stderr] error\n'
+
+    def test_long_line_is_split(self):
+        output = ProcessOutputCapture(max_lines=10, max_line_chars=4)
+        self.feed(output, 'stdout', [b'abcdefghij'])
+        assert output.stdout.get_lines() == ['abcd', 'efgh', 'ij']
+        # 切分的位置不插入换行。
+        assert output.stdout.get_text() == 'abcdefghij'
+
+    def test_get_text_keeps_newlines(self):
+        output = ProcessOutputCapture(max_lines=None, max_chars=None)
+        self.feed(output, 'stdout', [b'a\r', b'\nb\rc\n\n'])
+        assert output.stdout.get_lines() == ['a', 'b', 'c', '']
+        assert output.stdout.get_text() == 'a\nb\nc\n\n'
+
+    def test_failing_callback(self):
+        def fail(stream_name, line):
+            raise RuntimeError("callback failed")
+
+        output = ProcessOutputCapture(on_line=fail)
+        self.feed(output, 'stdout', [b'a\nb\n'])
+        assert output.stdout.get_lines() == ['a', 'b']
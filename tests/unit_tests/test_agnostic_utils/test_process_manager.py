@@ -0,0 +1,174 @@
+"""
+测试ProcessManager的并行运行、重启和超时。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.job_ledger import JobLedger
+from src.agnostic_utils.process_manager import ProcessJob, ProcessManager
+import asyncio
+import subprocess
+import sys
+import time
+
+# if TYPE_CHECKING:
+
+
+def _python(code: str) -> list[str]:
+    return [sys.executable, '-c', code]
+
+
+class TestProcessManager:
+    def test_parallel(self):
+        start = time.monotonic()
+        final_events = ProcessManager.batch_run_process(
+            args_list=[_python('import time; time.sleep(0.5); print("done")') for _ in range(4)],
+            max_workers=4,
+        )
+        # 4 个任务并行，约 0.5 秒。
+        assert time.monotonic() - start < 1.8
+        assert [event.kind for event in final_events] == ['succeeded'] * 4
+        assert final_events[0].output_tail == ('done',)
+
+    def test_restart_with_backoff(self, tmp_path):
+        counter_path = tmp_path / 'counter'
+        code = (
+            "import pathlib, sys\n"
+            f"path = pathlib.Path({str(counter_path)!r})\n"
+            "count = int(path.read_text()) if path.exists() else 0\n"
+            "path.write_text(str(count + 1))\n"
+            "sys.exit(0 if count >= 2 else 1)\n"
+        )
+
+        async def main():
+            return [
+                event async for event in ProcessManager.arun_jobs(
+                    jobs=[_python(code)],
+                    max_retries=3,
+                    retry_interval=0.01,
+                )
+            ]
+
+        events = asyncio.run(main())
+        kinds = [event.kind for event in events]
+        assert kinds.count('started') == 3
+        assert kinds.count('retrying') == 2
+        assert kinds[-1] == 'succeeded'
+        assert events[-1].attempt == 2
+
+    def test_max_retries(self):
+        final_events = ProcessManager.run_processes_with_restart(
+            args_list=[_python('import sys; sys.exit(3)')],
+            max_retries=2,
+            retry_interval=0,
+        )
+        assert final_events[0].kind == 'failed'
+        assert final_events[0].returncode == 3
+        assert final_events[0].reason == 'exit-code'
+        assert final_events[0].attempt == 1
+
+    @pytest.mark.parametrize(
+        ('code', 'timeout', 'idle_timeout', 'reason'),
+        [
+            ('import time; time.sleep(30)', 0.3, None, 'timeout'),
+            ('import time\nwhile True:\n    print(1, flush=True); time.sleep(0.05)', None, 0.3, None),
+            ('import time; print(1, flush=True); time.sleep(30)', 5.0, 0.3, 'idle-timeout'),
+        ],
+    )
+    def test_time_control(self, code, timeout, idle_timeout, reason):
+        start = time.monotonic()
+        final_event = ProcessManager.run_process_with_time_control(
+            args=_python(code),
+            timeout=timeout if reason is not None else 0.8,
+            idle_timeout=idle_timeout,
+        )
+        assert time.monotonic() - start < 3.0
+        # 持续输出的任务不会触发 idle-timeout ，由 timeout 结束。
+        assert final_event.reason == (reason or 'timeout')
+        assert final_event.kind == 'failed'
+
+    def test_spawn_error(self):
+        final_event = ProcessManager.batch_run_process(args_list=[['/nonexistent/command']])[0]
+        assert final_event.kind == 'failed'
+        assert final_event.reason == 'spawn-error'
+
+    def test_unexpected_error(self):
+        # 不是 str 的参数使 create_subprocess_exec 抛出 TypeError ，任务失败，其他任务继续运行。
+        final_events = ProcessManager.batch_run_process(
+            args_list=[_python('pass') + [1], _python('pass')],
+            max_workers=1,
+        )
+        assert [(event.kind, event.reason) for event in final_events] == [('failed', 'spawn-error'), ('succeeded', None)]
+
+    def test_emit_error_propagates(self, tmp_path):
+        class BrokenLedger(JobLedger):
+            def record_event(self, event):
+                raise RuntimeError('disk full')
+
+        job_ledger = BrokenLedger(db_path=str(tmp_path / 'jobs.sqlite'))
+
+        async def main():
+            async for _ in ProcessManager.arun_jobs(jobs=[_python('pass')], job_ledger=job_ledger):
+                pass
+
+        # worker 异常结束时不会一直等待事件。
+        try:
+            with pytest.raises(RuntimeError, match='disk full'):
+                asyncio.run(asyncio.wait_for(main(), timeout=10.0))
+        finally:
+            job_ledger.close()
+
+    def test_break_kills_processes(self):
+        async def main():
+            jobs = [ProcessJob(args=_python('import time; time.sleep(30)'), name=f"sleep-{i}") for i in range(2)]
+            async for event in ProcessManager.arun_jobs(jobs=jobs, max_workers=2):
+                if event.kind == 'started':
+                    break
+
+        start = time.monotonic()
+        asyncio.run(main())
+        assert time.monotonic() - start < 3.0
+
+    def test_output_capture(self, tmp_path):
+        forwarded = []
+        code = "import sys\nfor i in range(5000):\n    print(i)\nprint('oops', file=sys.stderr)\n"
+        result = ProcessManager.run_process(
+            args=_python(code),
+            max_output_lines=10,
+            log_path=str(tmp_path / 'job.log'),
+            on_output=lambda job, stream_name, line: forwarded.append((stream_name, line)),
+        )
+        assert result.returncode == 0
+        assert result.stdout.splitlines() == [str(i) for i in range(4990, 5000)]
+        assert result.stderr == 'oops\n'
+        assert len(forwarded) == 5001
+        assert (tmp_path / 'job.log').read_text().splitlines()[-1] == '[stderr] oops'
+
+    def test_run_process_keeps_full_output(self):
+        # 默认与 subprocess.run 一致，不截断。
+        result = ProcessManager.run_process(args=_python("for i in range(5000):\n    print(i)\n"))
+        assert result.stdout.splitlines() == [str(i) for i in range(5000)]
+
+    def test_run_process_matches_subprocess_run(self):
+        # 超长的行、不同的换行和没有换行的结尾都与 subprocess.run 相同。
+        code = (
+            "import sys\n"
+            "print(1)\n"
+            "sys.stdout.write('x' * 70000 + '\\n')\n"
+            "sys.stdout.write('a\\r\\nb\\rc\\n\\nend')\n"
+            "sys.stderr.write('err\\n')\n"
+        )
+        expected = subprocess.run(_python(code), capture_output=True, text=True, encoding='utf-8')
+        result = ProcessManager.run_process(args=_python(code))
+        assert result.stdout == expected.stdout
+        assert result.stderr == expected.stderr
+
+    def test_run_process_in_running_loop(self):
+        async def main():
+            return ProcessManager.run_process_with_restart(args=_python("print('ok')"), max_retries=1)
+
+        assert asyncio.run(main()).stdout == 'ok\n'
+
+    def test_run_process_spawn_error(self):
+        assert ProcessManager.run_process(args=['/nonexistent/command']) is None
@@ -0,0 +1,161 @@
+"""
+测试DualTokenBucketLimiter的RPM、TPM、FIFO和修正。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.rate_limiter import (
+    DualTokenBucketLimiter,
+    InMemoryRateLimitBackend,
+    RateLimitBackend,
+    RateLimitSpec,
+    SQLiteRateLimitBackend,
+)
+import asyncio
+import multiprocessing
+import sqlite3
+import time
+
+# if TYPE_CHECKING:
+
+
+class TestDualTokenBucketLimiter:
+    def test_refill_and_acquire(self):
+        spec = RateLimitSpec(requests_per_minute=60, tokens_per_minute=600, burst_seconds=1.0)
+        # 满的桶: 1 个请求和 10 个 token 。
+        request_level, token_level, wait = RateLimitBackend.refill_and_acquire(spec, 1.0, 10.0, 0.0, 0.0, tokens=4)
+        assert (request_level, token_level, wait) == (0.0, 6.0, 0.0)
+        # 请求桶为空，等待 1 秒。
+        _, _, wait = RateLimitBackend.refill_and_acquire(spec, 0.0, 6.0, 0.0, 0.0, tokens=4)
+        assert wait == pytest.approx(1.0)
+        # token 不足，等待补充。
+        _, _, wait = RateLimitBackend.refill_and_acquire(spec, 1.0, 2.0, 0.0, 0.0, tokens=4)
+        assert wait == pytest.approx(0.2)
+        # 超过容量的请求只要求桶是满的，之后为负数。
+        _, token_level, wait = RateLimitBackend.refill_and_acquire(spec, 1.0, 10.0, 0.0, 0.0, tokens=25)
+        assert wait == 0.0
+        assert token_level == -15.0
+
+    def test_requests_per_minute(self):
+        rate_limiter = DualTokenBucketLimiter(
+            key='test/rpm',
+            spec=RateLimitSpec(requests_per_minute=6000, burst_seconds=0.01),
+        )
+
+        async def main():
+            await asyncio.gather(*(rate_limiter.aacquire() for _ in range(5)))
+
+        asyncio.run(main())
+        assert rate_limiter.stats['acquired'] == 5
+        # 容量为 1 ，之后的 4 个请求各需要等待约 0.01 秒。
+        assert rate_limiter.stats['waits'] >= 4
+
+    def test_fifo(self):
+        rate_limiter = DualTokenBucketLimiter(
+            key='test/fifo',
+            spec=RateLimitSpec(requests_per_minute=60_000, tokens_per_minute=60_000, burst_seconds=0.01),
+        )
+        order = []
+
+        async def request(i: int, tokens: int):
+            await rate_limiter.aacquire(estimated_tokens=tokens)
+            order.append(i)
+
+        async def main():
+            tasks = []
+            for i, tokens in enumerate([10, 5, 1, 1, 1]):
+                tasks.append(asyncio.create_task(request(i, tokens)))
+                await asyncio.sleep(0)
+            await asyncio.gather(*tasks)
+
+        asyncio.run(main())
+        assert order == [0, 1, 2, 3, 4]
+
+    def test_record_usage(self):
+        backend = InMemoryRateLimitBackend()
+        spec = RateLimitSpec(requests_per_minute=60, tokens_per_minute=600, burst_seconds=10.0)
+        rate_limiter = DualTokenBucketLimiter(key='test/usage', spec=spec, backend=backend)
+        rate_limiter.acquire(estimated_tokens=100)
+        rate_limiter.record_usage(estimated_tokens=100, actual_tokens=40)
+        assert rate_limiter.stats['corrected_tokens'] == 60
+        # 容量 100 ，消耗 100 后退还 60 。
+        assert backend._buckets['test/usage'][1] == pytest.approx(60.0, abs=1.0)
+        rate_limiter.record_usage(estimated_tokens=100, actual_tokens=None)
+        assert rate_limiter.stats['corrected_tokens'] == 60
+
+
+def _acquire_in_process(db_path: str, num_requests: int, queue) -> None:
+    rate_limiter = DualTokenBucketLimiter(
+        key='test/processes',
+        spec=RateLimitSpec(requests_per_minute=300, burst_seconds=1.0),
+        backend=SQLiteRateLimitBackend(db_path=db_path),
+    )
+    for _ in range(num_requests):
+        rate_limiter.acquire()
+        queue.put(time.time())
+
+
+class TestSQLiteRateLimitBackend:
+    def test_shared_between_backends(self, tmp_path):
+        spec = RateLimitSpec(requests_per_minute=60, burst_seconds=2.0)
+        backend_a = SQLiteRateLimitBackend(db_path=tmp_path / 'rate_limit.sqlite')
+        backend_b = SQLiteRateLimitBackend(db_path=tmp_path / 'rate_limit.sqlite')
+        # 容量为 2 个请求，由 2 个 backend 共同消耗。
+        assert backend_a.try_acquire(key='k', spec=spec, tokens=0) == 0.0
+        assert backend_b.try_acquire(key='k', spec=spec, tokens=0) == 0.0
+        assert backend_a.try_acquire(key='k', spec=spec, tokens=0) > 0.0
+        assert backend_b.try_acquire(key='other', spec=spec, tokens=0) == 0.0
+
+    def test_adjust_tokens(self, tmp_path):
+        spec = RateLimitSpec(requests_per_minute=60, tokens_per_minute=600, burst_seconds=1.0)
+        backend = SQLiteRateLimitBackend(db_path=tmp_path / 'rate_limit.sqlite')
+        assert backend.try_acquire(key='k', spec=spec, tokens=10) == 0.0
+        backend.adjust_tokens(key='k', spec=spec, token_delta=-10)
+        assert backend.try_acquire(key='k', spec=spec, tokens=10) > 0.0
+
+    def test_aacquire_does_not_block_loop(self, tmp_path):
+        db_path = tmp_path / 'rate_limit.sqlite'
+        rate_limiter = DualTokenBucketLimiter(
+            key='test/locked',
+            spec=RateLimitSpec(requests_per_minute=60),
+            backend=SQLiteRateLimitBackend(db_path=db_path),
+        )
+        # 其他进程持有写锁。
+        connection = sqlite3.connect(db_path, isolation_level=None)
+        connection.execute('BEGIN IMMEDIATE')
+        ticks = []
+
+        async def heartbeat():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def main():
+            heartbeat_task = asyncio.create_task(heartbeat())
+            asyncio.get_running_loop().call_later(0.3, connection.execute, 'COMMIT')
+            try:
+                await rate_limiter.aacquire()
+            finally:
+                heartbeat_task.cancel()
+
+        asyncio.run(main())
+        connection.close()
+        assert rate_limiter.stats['acquired'] == 1
+        # 等待写锁期间，事件循环继续运行。
+        assert len(ticks) >= 10
+
+    def test_across_processes(self, tmp_path):
+        db_path = str(tmp_path / 'rate_limit.sqlite')
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        processes = [context.Process(target=_acquire_in_process, args=(db_path, 5, queue)) for _ in range(2)]
+        for process in processes:
+            process.start()
+        acquired_at = sorted(queue.get(timeout=30) for _ in range(10))
+        for process in processes:
+            process.join(timeout=30)
+            assert process.exitcode == 0
+        # 共享的桶: 容量为 5 个请求，之后的 5 个请求每 0.2 秒 1 个，至少 1 秒。
+        # 独立的桶: 每个进程都可以立即获取 5 个请求。
+        assert acquired_at[-1] - acquired_at[0] >= 0.9
@@ -0,0 +1,156 @@
+"""
+测试ResourceScheduler的预留、限制和监控。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.process_manager import ProcessJob, ProcessManager
+from src.agnostic_utils.resource_scheduler import ResourceScheduler, ResourceUsage
+import asyncio
+import os
+import sys
+
+# if TYPE_CHECKING:
+
+is_linux = pytest.mark.skipif(not sys.platform.startswith('linux'), reason="需要 /proc 和 rlimit 。")
+
+
+def _python(code: str, **kwargs) -> ProcessJob:
+    return ProcessJob(args=[sys.executable, '-c', code], **kwargs)
+
+
+def _run(jobs: list[ProcessJob], resource_scheduler: ResourceScheduler) -> list:
+    async def main():
+        return [
+            event async for event in ProcessManager.arun_jobs(
+                jobs=jobs,
+                max_retries=0,
+                resource_scheduler=resource_scheduler,
+            )
+        ]
+
+    return asyncio.run(main())
+
+
+def _max_running(events: list) -> int:
+    running = 0
+    max_running = 0
+    for event in events:
+        if event.kind == 'started':
+            running += 1
+            max_running = max(max_running, running)
+        elif event.kind == 'exited':
+            running -= 1
+    return max_running
+
+
+class TestResourceScheduler:
+    @pytest.mark.parametrize(
+        ('job_kwargs', 'expected_max_running'),
+        [
+            ({'cpus': 1}, 2),
+            ({'cpus': 2}, 1),
+            ({'cpus': 1, 'memory_mb': 600}, 1),
+        ],
+    )
+    def test_reservation(self, job_kwargs, expected_max_running):
+        resource_scheduler = ResourceScheduler(total_cpus=2, total_memory_mb=1000, address_space_factor=None)
+        jobs = [_python('import time; time.sleep(0.2)', **job_kwargs) for _ in range(4)]
+        events = _run(jobs, resource_scheduler)
+        assert _max_running(events) == expected_max_running
+        assert [event.kind for event in events if event.is_final] == ['succeeded'] * 4
+        assert resource_scheduler.reserved_cpus == 0
+        assert resource_scheduler.reserved_memory_mb == 0
+
+    def test_backfill(self):
+        resource_scheduler = ResourceScheduler(total_cpus=2, total_memory_mb=None, is_pinning_cpus=False)
+        jobs = [
+            _python('import time; time.sleep(0.3)', name='small-0', cpus=1),
+            _python('import time; time.sleep(0.1)', name='large', cpus=2),
+            _python('import time; time.sleep(0.1)', name='small-1', cpus=1),
+        ]
+        events = _run(jobs, resource_scheduler)
+        started = [event.job.name for event in events if event.kind == 'started']
+        # large 等待时，small-1 先使用剩余的 CPU 。
+        assert started == ['small-0', 'small-1', 'large']
+
+    def test_backfill_aging(self):
+        # large 等待超过 max_backfill_wait 后，small-1 不再回填，归还的 CPU 留给 large 。
+        resource_scheduler = ResourceScheduler(
+            total_cpus=2,
+            total_memory_mb=None,
+            is_pinning_cpus=False,
+            max_backfill_wait=0.0,
+        )
+        jobs = [
+            _python('import time; time.sleep(0.3)', name='small-0', cpus=1),
+            _python('import time; time.sleep(0.1)', name='large', cpus=2),
+            _python('import time; time.sleep(0.1)', name='small-1', cpus=1),
+        ]
+        events = _run(jobs, resource_scheduler)
+        started = [event.job.name for event in events if event.kind == 'started']
+        assert started == ['small-0', 'large', 'small-1']
+        assert _max_running(events) == 1
+
+    def test_shared_usage_scan(self, monkeypatch):
+        num_scans = 0
+
+        def read_process_groups_usage():
+            nonlocal num_scans
+            num_scans += 1
+            return {pgid: ResourceUsage(rss_mb=10.0, cpu_seconds=1.0, num_processes=1) for pgid in (1, 2, 3)}
+
+        monkeypatch.setattr(ResourceScheduler, 'read_process_groups_usage', staticmethod(read_process_groups_usage))
+        resource_scheduler = ResourceScheduler(total_cpus=1, total_memory_mb=None, sample_interval=60.0)
+        job = _python('pass', memory_mb=5)
+
+        async def main():
+            return await asyncio.gather(*[resource_scheduler.acheck_usage(job=job, pgid=pgid) for pgid in (1, 2, 3, 4)])
+
+        results = asyncio.run(main())
+        # 同一个采样间隔内的全部任务共享一次读取。
+        assert num_scans == 1
+        assert results[0] == (ResourceUsage(rss_mb=10.0, cpu_seconds=1.0, num_processes=1), 'memory-limit')
+        assert results[3] == (None, None)
+
+    @is_linux
+    def test_cpu_affinity(self):
+        resource_scheduler = ResourceScheduler(total_cpus=1, total_memory_mb=None)
+        events = _run([_python('import os; print(sorted(os.sched_getaffinity(0)))')], resource_scheduler)
+        assert events[-1].output_tail == (str([resource_scheduler.available_cores[0]]),)
+
+    @is_linux
+    def test_address_space_limit(self):
+        resource_scheduler = ResourceScheduler(total_cpus=1, total_memory_mb=None, address_space_factor=2.0)
+        events = _run([_python('bytearray(1024 * 1024 * 1024)', memory_mb=200)], resource_scheduler)
+        assert events[-1].kind == 'failed'
+        assert 'MemoryError' in events[-1].output_tail[-1]
+
+    @is_linux
+    def test_memory_kill(self):
+        resource_scheduler = ResourceScheduler(
+            total_cpus=1,
+            total_memory_mb=None,
+            address_space_factor=None,
+            memory_kill_factor=1.0,
+            sample_interval=0.05,
+        )
+        code = 'import time; data = bytearray(200 * 1024 * 1024); time.sleep(30)'
+        events = _run([_python(code, memory_mb=50, timeout=10)], resource_scheduler)
+        assert events[-1].reason == 'memory-limit'
+        assert events[-1].peak_rss_mb > 50
+
+    @is_linux
+    def test_cpu_seconds_limit(self):
+        resource_scheduler = ResourceScheduler(total_cpus=1, total_memory_mb=None)
+        events = _run([_python('while True: pass', cpu_seconds=1, timeout=10)], resource_scheduler)
+        assert events[-1].reason == 'cpu-limit'
+
+    @is_linux
+    def test_read_process_group_usage(self):
+        usage = ResourceScheduler.read_process_group_usage(pgid=os.getpgid(0))
+        assert usage.num_processes >= 1
+        assert usage.rss_mb > 0
+        assert ResourceScheduler.read_process_groups_usage()[os.getpgid(0)].num_processes >= 1
+        assert ResourceScheduler.read_available_memory_mb() > 0
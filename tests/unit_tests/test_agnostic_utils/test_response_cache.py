@@ -0,0 +1,140 @@
+"""
+测试ResponseCache的各个后端、TTL、淘汰和single-flight。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.response_cache import (
+    ResponseCache,
+    MemoryResponseCache,
+    SQLiteResponseCache,
+    MmapResponseCache,
+)
+import asyncio
+import time
+
+# if TYPE_CHECKING:
+
+
+def _build_cache(backend: str, tmp_path, **kwargs) -> ResponseCache:
+    if backend == 'memory':
+        return MemoryResponseCache(**kwargs)
+    elif backend == 'sqlite':
+        return SQLiteResponseCache(db_path=tmp_path / 'cache.sqlite', **kwargs)
+    return MmapResponseCache(data_path=tmp_path / 'cache.bin', **kwargs)
+
+
+_backends = ['memory', 'sqlite', 'mmap']
+
+
+class TestResponseCache:
+    @pytest.mark.parametrize('backend', _backends)
+    def test_get_and_set(self, backend, tmp_path):
+        cache = _build_cache(backend, tmp_path)
+        assert cache.get('a') is None
+        cache.set('a', '{"x": 1}')
+        cache.set('b', '中文')
+        cache.set('a', '{"x": 2}')
+        assert cache.get('a') == '{"x": 2}'
+        assert cache.get('b') == '中文'
+        assert len(cache) == 2
+        assert cache.stats['hits'] == 2
+        assert cache.stats['misses'] == 1
+
+    @pytest.mark.parametrize('backend', _backends)
+    def test_ttl(self, backend, tmp_path):
+        cache = _build_cache(backend, tmp_path, ttl_seconds=0.01)
+        cache.set('a', 'value')
+        time.sleep(0.02)
+        assert cache.get('a') is None
+
+    @pytest.mark.parametrize('backend', _backends)
+    def test_lru_eviction(self, backend, tmp_path):
+        cache = _build_cache(backend, tmp_path, max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        time.sleep(0.001)
+        assert cache.get('a') == '1'
+        cache.set('c', '3')
+        assert cache.get('b') is None
+        assert cache.get('a') == '1'
+        assert cache.get('c') == '3'
+        assert cache.stats['evictions'] == 1
+
+    @pytest.mark.parametrize('backend', ['sqlite', 'mmap'])
+    def test_persistence(self, backend, tmp_path):
+        cache = _build_cache(backend, tmp_path)
+        cache.set('a', 'value')
+        cache.close()
+        cache = _build_cache(backend, tmp_path)
+        assert cache.get('a') == 'value'
+
+    @pytest.mark.parametrize('backend', ['sqlite', 'mmap'])
+    def test_eviction_persists(self, backend, tmp_path):
+        cache = _build_cache(backend, tmp_path, max_entries=2)
+        for key in 'abcde':
+            cache.set(key, key)
+        cache.close()
+        cache = _build_cache(backend, tmp_path, max_entries=2)
+        assert len(cache) == 2
+        assert cache.get('a') is None
+        assert cache.get('e') == 'e'
+
+    def test_mmap_enforces_max_entries_on_open(self, tmp_path):
+        cache = _build_cache('mmap', tmp_path)
+        for key in 'abc':
+            cache.set(key, key)
+        cache.close()
+        cache = _build_cache('mmap', tmp_path, max_entries=1)
+        assert len(cache) == 1
+        assert cache.get('c') == 'c'
+        cache.close()
+        cache = _build_cache('mmap', tmp_path)
+        assert len(cache) == 1
+
+    def test_mmap_truncates_incomplete_record(self, tmp_path):
+        cache = _build_cache('mmap', tmp_path)
+        cache.set('a', 'value')
+        cache.close()
+        with open(tmp_path / 'cache.bin', 'ab') as f:
+            f.write(b'\x01\x00')
+        cache = _build_cache('mmap', tmp_path)
+        assert cache.get('a') == 'value'
+        cache.set('b', 'other')
+        assert cache.get('b') == 'other'
+
+    def test_single_flight(self):
+        cache = MemoryResponseCache()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'value'
+
+        async def main():
+            return await asyncio.gather(*(cache.aget_or_compute('a', compute) for _ in range(5)))
+
+        assert asyncio.run(main()) == ['value'] * 5
+        assert len(calls) == 1
+        assert cache.stats['deduplicated'] == 4
+        assert asyncio.run(cache.aget_or_compute('a', compute)) == 'value'
+        assert len(calls) == 1
+
+    def test_single_flight_failure_is_not_cached(self):
+        cache = MemoryResponseCache()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError('failed')
+
+        async def main():
+            return await asyncio.gather(*(cache.aget_or_compute('a', compute) for _ in range(3)), return_exceptions=True)
+
+        assert all(isinstance(result, ValueError) for result in asyncio.run(main()))
+        assert cache.get('a') is None
+
+    def test_make_key(self):
+        assert ResponseCache.make_key('ab', 'c') != ResponseCache.make_key('a', 'bc')
+        assert ResponseCache.make_key('a', 'b') == ResponseCache.make_key('a', 'b')
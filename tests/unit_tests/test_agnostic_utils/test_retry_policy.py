@@ -0,0 +1,94 @@
+"""
+测试RetryPolicy的异常分类、退避和统计。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.retry_policy import RetryPolicy
+import asyncio
+
+# if TYPE_CHECKING:
+
+
+class _Response:
+    def __init__(self, status_code: int, headers: dict | None = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class _HTTPError(Exception):
+    def __init__(self, status_code: int, headers: dict | None = None):
+        super().__init__(status_code)
+        self.response = _Response(status_code, headers)
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+_test_is_retryable_error_cases = [
+    (asyncio.TimeoutError(), True),
+    (ConnectionError(), True),
+    (_HTTPError(429), True),
+    (_HTTPError(503), True),
+    (_HTTPError(400), False),
+    (_HTTPError(401), False),
+    (RateLimitError(), True),
+    (AuthenticationError(), False),
+    (TypeError(), False),
+    (ValueError(), True),
+]
+
+
+class TestRetryPolicy:
+    @pytest.mark.parametrize('error, expected', _test_is_retryable_error_cases)
+    def test_is_retryable_error(self, error, expected):
+        assert RetryPolicy.is_retryable_error(error) is expected
+
+    def test_retry_after(self):
+        assert RetryPolicy.get_retry_after(_HTTPError(429, {'retry-after': '2'})) == 2.0
+        assert RetryPolicy.get_retry_after(_HTTPError(429)) is None
+        retry_policy = RetryPolicy(base_delay=0.0, max_delay=10.0)
+        assert retry_policy.compute_delay(attempt=0, error=_HTTPError(429, {'retry-after': '2'})) == 2.0
+
+    def test_arun_retries_then_succeeds(self):
+        errors = iter([_HTTPError(503), _HTTPError(429)])
+
+        async def func():
+            error = next(errors, None)
+            if error is not None:
+                raise error
+            return 'ok'
+
+        retry_policy = RetryPolicy(max_attempts=3, base_delay=0.0)
+        assert asyncio.run(retry_policy.arun(func)) == 'ok'
+        assert retry_policy.stats['attempts'] == 3
+        assert retry_policy.stats['waits'] == 2
+        assert retry_policy.stats['give_ups'] == 0
+
+    @pytest.mark.parametrize('error, expected_attempts', [(_HTTPError(401), 1), (_HTTPError(500), 3)])
+    def test_run_gives_up(self, error, expected_attempts):
+        retry_policy = RetryPolicy(max_attempts=3, base_delay=0.0)
+
+        def func():
+            raise error
+
+        with pytest.raises(_HTTPError):
+            retry_policy.run(func)
+        assert retry_policy.stats['attempts'] == expected_attempts
+        assert retry_policy.stats['give_ups'] == 1
+
+    def test_attempt_timeout_and_deadline(self):
+        async def func():
+            await asyncio.sleep(1.0)
+
+        retry_policy = RetryPolicy(max_attempts=10, base_delay=0.0, attempt_timeout=0.01, deadline=0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(retry_policy.arun(func))
+        assert 1 < retry_policy.stats['attempts'] < 10
+        assert retry_policy.stats['give_ups'] == 1
@@ -0,0 +1,53 @@
+"""
+测试SchemaValidatorCache与直接构建数据类的结果一致。
+"""
+
+from __future__ import annotations
+import pytest
+from pydantic import BaseModel, Field, field_validator
+
+from src.content_processors.schema_validator_cache import SchemaValidatorCache
+
+# if TYPE_CHECKING:
+
+
+class _TestListDataClass(BaseModel):
+    items: list[int] = Field(..., min_length=2, max_length=3)
+
+
+class _TestValidatedListDataClass(BaseModel):
+    items: list[int]
+
+    @field_validator('items')
+    @classmethod
+    def check_sorted(cls, items: list[int]) -> list[int]:
+        if items != sorted(items):
+            raise ValueError("items must be sorted.")
+        return items
+
+
+_test_check_list_cases = [
+    (_TestListDataClass, [1, 2], True),
+    (_TestListDataClass, ['1', 2, 3], True),
+    (_TestListDataClass, [1], False),
+    (_TestListDataClass, [1, 2, 3, 4], False),
+    (_TestListDataClass, ['a', 2], False),
+    (_TestValidatedListDataClass, [1, 2], True),
+    (_TestValidatedListDataClass, [2, 1], False),
+]
+
+
+class TestSchemaValidatorCache:
+    @pytest.mark.parametrize('schema_pydantic_base_model, raw_list_structured_data, expected', _test_check_list_cases)
+    def test_check_list(self, schema_pydantic_base_model, raw_list_structured_data, expected):
+        is_valid = SchemaValidatorCache.check_list(
+            raw_list_structured_data=raw_list_structured_data,
+            schema_pydantic_base_model=schema_pydantic_base_model,
+        )
+        assert is_valid == expected
+
+    def test_get_items_validator_is_cached(self):
+        assert (
+            SchemaValidatorCache.get_items_validator(_TestListDataClass)
+            is SchemaValidatorCache.get_items_validator(_TestListDataClass)
+        )
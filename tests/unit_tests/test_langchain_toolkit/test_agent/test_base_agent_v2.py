@@ -12,7 +12,6 @@ from src.langchain_toolkit import LocalLLMFactory
 from langchain_core.messages import (
     SystemMessage,
     HumanMessage,
-    AIMessage,
 )
 from pydantic import BaseModel, Field
 
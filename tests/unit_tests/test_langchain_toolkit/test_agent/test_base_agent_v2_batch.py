@@ -0,0 +1,120 @@
+"""
+测试BaseAgent v2的批量处理、自适应并发上限与并发候选。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.langchain_toolkit.agents.base_agent_v2 import BaseAgent
+from src.agnostic_utils.adaptive_concurrency import AdaptiveConcurrencyLimiter
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import (
+    SystemMessage,
+    HumanMessage,
+    AIMessage,
+)
+from pydantic import BaseModel
+import asyncio
+
+# if TYPE_CHECKING:
+
+
+class _Person(BaseModel):
+    name: str
+    age: int
+
+
+class _TrackingChatModel(GenericFakeChatModel):
+    """记录同时运行的请求数量。"""
+
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    async def ainvoke(self, input, *args, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            return await super().ainvoke(input, *args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+class _AuthenticationError(Exception):
+    status_code = 401
+
+
+class _UnauthorizedChatModel(GenericFakeChatModel):
+    """每次请求都返回 401 。"""
+
+    num_calls: int = 0
+
+    async def ainvoke(self, input, *args, **kwargs):
+        self.num_calls += 1
+        raise _AuthenticationError("invalid api key")
+
+
+class _FakeStructuredLLM:
+    async def ainvoke(self, input, *args, **kwargs):
+        return _Person(name='Bob', age=18)
+
+
+class _FakeFormatterLLM:
+    def with_structured_output(self, schema):
+        return _FakeStructuredLLM()
+
+
+class TestBaseAgentCandidates:
+    def test_fatal_error_propagates(self):
+        main_llm = _UnauthorizedChatModel(messages=iter([]))
+        agent = BaseAgent(
+            main_llm=main_llm,
+            main_llm_system_message=SystemMessage(content="You are Bob."),
+            is_need_structured_output=True,
+            formatter_llm=_FakeFormatterLLM(),
+            schema_pydantic_base_model=_Person,
+            formatter_llm_system_message=SystemMessage(content="You extract person information from message."),
+            num_candidates=2,
+            main_llm_max_retries=5,
+        )
+        # 与顺序的重试一致，抛出原本的异常，而不是用完全部候选后的 RuntimeError 。
+        with pytest.raises(_AuthenticationError):
+            asyncio.run(agent.a_call_llm_with_retry(messages=[HumanMessage("Who are you?")]))
+        assert main_llm.num_calls == 2
+
+
+class TestBaseAgentBatch:
+    def test_formatter_uses_concurrency_limiter(self):
+        concurrency_limiter = AdaptiveConcurrencyLimiter(initial_limit=2, min_limit=1, max_limit=2)
+        agent = BaseAgent(
+            main_llm=GenericFakeChatModel(messages=iter([AIMessage(content="I am Bob, 18 years old.")])),
+            main_llm_system_message=SystemMessage(content="You are Bob."),
+            is_need_structured_output=True,
+            formatter_llm=_FakeFormatterLLM(),
+            schema_pydantic_base_model=_Person,
+            formatter_llm_system_message=SystemMessage(content="You extract person information from message."),
+            concurrency_limiter=concurrency_limiter,
+        )
+        response = asyncio.run(agent.a_call_llm_with_retry(messages=[HumanMessage("Who are you?")]))
+        assert response.structured_output == _Person(name='Bob', age=18)
+        # main_llm 和 formatter 的请求都经过 limiter 。
+        assert concurrency_limiter.stats['successes'] == 2
+
+    @pytest.mark.parametrize('max_concurrency, expected_max_in_flight', [(None, 2), (1, 1)])
+    def test_batch_uses_concurrency_limiter(self, max_concurrency, expected_max_in_flight):
+        main_llm = _TrackingChatModel(messages=iter([AIMessage(content=f"answer {i}") for i in range(6)]))
+        concurrency_limiter = AdaptiveConcurrencyLimiter(initial_limit=2, min_limit=1, max_limit=2)
+        agent = BaseAgent(
+            main_llm=main_llm,
+            main_llm_system_message=SystemMessage(content="You are Bob."),
+            concurrency_limiter=concurrency_limiter,
+        )
+        responses = asyncio.run(agent.a_call_llm_with_retry_batch(
+            messages_list=[[HumanMessage(f"question {i}")] for i in range(6)],
+            max_concurrency=max_concurrency,
+        ))
+        assert sorted(response.ai_message.content for response in responses) == [f"answer {i}" for i in range(6)]
+        # abatch 的请求也经过 limiter 。
+        assert main_llm.max_in_flight == expected_max_in_flight
+        assert concurrency_limiter.stats['successes'] == 6
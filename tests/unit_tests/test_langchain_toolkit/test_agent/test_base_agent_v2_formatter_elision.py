@@ -0,0 +1,99 @@
+"""
+测试BaseAgent v2在本地提取结构化输出，跳过formatter的情况。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.langchain_toolkit.agents.base_agent_v2 import BaseAgent
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import (
+    SystemMessage,
+    HumanMessage,
+    AIMessage,
+)
+from pydantic import BaseModel, Field
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# if TYPE_CHECKING:
+
+
+class Person(BaseModel):
+    name: str = Field(description="The name of the person.")
+    age: int = Field(description="The age of the person.")
+
+
+class _FakeStructuredLLM:
+    """记录调用次数的 formatter 。"""
+
+    def __init__(self):
+        self.num_calls = 0
+
+    async def ainvoke(self, input, *args, **kwargs):
+        self.num_calls += 1
+        return Person(name='Formatter', age=0)
+
+    async def abatch(self, inputs, *args, **kwargs):
+        self.num_calls += len(inputs)
+        return [Person(name='Formatter', age=0) for _ in inputs]
+
+
+class _FakeFormatterLLM:
+    def __init__(self):
+        self.structured_llm = _FakeStructuredLLM()
+
+    def with_structured_output(self, schema):
+        return self.structured_llm
+
+
+def _build_agent(
+    contents: list[str],
+) -> tuple[BaseAgent, _FakeStructuredLLM]:
+    formatter_llm = _FakeFormatterLLM()
+    agent = BaseAgent(
+        main_llm=GenericFakeChatModel(messages=iter([AIMessage(content=content) for content in contents])),
+        main_llm_system_message=SystemMessage(content="You are Bob."),
+        is_need_structured_output=True,
+        formatter_llm=formatter_llm,
+        schema_pydantic_base_model=Person,
+        formatter_llm_system_message=SystemMessage(content="You extract person information from message."),
+    )
+    return agent, formatter_llm.structured_llm
+
+
+_test_elision_cases = [
+    ('I am Bob.\n```json\n{"name": "Bob", "age": 18}\n```', 'hit', Person(name='Bob', age=18)),
+    ('I am Bob.\n```json\n{"name": "Bob", "age": 18,}\n```', 'repaired', Person(name='Bob', age=18)),
+    ("I am Bob, 18 years old.", 'miss', Person(name='Formatter', age=0)),
+    ('I am Bob.\n```json\n{"name": "Bob"}\n```', 'miss', Person(name='Formatter', age=0)),
+]
+
+
+class TestBaseAgentFormatterElision:
+    @pytest.mark.parametrize('content, expected_outcome, expected', _test_elision_cases)
+    def test_a_call_llm_with_retry(self, content, expected_outcome, expected):
+        agent, structured_llm = _build_agent([content])
+        response = asyncio.run(agent.a_call_llm_with_retry(messages=[HumanMessage("Who are you?")]))
+        assert response.structured_output == expected
+        assert agent.formatter_elision_counter == {expected_outcome: 1}
+        # 只有 'miss' 请求 formatter 。
+        assert structured_llm.num_calls == (1 if expected_outcome == 'miss' else 0)
+
+    def test_a_call_llm_with_retry_batch(self):
+        agent, structured_llm = _build_agent([content for content, _, _ in _test_elision_cases])
+        responses = asyncio.run(agent.a_call_llm_with_retry_batch(
+            messages_list=[[HumanMessage("Who are you?")] for _ in _test_elision_cases],
+            max_concurrency=1,
+        ))
+        assert [response.structured_output for response in responses] == [expected for _, _, expected in _test_elision_cases]
+        assert agent.formatter_elision_counter == {'hit': 1, 'repaired': 1, 'miss': 2}
+        assert structured_llm.num_calls == 2
+
+    def test_counter_from_threads(self):
+        agent, _ = _build_agent([])
+        content = _test_elision_cases[0][0]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: agent.extract_structured_output_locally(raw_str=content), range(2000)))
+        assert agent.formatter_elision_counter == {'hit': 2000}
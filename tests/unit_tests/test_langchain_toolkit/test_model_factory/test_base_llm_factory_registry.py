@@ -0,0 +1,65 @@
+"""
+测试BaseLLMFactory的供应商表和实例复用。不请求 API 。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.langchain_toolkit.model_factory.base_llm_factory import BaseLLMFactory
+from src.agnostic_utils.http_client_registry import HttpClientRegistry
+
+import gc
+
+# if TYPE_CHECKING:
+
+
+@pytest.fixture
+def gateway_env(monkeypatch):
+    monkeypatch.setenv('TEST_GATEWAY_API_KEY', 'test-key')
+    monkeypatch.setenv('TEST_GATEWAY_API_BASE_URL', 'http://127.0.0.1:1/v1')
+    BaseLLMFactory.register_provider(
+        model_client='test-gateway',
+        api_key_env='TEST_GATEWAY_API_KEY',
+        base_url_env='TEST_GATEWAY_API_BASE_URL',
+    )
+    yield
+    BaseLLMFactory.PROVIDER_SPECS.pop('test-gateway', None)
+    BaseLLMFactory.invalidate(model_client='test-gateway')
+
+
+class TestBaseLLMFactoryRegistry:
+    def test_memoized(self, gateway_env):
+        llm = BaseLLMFactory.create_llm('test-gateway', 'model-a', {'temperature': 0.0})
+        assert BaseLLMFactory.create_llm('test-gateway', 'model-a', {'temperature': 0.0}) is llm
+        assert BaseLLMFactory.create_llm('test-gateway', 'model-a', {'temperature': 0.5}) is not llm
+        assert BaseLLMFactory.create_llm('test-gateway', 'model-b', {'temperature': 0.0}) is not llm
+        assert llm.openai_api_base == 'http://127.0.0.1:1/v1'
+
+    def test_weak_reference(self, gateway_env):
+        llm = BaseLLMFactory.create_llm('test-gateway', 'model-a')
+        del llm
+        gc.collect()
+        # 没有持有者的实例被回收，不会一直占用内存。
+        assert BaseLLMFactory.invalidate(model_client='test-gateway') == 0
+
+    def test_invalidate(self, gateway_env):
+        llm = BaseLLMFactory.create_llm('test-gateway', 'model-a')
+        assert BaseLLMFactory.invalidate(model_client='test-gateway', model_name='model-a') == 1
+        assert BaseLLMFactory.create_llm('test-gateway', 'model-a') is not llm
+
+    def test_unknown_model_client(self):
+        with pytest.raises(ValueError):
+            BaseLLMFactory.create_llm('unknown-client', 'model-a')
+
+    @pytest.mark.parametrize('is_env_proxy', [False, True])
+    def test_openai_proxy(self, gateway_env, monkeypatch, is_env_proxy):
+        # ChatOpenAI 不接受同时指定 openai_proxy 和 http_client ，此时不共享 client 。
+        if is_env_proxy:
+            monkeypatch.setenv('OPENAI_PROXY', 'http://proxy:1')
+            model_configs = {}
+        else:
+            model_configs = {'openai_proxy': 'http://proxy:1'}
+        llm = BaseLLMFactory.create_llm('test-gateway', 'model-proxy', model_configs)
+        assert llm.openai_proxy == 'http://proxy:1'
+        # ChatOpenAI 自行构建带代理的 client 。
+        assert llm.http_client is not HttpClientRegistry.get_client(base_url='http://127.0.0.1:1/v1', api_key='test-key')
@@ -0,0 +1,63 @@
+"""
+测试CachedChatModel的记录和重放。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.response_cache import MemoryResponseCache, MmapResponseCache
+from src.langchain_toolkit.model_factory.cached_chat_model import CachedChatModel, ReplayMissError
+
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+import asyncio
+
+# if TYPE_CHECKING:
+
+
+def _build_fake_llm(num_responses: int = 3) -> GenericFakeChatModel:
+    return GenericFakeChatModel(messages=iter([
+        AIMessage(
+            content=f"response {i}",
+            response_metadata={'model_name': 'fake', 'finish_reason': 'stop'},
+            usage_metadata={'input_tokens': 3, 'output_tokens': 2, 'total_tokens': 5},
+        )
+        for i in range(num_responses)
+    ]))
+
+
+_messages = [SystemMessage("You are a helpful assistant."), HumanMessage("hello")]
+
+
+class TestCachedChatModel:
+    def test_replay_or_call(self):
+        cached_llm = CachedChatModel(llm=_build_fake_llm(), response_cache=MemoryResponseCache())
+        first = cached_llm.invoke(_messages)
+        second = cached_llm.invoke(_messages)
+        assert first.content == second.content == "response 0"
+        assert second.response_metadata['finish_reason'] == 'stop'
+        assert second.usage_metadata['total_tokens'] == 5
+        assert cached_llm.invoke([*_messages, HumanMessage("again")]).content == "response 1"
+
+    def test_record_then_replay(self, tmp_path):
+        response_cache = MmapResponseCache(data_path=tmp_path / 'responses.bin')
+        recorder = CachedChatModel(llm=_build_fake_llm(), response_cache=response_cache, mode='record')
+        assert asyncio.run(recorder.ainvoke(_messages)).content == "response 0"
+        response_cache.close()
+
+        response_cache = MmapResponseCache(data_path=tmp_path / 'responses.bin')
+        replayer = CachedChatModel(llm=_build_fake_llm(0), response_cache=response_cache, mode='replay')
+        assert asyncio.run(replayer.ainvoke(_messages)).content == "response 0"
+        with pytest.raises(ReplayMissError):
+            replayer.invoke([HumanMessage("not recorded")])
+
+    def test_key_ignores_message_ids(self):
+        cached_llm = CachedChatModel(llm=_build_fake_llm(), response_cache=MemoryResponseCache())
+        history_a = [*_messages, AIMessage("hi", id='run-a'), HumanMessage("next")]
+        history_b = [*_messages, AIMessage("hi", id='run-b'), HumanMessage("next")]
+        assert cached_llm.make_key(history_a) == cached_llm.make_key(history_b)
+        assert cached_llm.make_key(history_a) != cached_llm.make_key(history_a, stop=['\n'])
+
+    def test_wrap_without_cache(self):
+        llm = _build_fake_llm()
+        assert CachedChatModel.wrap(llm=llm, response_cache=None) is llm
@@ -0,0 +1,83 @@
+"""
+测试RateLimitedChatModel和RateLimiterFactory。不请求 API 。
+"""
+
+from __future__ import annotations
+import pytest
+
+from src.agnostic_utils.rate_limiter import RateLimitSpec
+from src.langchain_toolkit.model_factory.rate_limited_chat_model import RateLimitedChatModel
+from src.langchain_toolkit.model_factory.rate_limiter_factory import RateLimiterFactory
+
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk
+import asyncio
+
+# if TYPE_CHECKING:
+
+
+class _UsageStreamingChatModel(GenericFakeChatModel):
+    """与 openai 一致，在最后的 chunk 中返回用量。"""
+
+    async def _astream(self, *args, **kwargs):
+        async for chunk in super()._astream(*args, **kwargs):
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content='',
+            usage_metadata={'input_tokens': 1, 'output_tokens': 2, 'total_tokens': 3},
+        ))
+
+
+@pytest.fixture
+def test_gateway():
+    yield 'test-gateway'
+    RateLimiterFactory.RATE_LIMIT_SPECS.pop('test-gateway', None)
+    RateLimiterFactory._drop_rate_limiters(lambda key: key[0] == 'test-gateway')
+
+
+class TestRateLimitedChatModel:
+    def test_shared_rate_limiter(self):
+        rate_limiter = RateLimiterFactory.get_rate_limiter(model_client='deepseek', model_name='deepseek-chat')
+        assert RateLimiterFactory.get_rate_limiter(model_client='deepseek', model_name='deepseek-chat') is rate_limiter
+        assert RateLimiterFactory.get_rate_limiter(model_client='deepseek', model_name='deepseek-reasoner') is not rate_limiter
+        assert RateLimiterFactory.get_rate_limit_spec('dashscope', 'qwen-plus-latest').requests_per_minute == 15000
+        assert RateLimiterFactory.get_rate_limit_spec('dashscope', 'qwen-max').requests_per_minute == 1200
+        assert RateLimiterFactory.get_rate_limit_spec('openai', 'o3-mini').tokens_per_minute == 30_000
+        assert RateLimiterFactory.get_rate_limit_spec('openai', 'o4-mini').requests_per_minute == 1000
+
+    def test_register_rate_limit(self, test_gateway):
+        rate_limiter = RateLimiterFactory.get_rate_limiter(model_client='test-gateway', model_name='model-a')
+        RateLimiterFactory.register_rate_limit('test-gateway', 'model-', RateLimitSpec(requests_per_minute=1, tokens_per_minute=10))
+        new_rate_limiter = RateLimiterFactory.get_rate_limiter(model_client='test-gateway', model_name='model-a')
+        assert new_rate_limiter is not rate_limiter
+        assert new_rate_limiter.spec.tokens_per_minute == 10
+
+    def test_acquire_and_correct(self, test_gateway):
+        RateLimiterFactory.register_rate_limit('test-gateway', 'usage', RateLimitSpec(requests_per_minute=6000, tokens_per_minute=60_000))
+        rate_limiter = RateLimiterFactory.get_rate_limiter(model_client='test-gateway', model_name='usage')
+        llm = GenericFakeChatModel(messages=iter([
+            AIMessage("ok", usage_metadata={'input_tokens': 1, 'output_tokens': 2, 'total_tokens': 3}),
+        ]))
+        rate_limited_llm = RateLimitedChatModel(llm=llm, token_bucket_limiter=rate_limiter)
+        messages = [HumanMessage("x" * 400)]
+        assert rate_limited_llm.estimate_tokens(messages) == 100
+        assert asyncio.run(rate_limited_llm.ainvoke(messages)).content == "ok"
+        assert rate_limiter.stats['acquired'] == 1
+        assert rate_limiter.stats['corrected_tokens'] == 97
+
+    def test_astream(self, test_gateway):
+        RateLimiterFactory.register_rate_limit('test-gateway', 'stream', RateLimitSpec(requests_per_minute=6000, tokens_per_minute=60_000))
+        rate_limiter = RateLimiterFactory.get_rate_limiter(model_client='test-gateway', model_name='stream')
+        llm = _UsageStreamingChatModel(messages=iter([AIMessage("a b c")]))
+        rate_limited_llm = RateLimitedChatModel(llm=llm, token_bucket_limiter=rate_limiter)
+
+        async def main():
+            return [chunk async for chunk in rate_limited_llm.astream([HumanMessage("x" * 400)])]
+
+        chunks = asyncio.run(main())
+        # 逐个 chunk 转发，而不是一个完整的 chunk 。
+        assert len(chunks) > 1
+        assert ''.join(chunk.content for chunk in chunks) == "a b c"
+        assert rate_limiter.stats['acquired'] == 1
+        assert rate_limiter.stats['corrected_tokens'] == 97